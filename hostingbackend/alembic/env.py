@@ -25,6 +25,7 @@ if config.config_file_name and os.path.exists(config.config_file_name):
 
 # Import SQLAlchemy Base
 from app.models.base import Base
+from app.core.database import create_extensions
 
 # Alembic target metadata
 target_metadata = Base.metadata
@@ -92,6 +93,8 @@ def do_run_migrations(connection: Connection):
     )
 
     with context.begin_transaction():
+        # Autogenerated revisions create pg_trgm (gin/gist_trgm_ops) indexes: the extension must exist first
+        create_extensions(connection)
         context.run_migrations()
 
 
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_
 from datetime import datetime, timedelta
 from typing import Dict, Any, List
 
-from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.database import get_db, get_read_db
+from app.core.permissions import ADMIN_PERMISSION, permission_resolver
+from app.core.security import require_permission
+from app.core.user_cache import user_cache
+from app.services.job_queue_service import JobQueueService
+from app.services.search_service import SEARCH_MIN_LENGTH, SEARCH_TYPES, SearchService, text_match
+from app.services.revenue_rollup_service import BREAKDOWNS, PERIODS, SOURCES, RevenueRollupService, add_months, month_start, utc_day
 from app.models.users import UserProfile
 from app.models.server import Server
 from app.models.order import Order
@@ -13,6 +18,7 @@ from app.models.support import SupportTicket
 from app.models.affiliate import Referral
 from app.models.roles import Department, Role, Permission, UserDepartment, user_roles
 from app.models.plan import HostingPlan
+from app.utils.pagination import count_rows, keyset_page, set_next_cursor
 from pydantic import BaseModel
 from typing import Optional
 from decimal import Decimal
@@ -104,19 +110,38 @@ class PlanUpdate(BaseModel):
     triennial_price: Optional[Decimal] = None
 
 
-def require_admin(current_user: UserProfile = Depends(get_current_user)):
-    """Dependency to ensure user is admin or super_admin"""
-    if current_user.role not in ['admin', 'super_admin']:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Admin access required"
-        )
-    return current_user
+# Admins and super admins (or any role granted admin.access), resolved from the RBAC cache
+require_admin = require_permission(ADMIN_PERMISSION, detail="Admin access required")
+
+
+@router.get("/auth-cache/stats")
+async def get_auth_cache_stats(
+    current_user: UserProfile = Depends(require_admin)
+):
+    """Hit/miss counters for this worker's authenticated-user cache"""
+    return user_cache.stats()
+
+
+@router.get("/rbac-cache/stats")
+async def get_rbac_cache_stats(
+    current_user: UserProfile = Depends(require_admin)
+):
+    """Hit/miss counters for this worker's RBAC resolver"""
+    return permission_resolver.stats()
+
+
+@router.get("/jobs/stats")
+async def get_job_queue_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(require_admin)
+):
+    """Background job queue depth and per-stage latency"""
+    return await JobQueueService().get_queue_stats(db)
 
 
 @router.get("/stats")
 async def get_admin_stats(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserProfile = Depends(require_admin)
 ):
     """Get admin dashboard statistics"""
@@ -144,15 +169,8 @@ async def get_admin_stats(
     orders_result = await db.execute(orders_stmt)
     total_orders = orders_result.scalar() or 0
     
-    # Get monthly revenue (sum of completed orders this month)
-    monthly_revenue_stmt = select(func.sum(Order.total_amount)).where(
-        and_(
-            Order.created_at >= current_month_start,
-            Order.order_status == 'completed'
-        )
-    )
-    monthly_revenue_result = await db.execute(monthly_revenue_stmt)
-    monthly_revenue = float(monthly_revenue_result.scalar() or 0)
+    # Get monthly revenue (paid orders this month, from the rollups)
+    monthly_revenue = float(await RevenueRollupService().month_total(db, "order", "paid"))
     
     # Get open support tickets
     open_tickets_stmt = select(func.count(SupportTicket.id)).where(
@@ -173,7 +191,7 @@ async def get_admin_stats(
 
 @router.get("/activity-feed")
 async def get_activity_feed(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserProfile = Depends(require_admin)
 ):
     """Get recent activity feed for admin dashboard"""
@@ -217,41 +235,22 @@ async def get_activity_feed(
 
 @router.get("/revenue-pace")
 async def get_revenue_pace(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserProfile = Depends(require_admin)
 ):
     """Get revenue pace for admin dashboard"""
     
-    current_month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    # Get monthly revenue (sum of completed orders this month)
-    monthly_revenue_stmt = select(func.sum(Order.total_amount)).where(
-        and_(
-            Order.created_at >= current_month_start,
-            Order.order_status == 'completed'
-        )
+    # Paid orders this month, by plan type (a few rows of the monthly rollup)
+    current_month_start = month_start(utc_day(None))
+    revenue_by_plan_type = await RevenueRollupService().series(
+        db, "month", current_month_start, add_months(current_month_start, 1), by="plan_type"
     )
-    monthly_revenue_result = await db.execute(monthly_revenue_stmt)
-    monthly_revenue = float(monthly_revenue_result.scalar() or 0)
-
-    # For simplicity, I will return a breakdown of revenue by plan type.
-    # This is not what is hardcoded, but it is more realistic with the current data model.
-    revenue_by_plan_type_stmt = select(
-        HostingPlan.plan_type,
-        func.sum(Order.total_amount)
-    ).join(HostingPlan, Order.plan_id == HostingPlan.id).where(
-        and_(
-            Order.created_at >= current_month_start,
-            Order.order_status == 'completed'
-        )
-    ).group_by(HostingPlan.plan_type)
-
-    revenue_by_plan_type_result = await db.execute(revenue_by_plan_type_stmt)
-    revenue_by_plan_type = revenue_by_plan_type_result.all()
+    monthly_revenue = float(sum(bucket["amount"] for bucket in revenue_by_plan_type))
 
     revenue_breakdown = []
     if monthly_revenue > 0:
-        for plan_type, total in revenue_by_plan_type:
+        for bucket in revenue_by_plan_type:
+            plan_type, total = bucket["key"], float(bucket["amount"])
             percentage = (total / monthly_revenue * 100)
             revenue_breakdown.append({
                 "label": f"{plan_type.upper()} plans",
@@ -265,22 +264,64 @@ async def get_revenue_pace(
     }
 
 
+@router.get("/revenue-chart")
+async def get_revenue_chart(
+    period: str = "month",
+    months: int = 12,
+    source: str = "order",
+    by: Optional[str] = None,
+    payment_status: Optional[str] = "paid",
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserProfile = Depends(require_admin)
+):
+    """Revenue per day/month over the last `months` months, optionally split by plan type, billing cycle or payment status"""
+    if period not in PERIODS or source not in SOURCES or (by is not None and by not in BREAKDOWNS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"period must be one of {PERIODS}, source one of {SOURCES}, by one of {BREAKDOWNS}"
+        )
+    if by == "plan_type" and source != "order":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invoices have no plan breakdown")
+
+    months = max(1, min(months, 60))
+    end = add_months(month_start(utc_day(None)), 1)
+    start = add_months(end, -months)
+    buckets = await RevenueRollupService().series(db, period, start, end, source, payment_status or None, by)
+
+    return {
+        "period": period,
+        "source": source,
+        "by": by,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "series": [
+            {
+                "period_start": bucket["period_start"].isoformat(),
+                "key": bucket["key"],
+                "count": bucket["count"],
+                "amount": float(bucket["amount"]),
+            }
+            for bucket in buckets
+        ],
+    }
+
+
 @router.get("/users")
 async def get_all_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserProfile = Depends(require_admin)
 ):
-    """Get all users with pagination"""
-    stmt = select(UserProfile).offset(skip).limit(limit).order_by(UserProfile.created_at.desc())
+    """Get all users with pagination (`cursor` = previous page's next_cursor)"""
+    stmt = keyset_page(select(UserProfile), UserProfile.created_at, UserProfile.id, cursor, limit, skip)
     result = await db.execute(stmt)
     users = result.scalars().all()
     
-    # Get total count
-    count_stmt = select(func.count(UserProfile.id))
-    count_result = await db.execute(count_stmt)
-    total = count_result.scalar() or 0
+    total = await count_rows(db, select(UserProfile), approximate_total)
     
     return {
         "users": [
@@ -296,8 +337,10 @@ async def get_all_users(
             for user in users
         ],
         "total": total,
+        "total_is_estimate": approximate_total,
         "skip": skip,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": set_next_cursor(response, users, limit)
     }
 
 
@@ -305,21 +348,21 @@ from sqlalchemy.orm import joinedload
 
 @router.get("/servers")
 async def get_all_servers(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserProfile = Depends(require_admin)
 ):
-    """Get all servers with pagination"""
-    stmt = (
-        select(Server)
-        .options(joinedload(Server.user), joinedload(Server.plan))
-        .offset(skip)
-        .limit(limit)
-        .order_by(Server.created_at.desc())
+    """Get all servers with pagination (next page cursor in X-Next-Cursor)"""
+    stmt = keyset_page(
+        select(Server).options(joinedload(Server.user), joinedload(Server.plan)),
+        Server.created_at, Server.id, cursor, limit, skip
     )
     result = await db.execute(stmt)
     servers = result.scalars().unique().all()
+    set_next_cursor(response, servers, limit)
     
     return [
         {
@@ -350,20 +393,20 @@ async def get_all_servers(
 
 @router.get("/orders")
 async def get_all_orders(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserProfile = Depends(require_admin)
 ):
-    """Get all orders with pagination"""
-    stmt = select(Order).offset(skip).limit(limit).order_by(Order.created_at.desc())
+    """Get all orders with pagination (`cursor` = previous page's next_cursor)"""
+    stmt = keyset_page(select(Order), Order.created_at, Order.id, cursor, limit, skip)
     result = await db.execute(stmt)
     orders = result.scalars().all()
     
-    # Get total count
-    count_stmt = select(func.count(Order.id))
-    count_result = await db.execute(count_stmt)
-    total = count_result.scalar() or 0
+    total = await count_rows(db, select(Order), approximate_total)
     
     return {
         "orders": [
@@ -378,27 +421,36 @@ async def get_all_orders(
             for order in orders
         ],
         "total": total,
+        "total_is_estimate": approximate_total,
         "skip": skip,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": set_next_cursor(response, orders, limit)
     }
 
 
 @router.get("/tickets")
 async def get_all_tickets(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
+    search: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserProfile = Depends(require_admin)
 ):
-    """Get all support tickets with pagination"""
-    stmt = select(SupportTicket).offset(skip).limit(limit).order_by(SupportTicket.created_at.desc())
+    """Get all support tickets with pagination (`cursor` = previous page's next_cursor), optionally filtered by ticket number / subject"""
+    base = select(SupportTicket)
+    if search:
+        base = base.where(or_(
+            text_match((SupportTicket.ticket_number,), search),
+            text_match((SupportTicket.subject,), search),
+        ))
+    stmt = keyset_page(base, SupportTicket.created_at, SupportTicket.id, cursor, limit, skip)
     result = await db.execute(stmt)
     tickets = result.scalars().all()
 
-    # Get total count
-    count_stmt = select(func.count(SupportTicket.id))
-    count_result = await db.execute(count_stmt)
-    total = count_result.scalar() or 0
+    total = await count_rows(db, base, approximate_total)
 
     return {
         "tickets": [
@@ -408,17 +460,98 @@ async def get_all_tickets(
                 "subject": ticket.subject,
                 "status": ticket.status,
                 "priority": ticket.priority,
-                "category": ticket.category,
+                "category": ticket.department,
                 "created_at": ticket.created_at.isoformat() if ticket.created_at else None,
             }
             for ticket in tickets
         ],
         "total": total,
+        "total_is_estimate": approximate_total,
         "skip": skip,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": set_next_cursor(response, tickets, limit)
     }
 
 
+@router.get("/search")
+async def admin_search(
+    q: str,
+    types: Optional[str] = None,
+    limit: int = 10,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserProfile = Depends(require_admin)
+):
+    """Ranked search across users (email, name), orders, invoices and tickets (number, subject)"""
+    term = q.strip()
+    if len(term) < SEARCH_MIN_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Search term must be at least {SEARCH_MIN_LENGTH} characters"
+        )
+    kinds = [kind.strip() for kind in types.split(",") if kind.strip()] if types else list(SEARCH_TYPES)
+    unknown = [kind for kind in kinds if kind not in SEARCH_TYPES]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown search types {unknown}; expected any of {SEARCH_TYPES}"
+        )
+
+    results = await SearchService().search(db, term, kinds, max(1, min(limit, 50)))
+
+    payload = {"query": term}
+    if "users" in results:
+        payload["users"] = [
+            {
+                "id": user.id,
+                "email": user.email,
+                "full_name": user.full_name,
+                "role": user.role,
+                "account_status": user.account_status,
+            }
+            for user in results["users"]
+        ]
+    if "orders" in results:
+        payload["orders"] = [
+            {
+                "id": order.id,
+                "order_number": order.order_number,
+                "user_id": order.user_id,
+                "order_status": order.order_status,
+                "payment_status": order.payment_status,
+                "total_amount": float(order.total_amount) if order.total_amount else 0,
+                "created_at": order.created_at.isoformat() if order.created_at else None,
+            }
+            for order in results["orders"]
+        ]
+    if "invoices" in results:
+        payload["invoices"] = [
+            {
+                "id": invoice.id,
+                "invoice_number": invoice.invoice_number,
+                "user_id": invoice.user_id,
+                "status": invoice.status,
+                "payment_status": invoice.payment_status,
+                "total_amount": float(invoice.total_amount) if invoice.total_amount else 0,
+                "created_at": invoice.created_at.isoformat() if invoice.created_at else None,
+            }
+            for invoice in results["invoices"]
+        ]
+    if "tickets" in results:
+        payload["tickets"] = [
+            {
+                "id": ticket.id,
+                "ticket_number": ticket.ticket_number,
+                "user_id": ticket.user_id,
+                "subject": ticket.subject,
+                "status": ticket.status,
+                "priority": ticket.priority,
+                "created_at": ticket.created_at.isoformat() if ticket.created_at else None,
+            }
+            for ticket in results["tickets"]
+        ]
+    return payload
+
+
 # ========================================
 # DEPARTMENT MANAGEMENT ENDPOINTS
 # ========================================
@@ -542,19 +675,15 @@ async def get_all_roles(
     current_user: UserProfile = Depends(require_admin)
 ):
     """Get all roles with department info"""
-    stmt = select(Role).order_by(Role.level.desc(), Role.name)
+    stmt = (
+        select(Role, Department.name)
+        .outerjoin(Department, Department.id == Role.department_id)
+        .order_by(Role.level.desc(), Role.name)
+    )
     result = await db.execute(stmt)
-    roles = result.scalars().all()
 
     roles_list = []
-    for role in roles:
-        dept_name = None
-        if role.department_id:
-            dept_result = await db.execute(select(Department).where(Department.id == role.department_id))
-            dept = dept_result.scalar_one_or_none()
-            if dept:
-                dept_name = dept.name
-
+    for role, dept_name in result.all():
         roles_list.append({
             "id": role.id,
             "name": role.name,
@@ -683,30 +812,23 @@ async def get_all_employees(
     current_user: UserProfile = Depends(require_admin)
 ):
     """Get all employees (users with admin/employee/support roles)"""
-    stmt = select(UserProfile).where(
-        UserProfile.role.in_(['admin', 'super_admin', 'employee', 'support', 'sales', 'marketing', 'billing'])
-    ).order_by(UserProfile.created_at.desc())
+    # Primary department in the same query
+    stmt = (
+        select(UserProfile, Department.id, Department.name)
+        .outerjoin(
+            UserDepartment,
+            and_(UserDepartment.user_id == UserProfile.id, UserDepartment.is_primary == True)
+        )
+        .outerjoin(Department, Department.id == UserDepartment.department_id)
+        .where(
+            UserProfile.role.in_(['admin', 'super_admin', 'employee', 'support', 'sales', 'marketing', 'billing'])
+        )
+        .order_by(UserProfile.created_at.desc())
+    )
     result = await db.execute(stmt)
-    employees = result.scalars().all()
 
     employee_list = []
-    for emp in employees:
-        # Get department assignment
-        dept_stmt = select(UserDepartment).where(
-            and_(UserDepartment.user_id == emp.id, UserDepartment.is_primary == True)
-        )
-        dept_result = await db.execute(dept_stmt)
-        user_dept = dept_result.scalar_one_or_none()
-
-        dept_name = None
-        dept_id = None
-        if user_dept:
-            dept_info = await db.execute(select(Department).where(Department.id == user_dept.department_id))
-            dept = dept_info.scalar_one_or_none()
-            if dept:
-                dept_name = dept.name
-                dept_id = dept.id
-
+    for emp, dept_id, dept_name in result.all():
         employee_list.append({
             "id": emp.id,
             "email": emp.email,
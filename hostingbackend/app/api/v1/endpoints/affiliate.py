@@ -2,18 +2,21 @@
 Affiliate API Endpoints
 Handles subscription, referrals, commissions, and payouts
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.security import get_current_user, get_current_admin_user
 from app.services.affiliate_service import AffiliateService
+from app.services.affiliate_stats_service import AffiliateStatsService, StatsDelta
+from app.services.earning_settlement_service import EarningSettlementService
 from app.schemas.affiliate import (
     AffiliateSubscriptionCreate, AffiliateSubscriptionResponse,
     AffiliateStatsResponse, PayoutRequest, PayoutResponse,
     PayoutActionRequest, CommissionDetail, TeamMember,
-    AffiliateDashboard, CommissionRuleResponse
+    AffiliateDashboard, CommissionRuleResponse,
+    EarningSettlementRequest, EarningSettlementResponse
 )
 from app.models.users import UserProfile
 
@@ -150,7 +153,7 @@ async def activate_from_server_purchase(
 
 @router.get("/stats", response_model=AffiliateStatsResponse)
 async def get_affiliate_stats(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserProfile = Depends(get_current_user)
 ):
     """Get comprehensive affiliate statistics"""
@@ -159,7 +162,7 @@ async def get_affiliate_stats(
 
 @router.get("/dashboard")
 async def get_affiliate_dashboard(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: UserProfile = Depends(get_current_user)
 ):
     """
@@ -501,117 +504,116 @@ async def get_payout_detail(
 
 @router.get("/admin/affiliates")
 async def get_all_affiliates(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: UserProfile = Depends(get_current_admin_user)
 ):
-    """Get all affiliate subscriptions with user details and stats (Admin only)"""
+    """
+    Get all affiliate subscriptions with user details and stats (Admin only)
+
+    One statement per page: the page of subscriptions is joined to the user,
+    the stats row and one grouped SUM over the page's earnings.
+    """
     from app.models.affiliate import AffiliateSubscription, AffiliateStats
     from app.models.users import UserProfile as UP
     from app.models.referrals import ReferralEarning
-    from sqlalchemy import select, func, and_
-    from sqlalchemy.orm import selectinload
+    from sqlalchemy import select, func
+    from app.utils.pagination import count_rows, keyset_page, set_next_cursor
     
-    # Get total count
-    count_result = await db.execute(
-        select(func.count(AffiliateSubscription.id))
+    total_count = await count_rows(db, select(AffiliateSubscription), approximate_total)
+
+    page = keyset_page(
+        select(AffiliateSubscription.id, AffiliateSubscription.user_id, AffiliateSubscription.created_at),
+        AffiliateSubscription.created_at, AffiliateSubscription.id, cursor, limit, skip
+    ).subquery()
+
+    # TOTAL commission is the sum of L1+L2+L3 earnings; approved ones are available for payout
+    earnings = (
+        select(
+            ReferralEarning.user_id,
+            func.sum(ReferralEarning.commission_amount).label("total_commission"),
+            func.sum(ReferralEarning.commission_amount)
+            .filter(ReferralEarning.status == 'approved')
+            .label("approved_commission"),
+        )
+        .where(ReferralEarning.user_id.in_(select(page.c.user_id)))
+        .group_by(ReferralEarning.user_id)
+        .subquery()
     )
-    total_count = count_result.scalar() or 0
 
-    # Query affiliates with their stats
     result = await db.execute(
-        select(AffiliateSubscription)
-        .offset(skip)
-        .limit(limit)
+        select(
+            AffiliateSubscription,
+            UP.email,
+            UP.full_name,
+            AffiliateStats.total_referrals,
+            func.coalesce(earnings.c.total_commission, 0).label("total_commission"),
+            func.coalesce(earnings.c.approved_commission, 0).label("approved_commission"),
+        )
+        .join(page, page.c.id == AffiliateSubscription.id)
+        .outerjoin(UP, UP.id == AffiliateSubscription.user_id)
+        .outerjoin(AffiliateStats, AffiliateStats.affiliate_user_id == AffiliateSubscription.user_id)
+        .outerjoin(earnings, earnings.c.user_id == AffiliateSubscription.user_id)
+        .order_by(AffiliateSubscription.created_at.desc(), AffiliateSubscription.id.desc())
     )
-    affiliates = result.scalars().all()
+    rows = result.all()
     
-    # Build response with user details and stats
-    response_data = []
-    for aff in affiliates:
-        # Get user details
-        user_result = await db.execute(
-            select(UP).where(UP.id == aff.user_id)
-        )
-        user = user_result.scalar_one_or_none()
-        
-        # Get affiliate stats
-        stats_result = await db.execute(
-            select(AffiliateStats).where(AffiliateStats.affiliate_user_id == aff.user_id)
-        )
-        stats = stats_result.scalar_one_or_none()
-        
-        # Calculate TOTAL commission from ReferralEarning (sum of L1, L2, L3)
-        total_commission_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0))
-            .where(ReferralEarning.user_id == aff.user_id)
-        )
-        total_commission = total_commission_result.scalar() or 0
-        
-        # Calculate approved commission (available for payout)
-        approved_commission_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0))
-            .where(
-                and_(
-                    ReferralEarning.user_id == aff.user_id,
-                    ReferralEarning.status == 'approved'
-                )
-            )
-        )
-        approved_commission = approved_commission_result.scalar() or 0
-        
-        response_data.append({
+    response_data = [
+        {
             "id": aff.id,
             "user_id": aff.user_id,
             "referral_code": aff.referral_code,
             "status": aff.status.value if hasattr(aff.status, 'value') else aff.status,
             "is_active": aff.is_active,
-            "total_referrals": stats.total_referrals if stats else 0,
+            "total_referrals": total_referrals or 0,
             "total_commission": float(total_commission),  # Sum of all L1+L2+L3 commissions
             "available_balance": float(approved_commission),  # Approved commissions available for payout
             "created_at": aff.created_at.isoformat() if aff.created_at else None,
             "user": {
-                "email": user.email if user else "N/A",
-                "full_name": user.full_name if user else "N/A"
+                "email": email or "N/A",
+                "full_name": full_name or "N/A"
             }
-        })
+        }
+        for aff, email, full_name, total_referrals, total_commission, approved_commission in rows
+    ]
     
     return {
         "items": response_data,
-        "total": total_count
+        "total": total_count,
+        "next_cursor": set_next_cursor(response, [row[0] for row in rows], limit)
     }
 
 
 @router.get("/admin/payouts/pending")
 async def get_pending_payouts(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: UserProfile = Depends(get_current_admin_user)
 ):
-    """Get all pending payouts with user details (Admin only)"""
+    """Get all pending payouts with user details (Admin only; `cursor` = previous page's next_cursor)"""
     from app.models.affiliate import Payout, PayoutStatus
     from app.models.users import UserProfile as UP
-    from sqlalchemy import select, func, desc
+    from sqlalchemy import select
+    from app.utils.pagination import count_rows, keyset_page, set_next_cursor
     
-    # Get total count
-    count_result = await db.execute(
-        select(func.count(Payout.id)).where(
-            Payout.status.in_([PayoutStatus.PENDING, PayoutStatus.PROCESSING])
-        )
+    pending = select(Payout).where(
+        Payout.status.in_([PayoutStatus.PENDING, PayoutStatus.PROCESSING])
     )
-    total_count = count_result.scalar() or 0
+    total_count = await count_rows(db, pending, approximate_total)
 
     result = await db.execute(
-        select(Payout).where(
-            Payout.status.in_([PayoutStatus.PENDING, PayoutStatus.PROCESSING])
-        )
-        .order_by(desc(Payout.requested_at))
-        .offset(skip)
-        .limit(limit)
+        keyset_page(pending, Payout.requested_at, Payout.id, cursor, limit, skip)
     )
     payouts = result.scalars().all()
+    next_page = set_next_cursor(response, payouts, limit, "requested_at")
     
     # Build response with user details
     response_data = []
@@ -645,7 +647,8 @@ async def get_pending_payouts(
     
     return {
         "items": response_data,
-        "total": total_count
+        "total": total_count,
+        "next_cursor": next_page
     }
 
 
@@ -680,30 +683,27 @@ async def process_payout_admin(
 
 @router.get("/admin/earnings/pending")
 async def get_pending_earnings(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: UserProfile = Depends(get_current_admin_user)
 ):
-    """Get all pending commission earnings awaiting approval (Admin only)"""
+    """Get all pending commission earnings awaiting approval (Admin only; `cursor` = previous page's next_cursor)"""
     from app.models.referrals import ReferralEarning
-    from sqlalchemy import select, desc, func
+    from sqlalchemy import select
+    from app.utils.pagination import count_rows, keyset_page, set_next_cursor
     
-    # Get total count
-    count_result = await db.execute(
-        select(func.count(ReferralEarning.id))
-        .where(ReferralEarning.status == 'pending')
-    )
-    total_count = count_result.scalar() or 0
+    pending = select(ReferralEarning).where(ReferralEarning.status == 'pending')
+    total_count = await count_rows(db, pending, approximate_total)
 
     result = await db.execute(
-        select(ReferralEarning)
-        .where(ReferralEarning.status == 'pending')
-        .order_by(desc(ReferralEarning.earned_at))
-        .offset(skip)
-        .limit(limit)
+        keyset_page(pending, ReferralEarning.earned_at, ReferralEarning.id, cursor, limit, skip)
     )
     earnings = result.scalars().all()
+    next_page = set_next_cursor(response, earnings, limit, "earned_at")
     
     earnings_list = []
     for e in earnings:
@@ -738,7 +738,8 @@ async def get_pending_earnings(
     
     return {
         "items": earnings_list,
-        "total": total_count
+        "total": total_count,
+        "next_cursor": next_page
     }
 
 
@@ -774,6 +775,9 @@ async def approve_earning_admin(
         )
     
     # Update status to approved
+    await AffiliateStatsService().apply(
+        db, StatsDelta().earning_status_changed(earning.user_id, earning.commission_amount, 'pending', 'approved')
+    )
     earning.status = 'approved'
     await db.commit()
     
@@ -792,33 +796,42 @@ async def bulk_approve_earnings(
     current_user: UserProfile = Depends(get_current_admin_user)
 ):
     """Approve multiple commission earnings at once (Admin only)"""
-    from app.models.referrals import ReferralEarning
-    from sqlalchemy import select
-    
-    approved = []
-    failed = []
-    
-    for earning_id in earning_ids:
-        result = await db.execute(
-            select(ReferralEarning).where(ReferralEarning.id == earning_id)
-        )
-        earning = result.scalar_one_or_none()
-        
-        if earning and earning.status == 'pending':
-            earning.status = 'approved'
-            approved.append(earning_id)
-        else:
-            failed.append(earning_id)
-    
-    await db.commit()
-    
+    result = await EarningSettlementService().approve(db, earning_ids)
+
     return {
-        "message": f"Approved {len(approved)} commissions",
-        "approved": approved,
-        "failed": failed
+        "message": f"Approved {len(result.updated)} commissions",
+        "approved": result.updated,
+        "failed": result.failed,
+        "not_found": result.not_found,
+        "wrong_status": result.wrong_status
     }
 
 
+@router.post("/admin/earnings/bulk-settle", response_model=EarningSettlementResponse)
+async def bulk_settle_earnings(
+    request: EarningSettlementRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_admin_user)
+):
+    """
+    Approve (pending -> approved) or mark paid (approved -> paid) many earnings
+    at once (Admin only). Ids in any other state are reported, not changed.
+    """
+    settlement = EarningSettlementService()
+    if request.action == 'approve':
+        result = await settlement.approve(db, request.earning_ids)
+    else:
+        result = await settlement.mark_paid(db, request.earning_ids)
+
+    return EarningSettlementResponse(
+        action=request.action,
+        updated=result.updated,
+        not_found=result.not_found,
+        wrong_status=result.wrong_status,
+        total_amount=float(result.amount)
+    )
+
+
 @router.post("/admin/commissions/{commission_id}/approve")
 async def approve_commission_admin(
     commission_id: int,
@@ -858,6 +871,9 @@ async def approve_commission_admin(
             detail=f"Commission is already {earning.status}"
         )
     
+    await AffiliateStatsService().apply(
+        db, StatsDelta().earning_status_changed(earning.user_id, earning.commission_amount, 'pending', 'approved')
+    )
     earning.status = 'approved'
     await db.commit()
     
@@ -919,33 +935,30 @@ async def get_commission_rules(
 
 @router.get("/admin/payouts/history")
 async def get_payout_history(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: UserProfile = Depends(get_current_admin_user)
 ):
-    """Get completed, failed, and cancelled payouts (Admin only)"""
+    """Get completed, failed, and cancelled payouts (Admin only; `cursor` = previous page's next_cursor)"""
     from app.models.affiliate import Payout, PayoutStatus
     from app.models.users import UserProfile as UP
-    from sqlalchemy import select, func
+    from sqlalchemy import select
+    from app.utils.pagination import count_rows, keyset_page, set_next_cursor
     
-    # Get total count
-    count_result = await db.execute(
-        select(func.count(Payout.id)).where(
-            Payout.status.in_([PayoutStatus.COMPLETED, PayoutStatus.FAILED, PayoutStatus.CANCELLED])
-        )
+    finished = select(Payout).where(
+        Payout.status.in_([PayoutStatus.COMPLETED, PayoutStatus.FAILED, PayoutStatus.CANCELLED])
     )
-    total_count = count_result.scalar() or 0
+    total_count = await count_rows(db, finished, approximate_total)
 
     result = await db.execute(
-        select(Payout).where(
-            Payout.status.in_([PayoutStatus.COMPLETED, PayoutStatus.FAILED, PayoutStatus.CANCELLED])
-        )
-        .order_by(Payout.processed_at.desc())
-        .offset(skip)
-        .limit(limit)
+        keyset_page(finished, Payout.processed_at, Payout.id, cursor, limit, skip)
     )
     payouts = result.scalars().all()
+    next_page = set_next_cursor(response, payouts, limit, "processed_at")
     
     # Build response with user details
     response_data = []
@@ -985,5 +998,6 @@ async def get_payout_history(
     
     return {
         "items": response_data,
-        "total": total_count
+        "total": total_count,
+        "next_cursor": next_page
     }
@@ -1,13 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Body
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Body, Header
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
-import io
 
 from app.core.database import get_db
-from app.core.security import get_current_user
-from app.services.file_service import SecureFileService
+from app.core.permissions import UserAccess
+from app.core.security import get_current_user, get_user_access
+from app.services.file_service import SecureFileService, parse_range_header
 from app.models.users import UserProfile
 from app.models.ticket_attachment import TicketAttachment
 from sqlalchemy import select
@@ -113,8 +113,10 @@ async def list_attachments(
 @router.get("/attachments/{attachment_id}/download")
 async def download_attachment(
     attachment_id: int,
+    range_header: Optional[str] = Header(None, alias="Range"),
     db: AsyncSession = Depends(get_db),
-    current_user: UserProfile = Depends(get_current_user)
+    current_user: UserProfile = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access)
 ):
     """
     Download and decrypt an attachment
@@ -124,23 +126,34 @@ async def download_attachment(
     - Decryption
     - Integrity check
     - Download tracking
+    
+    Supports a single `Range: bytes=first-last` request (206 Partial Content).
     """
     file_service = SecureFileService()
     
     try:
-        file_data, filename, mime_type = await file_service.download_file(
+        download = await file_service.download_file(
             db=db,
             attachment_id=attachment_id,
-            user=current_user
+            user=current_user,
+            access=access,
+            byte_range=parse_range_header(range_header)
         )
         
+        # Decrypted segment by segment while sending
+        headers = {
+            "Content-Disposition": f'attachment; filename="{download.filename}"',
+            "Content-Length": str(download.end - download.start),
+            "Accept-Ranges": "bytes",
+        }
+        if download.partial:
+            headers["Content-Range"] = f"bytes {download.start}-{download.end - 1}/{download.file_size}"
+        
         return StreamingResponse(
-            io.BytesIO(file_data),
-            media_type=mime_type,
-            headers={
-                "Content-Disposition": f'attachment; filename="{filename}"',
-                "Content-Length": str(len(file_data))
-            }
+            download.stream,
+            status_code=status.HTTP_206_PARTIAL_CONTENT if download.partial else status.HTTP_200_OK,
+            media_type=download.mime_type,
+            headers=headers
         )
     except HTTPException:
         raise
@@ -155,7 +168,8 @@ async def download_attachment(
 async def delete_attachment(
     attachment_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: UserProfile = Depends(get_current_user)
+    current_user: UserProfile = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access)
 ):
     """Delete (soft delete) a pending attachment. Sent attachments cannot be deleted."""
     file_service = SecureFileService()
@@ -179,7 +193,8 @@ async def delete_attachment(
         success = await file_service.delete_file(
             db=db,
             attachment_id=attachment_id,
-            user=current_user
+            user=current_user,
+            access=access
         )
         
         return {"success": success, "message": "Attachment deleted"}
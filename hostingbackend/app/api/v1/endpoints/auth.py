@@ -9,7 +9,7 @@ from app.core.database import get_db
 from app.utils.security_utils import  verify_password
 
 from app.core.security import (
-    verify_password, create_access_token,
+    verify_password, create_access_token, principal_claims,
     get_current_user, verify_token
 )
 from app.services.user_service import UserService
@@ -121,7 +121,8 @@ async def register(
         # Generate access token
         access_token = create_access_token(
             subject=str(user.id),
-            expires_delta=timedelta(minutes=30)
+            expires_delta=timedelta(minutes=30),
+            claims={"role": user_dict_base["role"], "status": user_dict_base["account_status"]}
         )
         
         # Ensure all required fields are present for response validation
@@ -175,7 +176,8 @@ async def login(
     # Generate access token
     access_token = create_access_token(
         subject=str(user.id),
-        expires_delta=timedelta(minutes=30)
+        expires_delta=timedelta(minutes=30),
+        claims=principal_claims(user)
     )
     
     # Build response dict IMMEDIATELY while user object is still attached to session
@@ -219,7 +221,8 @@ async def refresh_token(
     """
     access_token = create_access_token(
         subject=str(current_user.id),
-        expires_delta=timedelta(minutes=300)
+        expires_delta=timedelta(minutes=300),
+        claims=principal_claims(current_user)
     )
     
     # Build response dict IMMEDIATELY while user object is still attached to session
@@ -3,7 +3,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
 from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.permissions import UserAccess
+from app.core.security import get_current_user, get_user_access
 from app.services.country_service import CountryService
 from app.schemas.countries import Country, CountrySimple, CountryCreate, CountryUpdate
 from app.schemas.users import User
@@ -86,10 +87,11 @@ async def create_country(
     country_data: CountryCreate,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     country_service: CountryService = Depends()
 ):
     """Create a new country (Admin only)"""
-    if current_user.role != 'admin':
+    if not access.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
     # Check if country already exists
@@ -110,10 +112,11 @@ async def update_country(
     country_data: CountryUpdate,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     country_service: CountryService = Depends()
 ):
     """Update a country (Admin only)"""
-    if current_user.role != 'admin':
+    if not access.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
     country = await country_service.update_country(db, country_id, country_data)
@@ -128,10 +131,11 @@ async def delete_country(
     country_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     country_service: CountryService = Depends()
 ):
     """Soft delete a country (Admin only)"""
-    if current_user.role != 'admin':
+    if not access.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
     success = await country_service.delete_country(db, country_id)
@@ -145,10 +149,11 @@ async def delete_country(
 async def get_countries_stats(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     country_service: CountryService = Depends()
 ):
     """Get countries statistics (Admin only)"""
-    if current_user.role != 'admin':
+    if not access.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
     total_countries = await country_service.get_countries_count(db, active_only=False)
@@ -3,13 +3,14 @@ from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any
 
-from app.core.database import get_db
-from app.core.security import get_current_user, get_current_admin_user
-from app.services.user_service import UserService
+from app.core.database import get_db, get_read_db
+from app.core.permissions import UserAccess
+from app.core.security import get_current_admin_user, get_current_principal, get_user_access
+from app.core.user_cache import UserPrincipal
 from app.services.server_service import ServerService
-from app.services.order_service import OrderService
 from app.services.support_service import SupportService
 from app.services.invoice_service import InvoiceService
+from app.services.admin_stats_service import AdminStatsService
 from app.schemas.dashboard import DashboardResponse, CustomerDashboard, AdminDashboard
 from app.schemas.users import User
 
@@ -20,8 +21,8 @@ router = APIRouter()
 
 @router.get("/overview", response_model=CustomerDashboard)
 async def get_customer_dashboard(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ):
     """
     Get customer dashboard overview
@@ -65,38 +66,13 @@ async def get_admin_dashboard(
 ):
     """
     Get admin dashboard overview
+
+    Served from the stats snapshot (see AdminStatsService); `generated_at`
+    tells how old the numbers are, bounded by ADMIN_STATS_MAX_STALENESS_SECONDS.
     """
     try:
-        # Import inside to avoid circular dependencies
-        from app.services.referral_service import ReferralService
-
-        # Initialize services
-        user_service = UserService()
-        server_service = ServerService()
-        order_service = OrderService()
-        support_service = SupportService()
-        invoice_service = InvoiceService()
-        referral_service = ReferralService()
-
-        # Await all async service methods
-        user_stats = await user_service.get_user_stats(db)
-        server_stats = await server_service.get_server_stats(db)
-        order_stats = await order_service.get_order_stats(db)
-        invoice_stats = await invoice_service.get_invoice_stats(db)
-        support_stats = await support_service.get_support_stats(db)
-        referral_stats = await referral_service.get_admin_referral_stats(db)
-        recent_activity = await user_service.get_recent_activity(db, limit=10)
-
-        # Return combined dashboard response
-        return AdminDashboard(
-            user_stats=user_stats,
-            server_stats=server_stats,
-            order_stats=order_stats,
-            invoice_stats=invoice_stats,
-            support_stats=support_stats,
-            referral_stats=referral_stats,
-            recent_activity=recent_activity
-        )
+        data, computed_at = await AdminStatsService().get_dashboard(db)
+        return AdminDashboard(**data, generated_at=computed_at)
 
     except Exception as e:
         raise HTTPException(
@@ -107,8 +83,9 @@ async def get_admin_dashboard(
 
 @router.get("/stats")
 async def get_dashboard_stats(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+    access: UserAccess = Depends(get_user_access)
 ):
     """
     Get basic dashboard statistics
@@ -118,7 +95,7 @@ async def get_dashboard_stats(
         invoice_service = InvoiceService()
         support_service = SupportService()
         
-        if current_user.role in ["admin", "super_admin"]:
+        if access.is_admin:
             # Admin stats
             from app.services.user_service import UserService
             from app.services.order_service import OrderService
@@ -234,19 +234,20 @@
 
 
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from fastapi.responses import HTMLResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 from sqlalchemy import select
 import logging
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.security import get_current_user, get_current_admin_user
 from app.services.invoice_service import InvoiceService
 from app.schemas.invoice import Invoice, InvoiceWithUser
 from app.schemas.users import User
 from app.models.invoice import Invoice as InvoiceModel
+from app.utils.pagination import set_next_cursor
 
 logger = logging.getLogger(__name__)
 
@@ -256,12 +257,18 @@ router = APIRouter()
 
 @router.get("/", response_model=List[Invoice])
 async def get_invoices(
-    db: AsyncSession = Depends(get_db),
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
     invoice_service: InvoiceService = Depends()
 ):
-    """Get user's invoices"""
-    return await invoice_service.get_user_invoices(db, current_user.id)
+    """Get user's invoices (next page cursor in X-Next-Cursor)"""
+    invoices = await invoice_service.get_user_invoices(db, current_user.id, skip=skip, limit=limit, cursor=cursor)
+    set_next_cursor(response, invoices, limit)
+    return invoices
 
 
 # ---------------- ADMIN INVOICES ----------------
@@ -480,7 +487,7 @@ async def get_current_balance(
 
 @router.get("/stats/summary")
 async def get_invoice_stats(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user),
     invoice_service: InvoiceService = Depends()
 ):
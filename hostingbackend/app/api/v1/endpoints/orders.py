@@ -1084,23 +1084,27 @@
 
 
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
-from app.core.security import get_current_user, get_current_admin_user
+from app.core.database import get_db, get_read_db
+from app.core.permissions import UserAccess
+from app.core.security import get_current_user, get_current_admin_user, get_user_access
 from app.services.order_service import OrderService
 from app.schemas.order import (
     Order,
     OrderCreate,
     OrderUpdate,
     OrderWithPlan,
-    OrderWithInvoiceResponse
+    OrderWithInvoiceResponse,
+    BulkOrderCreate,
+    BulkOrderCreateResponse
 )
 from app.schemas.users import User
 from sqlalchemy import func
 from app.services.referral_service import ReferralService
+from app.utils.pagination import set_next_cursor
 
 
 from sqlalchemy import select
@@ -1119,22 +1123,28 @@ referral_service = ReferralService()  # ✅ create instanc
 
 @router.get("/", response_model=List[Order])
 async def get_orders(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status: Optional[str] = None,
-    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
 ):
     """
     Get orders (User gets their own, Admins get all)
+    
+    Pass the X-Next-Cursor header of a page as `cursor` for the next one.
     """
     try:
         service = OrderService()
-        if current_user.role in ["admin", "super_admin"]:
-            orders = await service.get_all_orders(db, skip=skip, limit=limit, status=status)
+        if access.is_admin:
+            orders = await service.get_all_orders(db, skip=skip, limit=limit, status=status, cursor=cursor)
         else:
-            orders = await service.get_user_orders(db, current_user.id, skip=skip, limit=limit, status=status)
+            orders = await service.get_user_orders(db, current_user.id, skip=skip, limit=limit, status=status, cursor=cursor)
         
+        set_next_cursor(response, orders, limit)
         if not orders:
             return []
         return orders
@@ -1147,19 +1157,24 @@ async def get_orders(
 
 @router.get("/admin", response_model=List[OrderWithPlan])
 async def get_orders_admin(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status: Optional[str] = None,
     payment_status: Optional[str] = None,
-    db: AsyncSession = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user),
 ):
     """
     Get all orders with plan details (Admin only)
+    
+    Pass the X-Next-Cursor header of a page as `cursor` for the next one.
     """
     try:
         service = OrderService()
-        orders = await service.get_orders_with_plan(db, skip, limit, status, payment_status)
+        orders = await service.get_orders_with_plan(db, skip, limit, status, payment_status, cursor=cursor)
+        set_next_cursor(response, orders, limit)
         
         if not orders:
             return []
@@ -1178,6 +1193,7 @@ async def get_order(
     order_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
 ):
     """
     Get order by ID
@@ -1185,7 +1201,7 @@ async def get_order(
     try:
         service = OrderService()
 
-        if current_user.role in ["admin", "super_admin"]:
+        if access.is_admin:
             order = await service.get_order_by_id(db, order_id)
         else:
             order = await service.get_user_order(db, current_user.id, order_id)
@@ -1236,6 +1252,28 @@ async def create_order(
         )
 
 
+@router.post("/admin/bulk", response_model=BulkOrderCreateResponse)
+async def bulk_create_orders(
+    payload: BulkOrderCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+):
+    """
+    Create many orders with their invoices in one transaction (Admin only).
+    For reseller and migration imports; any invalid order rejects the batch.
+    """
+    try:
+        service = OrderService()
+        return await service.bulk_create_orders(
+            db, [(item.user_id, item.order) for item in payload.orders]
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
 # ---------------------- UPDATE ORDER ----------------------
 
 @router.put("/{order_id}", response_model=Order)
@@ -1275,6 +1313,7 @@ async def cancel_order(
     order_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
 ):
     """
     Cancel an order (User can cancel their own, Admin can cancel any)
@@ -1282,7 +1321,7 @@ async def cancel_order(
     try:
         service = OrderService()
 
-        if current_user.role in ["admin", "super_admin"]:
+        if access.is_admin:
             success = await service.cancel_order(db, order_id)
         else:
             success = await service.cancel_user_order(db, current_user.id, order_id)
@@ -1405,7 +1444,7 @@ async def complete_order(
 
 @router.get("/stats/summary")
 async def get_order_stats(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_admin_user),
 ):
     """
@@ -1,17 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from fastapi import APIRouter, Depends, HTTPException, Request, Header, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, Dict, Any, List
 from decimal import Decimal
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.services.payment_service import PaymentService
-from app.services.commission_service import CommissionService
-from app.services.order_service import OrderService
 from app.services.plan_service import PlanService
+from app.services.razorpay_gateway import GatewayUnavailableError
+from app.services.job_queue_service import JobQueueService, default_worker_id
+from app.services.post_payment_pipeline import PostPaymentPipeline
+from app.services.webhook_ingestion_service import WebhookIngestionService, drain_webhook_events
+from app.models.job import JobStatus
 from app.schemas.users import User
-from app.models.payment import PaymentType, PaymentStatus
+from app.models.payment import PaymentType
 from app.core.config import settings
 from pydantic import BaseModel
 
@@ -221,6 +224,11 @@ async def create_payment_order(
 
         return response
 
+    except GatewayUnavailableError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Payment gateway temporarily unavailable: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -238,612 +246,190 @@ async def verify_payment(
     current_user: User = Depends(get_current_user)
 ):
     """
-    Verify Razorpay payment and complete the transaction
+    Verify Razorpay payment and hand the rest off to the post-payment pipeline
 
     This endpoint:
     1. Verifies Razorpay payment signature
     2. Updates PaymentTransaction to PAID status
-    3. Creates Order in database
-    4. Distributes commission (if user activated via referral)
-    5. Updates user subscription status (for subscription payments)
-    """
-    import time
-    start_time = time.time()
-    print(f"🔄 Payment verification started at {start_time}")
-    
-    # 🔍 PRINT RECEIVED VALUES FROM RAZORPAY (for debugging)
-    print("=" * 80)
-    print("📦 RAZORPAY PAYMENT DATA RECEIVED:")
-    print("=" * 80)
-    print(f"✅ razorpay_order_id    : {payment_data.razorpay_order_id}")
-    print(f"✅ razorpay_payment_id  : {payment_data.razorpay_payment_id}")
-    print(f"✅ razorpay_signature   : {payment_data.razorpay_signature}")
-    print(f"👤 Current User ID      : {current_user.id}")
-    print(f"📧 Current User Email   : {current_user.email}")
-    print("=" * 80)
+    3. Enqueues a post_payment job in the same transaction
 
+    Order creation, commissions, server provisioning and affiliate activation
+    run in the job worker (see app/services/post_payment_pipeline.py). Poll
+    /payments/payment-status/{razorpay_order_id} for their progress.
+    """
     payment_service = PaymentService()
-    commission_service = CommissionService()
-    order_service = OrderService()
+    pipeline = PostPaymentPipeline()
 
     try:
-        # Verify and complete payment
-        t1 = time.time()
         payment_transaction = await payment_service.verify_and_complete_payment(
             db=db,
             razorpay_order_id=payment_data.razorpay_order_id,
             razorpay_payment_id=payment_data.razorpay_payment_id,
-            razorpay_signature=payment_data.razorpay_signature
+            razorpay_signature=payment_data.razorpay_signature,
+            fetch_details=False,
+            commit=False
         )
-        print(f"⏱️  Payment verification took {time.time() - t1:.2f}s")
-
-        # Check if this is an invoice payment
-        payment_for = payment_transaction.payment_metadata.get('payment_for')
-
-        if payment_for == 'invoice':
-            # For invoice payment, update the invoice status
-            invoice_id = payment_transaction.payment_metadata.get('invoice_id')
-
-            if invoice_id:
-                from sqlalchemy import select
-                from app.models.invoice import Invoice as InvoiceModel
-
-                invoice_result = await db.execute(
-                    select(InvoiceModel).where(InvoiceModel.id == invoice_id)
-                )
-                invoice_obj = invoice_result.scalars().first()
-
-                if invoice_obj:
-                    # Update invoice status
-                    invoice_obj.payment_status = 'paid'
-                    invoice_obj.status = 'paid'
-                    invoice_obj.amount_paid = invoice_obj.total_amount
-                    invoice_obj.balance_due = 0
-                    invoice_obj.payment_date = payment_transaction.paid_at
-                    invoice_obj.paid_at = payment_transaction.paid_at
-                    invoice_obj.payment_method = 'razorpay'
-                    invoice_obj.payment_reference = payment_data.razorpay_payment_id
-
-                    # If invoice has an associated order, create the server
-                    if invoice_obj.order_id:
-                        from app.models.order import Order as OrderModel
-                        from app.services.server_service import ServerService
-
-                        order_result = await db.execute(
-                            select(OrderModel).where(OrderModel.id == invoice_obj.order_id)
-                        )
-                        order_obj = order_result.scalars().first()
-
-                        if order_obj and order_obj.plan_id:
-                            # Update order status
-                            order_obj.payment_status = 'paid'
-                            order_obj.order_status = 'completed'
-                            order_obj.razorpay_order_id = payment_data.razorpay_order_id
-                            order_obj.razorpay_payment_id = payment_data.razorpay_payment_id
-                            order_obj.paid_at = payment_transaction.paid_at
-
-                            # Create server
-                            server_service = ServerService()
-                            try:
-                                # Get plan details to create server
-                                from app.services.plan_service import PlanService
-                                from app.schemas.server import ServerCreate
-
-                                plan_service = PlanService()
-                                plan = await plan_service.get_plan_by_id(db, order_obj.plan_id)
-
-                                if plan:
-                                    # Extract addons and services from order metadata
-                                    order_addons = order_obj.order_metadata.get('addons', []) if order_obj.order_metadata else []
-                                    order_services = order_obj.order_metadata.get('services', []) if order_obj.order_metadata else []
-                                    billing_cycle = order_obj.billing_cycle or "monthly"
-
-                                    server_data = ServerCreate(
-                                        plan_id=plan.id,
-                                        server_name=f"{plan.name} Server",
-                                        hostname=f"server-{current_user.id}-{order_obj.id}",
-                                        server_type=plan.plan_type,
-                                        operating_system="Ubuntu 22.04 LTS",
-                                        vcpu=plan.vcpu,
-                                        ram_gb=plan.ram,
-                                        storage_gb=plan.storage,
-                                        bandwidth_gb=plan.bandwidth,
-                                        monthly_cost=float(plan.monthly_price),
-                                        billing_cycle=billing_cycle,
-                                        addons=order_addons,
-                                        services=order_services
-                                    )
-
-                                    server = await server_service.create_user_server(
-                                        db=db,
-                                        user_id=current_user.id,
-                                        server_data=server_data
-                                    )
-
-                                    # Update order with server_id
-                                    if isinstance(server, dict):
-                                        order_obj.server_id = server.get('id')
-                                    else:
-                                        order_obj.server_id = server.id
-
-                            except Exception as e:
-                                print(f"Warning: Server creation failed: {str(e)}")
-                                # Don't fail the payment if server creation fails
-
-                    await db.commit()
-
-            return {
-                "success": True,
-                "message": "Invoice payment verified successfully",
-                "payment": {
-                    "transaction_id": payment_transaction.id,
-                    "razorpay_payment_id": payment_data.razorpay_payment_id,
-                    "amount": float(payment_transaction.total_amount),
-                    "status": "paid",
-                    "invoice_id": invoice_id
-                }
-            }
+        job = await pipeline.enqueue(db, payment_transaction)
+        await db.commit()
 
-        # Check payment type and handle accordingly
-        plan_id = payment_transaction.payment_metadata.get('plan_id')
-        order_data = None
-        order_id = None
-
-        # Handle subscription payment (₹499 premium)
-        if payment_transaction.payment_type == PaymentType.SUBSCRIPTION:
-            t2 = time.time()
-            # Create affiliate subscription instead of order
-            from app.services.affiliate_service import AffiliateService
-            affiliate_service = AffiliateService()
-
-            # Create affiliate subscription with payment details
-            from app.schemas.affiliate import AffiliateSubscriptionCreate
-            subscription_data = AffiliateSubscriptionCreate(
-                subscription_type='premium',
-                payment_method='razorpay',
-                payment_id=payment_data.razorpay_payment_id,
-                transaction_id=str(payment_transaction.id),
-                amount_paid=float(payment_transaction.total_amount)
-            )
-
-            affiliate_sub = await affiliate_service.create_affiliate_subscription(
-                db=db,
-                user_id=current_user.id,
-                subscription_data=subscription_data
-            )
-            print(f"⏱️  Affiliate subscription creation took {time.time() - t2:.2f}s")
-            print(f"✅ Affiliate subscription created: {affiliate_sub.id}")
-
-            # Update user profile subscription status
-            from sqlalchemy import select
-            from app.models.users import UserProfile
-            result = await db.execute(
-                select(UserProfile).where(UserProfile.id == current_user.id)
-            )
-            user = result.scalars().first()
-            if user:
-                user.subscription_status = 'active'
-                user.subscription_start = datetime.utcnow()
-                await db.commit()
-
-            # Set order data for response (subscription doesn't create order)
-            order_data = {
-                'id': None,
-                'order_number': f'SUB-{affiliate_sub.id}',
-                'order_status': 'active',
-                'is_subscription': True
-            }
+        if settings.POST_PAYMENT_INLINE:
+            # Single-process deployments without a worker: run the job now
+            job_queue = JobQueueService()
+            claimed = await job_queue.claim_job(db, job.id, worker_id=f"inline:{default_worker_id()}")
+            if claimed:
+                await job_queue.run_job(db, claimed)
+            job = await job_queue.get_job(db, job.id)
 
-        else:
-            # For server payments, create order
-            from app.schemas.order import OrderCreate
-
-            t2 = time.time()
-            # Get billing cycle from payment transaction (priority: direct column > metadata > error)
-            billing_cycle = payment_transaction.billing_cycle
-            if not billing_cycle:
-                # Fallback to metadata if column is empty
-                billing_cycle = payment_transaction.payment_metadata.get('billing_cycle')
-                if not billing_cycle:
-                    # This should not happen, but default to monthly as last resort
-                    print(f"⚠️  WARNING: No billing_cycle found for payment {payment_transaction.id}, defaulting to monthly")
-                    billing_cycle = 'monthly'
-            
-            print(f"✅ Using billing_cycle: {billing_cycle} for order creation")
-            
-            order_create = OrderCreate(
-                plan_id=plan_id,
-                billing_cycle=billing_cycle,
-                total_amount=payment_transaction.total_amount,
-                status='active',
-                payment_status='paid',
-                payment_method=payment_transaction.payment_method or 'razorpay',
-                razorpay_order_id=payment_transaction.razorpay_order_id,
-                razorpay_payment_id=payment_transaction.razorpay_payment_id,
-                paid_at=payment_transaction.paid_at or datetime.utcnow(),
-                # Pass discount details from metadata
-                discount_amount=Decimal(str(payment_transaction.payment_metadata.get('discount_amount', 0))),
-                promo_code=payment_transaction.payment_metadata.get('promo_code')
-            )
-
-            order = await order_service.create_order(db, current_user.id, order_create)
-            print(f"⏱️  Order creation took {time.time() - t2:.2f}s")
-
-            # Extract order details from the returned dictionary
-            order_data = order.get('order', {}) if isinstance(order, dict) else order
-            order_id = order_data.get('id') if isinstance(order_data, dict) else order_data.id
-
-            # Link payment to order
-            t3 = time.time()
-            await payment_service.link_payment_to_order(
-                db=db,
-                payment_transaction_id=payment_transaction.id,
-                order_id=order_id
-            )
-            print(f"⏱️  Payment linking took {time.time() - t3:.2f}s")
-
-            # Update order with payment details - fetch the actual order object
-            from sqlalchemy import select
-            from app.models.order import Order as OrderModel
-            from app.models.invoice import Invoice as InvoiceModel
-
-            result = await db.execute(
-                select(OrderModel).where(OrderModel.id == order_id)
-            )
-            order_obj = result.scalars().first()
-
-            if order_obj:
-                order_obj.payment_type = payment_transaction.payment_type.value
-                order_obj.activation_type = payment_transaction.activation_type.value
-                order_obj.razorpay_order_id = payment_data.razorpay_order_id
-                order_obj.razorpay_payment_id = payment_data.razorpay_payment_id
-                order_obj.paid_at = payment_transaction.paid_at
-                order_obj.order_status = 'completed'
-                order_obj.payment_status = 'paid'
-                
-                # Save promo code and discount/tax from payment metadata
-                payment_metadata = payment_transaction.payment_metadata or {}
-                order_obj.promo_code = payment_metadata.get('promo_code')
-                if payment_metadata.get('discount_amount') is not None:
-                    order_obj.discount_amount = Decimal(str(payment_metadata.get('discount_amount')))
-                if payment_metadata.get('tax_amount') is not None:
-                    order_obj.tax_amount = Decimal(str(payment_metadata.get('tax_amount')))
-                
-                # 🆕 Ensure service dates are set (if not already set during order creation)
-                if not order_obj.service_start_date or not order_obj.service_end_date:
-                    # Use payment time as service start
-                    service_start = payment_transaction.paid_at or datetime.utcnow()
-                    
-                    # Calculate end date based on billing cycle
-                    billing_cycle = order_obj.billing_cycle or 'monthly'
-                    cycle_days = {
-                        'monthly': 30,
-                        'quarterly': 90,
-                        'semi_annual': 180,
-                        'semi-annually': 180,
-                        'annual': 365,
-                        'annually': 365,
-                        'biennial': 730,
-                        'biennially': 730,
-                        'triennial': 1095,
-                        'triennially': 1095,
-                        'one_time': 30
-                    }
-                    days = cycle_days.get(billing_cycle.lower(), 30)
-                    service_end = service_start + timedelta(days=days)
-                    
-                    order_obj.service_start_date = service_start
-                    order_obj.service_end_date = service_end
-                    
-                    print(f"✅ Service dates set: {service_start.date()} to {service_end.date()} ({billing_cycle})")
-                
-                
-                # Create order_addons records from payment metadata
-                selected_addons = payment_metadata.get('addons', [])
-                if selected_addons:
-                    from app.models.order_addon import OrderAddon
-                    
-                    for addon_data in selected_addons:
-                        # Skip addons with addon_id = 0 (hardcoded/temporary addons)
-                        if addon_data.get('addon_id', 0) == 0:
-                            continue
-                        
-                        try:
-                            # Calculate tax for this addon
-                            subtotal = Decimal(str(addon_data.get('subtotal', 0)))
-                            tax_rate = Decimal('0.18')  # 18% GST
-                            tax_amount = subtotal * tax_rate
-                            total_amount = subtotal + tax_amount
-                            
-                            # Create order_addon record with snapshot
-                            order_addon = OrderAddon(
-                                order_id=order_obj.id,
-                                addon_id=addon_data.get('addon_id'),
-                                addon_name=addon_data.get('addon_name', ''),
-                                addon_category=addon_data.get('category', 'GENERAL'),
-                                addon_description=addon_data.get('description', ''),
-                                quantity=addon_data.get('quantity', 1),
-                                unit_price=Decimal(str(addon_data.get('unit_price', 0))),
-                                subtotal=subtotal,
-                                discount_percent=Decimal('0'),
-                                discount_amount=Decimal('0'),
-                                tax_percent=tax_rate * 100,  # Store as percentage
-                                tax_amount=tax_amount,
-                                total_amount=total_amount,
-                                billing_type='monthly',  # Default
-                                currency='INR',
-                                unit_label=addon_data.get('unit_label', ''),
-                                is_active=1
-                            )
-                            db.add(order_addon)
-                            
-                        except Exception as addon_error:
-                            print(f"Warning: Failed to create order_addon for {addon_data.get('addon_name')}: {str(addon_error)}")
-                            # Continue processing other addons
-                    
-                    # Commit addon records
-                    await db.flush()
-
-
-                # Update associated invoice
-                invoice_result = await db.execute(
-                    select(InvoiceModel).where(InvoiceModel.order_id == order_id)
-                )
-                invoice_obj = invoice_result.scalars().first()
-                if invoice_obj:
-                    invoice_obj.payment_status = 'paid'
-                    invoice_obj.status = 'paid'
-                    invoice_obj.amount_paid = invoice_obj.total_amount
-                    invoice_obj.balance_due = 0
-                    invoice_obj.payment_date = payment_transaction.paid_at
-                    invoice_obj.paid_at = payment_transaction.paid_at
-                    invoice_obj.payment_method = 'razorpay'
-                    invoice_obj.payment_reference = payment_data.razorpay_payment_id
-
-                await db.commit()
-
-        # Distribute commission if applicable (skip for subscription payments)
-        commission_earnings = []
-        if payment_transaction.requires_commission() and payment_transaction.payment_type != PaymentType.SUBSCRIPTION:
-            t4 = time.time()
-            commission_earnings = await commission_service.distribute_commission(
-                db=db,
-                payment_transaction_id=payment_transaction.id
-            )
-            print(f"⏱️  Commission distribution took {time.time() - t4:.2f}s")
-
-        # 🆕 Auto-create server if this is a server purchase
-        server_created = None
-        if payment_transaction.payment_type == PaymentType.SERVER and plan_id:
-            try:
-                t5 = time.time()
-                from app.services.server_service import ServerService
-                from app.schemas.server import ServerCreate
-                from sqlalchemy import select
-                from app.models.plan import HostingPlan
-
-                server_service = ServerService()
-
-                # Get plan details
-                result = await db.execute(select(HostingPlan).filter(HostingPlan.id == plan_id))
-                plan = result.scalar_one_or_none()
-
-                if plan:
-                    # Extract server config from payment metadata
-                    server_metadata = payment_transaction.payment_metadata or {}
-
-                    server_data = ServerCreate(
-                        server_name=server_metadata.get('server_name', f'{plan.name} Server'),
-                        hostname=server_metadata.get('hostname', f'server-{current_user.id}-{order_id}.bidua.com'),
-                        server_type='VPS',
-                        operating_system=server_metadata.get('os', 'Ubuntu 22.04 LTS'),
-                        vcpu=plan.cpu_cores,
-                        ram_gb=plan.ram_gb,
-                        storage_gb=plan.storage_gb,
-                        bandwidth_gb=plan.bandwidth_gb or 1000,
-                        plan_id=plan.id,
-                        monthly_cost=plan.base_price,
-                        billing_cycle=order_obj.billing_cycle  # 🆕 Pass billing cycle from order
-                    )
-
-                    # 🆕 Use order service dates for server if available
-                    server_created_date = order_obj.service_start_date or datetime.utcnow()
-                    server_expiry_date = order_obj.service_end_date
-
-                    # Create server with order_id and dates to link them
-                    created_server = await server_service.create_user_server(
-                        db,
-                        current_user.id,
-                        server_data,
-                        order_id=order_obj.id,
-                        created_date=server_created_date,  # 🆕 Pass order start date
-                        expiry_date=server_expiry_date  # 🆕 Pass order end date
-                    )
-                    print(f"✅ Server created: {created_server.id} for order {order_obj.id}")
-                    print(f"🗓️ Server dates: {server_created_date.date()} to {server_expiry_date.date() if server_expiry_date else 'N/A'}")
-                    server_created = created_server # Assign to server_created for response
-                    print(f"⏱️  Server creation took {time.time() - t5:.2f}s")
-            except Exception as e:
-                print(f"❌ Server creation failed: {str(e)}")
-                print(f"⏱️  Failed server creation took {time.time() - t5:.2f}s")
-                # Don't fail payment verification, but log the error
-                import traceback
-                traceback.print_exc()
-
-        # 🆕 Auto-activate affiliate subscription after server purchase
-        affiliate_activated = False
-        if payment_transaction.payment_type == PaymentType.SERVER:
-            try:
-                t6 = time.time()
-                from app.services.affiliate_service import AffiliateService
-                affiliate_service = AffiliateService()
-
-                # Activate affiliate subscription (free with server purchase)
-                affiliate_sub = await affiliate_service.check_and_activate_from_server_purchase(db, current_user.id)
-                affiliate_activated = affiliate_sub is not None
-                if affiliate_activated:
-                    print(f"✅ Affiliate subscription activated for user {current_user.id}")
-                print(f"⏱️  Affiliate activation took {time.time() - t6:.2f}s")
-            except Exception as e:
-                print(f"❌ Affiliate activation failed: {str(e)}")
-                import traceback
-                traceback.print_exc()
-
-        print(f"✅ Total payment verification took {time.time() - start_time:.2f}s")
-
-        # Build response based on payment type
-        response = {
+        return _build_verify_response(payment_transaction, payment_data, job)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Payment verification failed: {str(e)}"
+        )
+
+
+def _build_verify_response(payment_transaction, payment_data: VerifyPaymentRequest, job) -> Dict[str, Any]:
+    """Response for /verify-payment; order/server fields fill in once the job has run."""
+    outcome = job.result or {}
+    done = job.status == JobStatus.SUCCEEDED
+    payment_for = (payment_transaction.payment_metadata or {}).get('payment_for')
+
+    processing = {
+        "job_id": job.id,
+        "status": job.status.value,
+        "completed_stages": job.completed_stages or [],
+    }
+
+    if payment_for == 'invoice':
+        return {
             "success": True,
-            "message": "Payment verified successfully! Welcome to BIDUA Hosting Affiliate Program!" if payment_transaction.payment_type == PaymentType.SUBSCRIPTION else "Payment verified and processed successfully",
+            "message": "Invoice payment verified successfully",
             "payment": {
                 "transaction_id": payment_transaction.id,
-                "payment_id": payment_data.razorpay_payment_id,
+                "razorpay_payment_id": payment_data.razorpay_payment_id,
                 "amount": float(payment_transaction.total_amount),
-                "status": payment_transaction.payment_status.value,
-                "payment_type": payment_transaction.payment_type.value,
-                "payment_method": payment_transaction.payment_method
-            }
+                "status": "paid",
+                "invoice_id": (payment_transaction.payment_metadata or {}).get('invoice_id')
+            },
+            "processing": processing
         }
 
-        # Add order info if available
-        if order_data:
-            response["order"] = {
-                "id": order_data.get('id') if isinstance(order_data, dict) else order_data.id,
-                "order_number": order_data.get('order_number') if isinstance(order_data, dict) else order_data.order_number,
-                "status": order_data.get('order_status') if isinstance(order_data, dict) else order_data.order_status,
-                "is_subscription": order_data.get('is_subscription', False)
-            }
-
-        # Add commission info for server payments
-        if payment_transaction.payment_type != PaymentType.SUBSCRIPTION:
-            response["commission"] = {
-                "distributed": payment_transaction.commission_distributed,
-                "earnings_count": len(commission_earnings),
-                "total_distributed": sum(float(e.commission_amount) for e in commission_earnings)
-            }
-
-        # Add server info for server payments
-        if payment_transaction.payment_type == PaymentType.SERVER:
-            response["server"] = {
-                "created": server_created is not None,
-                "server_id": server_created.id if server_created else None,
-                "hostname": server_created.hostname if server_created else None
-            }
-            response["affiliate"] = {
-                "activated": affiliate_activated
-            }
-
-        # Add affiliate info for subscription payments
-        if payment_transaction.payment_type == PaymentType.SUBSCRIPTION:
-            response["affiliate"] = {
-                "activated": True,
-                "subscription_type": "premium",
-                "message": "🎉 Your affiliate account is now active! Start referring and earning today!"
-            }
-
-        # Add transaction details for invoice display
-        response["transaction"] = {
+    is_subscription = payment_transaction.payment_type == PaymentType.SUBSCRIPTION
+    response = {
+        "success": True,
+        "message": "Payment verified successfully! Welcome to BIDUA Hosting Affiliate Program!" if is_subscription else "Payment verified and processed successfully",
+        "payment": {
+            "transaction_id": payment_transaction.id,
             "payment_id": payment_data.razorpay_payment_id,
-            "transaction_date": payment_transaction.paid_at.isoformat() if payment_transaction.paid_at else datetime.utcnow().isoformat(),
-            "gateway": "Razorpay",
             "amount": float(payment_transaction.total_amount),
-            "transaction_id": payment_transaction.id,
-            "payment_method": payment_transaction.payment_method or "razorpay"
+            "status": payment_transaction.payment_status.value,
+            "payment_type": payment_transaction.payment_type.value,
+            "payment_method": payment_transaction.payment_method
+        },
+        "processing": processing
+    }
+
+    if is_subscription:
+        response["order"] = {
+            "id": None,
+            "order_number": outcome.get('order_number'),
+            "status": 'active' if done else 'processing',
+            "is_subscription": True
+        }
+        response["affiliate"] = {
+            "activated": True,
+            "subscription_type": "premium",
+            "message": "🎉 Your affiliate account is now active! Start referring and earning today!"
+        }
+    else:
+        response["order"] = {
+            "id": outcome.get('order_id'),
+            "order_number": outcome.get('order_number'),
+            "status": 'completed' if outcome.get('order_id') else 'processing',
+            "is_subscription": False
+        }
+        response["commission"] = outcome.get('commission') or {
+            "distributed": payment_transaction.commission_distributed,
+            "earnings_count": 0,
+            "total_distributed": 0.0
+        }
+        response["server"] = {
+            "created": outcome.get('server_id') is not None,
+            "server_id": outcome.get('server_id'),
+            "hostname": outcome.get('hostname'),
+            "pending": not done
+        }
+        response["affiliate"] = {
+            "activated": bool(outcome.get('affiliate_activated'))
         }
 
-        return response
+    response["transaction"] = {
+        "payment_id": payment_data.razorpay_payment_id,
+        "transaction_date": payment_transaction.paid_at.isoformat() if payment_transaction.paid_at else datetime.utcnow().isoformat(),
+        "gateway": "Razorpay",
+        "amount": float(payment_transaction.total_amount),
+        "transaction_id": payment_transaction.id,
+        "payment_method": payment_transaction.payment_method or "razorpay"
+    }
 
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Payment verification failed: {str(e)}"
-        )
+    return response
 
 
-# --------------------------------------------------------
-# ✅ Razorpay Webhook Handler
-# --------------------------------------------------------
 @router.post("/razorpay-webhook")
 async def razorpay_webhook(
     request: Request,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
-    x_razorpay_signature: Optional[str] = Header(None)
+    x_razorpay_signature: Optional[str] = Header(None),
+    x_razorpay_event_id: Optional[str] = Header(None)
 ):
     """
-    Handle Razorpay webhooks for payment events
+    Receive Razorpay webhooks (payment.captured, payment.failed, order.paid, ...)
 
-    This is called by Razorpay for events like:
-    - payment.authorized
-    - payment.captured
-    - payment.failed
-    - order.paid
+    Only verifies the signature and stores the raw event, keyed by
+    X-Razorpay-Event-Id so redeliveries are dropped. Events are applied in
+    batches by the job worker (see app/services/webhook_ingestion_service.py).
     """
-    payment_service = PaymentService()
-    commission_service = CommissionService()
+    # Signature is computed over the raw body, so verify before parsing
+    raw_body = await request.body()
 
-    try:
-        # Get webhook payload
-        payload = await request.json()
+    from app.services.razorpay_service import RazorpayService
+    razorpay_service = RazorpayService()
 
-        # Verify webhook signature
-        from app.services.razorpay_service import RazorpayService
-        razorpay_service = RazorpayService()
+    is_valid = await razorpay_service.process_webhook(
+        payload=raw_body,
+        signature=x_razorpay_signature
+    )
+
+    if not is_valid:
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
 
-        is_valid = await razorpay_service.process_webhook(
-            payload=payload,
-            signature=x_razorpay_signature
+    try:
+        event, duplicate = await WebhookIngestionService().ingest(
+            db=db,
+            raw_body=raw_body,
+            event_id_header=x_razorpay_event_id
         )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    except Exception as e:
+        # Non-2xx makes Razorpay redeliver, which is what we want if the insert failed
+        print(f"❌ Webhook ingestion error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Webhook could not be stored")
 
-        if not is_valid:
-            raise HTTPException(status_code=400, detail="Invalid webhook signature")
-
-        # Process webhook event
-        event = payload.get('event')
-
-        if event == 'payment.captured':
-            # Payment was successful
-            payment_entity = payload.get('payload', {}).get('payment', {}).get('entity', {})
-            order_id = payment_entity.get('order_id')
-            payment_id = payment_entity.get('id')
-
-            # Find and update payment transaction
-            payment_transaction = await payment_service.get_payment_by_razorpay_order_id(
-                db=db,
-                razorpay_order_id=order_id
-            )
-
-            if payment_transaction and payment_transaction.payment_status == PaymentStatus.INITIATED:
-                payment_transaction.razorpay_payment_id = payment_id
-                payment_transaction.payment_status = PaymentStatus.PAID
-                payment_transaction.paid_at = datetime.utcnow()
-                await db.commit()
-
-                # Trigger commission distribution if needed
-                if payment_transaction.requires_commission():
-                    await commission_service.distribute_commission(
-                        db=db,
-                        payment_transaction_id=payment_transaction.id
-                    )
-
-        elif event == 'payment.failed':
-            # Payment failed
-            payment_entity = payload.get('payload', {}).get('payment', {}).get('entity', {})
-            order_id = payment_entity.get('order_id')
-            error_description = payment_entity.get('error_description', 'Payment failed')
-
-            await payment_service.mark_payment_failed(
-                db=db,
-                razorpay_order_id=order_id,
-                reason=error_description
-            )
-
-        return {"status": "success", "event": event}
+    if settings.WEBHOOK_DRAIN_INLINE and not duplicate:
+        # No worker deployed: apply after the response has been sent
+        background_tasks.add_task(drain_webhook_events)
 
-    except Exception as e:
-        print(f"❌ Webhook processing error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "success",
+        "event": event["event_type"],
+        "event_id": event["event_id"],
+        "duplicate": duplicate
+    }
 
 
 # --------------------------------------------------------
@@ -872,7 +458,7 @@ async def get_payment_status(
     if payment_transaction.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    return {
+    response = {
         "success": True,
         "payment": {
             "id": payment_transaction.id,
@@ -886,4 +472,22 @@ async def get_payment_status(
             "created_at": payment_transaction.created_at.isoformat(),
             "paid_at": payment_transaction.paid_at.isoformat() if payment_transaction.paid_at else None
         }
-    }
\ No newline at end of file
+    }
+
+    # Progress of the post-payment pipeline (order, commission, server)
+    job = await JobQueueService().get_job_by_dedupe_key(
+        db, PostPaymentPipeline.dedupe_key(payment_transaction)
+    )
+    if job:
+        outcome = job.result or {}
+        response["payment"]["order_id"] = outcome.get('order_id') or payment_transaction.order_id
+        response["processing"] = {
+            "job_id": job.id,
+            "status": job.status.value,
+            "completed_stages": job.completed_stages or [],
+            "attempts": job.attempts,
+            "server_id": outcome.get('server_id'),
+            "last_error": job.last_error if job.status == JobStatus.DEAD else None
+        }
+
+    return response
\ No newline at end of file
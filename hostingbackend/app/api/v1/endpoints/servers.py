@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.permissions import UserAccess
+from app.core.security import get_current_user, get_current_principal, get_user_access
+from app.core.user_cache import UserPrincipal
 from app.services.server_service import ServerService
 from app.schemas.server import Server, ServerCreate, ServerUpdate, ServerAction
 from app.schemas.users import User
@@ -15,11 +17,12 @@ router = APIRouter()
 @router.get("/")
 async def get_servers(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_principal),
+    access: UserAccess = Depends(get_user_access),
     server_service: ServerService = Depends()
 ):
     """Get servers - users see their own, admins see all"""
-    if current_user.role in ["admin", "super_admin"]:
+    if access.is_admin:
         # Admin: Return all servers
         return await server_service.get_all_servers(db)
     else:
@@ -66,10 +69,11 @@ async def update_server(
     server_update: ServerUpdate,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     server_service: ServerService = Depends()
 ):
     """Update server (requires login)"""
-    if current_user.role in ["admin", "super_admin"]:
+    if access.is_admin:
         server = await server_service.update_server(db, server_id, server_update)
     else:
         server = await server_service.update_user_server(db, current_user.id, server_id, server_update)
@@ -89,10 +93,11 @@ async def server_action(
     action: ServerAction,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     server_service: ServerService = Depends()
 ):
     """Perform server actions (requires login)"""
-    if current_user.role in ["admin", "super_admin"]:
+    if access.is_admin:
         success = await server_service.perform_server_action(db, server_id, action.action)
     else:
         success = await server_service.perform_user_server_action(db, current_user.id, server_id, action.action)
@@ -111,10 +116,11 @@ async def delete_server(
     server_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     server_service: ServerService = Depends()
 ):
     """Delete server (requires login)"""
-    if current_user.role in ["admin", "super_admin"]:
+    if access.is_admin:
         success = await server_service.delete_server(db, server_id)
     else:
         success = await server_service.delete_user_server(db, current_user.id, server_id)
@@ -132,11 +138,12 @@ async def delete_server(
 async def get_server_status(
     server_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: UserPrincipal = Depends(get_current_principal),
+    access: UserAccess = Depends(get_user_access),
     server_service: ServerService = Depends()
 ):
     """Get server status (requires login)"""
-    if current_user.role in ["admin", "super_admin"]:
+    if access.is_admin:
         server = await server_service.get_server_by_id(db, server_id)
     else:
         server = await server_service.get_user_server(db, current_user.id, server_id)
@@ -5,7 +5,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
 from app.core.database import get_db
-from app.core.security import get_current_user, get_current_admin_user
+from app.core.permissions import UserAccess
+from app.core.security import get_current_user, get_current_admin_user, get_user_access
 from app.services.support_service import SupportService
 from app.schemas.support import SupportTicket, SupportTicketCreate, SupportTicketUpdate, SupportTicketWithUser
 from app.schemas.users import User
@@ -46,12 +47,13 @@ async def get_ticket(
     ticket_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     support_service: SupportService = Depends()
 ):
     """
     Get support ticket by ID
     """
-    if current_user.role in ["admin", "super_admin"]:
+    if access.is_admin:
         ticket = support_service.get_ticket_by_id(db, ticket_id)
     else:
         ticket = support_service.get_user_ticket(db, current_user.id, ticket_id)
@@ -78,12 +80,13 @@ async def update_ticket(
     ticket_update: SupportTicketUpdate,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     support_service: SupportService = Depends()
 ):
     """
     Update support ticket
     """
-    if current_user.role in ["admin", "super_admin"]:
+    if access.is_admin:
         ticket = support_service.update_ticket(db, ticket_id, ticket_update)
     else:
         ticket = support_service.update_user_ticket(db, current_user.id, ticket_id, ticket_update)
@@ -97,12 +100,13 @@ async def close_ticket(
     ticket_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     support_service: SupportService = Depends()
 ):
     """
     Close support ticket
     """
-    if current_user.role in ["admin", "super_admin"]:
+    if access.is_admin:
         success = support_service.close_ticket(db, ticket_id)
     else:
         success = support_service.close_user_ticket(db, current_user.id, ticket_id)
@@ -116,12 +120,13 @@ async def reopen_ticket(
     ticket_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     support_service: SupportService = Depends()
 ):
     """
     Reopen support ticket
     """
-    if current_user.role in ["admin", "super_admin"]:
+    if access.is_admin:
         success = support_service.reopen_ticket(db, ticket_id)
     else:
         success = support_service.reopen_user_ticket(db, current_user.id, ticket_id)
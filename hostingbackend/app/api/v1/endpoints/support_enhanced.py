@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
 from app.core.database import get_db
-from app.core.security import get_current_user, get_current_admin_user
+from app.core.permissions import UserAccess
+from app.core.security import get_current_user, get_current_admin_user, get_user_access
 from app.services.support_service_enhanced import SupportService
 from app.schemas.support import SupportTicketCreate, SupportTicketUpdate
 from app.schemas.ticket_message import TicketMessageCreate, TicketMessage
 from app.schemas.users import User
+from app.utils.pagination import set_next_cursor
 
 router = APIRouter()
 
@@ -17,26 +19,33 @@ router = APIRouter()
 
 @router.get("/tickets")
 async def get_my_tickets(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
     support_service: SupportService = Depends()
 ):
-    """Get current user's support tickets"""
-    return await support_service.get_user_tickets(db, current_user.id, skip=skip, limit=limit, status=status)
+    """Get current user's support tickets (next page cursor in X-Next-Cursor)"""
+    tickets = await support_service.get_user_tickets(
+        db, current_user.id, skip=skip, limit=limit, status=status, cursor=cursor
+    )
+    set_next_cursor(response, tickets, limit)
+    return tickets
 
 @router.get("/tickets/{ticket_number}")
 async def get_ticket_detail(
     ticket_number: str,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     support_service: SupportService = Depends()
 ):
     """Get ticket details with messages"""
     # Check if user owns this ticket or is admin/support
-    if current_user.role in ["admin", "super_admin", "support"]:
+    if access.is_support:
         ticket_obj = await support_service.get_ticket_by_number(db, ticket_number)
     else:
         ticket_obj = await support_service.get_user_ticket_by_number(db, current_user.id, ticket_number)
@@ -49,7 +58,7 @@ async def get_ticket_detail(
         raise HTTPException(status_code=404, detail="Ticket details not found")
     
     # Get messages
-    include_internal = current_user.role in ["admin", "super_admin", "support"]
+    include_internal = access.is_support
     messages = await support_service.get_ticket_messages(db, ticket_obj.id, include_internal=include_internal)
     
     return {
@@ -73,11 +82,12 @@ async def add_ticket_message(
     message_data: TicketMessageCreate,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     support_service: SupportService = Depends()
 ):
     """Add a message/reply to a ticket"""
     # Verify user has access to this ticket
-    if current_user.role in ["admin", "super_admin", "support"]:
+    if access.is_support:
         ticket = await support_service.get_ticket_by_number(db, ticket_number)
         is_staff = True
     else:
@@ -96,10 +106,11 @@ async def update_ticket_status(
     new_status: str,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     support_service: SupportService = Depends()
 ):
     """Update ticket status (user can only close their own tickets)"""
-    if current_user.role in ["admin", "super_admin", "support"]:
+    if access.is_support:
         ticket = await support_service.get_ticket_by_number(db, ticket_number)
     else:
         # Users can only close their own tickets
@@ -123,36 +134,47 @@ async def update_ticket_status(
 
 @router.get("/admin/tickets")
 async def get_all_tickets(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status: Optional[str] = None,
     priority: Optional[str] = None,
     assigned_to: Optional[int] = None,
     department: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin_user),
     support_service: SupportService = Depends()
 ):
-    """Get all support tickets with filters (Admin/Support only)"""
-    return await support_service.get_all_tickets(
+    """Get all support tickets with filters (Admin/Support only; next page cursor in X-Next-Cursor)"""
+    tickets = await support_service.get_all_tickets(
         db, skip=skip, limit=limit, status=status, priority=priority,
-        assigned_to=assigned_to, department=department
+        assigned_to=assigned_to, department=department, cursor=cursor
     )
+    set_next_cursor(response, tickets, limit)
+    return tickets
 
 @router.get("/admin/my-assigned-tickets")
 async def get_my_assigned_tickets(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     status: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
+    access: UserAccess = Depends(get_user_access),
     support_service: SupportService = Depends()
 ):
     """Get tickets assigned to current support employee"""
-    if current_user.role not in ["admin", "super_admin", "support"]:
+    if not access.is_support:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    return await support_service.get_assigned_tickets(db, current_user.id, skip=skip, limit=limit, status=status)
+    tickets = await support_service.get_assigned_tickets(
+        db, current_user.id, skip=skip, limit=limit, status=status, cursor=cursor
+    )
+    set_next_cursor(response, tickets, limit)
+    return tickets
 
 @router.put("/admin/tickets/{ticket_id}/assign")
 async def assign_ticket(
@@ -1,7 +1,7 @@
 
 
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
@@ -9,27 +9,34 @@ from app.core.database import get_db
 from app.core.security import get_current_admin_user
 from app.services.user_service import UserService
 from app.schemas.users import User, UserCreate, UserUpdate, UserStats
+from app.utils.pagination import set_next_cursor
 
 router = APIRouter()
 
 @router.get("/", response_model=List[User])
 async def get_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
     role: Optional[str] = None,
     status: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin_user),
     user_service: UserService = Depends()
 ):
     """
-    Get all users (Admin only)
+    Get all users (Admin only), newest first
+    
+    Pass the X-Next-Cursor header of a page as `cursor` for the next one.
     """
-    return await user_service.get_users(
+    users = await user_service.get_users(
         db, skip=skip, limit=limit,
-        search=search, role=role, status=status
+        search=search, role=role, status=status, cursor=cursor
     )
+    set_next_cursor(response, users, limit)
+    return users
 
 
 @router.get("/stats", response_model=UserStats)
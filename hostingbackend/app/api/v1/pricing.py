@@ -13,8 +13,7 @@ from app.schemas.pricing import (
     PricingQuoteResponse,
 )
 from decimal import Decimal
-from app.models.addon import Addon
-from sqlalchemy import select
+from app.services.catalog_cache import catalog_cache
 
 router = APIRouter(prefix="/pricing", tags=["Pricing"])
 
@@ -121,21 +120,19 @@ async def get_pricing_quote(
     This endpoint is designed to be used by the checkout page so the summary is
     computed on the backend instead of only on the UI.
     """
+    # Plans and addons come from the in-process catalog cache
+    catalog = await catalog_cache.get()
+
     # 1) Fetch plan
-    plan_result = await db.execute(select(HostingPlan).where(HostingPlan.id == payload.plan_id))
-    plan = plan_result.scalar_one_or_none()
+    plan = catalog.plan(payload.plan_id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
 
     # 2) Helper to get addon price by slug with a fallback
     async def addon_price(slug: str, fallback: Decimal) -> Decimal:
-        try:
-            res = await db.execute(select(Addon).where(Addon.slug == slug, Addon.is_active == True))
-            addon = res.scalar_one_or_none()
-            if addon and addon.price is not None:
-                return Decimal(str(addon.price))
-        except Exception:
-            pass
+        addon = catalog.active_addon_by_slug(slug)
+        if addon and addon.price is not None:
+            return Decimal(str(addon.price))
         return Decimal(str(fallback))
 
     qty = max(1, payload.quantity or 1)
@@ -12,12 +12,38 @@ class Settings(BaseSettings):
 
     # 🔹 Database
     DATABASE_URL: str
+    DATABASE_DIRECT_URL: Optional[str] = None  # Postgres bypassing PgBouncer (LISTEN/NOTIFY); defaults to DATABASE_URL
+    DB_POOL_MODE: str = "direct"      # "direct" (Postgres) or "pgbouncer" (transaction pooling)
+    DB_POOL_CLASS: str = "queue"      # "queue" (keep connections) or "null" (connect per checkout)
+    DB_POOL_SIZE: int = 20            # persistent connections per worker (queue pool)
+    DB_MAX_OVERFLOW: int = 40         # burst connections per worker (queue pool)
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_PING_IDLE_SECONDS: float = 30  # Ping a pooled connection on checkout only after this much idleness
+    DB_STATEMENT_CACHE_SIZE: int = 100  # asyncpg prepared statement cache (direct mode; 0 under pgbouncer)
+    DATABASE_REPLICA_URL: Optional[str] = None  # Streaming replica for read-only endpoints (get_read_db)
+    DB_REPLICA_MAX_LAG_SECONDS: float = 5       # Reads fall back to the primary above this replay lag
+    DB_REPLICA_LAG_CHECK_SECONDS: float = 2     # Per-worker lag check interval
+    DB_READ_YOUR_WRITES_SECONDS: float = 10     # Reads after a caller's own commit stay on the primary this long
+    DB_SLOW_QUERY_MS: int = 500       # Statements slower than this are logged with their fingerprint
+    DB_TIMING_HEADER: bool = False    # Send per-request DB time/query count as a Server-Timing header
+    METRICS_TOKEN: Optional[str] = None  # Bearer token required on /metrics when set
 
     # 🔹 Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # 🔹 Auth principal cache (per worker)
+    USER_CACHE_MAX_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 30.0
+    # Trust signed role/status claims on read-only routes (skips the DB entirely)
+    AUTH_TRUST_TOKEN_CLAIMS: bool = False
+
+    # 🔹 RBAC resolver (roles, permissions, departments; per worker)
+    RBAC_CACHE_MAX_SIZE: int = 10000
+    RBAC_CACHE_TTL_SECONDS: float = 300.0  # Backstop reload if a LISTEN notification is missed
+
     # 🔹 CORS - Allow all origins for Replit environment
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
 
@@ -43,6 +69,68 @@ class Settings(BaseSettings):
     APP_NAME: str = "Razorpay Payment Gateway"
     RAZORPAY_KEY_ID: str
     RAZORPAY_KEY_SECRET: str
+    RAZORPAY_API_BASE_URL: str = "https://api.razorpay.com/v1"
+    RAZORPAY_TIMEOUT_SECONDS: float = 10.0
+    RAZORPAY_CONNECT_TIMEOUT_SECONDS: float = 3.0
+    RAZORPAY_MAX_RETRIES: int = 2
+    RAZORPAY_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    RAZORPAY_CIRCUIT_RESET_SECONDS: float = 30.0
+
+    # 🔹 Background jobs
+    POST_PAYMENT_INLINE: bool = False  # Run the post-payment job in the request when no worker is deployed
+    JOB_WORKER_POLL_SECONDS: float = 1.0
+    JOB_WORKER_BATCH_SIZE: int = 10
+    WEBHOOK_DRAIN_BATCH_SIZE: int = 200
+    WEBHOOK_DRAIN_INLINE: bool = False  # Apply webhook events in a background task when no worker is deployed
+
+    # 🔹 Admin dashboard stats snapshot
+    ADMIN_STATS_MAX_STALENESS_SECONDS: int = 60  # Older snapshots are recomputed on read
+    ADMIN_STATS_REFRESH_SECONDS: int = 30        # Worker refresh interval (keep below the staleness bound)
+
+    # 🔹 Affiliate stats
+    AFFILIATE_STATS_RECONCILE_SECONDS: int = 3600  # Worker drift check/repair interval
+
+    # 🔹 Commission engine
+    COMMISSION_BACKFILL_BATCH_SIZE: int = 500      # Orders per INSERT in backfill mode
+    EARNING_SETTLEMENT_BATCH_SIZE: int = 10000     # Earning ids per UPDATE/transaction in bulk approve/pay
+
+    # 🔹 Catalog cache (plans, addons, services, countries, commission rules)
+    CATALOG_CACHE_TTL_SECONDS: int = 300  # Backstop reload if a LISTEN notification is missed
+
+    # 🔹 Ticket attachments
+    ATTACHMENT_MASTER_KEY: Optional[str] = None  # urlsafe base64, 32 bytes; derived from SECRET_KEY if unset
+    ATTACHMENT_CHUNK_SIZE: int = 64 * 1024       # Plaintext bytes per encrypted segment
+    ATTACHMENT_STORAGE_BACKEND: str = "local"    # "local" or "s3" (any S3-compatible store, e.g. MinIO)
+    ATTACHMENT_STORAGE_DIR: str = "storage/attachments"  # Local backend root, outside app/static
+    ATTACHMENT_S3_ENDPOINT_URL: Optional[str] = None
+    ATTACHMENT_S3_BUCKET: Optional[str] = None
+    ATTACHMENT_S3_ACCESS_KEY: Optional[str] = None
+    ATTACHMENT_S3_SECRET_KEY: Optional[str] = None
+    ATTACHMENT_S3_REGION: str = "us-east-1"
+
+    # 🔹 Order / invoice / ticket numbers
+    NUMBER_BLOCK_SIZE: int = 20  # Sequence values reserved per worker round trip
+
+    # 🔹 Bulk order import (resellers, migrations)
+    ORDER_BULK_CREATE_MAX: int = 1000  # Orders per bulk-create request (one transaction)
+
+    # 🔹 Server lifecycle scheduler (renewal invoices, renewals, suspension)
+    SERVER_LIFECYCLE_ENABLED: bool = False        # Off until turned on per deployment: passes suspend and terminate servers
+    SERVER_LIFECYCLE_INTERVAL_SECONDS: int = 300  # Pass interval; also how often non-leaders retry the lock
+    SERVER_LIFECYCLE_BATCH_SIZE: int = 1000       # Servers per statement/transaction
+    SERVER_RENEWAL_LEAD_DAYS: int = 7             # Invoice auto-renewals this long before expiry
+    SERVER_SUSPEND_GRACE_DAYS: int = 3            # Suspend unrenewed servers this long after expiry
+    SERVER_TERMINATE_AFTER_DAYS: int = 30         # Terminate servers this long after they were suspended
+
+    # 🔹 Public response cache (pricing / plans / countries / addons)
+    RESPONSE_CACHE_ENABLED: bool = True                      # Server-side cache; headers and 304s apply regardless
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000                   # Per worker (route + query combinations)
+    RESPONSE_CACHE_TTL_SECONDS: float = 300.0                # Backstop if a catalog notification is missed
+    RESPONSE_CACHE_MAX_AGE_SECONDS: int = 60                 # Browser / CDN freshness for catalog responses
+    RESPONSE_CACHE_STALE_WHILE_REVALIDATE_SECONDS: int = 300 # CDN may serve stale while revalidating
+
+    # 🔹 Revenue rollups
+    REVENUE_ROLLUP_RECONCILE_SECONDS: int = 3600  # Worker rebuild interval for the current and previous month
 
     class Config:
         env_file = ".env"
@@ -1,37 +1,148 @@
+from sqlalchemy import event, text
+from sqlalchemy.exc import DisconnectionError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool
 from app.core.config import settings
+from app.core.db_metrics import InstrumentedNullPool, InstrumentedQueuePool, instrument_engine
+from app.core.db_routing import ReplicaLagMonitor, read_target, track_primary_writes
+from typing import Any, Dict, Optional
+from uuid import uuid4
 import os
+import time
 
 # Get database URL from environment or settings
 DATABASE_URL = os.getenv("DATABASE_URL") or settings.DATABASE_URL
 
-# Convert PostgreSQL URL to async version (postgresql+asyncpg://)
-if DATABASE_URL.startswith("postgresql://"):
-    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
-elif DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+asyncpg://", 1)
-
-# asyncpg doesn't support sslmode parameter - remove it
-if "?sslmode=" in DATABASE_URL:
-    DATABASE_URL = DATABASE_URL.split("?sslmode=")[0]
-elif "&sslmode=" in DATABASE_URL:
-    DATABASE_URL = DATABASE_URL.split("&sslmode=")[0]
-
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=False,
-    future=True,
-
-    # REQUIRED FOR LOAD
-    pool_pre_ping=True,
-    pool_size=20,         # persistent connections
-    max_overflow=40,     # burst connections
-    pool_timeout=30,
-    pool_recycle=1800,
-)
+
+def to_async_url(url: str) -> str:
+    """postgres:// / postgresql:// -> postgresql+asyncpg://, without sslmode."""
+    # Convert PostgreSQL URL to async version (postgresql+asyncpg://)
+    if url.startswith("postgresql://"):
+        url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    elif url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql+asyncpg://", 1)
+
+    # asyncpg doesn't support sslmode parameter - remove it
+    if "?sslmode=" in url:
+        url = url.split("?sslmode=")[0]
+    elif "&sslmode=" in url:
+        url = url.split("&sslmode=")[0]
+    return url
+
+
+DATABASE_URL = to_async_url(DATABASE_URL)
+
+# Postgres itself, bypassing PgBouncer: for LISTEN/NOTIFY and other
+# session-level features that transaction pooling cannot carry
+DATABASE_DIRECT_URL = to_async_url(settings.DATABASE_DIRECT_URL) if settings.DATABASE_DIRECT_URL else DATABASE_URL
+
+
+# -----------------------------------------------------------------------------
+# Deployment modes (DB_POOL_MODE / DB_POOL_CLASS)
+#
+#   direct     App talks to Postgres. Queue pool, asyncpg statement caches on.
+#   pgbouncer  App talks to PgBouncer in transaction pooling mode. Each
+#              transaction may run on a different server connection, so
+#              prepared statements must not outlive it: asyncpg's statement
+#              cache and SQLAlchemy's prepared statement cache are off and
+#              statement names are unique per prepare.
+#
+# DB_POOL_CLASS "queue" keeps client connections open (cheap for PgBouncer,
+# saves a connect + auth per checkout); "null" opens one per checkout and
+# lets PgBouncer do all pooling - use it when workers x pool size would
+# exceed PgBouncer's max_client_conn.
+#
+# Liveness: instead of pool_pre_ping (a round trip on every checkout), a
+# pooled connection is pinged only when it sat idle for more than
+# DB_PING_IDLE_SECONDS; a failed ping discards it and the pool retries with
+# a fresh one. NullPool connections are always fresh and never pinged.
+# -----------------------------------------------------------------------------
+
+DB_POOL_MODES = ("direct", "pgbouncer")
+
+
+def build_engine_options(
+    mode: Optional[str] = None,
+    pool_class: Optional[str] = None,
+) -> Dict[str, Any]:
+    """create_async_engine() keyword arguments for a deployment mode."""
+    mode = mode or settings.DB_POOL_MODE
+    pool_class = pool_class or settings.DB_POOL_CLASS
+    if mode not in DB_POOL_MODES:
+        raise ValueError(f"DB_POOL_MODE must be one of {DB_POOL_MODES}, got {mode!r}")
+    if pool_class not in ("queue", "null"):
+        raise ValueError(f"DB_POOL_CLASS must be 'queue' or 'null', got {pool_class!r}")
+
+    options: Dict[str, Any] = {"echo": False, "future": True}
+
+    if mode == "pgbouncer":
+        options["connect_args"] = {
+            "statement_cache_size": 0,             # asyncpg's own cache
+            "prepared_statement_cache_size": 0,    # SQLAlchemy's asyncpg adapter cache
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    else:
+        options["connect_args"] = {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+
+    if pool_class == "null":
+        options["poolclass"] = InstrumentedNullPool
+    else:
+        # REQUIRED FOR LOAD
+        options.update(
+            poolclass=InstrumentedQueuePool,  # records checkout wait time for /metrics
+            pool_pre_ping=False,              # see install_idle_ping
+            pool_size=settings.DB_POOL_SIZE,          # persistent connections
+            max_overflow=settings.DB_MAX_OVERFLOW,    # burst connections
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    return options
+
+
+def install_idle_ping(async_engine, idle_seconds: Optional[float] = None) -> None:
+    """Ping pooled connections on checkout only after `idle_seconds` of idleness."""
+    idle_seconds = settings.DB_PING_IDLE_SECONDS if idle_seconds is None else idle_seconds
+    dialect = async_engine.sync_engine.dialect
+    pool = async_engine.sync_engine.pool
+    if isinstance(pool, NullPool):
+        return
+
+    @event.listens_for(pool, "checkin")
+    def _checked_in(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(pool, "checkout")
+    def _check_idle(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            dialect.do_ping(dbapi_connection)  # same check as pool_pre_ping
+        except Exception as e:
+            # The pool discards this connection and retries the checkout
+            raise DisconnectionError(f"Idle connection failed ping: {e}") from e
 
 
+def create_engine_for_mode(url: str, mode: Optional[str] = None, pool_class: Optional[str] = None, name: str = "primary"):
+    """Engine with the mode's pool/cache settings, idle ping and /metrics instrumentation."""
+    async_engine = create_async_engine(url, **build_engine_options(mode, pool_class))
+    install_idle_ping(async_engine)
+    instrument_engine(async_engine, name)
+    return async_engine
+
+
+engine = create_engine_for_mode(DATABASE_URL)
+track_primary_writes(engine)
+
+# Streaming replica for read-only endpoints (see app.core.db_routing)
+DATABASE_REPLICA_URL = to_async_url(settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else None
+replica_engine = create_engine_for_mode(DATABASE_REPLICA_URL, name="replica") if DATABASE_REPLICA_URL else None
+replica_monitor = ReplicaLagMonitor(replica_engine) if replica_engine is not None else None
+
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -40,6 +151,15 @@ AsyncSessionLocal = sessionmaker(
     autocommit=False
 )
 
+ReadSessionLocal = sessionmaker(
+    bind=replica_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False,
+    autocommit=False,
+    info={"read_only": True},
+) if replica_engine is not None else None
+
 Base = declarative_base()
 
 async def get_db():
@@ -50,9 +170,41 @@ async def get_db():
         finally:
             await session.close()
 
+async def get_read_db():
+    """
+    Dependency for read-only endpoints: a replica session when a replica is
+    configured, within the lag bound and the caller has no recent write;
+    a primary session otherwise.
+    """
+    factory = AsyncSessionLocal
+    if ReadSessionLocal is not None and read_target(await replica_monitor.healthy()) == "replica":
+        factory = ReadSessionLocal
+    async with factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+def is_read_session(session) -> bool:
+    """True for replica sessions from get_read_db (writes must go to the primary)."""
+    return session.info.get("read_only", False)
+
+# Postgres extensions the models' indexes rely on (pg_trgm search indexes)
+REQUIRED_EXTENSIONS = ("pg_trgm",)
+
+
+def create_extensions(connection) -> None:
+    """CREATE EXTENSION IF NOT EXISTS for REQUIRED_EXTENSIONS (sync connection; no-op off Postgres)."""
+    if connection.dialect.name != "postgresql":
+        return
+    for extension in REQUIRED_EXTENSIONS:
+        connection.execute(text(f"CREATE EXTENSION IF NOT EXISTS {extension}"))
+
+
 async def init_db():
     """Initialize database - create all tables"""
     async with engine.begin() as conn:
+        await conn.run_sync(create_extensions)
         await conn.run_sync(Base.metadata.create_all)
 
 def get_target_metadata():
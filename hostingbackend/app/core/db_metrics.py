@@ -0,0 +1,217 @@
+"""
+Database instrumentation for the async engine.
+
+- Pool: time spent waiting for a connection (`db_pool_checkout_seconds`),
+  checkout timeouts, and size / checked-out / overflow / idle gauges read
+  from the pool at scrape time.
+- Queries: every cursor execution is counted and timed. Inside an HTTP
+  request the totals are also added to that request's `RequestDBStats`
+  (`request.state.db_stats`), which `DBMetricsMiddleware` records per route
+  as `http_request_db_queries` / `http_request_db_seconds` - a route whose
+  query count grows with the page size is an N+1.
+- Slow queries (over DB_SLOW_QUERY_MS) are logged with a fingerprint: the
+  statement with literals and parameters replaced by `?`, hashed, so the
+  same query shape always gets the same id in logs and in
+  `db_slow_queries_total`.
+
+Exposed through `/metrics` (see app.core.metrics).
+"""
+
+import contextvars
+import hashlib
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from starlette.datastructures import MutableHeaders
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+POOL_CHECKOUT_SECONDS = registry.histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a pooled DB connection", ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+POOL_CHECKOUT_TIMEOUTS = registry.counter(
+    "db_pool_checkout_timeouts_total", "Checkouts that gave up after pool_timeout", ["pool"],
+)
+QUERIES = registry.counter("db_queries_total", "SQL statements executed", ["pool"])
+QUERY_SECONDS = registry.histogram("db_query_seconds", "SQL statement execution time", ["pool"])
+SLOW_QUERIES = registry.counter(
+    "db_slow_queries_total", "Statements slower than DB_SLOW_QUERY_MS, by fingerprint", ["pool", "fingerprint"],
+)
+REQUESTS = registry.counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+REQUEST_SECONDS = registry.histogram("http_request_duration_seconds", "HTTP request duration", ["method", "route"])
+REQUEST_QUERIES = registry.histogram(
+    "http_request_db_queries", "SQL statements per HTTP request", ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000),
+)
+REQUEST_DB_SECONDS = registry.histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per HTTP request", ["method", "route"],
+)
+
+_pools: List[Tuple[str, QueuePool]] = []
+
+
+def _pool_gauge(read):
+    def collect() -> Dict[Tuple[str, ...], float]:
+        return {(name,): read(pool) for name, pool in _pools}
+    return collect
+
+
+registry.gauge("db_pool_size", "Configured pool_size", ["pool"], collect=_pool_gauge(lambda p: p.size()))
+registry.gauge("db_pool_checked_out", "Connections in use", ["pool"], collect=_pool_gauge(lambda p: p.checkedout()))
+registry.gauge("db_pool_overflow", "Connections open beyond pool_size", ["pool"], collect=_pool_gauge(lambda p: max(p.overflow(), 0)))
+registry.gauge("db_pool_idle", "Idle connections in the pool", ["pool"], collect=_pool_gauge(lambda p: p.checkedin()))
+
+
+class _TimedCheckout:
+    """Pool mixin that records how long each checkout waited (incl. connecting)."""
+
+    metrics_name = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.inc(pool=self.metrics_name)
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start, pool=self.metrics_name)
+
+
+class InstrumentedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+class InstrumentedNullPool(_TimedCheckout, NullPool):
+    """NullPool: every checkout opens a connection, so this times connect + auth."""
+
+
+# ==================== Query accounting ====================
+
+@dataclass
+class RequestDBStats:
+    queries: int = 0
+    seconds: float = 0.0
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestDBStats]] = contextvars.ContextVar("request_db_stats", default=None)
+
+
+def current_request_db_stats() -> Optional[RequestDBStats]:
+    return _request_stats.get()
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"\$\d+|%\(\w+\)s|(?<![:\w]):\w+")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_REPEATED_ROWS = re.compile(r"(\(\?\.\.\.\))(?:\s*,\s*\(\?\.\.\.\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """Statement shape: literals and bind parameters as `?`, IN lists and VALUES rows collapsed."""
+    text = _STRING_LITERAL.sub("?", statement)
+    text = _PARAMETER.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _VALUE_LIST.sub("(?...)", text)
+    text = _REPEATED_ROWS.sub(r"\1, ...", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def statement_fingerprint(statement: str) -> str:
+    return hashlib.sha1(normalize_statement(statement).encode()).hexdigest()[:12]
+
+
+def instrument_engine(engine, name: str = "primary") -> None:
+    """Attach query/pool instrumentation to an AsyncEngine (call once per engine)."""
+    sync_engine = engine.sync_engine
+    pool = sync_engine.pool
+    if isinstance(pool, _TimedCheckout):
+        pool.metrics_name = name
+    if isinstance(pool, QueuePool):
+        _pools.append((name, pool))
+
+    slow_seconds = settings.DB_SLOW_QUERY_MS / 1000.0
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+
+        QUERIES.inc(pool=name)
+        QUERY_SECONDS.observe(elapsed, pool=name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+
+        if elapsed >= slow_seconds:
+            fingerprint = statement_fingerprint(statement)
+            SLOW_QUERIES.inc(pool=name, fingerprint=fingerprint)
+            print(f"🐢 Slow query {elapsed * 1000:.0f}ms [{fingerprint}] {normalize_statement(statement)[:500]}")
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        if exception_context.connection is not None:
+            exception_context.connection.info.pop("query_started", None)
+
+
+# ==================== Per-route middleware ====================
+
+class DBMetricsMiddleware:
+    """
+    ASGI middleware: per-request DB query count and time, recorded per route
+    template (e.g. `/api/v1/orders/{order_id}`) so label cardinality stays
+    bounded. With DB_TIMING_HEADER the totals are also sent as a
+    `Server-Timing: db;dur=...` response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDBStats()
+        token = _request_stats.set(stats)
+        scope.setdefault("state", {})["db_stats"] = stats
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.DB_TIMING_HEADER:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", f'db;dur={stats.seconds * 1000:.1f};desc="{stats.queries} queries"'
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "other"
+            method = scope["method"]
+            REQUESTS.inc(method=method, route=route, status=str(status_code))
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, route=route)
+            REQUEST_QUERIES.observe(stats.queries, method=method, route=route)
+            REQUEST_DB_SECONDS.observe(stats.seconds, method=method, route=route)
@@ -0,0 +1,164 @@
+"""
+Read/write session routing between the primary and a streaming replica.
+
+Read-only endpoints depend on `get_read_db` (app.core.database), which hands
+out a replica session unless one of these sends the read to the primary:
+
+- no replica is configured (DATABASE_REPLICA_URL unset)
+- the replica is lagging more than DB_REPLICA_MAX_LAG_SECONDS, or the lag
+  check failed (checked at most every DB_REPLICA_LAG_CHECK_SECONDS per worker)
+- read-your-writes: the caller committed on the primary within the last
+  DB_READ_YOUR_WRITES_SECONDS
+
+Read-your-writes has to work across workers, so the client carries it:
+when a request commits on the primary, `ReadYourWritesMiddleware` answers
+with a `primary_until` cookie and an `X-Primary-Until` header (epoch
+seconds). Requests presenting either one before that time read from the
+primary. Keep the window above the replica's usual lag.
+"""
+
+import asyncio
+import contextvars
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, text
+from starlette.datastructures import MutableHeaders
+from starlette.requests import cookie_parser
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+PRIMARY_UNTIL_COOKIE = "primary_until"
+PRIMARY_UNTIL_HEADER = "X-Primary-Until"
+
+READ_SESSIONS = registry.counter(
+    "db_read_sessions_total", "get_read_db sessions by target and routing reason", ["target", "reason"],
+)
+
+
+@dataclass
+class RequestRouting:
+    primary_until: float = 0.0  # presented by the client
+    wrote: bool = False         # this request committed on the primary
+
+
+_routing: contextvars.ContextVar[Optional[RequestRouting]] = contextvars.ContextVar("db_routing", default=None)
+
+
+def read_your_writes_pending() -> bool:
+    routing = _routing.get()
+    return routing is not None and (routing.wrote or routing.primary_until > time.time())
+
+
+def track_primary_writes(engine) -> None:
+    """Flag the current request whenever a transaction commits on `engine`."""
+
+    @event.listens_for(engine.sync_engine, "commit")
+    def _on_commit(conn):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+
+
+class ReplicaLagMonitor:
+    """Cached replication lag of one replica engine (per worker)."""
+
+    LAG_SQL = text(
+        "SELECT CASE "
+        "WHEN NOT pg_is_in_recovery() THEN 0 "
+        "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    )
+
+    def __init__(self, engine, max_lag_seconds: Optional[float] = None, check_interval: Optional[float] = None):
+        self.engine = engine
+        self.max_lag = settings.DB_REPLICA_MAX_LAG_SECONDS if max_lag_seconds is None else max_lag_seconds
+        self.check_interval = settings.DB_REPLICA_LAG_CHECK_SECONDS if check_interval is None else check_interval
+        self.lag: Optional[float] = None  # None = unknown / check failed
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        registry.gauge(
+            "db_replica_lag_seconds", "Replica replay lag at the last check (-1 = unknown)", [],
+            collect=lambda: {(): self.lag if self.lag is not None else -1},
+        )
+
+    async def healthy(self) -> bool:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            async with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    await self._check()
+        return self.lag is not None and self.lag <= self.max_lag
+
+    async def _check(self) -> None:
+        try:
+            async with self.engine.connect() as conn:
+                lag = (await conn.execute(self.LAG_SQL)).scalar()
+            self.lag = float(lag) if lag is not None else None
+        except Exception as e:
+            print(f"⚠️ Replica lag check failed: {e}")
+            self.lag = None
+        self._checked_at = time.monotonic()
+
+
+def read_target(monitor_healthy: bool) -> str:
+    """Record and return 'replica' or 'primary' for one read session."""
+    if read_your_writes_pending():
+        READ_SESSIONS.inc(target="primary", reason="read_your_writes")
+        return "primary"
+    if not monitor_healthy:
+        READ_SESSIONS.inc(target="primary", reason="replica_lag")
+        return "primary"
+    READ_SESSIONS.inc(target="replica", reason="ok")
+    return "replica"
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware carrying the read-your-writes window in a cookie/header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        routing = RequestRouting(primary_until=self._presented_until(scope))
+        token = _routing.set(routing)
+
+        async def send_with_window(message):
+            if message["type"] == "http.response.start" and routing.wrote:
+                window = int(settings.DB_READ_YOUR_WRITES_SECONDS)
+                until = int(time.time()) + window
+                headers = MutableHeaders(scope=message)
+                secure = "; Secure" if scope.get("scheme") == "https" else ""
+                headers.append(
+                    "Set-Cookie",
+                    f"{PRIMARY_UNTIL_COOKIE}={until}; Max-Age={window}; Path=/; HttpOnly; SameSite=Lax{secure}",
+                )
+                headers[PRIMARY_UNTIL_HEADER] = str(until)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_window)
+        finally:
+            _routing.reset(token)
+
+    @staticmethod
+    def _presented_until(scope) -> float:
+        values = []
+        for name, value in scope.get("headers", []):
+            if name == b"cookie":
+                values.append(cookie_parser(value.decode("latin-1")).get(PRIMARY_UNTIL_COOKIE))
+            elif name == PRIMARY_UNTIL_HEADER.lower().encode():
+                values.append(value.decode("latin-1"))
+        until = 0.0
+        for value in values:
+            try:
+                until = max(until, float(value))
+            except (TypeError, ValueError):
+                continue
+        return until
@@ -0,0 +1,74 @@
+"""
+Leader election over a Postgres advisory lock.
+
+Every process (uvicorn worker, job worker) may run the same periodic task;
+`AdvisoryLeader.ensure()` returns True only in the process currently
+holding `pg_try_advisory_lock(hashtext(name))`.
+
+The lock is session-level, so it is held on a dedicated asyncpg connection
+to DATABASE_DIRECT_URL (around PgBouncer: in transaction pooling the server
+connection behind a session-level lock is shared with other clients and the
+lock would leak to them). If the leader dies or its connection drops,
+Postgres releases the lock and the next `ensure()` elsewhere takes over.
+"""
+
+import asyncio
+from typing import Optional
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.core.database import DATABASE_DIRECT_URL, engine
+
+
+class AdvisoryLeader:
+    def __init__(self, name: str):
+        self.name = name
+        self._conn: Optional[asyncpg.Connection] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_leader(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    async def ensure(self) -> bool:
+        """True if this process is (still, or now) the leader."""
+        # Without Postgres there is nothing to coordinate with (local development)
+        if engine.dialect.name != "postgresql":
+            return True
+
+        async with self._lock:
+            if self.is_leader:
+                try:
+                    await self._conn.fetchval("SELECT 1")
+                    return True
+                except Exception as e:
+                    print(f"⚠️ Leader connection for {self.name} lost: {e}")
+                    await self._close()
+
+            dsn = make_url(DATABASE_DIRECT_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                if await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", self.name):
+                    self._conn = conn
+                    print(f"👑 Became leader for {self.name}")
+                    return True
+            except Exception as e:
+                print(f"⚠️ Leader election for {self.name} failed: {e}")
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+            return False
+
+    async def release(self) -> None:
+        async with self._lock:
+            await self._close()
+
+    async def _close(self) -> None:
+        # Closing the session releases the advisory lock
+        if self._conn is not None and not self._conn.is_closed():
+            try:
+                await self._conn.close()
+            except Exception:
+                self._conn.terminate()
+        self._conn = None
@@ -0,0 +1,357 @@
+"""
+Per-worker RBAC resolver.
+
+Routers used to authorize by comparing `current_user.role` with string
+lists. `permission_resolver.resolve()` turns a user into a `UserAccess`
+with a frozen permission set, so a check is one set lookup:
+
+- Roles (`roles` -> `role_permissions` -> `permissions`) and departments
+  are loaded once per worker into an `RbacSnapshot` (three queries).
+- Per user, the `user_roles` / `user_departments` membership is loaded
+  once (two indexed queries) and cached with a TTL + LRU bound, like the
+  auth principal cache (app.core.user_cache).
+- A user's legacy `UserProfile.role` string counts as one more role
+  code (see LEGACY_ROLE_CODES). BUILTIN_PERMISSIONS is granted on top of
+  whatever `role_permissions` holds (ADMIN and SUPER_ADMIN always hold
+  "*"), so the old role-string checks keep passing on unseeded databases.
+
+Invalidation follows the catalog cache: any flush touching roles,
+permissions or departments (or a user's role / department membership)
+issues `pg_notify('rbac_changed', ...)` in the same transaction and every
+worker's listener drops the affected entries; the TTL bounds staleness
+while a listener is down. Raw writes to `user_roles` / `role_permissions`
+must call `permission_resolver.invalidate()` themselves.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Tuple
+
+import asyncpg
+from sqlalchemy import event, inspect as sa_inspect, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import DATABASE_DIRECT_URL, AsyncSessionLocal, engine
+from app.models.roles import Department, Permission, Role, UserDepartment, role_permissions, user_roles
+from app.models.users import UserProfile
+
+
+RBAC_CHANNEL = "rbac_changed"
+RBAC_MODELS = (Role, Permission, Department)
+
+LISTENER_RETRY_SECONDS = 5
+
+ALL_PERMISSIONS = "*"
+ADMIN_PERMISSION = "admin.access"
+SUPPORT_PERMISSION = "ticket.update"
+
+# `UserProfile.role` strings that differ from their role code
+LEGACY_ROLE_CODES = {
+    "user": "CUSTOMER",
+    "customer": "CUSTOMER",
+    "support": "SUPPORT_AGENT",
+    "sales": "SALES_EXEC",
+    "billing": "BILLING_SPECIALIST",
+}
+
+# Floor for the legacy role strings, whatever the RBAC tables say
+BUILTIN_PERMISSIONS: Dict[str, FrozenSet[str]] = {
+    "SUPER_ADMIN": frozenset({ALL_PERMISSIONS}),
+    "ADMIN": frozenset({ALL_PERMISSIONS}),
+    "SUPPORT_AGENT": frozenset({"ticket.read", "ticket.update", "user.read", "server.read", "billing.read"}),
+}
+
+
+def role_code(role: Optional[str]) -> str:
+    role = (role or "").strip()
+    return LEGACY_ROLE_CODES.get(role.lower(), role.upper())
+
+
+@dataclass(frozen=True)
+class UserAccess:
+    """Resolved roles, permissions and departments of one user."""
+    user_id: int
+    role: str
+    role_codes: FrozenSet[str]
+    permissions: FrozenSet[str]
+    department_ids: Tuple[int, ...] = ()
+    primary_department_id: Optional[int] = None
+
+    def can(self, *codes: str) -> bool:
+        """True if the user holds any of `codes` ("*" and "<resource>.manage" imply the rest)."""
+        if ALL_PERMISSIONS in self.permissions:
+            return True
+        for code in codes:
+            if code in self.permissions or f"{code.split('.', 1)[0]}.manage" in self.permissions:
+                return True
+        return False
+
+    @property
+    def is_admin(self) -> bool:
+        return self.can(ADMIN_PERMISSION)
+
+    @property
+    def is_support(self) -> bool:
+        return self.can(SUPPORT_PERMISSION)
+
+
+@dataclass
+class RbacSnapshot:
+    version: int
+    loaded_at: float
+    role_permissions: Dict[str, FrozenSet[str]] = field(default_factory=dict)  # active roles by code
+    role_codes: Dict[int, str] = field(default_factory=dict)                    # active roles by id
+    departments: Dict[int, Department] = field(default_factory=dict)
+
+    def permissions_for(self, codes: Iterable[str]) -> FrozenSet[str]:
+        granted = set()
+        for code in codes:
+            granted |= self.role_permissions.get(code, frozenset())
+            granted |= BUILTIN_PERMISSIONS.get(code, frozenset())
+        return frozenset(granted)
+
+
+class PermissionResolver:
+    """Versioned RBAC snapshot plus a bounded TTL + LRU cache of `UserAccess`."""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._version = 0
+        self._snapshot: Optional[RbacSnapshot] = None
+        self._lock = asyncio.Lock()
+        self._users: "OrderedDict[int, Tuple[float, int, UserAccess]]" = OrderedDict()
+        self._listener_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    async def resolve(self, user) -> UserAccess:
+        """`UserAccess` for a `UserProfile` or token principal (id + role)."""
+        entry = self._users.get(user.id)
+        if entry is not None:
+            expires_at, version, access = entry
+            if version == self._version and expires_at >= time.monotonic() and access.role == user.role:
+                self._users.move_to_end(user.id)
+                self.hits += 1
+                return access
+            self._users.pop(user.id, None)
+
+        self.misses += 1
+        snapshot = await self.snapshot()
+        access = await self._load_user(snapshot, user.id, user.role)
+        self._put(snapshot.version, access)
+        return access
+
+    async def snapshot(self) -> RbacSnapshot:
+        snapshot = self._current()
+        if snapshot is not None:
+            return snapshot
+
+        async with self._lock:
+            snapshot = self._current()
+            if snapshot is None:
+                snapshot = await self._load_snapshot(self._version)
+                self._snapshot = snapshot
+            return snapshot
+
+    def _current(self) -> Optional[RbacSnapshot]:
+        snapshot = self._snapshot
+        if (
+            snapshot is not None
+            and snapshot.version == self._version
+            and time.monotonic() - snapshot.loaded_at < self.ttl_seconds
+        ):
+            return snapshot
+        return None
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+    def invalidate(self) -> None:
+        """Roles, permissions or departments changed: reload everything."""
+        self._version += 1
+        self._users.clear()
+        self.invalidations += 1
+
+    def invalidate_user(self, user_id: int) -> None:
+        if self._users.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        snapshot = self._snapshot
+        return {
+            "size": len(self._users),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "version": self._version,
+            "roles": len(snapshot.role_permissions) if snapshot else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _put(self, version: int, access: UserAccess) -> None:
+        if self.max_size <= 0:
+            return
+        self._users[access.user_id] = (time.monotonic() + self.ttl_seconds, version, access)
+        self._users.move_to_end(access.user_id)
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+    async def _load_snapshot(self, version: int) -> RbacSnapshot:
+        async with AsyncSessionLocal() as db:
+            roles = (await db.execute(
+                select(Role.id, Role.code).where(Role.is_active == True)
+            )).all()
+            grants = (await db.execute(
+                select(role_permissions.c.role_id, Permission.code)
+                .join(Permission, Permission.id == role_permissions.c.permission_id)
+                .where(Permission.is_active == True)
+            )).all()
+            departments = (await db.execute(select(Department))).scalars().all()
+
+        codes = {role_id: code for role_id, code in roles}
+        granted: Dict[str, set] = {code: set() for code in codes.values()}
+        for role_id, permission in grants:
+            if role_id in codes:
+                granted[codes[role_id]].add(permission)
+
+        return RbacSnapshot(
+            version=version,
+            loaded_at=time.monotonic(),
+            role_permissions={code: frozenset(perms) for code, perms in granted.items()},
+            role_codes=codes,
+            departments={d.id: d for d in departments},
+        )
+
+    async def _load_user(self, snapshot: RbacSnapshot, user_id: int, role: str) -> UserAccess:
+        async with AsyncSessionLocal() as db:
+            role_ids = (await db.execute(
+                select(user_roles.c.role_id).where(user_roles.c.user_id == user_id)
+            )).scalars().all()
+            memberships = (await db.execute(
+                select(UserDepartment.department_id, UserDepartment.is_primary)
+                .where(UserDepartment.user_id == user_id)
+                .order_by(UserDepartment.is_primary.desc(), UserDepartment.id)
+            )).all()
+
+        codes = {role_code(role)} | {snapshot.role_codes[i] for i in role_ids if i in snapshot.role_codes}
+        codes.discard("")
+        department_ids = tuple(department_id for department_id, _ in memberships)
+        primary = next((department_id for department_id, is_primary in memberships if is_primary), None)
+        return UserAccess(
+            user_id=user_id,
+            role=role,
+            role_codes=frozenset(codes),
+            permissions=snapshot.permissions_for(codes),
+            department_ids=department_ids,
+            primary_department_id=primary,
+        )
+
+    # ==================== LISTEN/NOTIFY ====================
+
+    def start_listener(self) -> None:
+        """Start the background LISTEN task (call once per process, inside the event loop)."""
+        if engine.dialect.name != "postgresql":
+            return
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen_forever())
+
+    async def stop_listener(self) -> None:
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        if payload.startswith("user:"):
+            self.invalidate_user(int(payload[5:]))
+        else:
+            self.invalidate()
+
+    async def _listen_forever(self) -> None:
+        # LISTEN needs a session-level connection: go around PgBouncer
+        dsn = make_url(DATABASE_DIRECT_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                conn.add_termination_listener(lambda _conn: closed.set())
+                await conn.add_listener(RBAC_CHANNEL, self._on_notify)
+                # Notifications sent while we were not listening are lost
+                self.invalidate()
+                await closed.wait()
+            except asyncio.CancelledError:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+                raise
+            except Exception as e:
+                print(f"⚠️ RBAC listener error: {e}")
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+
+
+permission_resolver = PermissionResolver(
+    max_size=settings.RBAC_CACHE_MAX_SIZE,
+    ttl_seconds=settings.RBAC_CACHE_TTL_SECONDS,
+)
+
+
+# ==================== Write hooks ====================
+
+def _rbac_changes(session) -> set:
+    changed = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, RBAC_MODELS):
+            changed.add("roles")
+        elif isinstance(obj, UserDepartment):
+            changed.add(f"user:{obj.user_id}")
+        elif isinstance(obj, UserProfile) and obj not in session.new:
+            if obj in session.deleted or sa_inspect(obj).attrs.role.history.has_changes():
+                changed.add(f"user:{obj.id}")
+    # A role change reloads every user anyway
+    return {"roles"} if "roles" in changed else changed
+
+
+@event.listens_for(Session, "after_flush")
+def _notify_rbac_writes(session, flush_context):
+    changed = _rbac_changes(session)
+    if not changed:
+        return
+
+    session.info.setdefault("rbac_changed", set()).update(changed)
+    connection = session.connection()
+    if connection.dialect.name == "postgresql":
+        for payload in sorted(changed):
+            connection.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": RBAC_CHANNEL, "payload": payload})
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_rbac_commit(session):
+    # This worker does not wait for its own notification
+    for payload in session.info.pop("rbac_changed", ()):
+        if payload.startswith("user:"):
+            permission_resolver.invalidate_user(int(payload[5:]))
+        else:
+            permission_resolver.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rbac_changes(session):
+    session.info.pop("rbac_changed", None)
@@ -0,0 +1,193 @@
+"""
+Per-route HTTP cache policies for the public catalog endpoints.
+
+`ResponseCacheMiddleware` replaces the blanket no-cache middleware:
+
+- Routes listed in CACHE_POLICIES (public pricing / plans / countries /
+  addons reads) get `Cache-Control: public, max-age=..., stale-while-revalidate=...`
+  and a strong ETag. Their 200 responses are kept in a per-worker LRU keyed
+  by path + normalized query string, tagged with the catalog version
+  (app.services.catalog_cache), so a catalog write - which bumps the
+  version in every worker through LISTEN/NOTIFY - drops them all at once.
+  RESPONSE_CACHE_TTL_SECONDS bounds staleness if a notification is missed.
+- The ETag is the SHA-256 of the body: identical across workers and
+  changes exactly when the content does. (The catalog version is a
+  per-worker counter, so it cannot name content across workers.) A
+  matching `If-None-Match` gets `304 Not Modified`; it skips the database
+  only when this worker already holds the entry, otherwise the route runs
+  once to recompute the body and its hash.
+- Everything else - authenticated, private and write routes, non-200
+  responses, and public routes called with an Authorization header -
+  keeps `Cache-Control: no-cache, no-store, must-revalidate`.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+
+RESPONSE_CACHE_REQUESTS = registry.counter(
+    "http_response_cache_total", "Cacheable-route requests by result", ["result"],
+)
+
+NO_STORE_HEADERS = {
+    "Cache-Control": "no-cache, no-store, must-revalidate",
+    "Pragma": "no-cache",
+    "Expires": "0",
+}
+
+# Response headers replayed on cache hits (CORS headers are added per request by the outer CORS middleware)
+STORED_HEADERS = ("content-type", "content-language")
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    max_age: int                 # Browser / CDN freshness
+    stale_while_revalidate: int  # CDN may serve stale this long while refetching
+
+    @property
+    def cache_control(self) -> str:
+        return f"public, max-age={self.max_age}, stale-while-revalidate={self.stale_while_revalidate}"
+
+
+CATALOG = CachePolicy(
+    max_age=settings.RESPONSE_CACHE_MAX_AGE_SECONDS,
+    stale_while_revalidate=settings.RESPONSE_CACHE_STALE_WHILE_REVALIDATE_SECONDS,
+)
+STATIC = CachePolicy(max_age=3600, stale_while_revalidate=86400)  # Hardcoded in the code
+
+# Paths under API_V1_STR; GET only
+CACHE_POLICIES: Dict[str, CachePolicy] = {
+    "/pricing/plans": CATALOG,
+    "/pricing/billing-cycles": STATIC,
+    "/pricing/plan-types": STATIC,
+    "/pricing/filters": STATIC,
+    "/plans/": CATALOG,
+    "/countries/simple": CATALOG,
+    "/addons/": CATALOG,
+}
+
+
+@dataclass
+class CachedResponse:
+    version: int
+    stored_at: float
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+
+
+def strong_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ResponseCache:
+    """Per-worker LRU of public responses, valid for one catalog version."""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], CachedResponse]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str], version: int) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.version != version or time.monotonic() - entry.stored_at >= self.ttl_seconds:
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Tuple[str, str], entry: CachedResponse) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    def __init__(
+        self,
+        app,
+        version: Callable[[], int],
+        policies: Optional[Dict[str, CachePolicy]] = None,
+        prefix: str = settings.API_V1_STR,
+        cache: Optional[ResponseCache] = None,
+    ):
+        super().__init__(app)
+        self.version = version
+        self.policies = {prefix + path: policy for path, policy in (policies or CACHE_POLICIES).items()}
+        self.cache = cache or ResponseCache(settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_TTL_SECONDS)
+
+    async def dispatch(self, request: Request, call_next):
+        policy = self.policies.get(request.url.path) if request.method == "GET" else None
+        if policy is None or "authorization" in request.headers:
+            if policy is not None:
+                RESPONSE_CACHE_REQUESTS.inc(result="bypass")
+            return self._no_store(await call_next(request))
+
+        # Same query in any order is the same entry
+        key = (request.url.path, urlencode(sorted(parse_qsl(request.url.query, keep_blank_values=True))))
+        version = self.version()
+        entry = self.cache.get(key, version) if settings.RESPONSE_CACHE_ENABLED else None
+
+        if entry is None:
+            response = await call_next(request)
+            if response.status_code != 200:
+                return self._no_store(response)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            entry = CachedResponse(
+                version=version,
+                stored_at=time.monotonic(),
+                body=body,
+                etag=strong_etag(body),
+                headers={name: value for name, value in response.headers.items() if name in STORED_HEADERS},
+            )
+            # Other headers the route set go out on this response only
+            extra = {name: value for name, value in response.headers.items() if name != "content-length"}
+            if settings.RESPONSE_CACHE_ENABLED:
+                self.cache.put(key, entry)
+            result = "miss"
+        else:
+            extra = {}
+            result = "hit"
+
+        headers = {**extra, **entry.headers, "ETag": entry.etag, "Cache-Control": policy.cache_control}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            RESPONSE_CACHE_REQUESTS.inc(result="not_modified")
+            headers.pop("content-type", None)
+            return Response(status_code=304, headers=headers)
+
+        RESPONSE_CACHE_REQUESTS.inc(result=result)
+        return Response(content=entry.body, status_code=200, headers=headers)
+
+    @staticmethod
+    def _no_store(response: Response) -> Response:
+        response.headers.update(NO_STORE_HEADERS)
+        return response
@@ -135,7 +135,7 @@
 
 
 from datetime import datetime, timedelta
-from typing import Any, Union, Optional
+from typing import Any, Dict, Union, Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -143,6 +143,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.permissions import UserAccess, permission_resolver
+from app.core.user_cache import UserPrincipal, user_cache
 from app.models.users import UserProfile
 from app.utils.security_utils import get_password_hash, verify_password
 
@@ -150,15 +152,25 @@ from app.utils.security_utils import get_password_hash, verify_password
 security = HTTPBearer()
 
 
-def create_access_token(subject: Union[str, Any], expires_delta: timedelta = None) -> str:
-    expire = datetime.utcnow() + (
+def create_access_token(
+    subject: Union[str, Any],
+    expires_delta: timedelta = None,
+    claims: Optional[Dict[str, Any]] = None,
+) -> str:
+    now = datetime.utcnow()
+    expire = now + (
         expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     )
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {**(claims or {}), "exp": expire, "iat": now, "sub": str(subject)}
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
+def principal_claims(user: UserProfile) -> Dict[str, Any]:
+    """Signed role/status claims used by the stateless read-only auth mode."""
+    return {"role": user.role, "status": user.account_status}
+
+
 def verify_token(token: str) -> Optional[dict]:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -167,45 +179,87 @@ def verify_token(token: str) -> Optional[dict]:
         return None
 
 
-async def get_current_user(
-    db: AsyncSession = Depends(get_db),
-    token: HTTPAuthorizationCredentials = Depends(security)
-) -> UserProfile:
-    from app.services.user_service import UserService  # moved inside to prevent circular import
-
-    print(f"=== GET_CURRENT_USER ===")
-    print(f"Token object: {token}")
-    print(f"Token type: {type(token)}")
-    if hasattr(token, 'credentials'):
-        print(f"Token credentials: {token.credentials[:50] if token.credentials else 'None'}...")
-    
+def _decode_credentials(token: HTTPAuthorizationCredentials) -> dict:
     payload = verify_token(token.credentials)
-    print(f"Payload: {payload}")
-    
     if not payload or "sub" not in payload:
-        print("ERROR: Invalid payload or missing 'sub'")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
         )
+    return payload
 
-    user_service = UserService()
-    user = await user_service.get_user_by_id(db, int(payload["sub"]))
-    if not user:
-        print(f"ERROR: User not found for id {payload['sub']}")
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
-    if user.account_status != "active":
-        print(f"ERROR: User account not active: {user.account_status}")
+def _ensure_active(account_status: str) -> None:
+    if account_status != "active":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Account is suspended or inactive",
         )
 
-    print(f"SUCCESS: User authenticated: {user.email}")
+
+async def _resolve_user(db: AsyncSession, payload: dict) -> UserProfile:
+    """Load the token's user, serving repeat requests from the worker cache."""
+    from app.services.user_service import UserService  # moved inside to prevent circular import
+
+    user_id = int(payload["sub"])
+    iat = payload.get("iat")
+
+    cached = user_cache.get(user_id, iat)
+    if cached is not None:
+        # Attach the snapshot to this request's session without a SELECT
+        return await db.merge(cached, load=False)
+
+    user_service = UserService()
+    user = await user_service.get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+    if user.account_status == "active":
+        user_cache.put(user_id, iat, user)
     return user
 
 
+async def get_current_user(
+    db: AsyncSession = Depends(get_db),
+    token: HTTPAuthorizationCredentials = Depends(security)
+) -> UserProfile:
+    payload = _decode_credentials(token)
+    user = await _resolve_user(db, payload)
+    _ensure_active(user.account_status)
+    return user
+
+
+async def get_current_principal(
+    db: AsyncSession = Depends(get_db),
+    token: HTTPAuthorizationCredentials = Depends(security)
+) -> UserPrincipal:
+    """
+    Identity for read-only routes that only need id/role.
+
+    With AUTH_TRUST_TOKEN_CLAIMS enabled the signed role/status claims are
+    trusted as-is and no DB session is touched; otherwise this falls back to
+    the cached user lookup.
+    """
+    payload = _decode_credentials(token)
+
+    if settings.AUTH_TRUST_TOKEN_CLAIMS and "role" in payload and "status" in payload:
+        _ensure_active(payload["status"])
+        return UserPrincipal(
+            id=int(payload["sub"]),
+            role=payload["role"],
+            account_status=payload["status"],
+        )
+
+    user = await _resolve_user(db, payload)
+    _ensure_active(user.account_status)
+    return UserPrincipal(
+        id=user.id,
+        role=user.role,
+        account_status=user.account_status,
+        email=user.email,
+    )
+
+
 async def get_current_active_user(
     current_user: UserProfile = Depends(get_current_user)
 ) -> UserProfile:
@@ -217,13 +271,36 @@ async def get_current_active_user(
     return current_user
 
 
+async def get_user_access(
+    current_user: UserPrincipal = Depends(get_current_principal)
+) -> UserAccess:
+    """Resolved roles/permissions of the current user (cached per worker)."""
+    return await permission_resolver.resolve(current_user)
+
+
+def require_permission(*codes: str, detail: str = "Not enough permissions"):
+    """Dependency factory: the current user must hold any of `codes`."""
+    async def dependency(
+        current_user: UserProfile = Depends(get_current_user),
+    ) -> UserProfile:
+        access = await permission_resolver.resolve(current_user)
+        if not access.can(*codes):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=detail,
+            )
+        return current_user
+
+    return dependency
+
+
 async def get_current_admin_user(
     current_user: UserProfile = Depends(get_current_user)
 ) -> UserProfile:
-    if current_user.role not in ["admin", "super_admin"]:
+    access = await permission_resolver.resolve(current_user)
+    if not access.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not enough permissions",
         )
     return current_user
-
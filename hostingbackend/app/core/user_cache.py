@@ -0,0 +1,221 @@
+"""
+Per-worker cache of authenticated user principals.
+
+`get_current_user` used to run a `SELECT users_profiles` on every
+authenticated request. Entries here are keyed by ``(user_id, iat)`` so a
+freshly issued token never reads a snapshot taken for an older one, and
+are bounded both in size (LRU) and in age (TTL) so balances and profile
+fields cannot drift far from the database even on workers that never see
+an invalidation.
+
+Each uvicorn worker owns its own cache. Invalidation is local, which is
+why the TTL is the hard upper bound on staleness across workers.
+
+Write hooks at the bottom of this module invalidate on commit, wherever
+the write comes from: a flushed `UserProfile` change or delete drops that
+user's snapshots, and a bulk `update(UserProfile)` / `delete(UserProfile)`
+statement touching role or account_status drops the users it names by
+primary key (or the whole cache when it cannot tell which).
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.config import settings
+from app.models.users import UserProfile
+
+
+# Columns whose change must not wait for the TTL (authorization)
+PRINCIPAL_COLUMNS = {"role", "account_status"}
+ALL_USERS = "*"
+
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """Lightweight identity built from signed token claims (no DB row)."""
+    id: int
+    role: str
+    account_status: str
+    email: Optional[str] = None
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+    @property
+    def is_active(self) -> bool:
+        return self.account_status == "active"
+
+
+class UserPrincipalCache:
+    """Bounded TTL + LRU cache of detached `UserProfile` snapshots."""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 30.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[int, Hashable], Tuple[float, UserProfile]]" = OrderedDict()
+        self._by_user: Dict[int, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def get(self, user_id: int, iat: Hashable) -> Optional[UserProfile]:
+        key = (user_id, iat)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, snapshot = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return snapshot
+
+    def put(self, user_id: int, iat: Hashable, user: UserProfile) -> None:
+        if self.max_size <= 0:
+            return
+
+        key = (user_id, iat)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, self._snapshot(user))
+        self._entries.move_to_end(key)
+        self._by_user.setdefault(user_id, set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    # ------------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------------
+    def invalidate(self, user_id: int) -> None:
+        """Drop every cached token snapshot for a user."""
+        keys = self._by_user.pop(user_id, None)
+        if not keys:
+            return
+        for key in keys:
+            self._entries.pop(key, None)
+        self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _remove(self, key: Tuple[int, Hashable]) -> None:
+        self._entries.pop(key, None)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                self._by_user.pop(key[0], None)
+
+    @staticmethod
+    def _snapshot(user: UserProfile) -> UserProfile:
+        """
+        Copy column values into a detached instance.
+
+        The request's own instance stays attached to its session; the copy is
+        later re-attached to other sessions with ``merge(load=False)``.
+        """
+        mapper = sa_inspect(UserProfile)
+        snapshot = UserProfile(**{
+            attr.key: getattr(user, attr.key) for attr in mapper.column_attrs
+        })
+        make_transient_to_detached(snapshot)
+        return snapshot
+
+
+user_cache = UserPrincipalCache(
+    max_size=settings.USER_CACHE_MAX_SIZE,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+)
+
+
+# ==================== Write hooks ====================
+
+def _bulk_user_changes(orm_execute_state) -> set:
+    """User ids a bulk UPDATE / DELETE may have changed ({ALL_USERS} if unknown)."""
+    statement = orm_execute_state.statement
+    params = orm_execute_state.parameters
+    rows = params if isinstance(params, list) else [params or {}]
+
+    if orm_execute_state.is_update:
+        columns = {getattr(column, "key", column) for column in getattr(statement, "_values", None) or {}}
+        for row in rows:
+            columns.update(row)
+        if not columns & PRINCIPAL_COLUMNS:
+            return set()
+
+    # Bulk UPDATE by primary key: one parameter set per user
+    if orm_execute_state.is_update and rows and all("id" in row for row in rows):
+        return {row["id"] for row in rows}
+    return {ALL_USERS}
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_user_writes(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.bind_mapper is None or orm_execute_state.bind_mapper.class_ is not UserProfile:
+        return
+    changed = _bulk_user_changes(orm_execute_state)
+    if changed:
+        orm_execute_state.session.info.setdefault("principals_changed", set()).update(changed)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_user_writes(session, flush_context):
+    changed = {
+        obj.id
+        for obj in (*session.dirty, *session.deleted)
+        if isinstance(obj, UserProfile) and (obj in session.deleted or session.is_modified(obj))
+    }
+    if changed:
+        session.info.setdefault("principals_changed", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_user_commit(session):
+    changed = session.info.pop("principals_changed", None)
+    if not changed:
+        return
+    if ALL_USERS in changed:
+        user_cache.clear()
+        return
+    for user_id in changed:
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_changes(session):
+    session.info.pop("principals_changed", None)
@@ -226,7 +226,6 @@ from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.base import BaseHTTPMiddleware
 import uvicorn
 from fastapi.responses import FileResponse
 from sqlalchemy.engine import URL
@@ -234,7 +233,13 @@ from scalar_fastapi import get_scalar_api_reference
 
 from app.core.config import settings
 from app.api.v1.api import api_router
-from app.core.database import engine
+from app.core.database import engine, replica_engine
+from app.core.db_metrics import DBMetricsMiddleware
+from app.core.db_routing import PRIMARY_UNTIL_HEADER, ReadYourWritesMiddleware
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.core.metrics import METRICS_CONTENT_TYPE, render_metrics
+from app.core.response_cache import ResponseCacheMiddleware
+from app.services.catalog_cache import catalog_cache
 
 
 # -----------------------------------------------------------------------------
@@ -263,27 +268,28 @@ app = FastAPI(
 # -----------------------------------------------------------------------------
 # Middleware
 # -----------------------------------------------------------------------------
+# Innermost: per-route cache policy (public catalog reads cached with ETags,
+# everything else no-store); CORS outside it so cached responses get the
+# caller's CORS headers
+app.add_middleware(ResponseCacheMiddleware, version=lambda: catalog_cache.version)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, PRIMARY_UNTIL_HEADER, "ETag"],
 )
 
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
 
+# Read-your-writes window for replica routing (only needed with a replica)
+if replica_engine is not None:
+    app.add_middleware(ReadYourWritesMiddleware)
 
-class NoCacheMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
-
-
-app.add_middleware(NoCacheMiddleware)
+# Outermost: per-route request duration, DB query count and DB time
+app.add_middleware(DBMetricsMiddleware)
 
 
 # -----------------------------------------------------------------------------
@@ -328,10 +334,36 @@ async def on_startup():
         database=url.database,
     )
 
+    # Catalog cache and public response cache invalidation (LISTEN catalog_changed)
+    catalog_cache.start_listener()
+
+    # RBAC resolver invalidation (LISTEN rbac_changed)
+    from app.core.permissions import permission_resolver
+    permission_resolver.start_listener()
+
+    # Server lifecycle (renewals, suspensions); only the elected leader runs passes
+    from app.workers.lifecycle_scheduler import lifecycle_scheduler
+    lifecycle_scheduler.start()
+
     print("🔗 API startup complete")
     print(f"✅ Connected to database: {safe_url}")
 
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Release pooled outbound connections held by this worker."""
+    from app.services.razorpay_gateway import close_razorpay_gateway
+    from app.core.permissions import permission_resolver
+    from app.services.attachment_storage import close_attachment_storage
+    from app.workers.lifecycle_scheduler import lifecycle_scheduler
+
+    await close_razorpay_gateway()
+    await catalog_cache.stop_listener()
+    await permission_resolver.stop_listener()
+    await close_attachment_storage()
+    await lifecycle_scheduler.stop()
+
+
 # -----------------------------------------------------------------------------
 # Utility Endpoints
 # -----------------------------------------------------------------------------
@@ -359,6 +391,14 @@ async def ping():
     return {"message": "pong"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus text exposition of this worker's pool, query and route metrics."""
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        return Response(status_code=401)
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/swagger", include_in_schema=False)
 async def scalar_html():
     return get_scalar_api_reference(
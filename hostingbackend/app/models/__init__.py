@@ -16,6 +16,10 @@ from app.models.addon import Addon, AddonCategory, BillingType
 from app.models.service import Service, ServiceCategory
 from app.models.order_addon import OrderAddon
 from app.models.order_service import OrderService
+from app.models.job import BackgroundJob, JobStatus
+from app.models.webhook_event import WebhookEvent, WebhookEventStatus
+from app.models.stats_snapshot import StatsSnapshot
+from app.models.revenue_rollup import RevenueRollup
 
 __all__ = [
     "UserProfile",
@@ -44,4 +48,10 @@ __all__ = [
     "ServiceCategory",
     "OrderAddon",
     "OrderService",
+    "BackgroundJob",
+    "JobStatus",
+    "WebhookEvent",
+    "WebhookEventStatus",
+    "StatsSnapshot",
+    "RevenueRollup",
 ]
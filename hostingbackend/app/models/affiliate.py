@@ -2,7 +2,7 @@
 Affiliate/Referral System Models
 Handles multi-level referral tracking, commissions, and payouts
 """
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Numeric, Text, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Numeric, Text, Index, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -122,6 +122,33 @@ class Referral(Base):
         return f"<Referral(referrer_id={self.referrer_id}, referred_user_id={self.referred_user_id}, level={self.level})>"
 
 
+
+class ReferralClosure(Base):
+    """
+    Materialized referral ancestry (closure table).
+
+    One row per (ancestor, descendant) pair at every depth: depth 1 is the
+    direct referrer, 2 the referrer's referrer, and so on. Uplines and
+    per-level downline counts are single indexed queries at any depth.
+    Built from UserProfile.referred_by; maintained by ReferralTreeService
+    when a referral is tracked.
+    """
+    __tablename__ = "referral_closure"
+
+    ancestor_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+    depth = Column(Integer, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_referral_closure_descendant', 'descendant_id', 'depth'),
+        Index('idx_referral_closure_ancestor_depth', 'ancestor_id', 'depth'),
+    )
+
+    def __repr__(self):
+        return f"<ReferralClosure(ancestor={self.ancestor_id}, descendant={self.descendant_id}, depth={self.depth})>"
+
 class CommissionRule(Base):
     """
     Defines commission rates for different levels and products
@@ -205,6 +232,10 @@ class Commission(Base):
     referral = relationship("Referral", back_populates="commissions")
     payout = relationship("Payout", back_populates="commissions")
     
+    __table_args__ = (
+        UniqueConstraint('order_id', 'affiliate_user_id', 'level', name='uq_commission_order_affiliate_level'),
+    )
+
     def __repr__(self):
         return f"<Commission(id={self.id}, affiliate_user_id={self.affiliate_user_id}, amount={self.commission_amount}, status='{self.status}')>"
 
@@ -270,6 +301,12 @@ class Payout(Base):
     commissions = relationship("Commission", back_populates="payout")
     # Note: earning relationship will be added after importing ReferralEarning model
     
+    # Admin payout queues, newest first (keyset pagination)
+    __table_args__ = (
+        Index('idx_payout_status_requested', 'status', 'requested_at', 'id'),
+        Index('idx_payout_status_processed', 'status', 'processed_at', 'id'),
+    )
+    
     def __repr__(self):
         return f"<Payout(id={self.id}, affiliate_user_id={self.affiliate_user_id}, amount={self.amount}, status='{self.status}')>"
 
@@ -277,6 +314,9 @@ class Payout(Base):
 class AffiliateStats(Base):
     """
     Cached statistics for affiliate performance
+
+    Maintained with atomic deltas by AffiliateStatsService; the job worker
+    reconciles it against referrals/earnings/payouts periodically.
     """
     __tablename__ = "affiliate_stats"
     
@@ -304,6 +344,7 @@ class AffiliateStats(Base):
     # Payout info
     total_payouts = Column(Integer, default=0)
     total_payout_amount = Column(Numeric(12, 2), default=0.00)
+    pending_payout_amount = Column(Numeric(12, 2), default=0.00)  # Pending + processing payouts
     available_balance = Column(Numeric(12, 2), default=0.00)
     
     # Last updated
@@ -18,8 +18,11 @@ from app.models.settings import UserSettings
 from app.models.countries import Country
 from app.models.roles import Department, Role, Permission, UserDepartment, role_permissions, user_roles
 from app.models.affiliate import (
-    AffiliateSubscription, Referral, CommissionRule, Commission, Payout, AffiliateStats
+    AffiliateSubscription, Referral, CommissionRule, Commission, Payout, AffiliateStats, ReferralClosure
 )
+from app.models.job import BackgroundJob
+from app.models.webhook_event import WebhookEvent
+from app.models.stats_snapshot import StatsSnapshot
 # from app.models.payment import PaymentModel, PlanModel, SubscriptionModel
 
 __all__ = [
@@ -36,7 +39,10 @@ __all__ = [
     "UserSettings",
     "Country",
     "Department", "Role", "Permission", "UserDepartment",
-    "AffiliateSubscription", "Referral", "CommissionRule", "Commission", "Payout", "AffiliateStats",
+    "AffiliateSubscription", "Referral", "CommissionRule", "Commission", "Payout", "AffiliateStats", "ReferralClosure",
+    "BackgroundJob",
+    "WebhookEvent",
+    "StatsSnapshot",
 ]
 
 # Optional debug info
@@ -27,6 +27,7 @@ class Country(Base):
         Index('idx_country_code', 'code'),
         Index('idx_country_active', 'is_active'),
         Index('idx_country_search', 'name', 'code', 'alpha3_code'),
+        Index('idx_country_name_trgm', 'name', postgresql_using='gist', postgresql_ops={'name': 'gist_trgm_ops'}),
     )
 
     def __repr__(self):
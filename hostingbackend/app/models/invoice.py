@@ -171,6 +171,7 @@ class Invoice(Base):
     __table_args__ = (
         # User-specific queries
         Index('idx_invoice_user_status', 'user_id', 'status'),
+        Index('idx_invoice_user_created', 'user_id', 'created_at', 'id'),
         Index('idx_invoice_user_payment_status', 'user_id', 'payment_status'),
         
         # Financial reporting
@@ -184,6 +185,7 @@ class Invoice(Base):
         
         # Quick lookups
         Index('idx_invoice_number', 'invoice_number'),
+        Index('idx_invoice_number_trgm', 'invoice_number', postgresql_using='gin', postgresql_ops={'invoice_number': 'gin_trgm_ops'}),
         Index('idx_invoice_order', 'order_id'),
         
         # Overdue invoices tracking
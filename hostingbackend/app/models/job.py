@@ -0,0 +1,61 @@
+from sqlalchemy import Column, String, Integer, DateTime, JSON, Index, Text, Enum
+from sqlalchemy.sql import func
+from app.core.database import Base
+import enum
+
+
+class JobStatus(str, enum.Enum):
+    """Background job lifecycle"""
+    PENDING = "pending"      # Waiting for a worker (or for run_after)
+    RUNNING = "running"      # Claimed by a worker
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"        # Last attempt failed, will be retried
+    DEAD = "dead"            # Gave up after max_attempts
+
+
+class BackgroundJob(Base):
+    """
+    Transactional outbox / job queue.
+
+    Rows are inserted in the same transaction as the business change that
+    triggers them (e.g. marking a payment as paid), so a job exists if and
+    only if that change committed. Workers claim rows with
+    `SELECT ... FOR UPDATE SKIP LOCKED`.
+    """
+    __tablename__ = "background_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # What to run
+    job_type = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+
+    # Enqueueing the same logical job twice is a no-op
+    dedupe_key = Column(String(255), nullable=True, unique=True)
+
+    # Scheduling & retries
+    status = Column(Enum(JobStatus), default=JobStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=8, nullable=False)
+    run_after = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    locked_by = Column(String(100), nullable=True)
+
+    # Progress & diagnostics
+    completed_stages = Column(JSON, nullable=True)   # Stage names already done (skipped on retry)
+    stage_timings = Column(JSON, nullable=True)      # {stage: milliseconds} of the last run
+    result = Column(JSON, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('idx_job_claim', 'status', 'run_after'),
+        Index('idx_job_type_status', 'job_type', 'status'),
+    )
+
+    def __repr__(self):
+        return f"<BackgroundJob(id={self.id}, type='{self.job_type}', status='{self.status}', attempts={self.attempts})>"
@@ -123,8 +123,9 @@ class Order(Base):
         Index('idx_order_status_payment', 'order_status', 'payment_status'),
         Index('idx_order_payment_status_date', 'payment_status', 'created_at'),
 
-        # Financial reporting
-        Index('idx_order_created_date', 'created_at'),
+        # Financial reporting and keyset pagination on (created_at, id)
+        Index('idx_order_created_date', 'created_at', 'id'),
+        Index('idx_order_user_created', 'user_id', 'created_at', 'id'),
         Index('idx_order_payment_date', 'payment_date'),
 
         # Billing and subscription management
@@ -133,6 +134,7 @@ class Order(Base):
 
         # Quick lookups
         Index('idx_order_number', 'order_number'),
+        Index('idx_order_number_trgm', 'order_number', postgresql_using='gin', postgresql_ops={'order_number': 'gin_trgm_ops'}),
         Index('idx_order_plan', 'plan_id'),
 
         # Comprehensive analytics
@@ -67,7 +67,7 @@
 
 
 
-from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Text, JSON, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -153,4 +153,11 @@ class ReferralEarning(Base):
         back_populates="referral_earnings"
     )
 
+    # One earning per (order, beneficiary, level); commission writers insert
+    # with ON CONFLICT DO NOTHING against this key
+    __table_args__ = (
+        UniqueConstraint('order_id', 'user_id', 'level', name='uq_referral_earning_order_user_level'),
+        Index('idx_referral_earning_status_earned', 'status', 'earned_at', 'id'),  # Approval queue pages
+    )
+
 
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, String, Integer, Date, DateTime, Numeric, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class RevenueRollup(Base):
+    """
+    Order / invoice totals per day and per month.
+
+    One row per (period, source, payment_status, period_start, plan_id,
+    billing_cycle), maintained incrementally by RevenueRollupService so
+    revenue charts read a few rows instead of scanning orders/invoices.
+    Invoices carry no plan dimensions (plan_id 0, billing_cycle '').
+    """
+    __tablename__ = "revenue_rollups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    period = Column(String(10), nullable=False)          # day, month
+    source = Column(String(20), nullable=False)          # order, invoice
+    payment_status = Column(String(50), nullable=False)
+    period_start = Column(Date, nullable=False)          # UTC day / first day of the month
+    plan_id = Column(Integer, nullable=False, default=0)  # 0 = no plan (invoices)
+    billing_cycle = Column(String(50), nullable=False, default='')
+
+    count = Column(Integer, nullable=False, default=0)
+    amount = Column(Numeric(14, 2), nullable=False, default=0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # 🔹 Bucket key; its prefix serves period/source/status range reads
+    __table_args__ = (
+        UniqueConstraint(
+            'period', 'source', 'payment_status', 'period_start', 'plan_id', 'billing_cycle',
+            name='uq_revenue_rollup_bucket',
+        ),
+    )
+
+    def __repr__(self):
+        return f"<RevenueRollup({self.period} {self.period_start} {self.source}/{self.payment_status}: {self.amount})>"
@@ -61,11 +61,15 @@ class Server(Base):
     
     # 🔹 NEW: Link to order for addon/service access
     order_id = Column(Integer, ForeignKey('orders.id'), nullable=True)
+
+    # 🔹 Open renewal invoice (set by the lifecycle scheduler, cleared when the renewal is applied)
+    renewal_invoice_id = Column(Integer, ForeignKey('invoices.id'), nullable=True)
     
     server_name = Column(String(255), nullable=False)
     hostname = Column(String(255), nullable=False)
     ip_address = Column(String(45), nullable=True)
     server_status = Column(String(50), default='provisioning')  # provisioning, active, suspended, terminated
+    suspended_at = Column(DateTime(timezone=True), nullable=True)  # Set by the lifecycle scheduler; termination counts from it
     server_type = Column(String(50), nullable=False)  # vps, dedicated, cloud, etc.
     
     # Server specifications (can be overridden from plan)
@@ -118,7 +122,9 @@ class Server(Base):
         Index('idx_server_plan', 'plan_id'),
         Index('idx_server_status', 'server_status'),
         Index('idx_server_expiry', 'expiry_date'),
-        Index('idx_server_created', 'created_at'),
+        Index('idx_server_status_suspended', 'server_status', 'suspended_at'),
+        Index('idx_server_created', 'created_at', 'id'),  # Keyset pagination
+        Index('idx_server_renewal_invoice', 'renewal_invoice_id'),
     )
 
     def __repr__(self):
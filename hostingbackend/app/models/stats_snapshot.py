@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, DateTime, JSON, Float
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class StatsSnapshot(Base):
+    """
+    Precomputed dashboard aggregates.
+
+    One row per dashboard (e.g. 'admin_dashboard'), rewritten by the job
+    worker on a schedule so the page is served with a single primary-key read.
+    """
+    __tablename__ = "stats_snapshots"
+
+    key = Column(String(100), primary_key=True)
+    data = Column(JSON, nullable=False)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    compute_ms = Column(Float, nullable=True)  # How long the aggregate queries took
+
+    def __repr__(self):
+        return f"<StatsSnapshot(key='{self.key}', computed_at='{self.computed_at}')>"
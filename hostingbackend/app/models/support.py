@@ -81,7 +81,7 @@
 
 
 
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, Numeric, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, Numeric, ForeignKey, Text, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -128,3 +128,13 @@ class SupportTicket(Base):
         cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        # Newest-first queues and keyset pagination on (created_at, id)
+        Index('idx_support_tickets_created_id', 'created_at', 'id'),
+        Index('idx_support_tickets_user_created', 'user_id', 'created_at'),
+        Index('idx_support_tickets_assigned_status', 'assigned_to', 'status'),
+        # Admin search (pg_trgm)
+        Index('idx_support_tickets_number_trgm', 'ticket_number', postgresql_using='gin', postgresql_ops={'ticket_number': 'gin_trgm_ops'}),
+        Index('idx_support_tickets_subject_trgm', 'subject', postgresql_using='gist', postgresql_ops={'subject': 'gist_trgm_ops'}),
+    )
+
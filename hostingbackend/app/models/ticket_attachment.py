@@ -4,6 +4,11 @@ from datetime import datetime
 from app.core.database import Base
 
 
+# Attachment encryption formats
+ENCRYPTION_VERSION_LEGACY = 1  # PBKDF2-derived Fernet key; its salt was never stored, so these cannot be decrypted
+ENCRYPTION_VERSION_STREAM = 2  # Per-file data key (wrapped), segmented AES-256-GCM
+
+
 class TicketAttachment(Base):
     __tablename__ = "ticket_attachments"
 
@@ -19,9 +24,12 @@ class TicketAttachment(Base):
     file_size = Column(BigInteger, nullable=False)  # in bytes
     
     # Encrypted storage information
-    storage_path = Column(String(500), nullable=False)  # Path to encrypted file
+    storage_path = Column(String(500), nullable=False)  # Object key in the storage backend
+    storage_backend = Column(String(20), nullable=True)  # local, s3; NULL = path relative to the app root (pre-backend rows)
     encryption_key_id = Column(String(100), nullable=False)  # Reference to encryption key
-    file_hash = Column(String(64), nullable=False)  # SHA-256 hash for integrity
+    encryption_version = Column(Integer, default=ENCRYPTION_VERSION_LEGACY)  # 1 = Fernet whole file, 2 = segmented AES-GCM
+    wrapped_key = Column(String(255), nullable=True)  # Data key wrapped by the master key (version 2)
+    file_hash = Column(String(64), nullable=False, index=True)  # SHA-256 of the plaintext; also the dedup key
     
     # Security information
     is_safe = Column(Boolean, default=False)  # After virus scan
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -26,5 +26,10 @@ class TicketMessage(Base):
         cascade="all, delete-orphan"
     )
     
+    __table_args__ = (
+        # Per-ticket message counts in ticket listings
+        Index('idx_ticket_messages_ticket_internal', 'ticket_id', 'is_internal_note'),
+    )
+    
     def __repr__(self):
         return f"<TicketMessage(id={self.id}, ticket_id={self.ticket_id}, staff={self.is_staff_reply})>"
@@ -665,9 +665,12 @@ class UserProfile(Base):
         Index('idx_user_referral_code', 'referral_code'),
         Index('idx_user_status_role', 'account_status', 'role'),
         Index('idx_user_referred_by', 'referred_by'),
-        Index('idx_user_created_at', 'created_at'),
+        Index('idx_user_created_at', 'created_at', 'id'),  # Keyset pagination
         Index('idx_user_subscription', 'subscription_status', 'subscription_end'),
         Index('idx_user_balance_status', 'available_balance', 'account_status'),
+        # Admin search (pg_trgm): ILIKE '%term%', fuzzy matches and nearest-first (<->) KNN scans
+        Index('idx_user_email_trgm', 'email', postgresql_using='gist', postgresql_ops={'email': 'gist_trgm_ops'}),
+        Index('idx_user_full_name_trgm', 'full_name', postgresql_using='gist', postgresql_ops={'full_name': 'gist_trgm_ops'}),
     )
 
 
@@ -0,0 +1,54 @@
+from sqlalchemy import Column, String, Integer, DateTime, JSON, Index, Text, Enum
+from sqlalchemy.sql import func
+from app.core.database import Base
+import enum
+
+
+class WebhookEventStatus(str, enum.Enum):
+    """Webhook event processing state"""
+    RECEIVED = "received"      # Stored and acknowledged, not yet applied
+    PROCESSED = "processed"    # Applied to the payment transaction
+    IGNORED = "ignored"        # Valid but nothing to do (unknown order, event type, stale)
+    FAILED = "failed"          # Applying it raised; retried on the next drain
+
+
+class WebhookEvent(Base):
+    """
+    Raw Razorpay webhook deliveries.
+
+    The endpoint only verifies the signature and inserts the row (keyed by
+    Razorpay's event id, so redeliveries are dropped by the unique
+    constraint); the job worker drains them in batches.
+    """
+    __tablename__ = "webhook_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    # Identity
+    provider = Column(String(50), default='razorpay', nullable=False)
+    event_id = Column(String(100), nullable=False, unique=True)  # X-Razorpay-Event-Id (or body hash)
+    event_type = Column(String(100), nullable=False, index=True)  # payment.captured, payment.failed, ...
+
+    # Routing
+    razorpay_order_id = Column(String(100), nullable=True, index=True)
+    razorpay_payment_id = Column(String(100), nullable=True)
+
+    # Raw delivery
+    payload = Column(JSON, nullable=False)
+    event_created_at = Column(Integer, nullable=True)  # Razorpay `created_at` (unix seconds)
+
+    # Processing
+    status = Column(Enum(WebhookEventStatus), default=WebhookEventStatus.RECEIVED, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+
+    # Timestamps
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('idx_webhook_drain', 'status', 'received_at'),
+    )
+
+    def __repr__(self):
+        return f"<WebhookEvent(id={self.id}, event_id='{self.event_id}', type='{self.event_type}', status='{self.status}')>"
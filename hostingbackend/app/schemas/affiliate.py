@@ -2,7 +2,7 @@
 Affiliate/Referral System Schemas
 """
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List
+from typing import Optional, List, Dict, Literal
 from datetime import datetime
 from decimal import Decimal
 
@@ -175,6 +175,21 @@ class PayoutActionRequest(BaseModel):
     admin_notes: Optional[str] = None
 
 
+class EarningSettlementRequest(BaseModel):
+    """Admin bulk action on referral earnings"""
+    earning_ids: List[int] = Field(..., min_length=1)
+    action: Literal['approve', 'pay'] = Field(..., description="approve (pending -> approved) or pay (approved -> paid)")
+
+
+class EarningSettlementResponse(BaseModel):
+    """Per-id outcome of a bulk earnings action"""
+    action: str
+    updated: List[int]
+    not_found: List[int]
+    wrong_status: Dict[int, str]
+    total_amount: float
+
+
 # ==================== Affiliate Stats ====================
 
 class AffiliateStatsResponse(BaseModel):
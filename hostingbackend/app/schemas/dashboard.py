@@ -157,6 +157,7 @@ class AdminDashboard(BaseModel):
     support_stats: Dict[str, Any]
     referral_stats: Dict[str, Any]
     recent_activity: List[Dict[str, Any]]
+    generated_at: Optional[datetime] = None  # When the stats snapshot was computed
 
 class DashboardResponse(BaseModel):
     message: str
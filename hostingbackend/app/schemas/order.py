@@ -473,6 +473,24 @@ class OrderWithInvoiceResponse(BaseModel):
         from_attributes = True
 
 
+# -------------------- BULK CREATE (reseller / migration imports) --------------------
+
+class BulkOrderItem(BaseModel):
+    user_id: int
+    order: OrderCreate
+
+
+class BulkOrderCreate(BaseModel):
+    orders: List[BulkOrderItem] = Field(..., min_length=1)
+
+
+class BulkOrderCreateResponse(BaseModel):
+    created: int
+    statements: int               # SQL statements sent for the whole batch
+    statements_per_order: float
+    orders: List[OrderWithInvoiceResponse]
+
+
 # -------------------- ✅ ORDER COMPLETE RESPONSE --------------------
 
 class OrderCompleteResponse(BaseModel):
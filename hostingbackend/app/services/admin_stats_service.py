@@ -0,0 +1,143 @@
+"""
+Admin dashboard stats snapshot.
+
+`/dashboard/admin` used to run every domain's stats query on each page
+load. The aggregates are now computed by `refresh` (job worker, on a
+schedule) and stored as one `stats_snapshots` row. Reads go through a
+per-worker copy of that row:
+
+- the in-memory copy is served while it is younger than the staleness bound
+- otherwise the row is re-read (one primary-key SELECT)
+- if the row itself is older than the bound (worker down), the request
+  recomputes it; a lock keeps concurrent requests on this worker from
+  recomputing in parallel
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.stats_snapshot import StatsSnapshot
+
+
+ADMIN_DASHBOARD_KEY = "admin_dashboard"
+
+
+def _jsonable(value: Any) -> Any:
+    """Pydantic models / Decimals → plain JSON types (numbers stay numbers)."""
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class AdminStatsService:
+    """Computes, stores and serves the admin dashboard snapshot."""
+
+    # Per-worker copy of the latest snapshot: (data, computed_at)
+    _local: Optional[Tuple[Dict[str, Any], datetime]] = None
+    _refresh_lock = asyncio.Lock()
+
+    def __init__(self, max_staleness_seconds: Optional[int] = None):
+        self.max_staleness = timedelta(
+            seconds=max_staleness_seconds
+            if max_staleness_seconds is not None
+            else settings.ADMIN_STATS_MAX_STALENESS_SECONDS
+        )
+
+    async def compute(self, db: AsyncSession) -> Dict[str, Any]:
+        """Run every domain's aggregate query (one round trip each)."""
+        # Import inside to avoid circular dependencies
+        from app.services.user_service import UserService
+        from app.services.server_service import ServerService
+        from app.services.order_service import OrderService
+        from app.services.invoice_service import InvoiceService
+        from app.services.support_service import SupportService
+        from app.services.referral_service import ReferralService
+
+        return _jsonable({
+            "user_stats": await UserService().get_user_stats(db),
+            "server_stats": await ServerService().get_server_stats(db),
+            "order_stats": await OrderService().get_order_stats(db),
+            "invoice_stats": await InvoiceService().get_invoice_stats(db),
+            "support_stats": await SupportService().get_support_stats(db),
+            "referral_stats": await ReferralService().get_admin_referral_stats(db),
+            "recent_activity": await UserService().get_recent_activity(db, limit=10),
+        })
+
+    async def refresh(self, db: AsyncSession) -> Tuple[Dict[str, Any], datetime]:
+        """Recompute and upsert the snapshot row."""
+        started = time.perf_counter()
+        data = await self.compute(db)
+        compute_ms = round((time.perf_counter() - started) * 1000, 2)
+        computed_at = datetime.now(timezone.utc)
+
+        stmt = pg_insert(StatsSnapshot).values(
+            key=ADMIN_DASHBOARD_KEY,
+            data=data,
+            computed_at=computed_at,
+            compute_ms=compute_ms,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StatsSnapshot.key],
+            set_={
+                "data": stmt.excluded.data,
+                "computed_at": stmt.excluded.computed_at,
+                "compute_ms": stmt.excluded.compute_ms,
+            },
+        )
+        await db.execute(stmt)
+        await db.commit()
+
+        AdminStatsService._local = (data, computed_at)
+        return data, computed_at
+
+    async def get_dashboard(self, db: AsyncSession) -> Tuple[Dict[str, Any], datetime]:
+        """Snapshot no older than the staleness bound, plus when it was computed."""
+        local = AdminStatsService._local
+        if local and self._fresh(local[1]):
+            return local
+
+        row = (await db.execute(
+            select(StatsSnapshot.data, StatsSnapshot.computed_at)
+            .where(StatsSnapshot.key == ADMIN_DASHBOARD_KEY)
+        )).first()
+        if row and self._fresh(row.computed_at):
+            AdminStatsService._local = (row.data, row.computed_at)
+            return row.data, row.computed_at
+
+        async with AdminStatsService._refresh_lock:
+            # Another request on this worker may have refreshed while we waited
+            local = AdminStatsService._local
+            if local and self._fresh(local[1]):
+                return local
+            return await self.refresh(db)
+
+    def _fresh(self, computed_at: Optional[datetime]) -> bool:
+        if computed_at is None:
+            return False
+        if computed_at.tzinfo is None:
+            computed_at = computed_at.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - computed_at < self.max_staleness
+
+
+async def refresh_admin_stats() -> None:
+    """Refresh the snapshot in a fresh session (job worker)."""
+    async with AsyncSessionLocal() as db:
+        await AdminStatsService().refresh(db)
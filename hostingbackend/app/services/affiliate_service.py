@@ -2,8 +2,7 @@
 Affiliate Service - Handles subscription, referral tracking, and commission calculations
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_, desc
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy import select, func, and_, desc
 from typing import Optional, List, Dict, Tuple
 from decimal import Decimal
 from datetime import datetime, timedelta
@@ -11,11 +10,16 @@ import secrets
 import string
 
 from app.models.affiliate import (
-    AffiliateSubscription, Referral, Commission, CommissionRule,
+    AffiliateSubscription, Referral, Commission,
     Payout, AffiliateStats, AffiliateStatus, CommissionStatus, PayoutStatus
 )
 from app.models.users import UserProfile
 from app.models.order import Order
+from app.core.database import AsyncSessionLocal, is_read_session
+from app.services.affiliate_stats_service import AffiliateStatsService, StatsDelta
+from app.services.earning_settlement_service import EarningSettlementService
+from app.services.referral_tree_service import ReferralTreeService
+from app.services.commission_engine import CommissionEngine
 from app.models.server import Server
 from app.schemas.affiliate import (
     AffiliateSubscriptionCreate, AffiliateSubscriptionResponse,
@@ -187,6 +191,7 @@ class AffiliateService:
         )
         db.add(referral_l1)
         await db.flush()
+        stats_delta = StatsDelta().referral_added(referrer_subscription.user_id, 1)
 
         # Update referred user's profile
         user_result = await db.execute(
@@ -196,17 +201,15 @@ class AffiliateService:
         if user:
             user.referred_by = referrer_subscription.user_id
 
-        # Track up to Level 2 and Level 3
-        current_referrer_id = referrer_subscription.user_id
+        # Extend the closure table, then read L2/L3 from it in one query
+        # instead of walking referred_by one level at a time
+        tree = ReferralTreeService()
+        await tree.add_referral(db, referred_user_id, referrer_subscription.user_id)
+        uplines = await tree.get_uplines(db, referred_user_id, max_depth=3)
         parent_referral_id = referral_l1.id
-        
+
         for level in [2, 3]:
-            # Find next level referrer
-            next_result = await db.execute(
-                select(UserProfile.referred_by).where(UserProfile.id == current_referrer_id)
-            )
-            next_referrer_id = next_result.scalar_one_or_none()
-            
+            next_referrer_id = uplines.get(level)
             if not next_referrer_id:
                 break
 
@@ -223,6 +226,7 @@ class AffiliateService:
             )
             db.add(referral)
             await db.flush()
+            stats_delta.referral_added(next_referrer_id, level)
             
             # Update user's referral levels
             if level == 2 and user:
@@ -231,19 +235,11 @@ class AffiliateService:
                 user.referral_level_3 = next_referrer_id
             
             parent_referral_id = referral.id
-            current_referrer_id = next_referrer_id
 
+        # Stats for all affected affiliates (L1, L2, L3) change in the same transaction
+        await AffiliateStatsService().apply(db, stats_delta)
         await db.commit()
         
-        # Update stats for all affected affiliates (L1, L2, L3)
-        await self._update_referral_counts(db, referrer_subscription.user_id)
-        
-        # Also update stats for L2 and L3 referrers if they exist
-        if user and user.referral_level_2:
-            await self._update_referral_counts(db, user.referral_level_2)
-        if user and user.referral_level_3:
-            await self._update_referral_counts(db, user.referral_level_3)
-        
         return referral_l1
 
     async def mark_referral_converted(
@@ -258,16 +254,16 @@ class AffiliateService:
             select(Referral).where(Referral.referred_user_id == user_id)
         )
         referrals = result.scalars().all()
+        stats_delta = StatsDelta()
 
         for referral in referrals:
             if not referral.has_purchased:
                 referral.has_purchased = True
                 referral.first_purchase_at = datetime.utcnow()
                 referral.first_purchase_amount = amount
-                
-                # Update stats
-                await self._update_referral_counts(db, referral.referrer_id)
+                stats_delta.referral_converted(referral.referrer_id, referral.level)
 
+        await AffiliateStatsService().apply(db, stats_delta)
         await db.commit()
 
     # ==================== Commission Management ====================
@@ -294,68 +290,22 @@ class AffiliateService:
         )
         referrals = result.scalars().all()
 
-        for referral in referrals:
-            # Get applicable commission rule
-            commission_rule = await self._get_commission_rule(
-                db, referral.level, product_type, order_amount
-            )
-            
-            if not commission_rule:
-                continue
-
-            # Calculate commission
-            if commission_rule.commission_type == 'percentage':
-                commission_amount = order_amount * (commission_rule.commission_value / 100)
-            else:
-                commission_amount = commission_rule.commission_value
-
-            # Create commission record (Legacy)
-            commission = Commission(
-                affiliate_user_id=referral.referrer_id,
-                referral_id=referral.id,
-                order_id=order_id,
-                level=referral.level,
-                commission_rule_id=commission_rule.id,
-                order_amount=order_amount,
-                commission_rate=commission_rule.commission_value,
-                commission_amount=commission_amount,
-                currency='INR',
-                status=CommissionStatus.PENDING
-            )
-            db.add(commission)
-
-            # Create ReferralEarning record (New System - used by Dashboard)
-            from app.models.referrals import ReferralEarning
-            
-            # Check if earning already exists to avoid duplicates
-            existing_earning = await db.execute(
-                select(ReferralEarning).where(
-                    and_(
-                        ReferralEarning.order_id == order_id,
-                        ReferralEarning.user_id == referral.referrer_id,
-                        ReferralEarning.level == referral.level
-                    )
-                )
-            )
-            if not existing_earning.scalar_one_or_none():
-                earning = ReferralEarning(
-                    user_id=referral.referrer_id,
-                    referred_user_id=user_id,
-                    order_id=order_id,
-                    level=referral.level,
-                    commission_rate=commission_rule.commission_value,
-                    order_amount=order_amount,
-                    commission_amount=commission_amount,
-                    status='pending'
-                )
-                db.add(earning)
-
+        # Rules come from the in-memory cache; Commission (legacy) and
+        # ReferralEarning (dashboard) rows for every level are written with
+        # one INSERT each, skipping levels already recorded for this order
+        engine = CommissionEngine()
+        lines = await engine.rule_lines(db, referrals, product_type, Decimal(order_amount))
+        await engine.record(
+            db,
+            order_id=order_id,
+            referred_user_id=user_id,
+            order_amount=order_amount,
+            lines=lines,
+            earning_status='pending',
+            with_commissions=True,
+        )
         await db.commit()
 
-        # Update affiliate stats for all referrers
-        for referral in referrals:
-            await self._update_commission_stats(db, referral.referrer_id)
-
     async def approve_commission(
         self,
         db: AsyncSession,
@@ -374,9 +324,6 @@ class AffiliateService:
             commission.approved_by = approved_by
             await db.commit()
             
-            # Update stats
-            await self._update_commission_stats(db, commission.affiliate_user_id)
-            
             return commission
         return None
 
@@ -476,12 +423,14 @@ class AffiliateService:
             status_history=status_history
         )
         db.add(payout)
+
+        # New pending payout reduces available_balance
+        await AffiliateStatsService().apply(
+            db, StatsDelta().payout_requested(user_id, payout_request.amount)
+        )
         await db.commit()
         await db.refresh(payout)
 
-        # Update stats to reflect new pending payout (reduces available_balance)
-        await self._update_commission_stats(db, user_id)
-
         return payout
 
     async def process_payout(
@@ -502,6 +451,9 @@ class AffiliateService:
         if not payout:
             return None
 
+        was_open = payout.status in (PayoutStatus.PENDING, PayoutStatus.PROCESSING)
+        stats_delta = StatsDelta()
+
         if action == 'approve':
             payout.status = PayoutStatus.PROCESSING
         elif action == 'complete':
@@ -509,22 +461,23 @@ class AffiliateService:
             payout.processed_at = datetime.utcnow()
             
             # Mark commissions as paid
-            await self._mark_commissions_paid(db, payout.affiliate_user_id, payout.amount, payout_id)
+            await self._mark_commissions_paid(db, payout.affiliate_user_id, payout.amount, payout_id, stats_delta)
+            if was_open:
+                stats_delta.payout_closed(payout.affiliate_user_id, payout.amount, completed=True)
         elif action == 'reject':
             payout.status = PayoutStatus.FAILED
             payout.processed_at = datetime.utcnow()
+            if was_open:
+                stats_delta.payout_closed(payout.affiliate_user_id, payout.amount, completed=False)
 
         payout.processed_by = processed_by
         payout.transaction_id = transaction_id
         payout.admin_notes = admin_notes
 
+        await AffiliateStatsService().apply(db, stats_delta)
         await db.commit()
         await db.refresh(payout)
 
-        # Update stats
-        if action == 'complete':
-            await self._update_commission_stats(db, payout.affiliate_user_id)
-
         return payout
 
     # ==================== Stats & Analytics ====================
@@ -542,11 +495,7 @@ class AffiliateService:
         stats = result.scalar_one_or_none()
 
         if not stats:
-            await self._initialize_affiliate_stats(db, user_id)
-            stats = await db.execute(
-                select(AffiliateStats).where(AffiliateStats.affiliate_user_id == user_id)
-            )
-            stats = stats.scalar_one()
+            stats = await self._initialize_affiliate_stats(db, user_id)
 
         # Get subscription info
         subscription = await self.get_user_subscription(db, user_id)
@@ -601,86 +550,82 @@ class AffiliateService:
         user_id: int,
         level: Optional[int] = None
     ) -> List[TeamMember]:
-        """Get team members at specific level or all levels"""
-        query = select(Referral).where(Referral.referrer_id == user_id)
-        
-        if level:
-            query = query.where(Referral.level == level)
-
-        query = query.options(selectinload(Referral.commissions))
-        
-        result = await db.execute(query)
-        referrals = result.scalars().all()
-
-        team_members = []
-        for ref in referrals:
-            # Get user details
-            user_result = await db.execute(
-                select(UserProfile).where(UserProfile.id == ref.referred_user_id)
-            )
-            user = user_result.scalar_one_or_none()
-            if not user:
-                continue
-
-            # Get total purchases
-            purchases_result = await db.execute(
-                select(func.coalesce(func.sum(Order.total_amount), 0)).where(
-                    and_(
-                        Order.user_id == ref.referred_user_id,
-                        Order.order_status.in_(['completed', 'active'])
-                    )
-                )
-            )
-            total_purchases = purchases_result.scalar() or Decimal('0')
+        """
+        Get team members at specific level or all levels
 
-            # Get total commission from this user (from ReferralEarning table)
-            from app.models.referrals import ReferralEarning
-            commission_result = await db.execute(
-                select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0)).where(
-                    and_(
-                        ReferralEarning.referred_user_id == ref.referred_user_id,
-                        ReferralEarning.user_id == user_id  # The user earning the commission
-                    )
-                )
-            )
-            total_commission = commission_result.scalar() or Decimal('0')
+        One statement: each per-member figure is a grouped aggregate over
+        the team's member ids, outer-joined to the member rows.
+        """
+        from app.models.referrals import ReferralEarning
 
-            # Get active servers count
-            servers_result = await db.execute(
-                select(func.count(Server.id)).where(
-                    and_(
-                        Server.user_id == ref.referred_user_id,
-                        Server.server_status.in_(['active', 'running'])
-                    )
-                )
+        team = select(Referral.referred_user_id).where(Referral.referrer_id == user_id)
+        if level:
+            team = team.where(Referral.level == level)
+        team = team.cte("team_members")
+        team_ids = select(team.c.referred_user_id)
+
+        purchases = (
+            select(Order.user_id, func.sum(Order.total_amount).label("total_purchases"))
+            .where(Order.user_id.in_(team_ids), Order.order_status.in_(['completed', 'active']))
+            .group_by(Order.user_id)
+            .cte("team_purchases")
+        )
+        earnings = (
+            select(ReferralEarning.referred_user_id, func.sum(ReferralEarning.commission_amount).label("total_commission"))
+            .where(ReferralEarning.user_id == user_id, ReferralEarning.referred_user_id.in_(team_ids))
+            .group_by(ReferralEarning.referred_user_id)
+            .cte("team_earnings")
+        )
+        servers = (
+            select(Server.user_id, func.count(Server.id).label("active_servers"))
+            .where(Server.user_id.in_(team_ids), Server.server_status.in_(['active', 'running']))
+            .group_by(Server.user_id)
+            .cte("team_servers")
+        )
+        children = (
+            select(Referral.referrer_id, func.count(Referral.id).label("child_count"))
+            .where(Referral.referrer_id.in_(team_ids), Referral.level == 1)
+            .group_by(Referral.referrer_id)
+            .cte("team_children")
+        )
+
+        query = (
+            select(
+                Referral,
+                UserProfile,
+                func.coalesce(purchases.c.total_purchases, 0).label("total_purchases"),
+                func.coalesce(earnings.c.total_commission, 0).label("total_commission"),
+                func.coalesce(servers.c.active_servers, 0).label("active_servers"),
+                func.coalesce(children.c.child_count, 0).label("child_count"),
             )
-            active_servers = servers_result.scalar() or 0
+            .join(UserProfile, UserProfile.id == Referral.referred_user_id)
+            .outerjoin(purchases, purchases.c.user_id == Referral.referred_user_id)
+            .outerjoin(earnings, earnings.c.referred_user_id == Referral.referred_user_id)
+            .outerjoin(servers, servers.c.user_id == Referral.referred_user_id)
+            .outerjoin(children, children.c.referrer_id == Referral.referred_user_id)
+            .where(Referral.referrer_id == user_id)
+            .order_by(Referral.level, Referral.created_at, Referral.id)
+        )
+        if level:
+            query = query.where(Referral.level == level)
 
-            # Get child count (direct referrals of this member)
-            child_result = await db.execute(
-                select(func.count(Referral.id)).where(
-                    and_(
-                        Referral.referrer_id == ref.referred_user_id,
-                        Referral.level == 1
-                    )
-                )
-            )
-            child_count = child_result.scalar() or 0
+        result = await db.execute(query)
 
-            team_members.append(TeamMember(
+        return [
+            TeamMember(
                 user_id=user.id,
                 email=user.email,
                 full_name=user.full_name,
                 level=ref.level,
                 joined_at=ref.created_at,
                 has_purchased=ref.has_purchased,
-                total_purchases=total_purchases,
-                total_commission=total_commission,
+                total_purchases=Decimal(total_purchases),
+                total_commission=Decimal(total_commission),
                 active_servers=active_servers,
                 child_count=child_count
-            ))
-
-        return team_members
+            )
+            for ref, user, total_purchases, total_commission, active_servers, child_count in result.all()
+        ]
 
     async def get_recent_commissions(
         self,
@@ -688,39 +633,19 @@ class AffiliateService:
         user_id: int,
         limit: int = 10
     ) -> List[CommissionDetail]:
-        """Get recent commissions"""
+        """Get recent commissions (referred user and order joined in the same query)"""
         result = await db.execute(
-            select(Commission)
+            select(Commission, UserProfile.email, Order.id.label("existing_order_id"))
+            .outerjoin(Referral, Referral.id == Commission.referral_id)
+            .outerjoin(UserProfile, UserProfile.id == Referral.referred_user_id)
+            .outerjoin(Order, Order.id == Commission.order_id)
             .where(Commission.affiliate_user_id == user_id)
             .order_by(desc(Commission.created_at))
             .limit(limit)
-            .options(
-                selectinload(Commission.referral)
-            )
         )
-        commissions = result.scalars().all()
-
-        details = []
-        for comm in commissions:
-            # Get referred user email
-            referred_email = None
-            if comm.referral:
-                user_result = await db.execute(
-                    select(UserProfile.email).where(UserProfile.id == comm.referral.referred_user_id)
-                )
-                referred_email = user_result.scalar_one_or_none()
 
-            # Get order description
-            order_desc = None
-            if comm.order_id:
-                order_result = await db.execute(
-                    select(Order).where(Order.id == comm.order_id)
-                )
-                order = order_result.scalar_one_or_none()
-                if order:
-                    order_desc = f"Order #{order.id}"
-
-            details.append(CommissionDetail(
+        return [
+            CommissionDetail(
                 id=comm.id,
                 affiliate_user_id=comm.affiliate_user_id,
                 level=comm.level,
@@ -733,279 +658,56 @@ class AffiliateService:
                 paid_at=comm.paid_at,
                 created_at=comm.created_at,
                 referred_user_email=referred_email,
-                order_description=order_desc
-            ))
-
-        return details
-
-    # ==================== Helper Methods ====================
-
-    async def _initialize_affiliate_stats(self, db: AsyncSession, user_id: int):
-        """Initialize affiliate stats record"""
-        stats = AffiliateStats(
-            affiliate_user_id=user_id,
-            total_referrals_level1=0,
-            total_referrals_level2=0,
-            total_referrals_level3=0,
-            total_referrals=0,
-            active_referrals_level1=0,
-            active_referrals_level2=0,
-            active_referrals_level3=0,
-            active_referrals=0,
-            total_commission_earned=Decimal('0'),
-            pending_commission=Decimal('0'),
-            approved_commission=Decimal('0'),
-            paid_commission=Decimal('0'),
-            available_balance=Decimal('0'),
-            total_payouts=0,
-            total_payout_amount=Decimal('0')
-        )
-        db.add(stats)
-        await db.commit()
-
-    async def _update_referral_counts(self, db: AsyncSession, user_id: int):
-        """Update referral counts in stats"""
-        stats_result = await db.execute(
-            select(AffiliateStats).where(AffiliateStats.affiliate_user_id == user_id)
-        )
-        stats = stats_result.scalar_one_or_none()
-        if not stats:
-            await self._initialize_affiliate_stats(db, user_id)
-            return
-
-        # Count referrals by level
-        for level in [1, 2, 3]:
-            # Total referrals
-            total_result = await db.execute(
-                select(func.count(Referral.id)).where(
-                    and_(
-                        Referral.referrer_id == user_id,
-                        Referral.level == level
-                    )
-                )
+                order_description=f"Order #{existing_order_id}" if existing_order_id else None
             )
-            total = total_result.scalar() or 0
+            for comm, referred_email, existing_order_id in result.all()
+        ]
 
-            # Active referrals (with purchases)
-            active_result = await db.execute(
-                select(func.count(Referral.id)).where(
-                    and_(
-                        Referral.referrer_id == user_id,
-                        Referral.level == level,
-                        Referral.has_purchased == True
-                    )
-                )
-            )
-            active = active_result.scalar() or 0
-
-            if level == 1:
-                stats.total_referrals_level1 = total
-                stats.active_referrals_level1 = active
-            elif level == 2:
-                stats.total_referrals_level2 = total
-                stats.active_referrals_level2 = active
-            else:
-                stats.total_referrals_level3 = total
-                stats.active_referrals_level3 = active
-
-        stats.total_referrals = stats.total_referrals_level1 + stats.total_referrals_level2 + stats.total_referrals_level3
-        stats.active_referrals = stats.active_referrals_level1 + stats.active_referrals_level2 + stats.active_referrals_level3
-
-        await db.commit()
-
-    async def _update_commission_stats(self, db: AsyncSession, user_id: int):
-        """Update commission stats from ReferralEarning table"""
-        from app.models.referrals import ReferralEarning
-        
-        stats_result = await db.execute(
-            select(AffiliateStats).where(AffiliateStats.affiliate_user_id == user_id)
-        )
-        stats = stats_result.scalar_one_or_none()
-        if not stats:
-            return
-
-        # Total earned (all statuses)
-        total_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0)).where(
-                ReferralEarning.user_id == user_id
-            )
-        )
-        stats.total_commission_earned = total_result.scalar() or Decimal('0')
-
-        # Pending
-        pending_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0)).where(
-                and_(
-                    ReferralEarning.user_id == user_id,
-                    ReferralEarning.status == 'pending'
-                )
-            )
-        )
-        stats.pending_commission = pending_result.scalar() or Decimal('0')
-
-        # Approved
-        approved_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0)).where(
-                and_(
-                    ReferralEarning.user_id == user_id,
-                    ReferralEarning.status == 'approved'
-                )
-            )
-        )
-        stats.approved_commission = approved_result.scalar() or Decimal('0')
-
-        # Paid
-        paid_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0)).where(
-                and_(
-                    ReferralEarning.user_id == user_id,
-                    ReferralEarning.status == 'paid'
-                )
-            )
-        )
-        stats.paid_commission = paid_result.scalar() or Decimal('0')
-
-        # Payouts
-        payout_count_result = await db.execute(
-            select(func.count(Payout.id)).where(
-                and_(
-                    Payout.affiliate_user_id == user_id,
-                    Payout.status == PayoutStatus.COMPLETED
-                )
-            )
-        )
-        stats.total_payouts = payout_count_result.scalar() or 0
-
-        payout_amount_result = await db.execute(
-            select(func.coalesce(func.sum(Payout.amount), 0)).where(
-                and_(
-                    Payout.affiliate_user_id == user_id,
-                    Payout.status == PayoutStatus.COMPLETED
-                )
-            )
-        )
-        stats.total_payout_amount = payout_amount_result.scalar() or Decimal('0')
-
-        # Get pending payout amount (PENDING + PROCESSING status)
-        pending_payouts_result = await db.execute(
-            select(func.coalesce(func.sum(Payout.amount), 0)).where(
-                and_(
-                    Payout.affiliate_user_id == user_id,
-                    Payout.status.in_([PayoutStatus.PENDING, PayoutStatus.PROCESSING])
-                )
-            )
-        )
-        pending_payouts_amount = pending_payouts_result.scalar() or Decimal('0')
+    # ==================== Helper Methods ====================
 
-        # Available balance = approved - (completed payouts + pending payouts)
-        # ALWAYS ensure balance is never negative
-        stats.available_balance = max(
-            Decimal('0'),
-            stats.approved_commission - stats.total_payout_amount - pending_payouts_amount
-        )
+    async def _initialize_affiliate_stats(self, db: AsyncSession, user_id: int) -> AffiliateStats:
+        """Initialize affiliate stats record (on the primary when `db` is a replica session)"""
+        if is_read_session(db):
+            async with AsyncSessionLocal() as primary:
+                return await self._initialize_affiliate_stats(primary, user_id)
 
+        await AffiliateStatsService().ensure_rows(db, [user_id])
         await db.commit()
-
-
-    async def _get_commission_rule(
-        self,
-        db: AsyncSession,
-        level: int,
-        product_type: str,
-        order_amount: Decimal
-    ) -> Optional[CommissionRule]:
-        """Get applicable commission rule"""
         result = await db.execute(
-            select(CommissionRule).where(
-                and_(
-                    CommissionRule.level == level,
-                    or_(
-                        CommissionRule.product_type == product_type,
-                        CommissionRule.product_type == 'all',
-                        CommissionRule.product_type == None
-                    ),
-                    CommissionRule.is_active == True,
-                    or_(
-                        CommissionRule.min_purchase_amount == None,
-                        CommissionRule.min_purchase_amount <= order_amount
-                    ),
-                    or_(
-                        CommissionRule.max_purchase_amount == None,
-                        CommissionRule.max_purchase_amount >= order_amount
-                    )
-                )
-            ).order_by(desc(CommissionRule.priority))
+            select(AffiliateStats).where(AffiliateStats.affiliate_user_id == user_id)
         )
-        return result.scalars().first()
+        return result.scalar_one()
 
     async def _mark_commissions_paid(
         self,
         db: AsyncSession,
         user_id: int,
         amount: Decimal,
-        payout_id: int
+        payout_id: int,
+        stats_delta: Optional[StatsDelta] = None
     ):
-        """Mark commissions as paid for a payout - updates both Commission and ReferralEarning"""
-        from app.models.referrals import ReferralEarning
-        
-        # Get the payout to check if it's individual or total
+        """Mark commissions as paid for a payout - updates both Commission and ReferralEarning.
+
+        Runs inside the caller's transaction (process_payout commits once).
+        """
+        settlement = EarningSettlementService()
+        if stats_delta is None:
+            stats_delta = StatsDelta()
+
         payout_result = await db.execute(
-            select(Payout).where(Payout.id == payout_id)
+            select(Payout.payout_type, Payout.earning_id).where(Payout.id == payout_id)
         )
-        payout = payout_result.scalar_one_or_none()
-        
+        payout = payout_result.one_or_none()
+
         if not payout:
             return
-        
-        # Handle individual payout - mark specific earning as paid
+
         if payout.payout_type == 'individual' and payout.earning_id:
-            earning_result = await db.execute(
-                select(ReferralEarning).where(ReferralEarning.id == payout.earning_id)
-            )
-            earning = earning_result.scalar_one_or_none()
-            if earning:
-                earning.status = 'paid'
-                earning.paid_at = datetime.utcnow()
+            # Individual payout - the specific earning, whatever unpaid state it is in
+            await settlement.transition(db, [payout.earning_id], ('pending', 'approved'), 'paid', stats_delta)
         else:
-            # Handle total payout - mark approved earnings up to the payout amount
-            earnings_result = await db.execute(
-                select(ReferralEarning).where(
-                    and_(
-                        ReferralEarning.user_id == user_id,
-                        ReferralEarning.status == 'approved'
-                    )
-                ).order_by(ReferralEarning.earned_at)
-            )
-            earnings = earnings_result.scalars().all()
-            
-            remaining_for_earnings = amount
-            for earning in earnings:
-                if remaining_for_earnings <= 0:
-                    break
-                earning.status = 'paid'
-                earning.paid_at = datetime.utcnow()
-                remaining_for_earnings -= earning.commission_amount
-        
-        # Also mark legacy Commission records as paid (if they exist)
-        result = await db.execute(
-            select(Commission).where(
-                and_(
-                    Commission.affiliate_user_id == user_id,
-                    Commission.status == CommissionStatus.APPROVED,
-                    Commission.payout_id == None
-                )
-            ).order_by(Commission.created_at).limit(100)  # Safety limit
-        )
-        commissions = result.scalars().all()
+            # Total payout - approved earnings, oldest first, up to the payout amount
+            await settlement.mark_paid_up_to(db, user_id, amount, stats_delta)
 
-        remaining = amount
-        for comm in commissions:
-            if remaining <= 0:
-                break
-            
-            comm.status = CommissionStatus.PAID
-            comm.paid_at = datetime.utcnow()
-            comm.payout_id = payout_id
-            remaining -= comm.commission_amount
-
-        await db.commit()
+        # Also mark legacy Commission records as paid (if they exist)
+        await settlement.mark_commissions_paid_up_to(db, user_id, amount, payout_id)
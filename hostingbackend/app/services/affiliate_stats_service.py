@@ -0,0 +1,355 @@
+"""
+Incremental maintenance of `affiliate_stats`.
+
+Every referral / earning / payout event used to recount an affiliate's
+whole history (about 10 COUNT/SUM queries) for each upline it touched.
+Events now record what changed in a `StatsDelta` and apply it with one
+upsert in the originating transaction:
+
+    INSERT INTO affiliate_stats (...) VALUES (...), (...)
+    ON CONFLICT (affiliate_user_id) DO UPDATE
+        SET total_referrals = affiliate_stats.total_referrals + excluded.total_referrals, ...
+
+Rows are updated atomically in the database, so concurrent events for the
+same affiliate cannot lose updates. `reconcile` recomputes the truth with
+a few set-based GROUP BY queries and repairs any drift (paths that bypass
+the deltas, manual SQL, ...); the job worker runs it periodically.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal
+from app.models.affiliate import AffiliateStats, Referral, Payout, PayoutStatus
+from app.models.referrals import ReferralEarning
+
+
+COUNT_COLUMNS = [
+    "total_referrals_level1", "total_referrals_level2", "total_referrals_level3", "total_referrals",
+    "active_referrals_level1", "active_referrals_level2", "active_referrals_level3", "active_referrals",
+    "total_payouts",
+]
+AMOUNT_COLUMNS = [
+    "total_commission_earned", "pending_commission", "approved_commission", "paid_commission",
+    "total_payout_amount", "pending_payout_amount",
+]
+DELTA_COLUMNS = COUNT_COLUMNS + AMOUNT_COLUMNS
+
+# ReferralEarning.status -> stats column holding that status' total
+EARNING_STATUS_COLUMNS = {
+    "pending": "pending_commission",
+    "approved": "approved_commission",
+    "paid": "paid_commission",
+}
+
+OPEN_PAYOUT_STATUSES = (PayoutStatus.PENDING, PayoutStatus.PROCESSING)
+
+
+def _zero(column: str):
+    return Decimal("0") if column in AMOUNT_COLUMNS else 0
+
+
+def _available_balance(approved, paid_out, pending_payouts) -> Decimal:
+    """Approved commission minus completed and in-flight payouts, never negative."""
+    return max(Decimal("0"), Decimal(approved) - Decimal(paid_out) - Decimal(pending_payouts))
+
+
+class StatsDelta:
+    """Accumulates per-affiliate counter changes for one transaction."""
+
+    def __init__(self):
+        self._changes: Dict[int, Dict[str, Any]] = defaultdict(dict)
+
+    def add(self, user_id: Optional[int], **changes) -> "StatsDelta":
+        if not user_id:
+            return self
+        row = self._changes[user_id]
+        for column, value in changes.items():
+            row[column] = row.get(column, _zero(column)) + value
+        return self
+
+    # ---- Referral events ----
+    def referral_added(self, referrer_id: int, level: int) -> "StatsDelta":
+        return self.add(referrer_id, **{f"total_referrals_level{level}": 1, "total_referrals": 1})
+
+    def referral_converted(self, referrer_id: int, level: int) -> "StatsDelta":
+        return self.add(referrer_id, **{f"active_referrals_level{level}": 1, "active_referrals": 1})
+
+    # ---- Earning events ----
+    def earning_created(self, user_id: int, amount: Decimal, status: str = "pending") -> "StatsDelta":
+        amount = Decimal(str(amount or 0))
+        changes = {"total_commission_earned": amount}
+        column = EARNING_STATUS_COLUMNS.get(status)
+        if column:
+            changes[column] = amount
+        return self.add(user_id, **changes)
+
+    def earning_status_changed(self, user_id: int, amount: Decimal, old_status: str, new_status: str) -> "StatsDelta":
+        amount = Decimal(str(amount or 0))
+        changes: Dict[str, Any] = {}
+        if old_status in EARNING_STATUS_COLUMNS:
+            changes[EARNING_STATUS_COLUMNS[old_status]] = -amount
+        if new_status in EARNING_STATUS_COLUMNS:
+            column = EARNING_STATUS_COLUMNS[new_status]
+            changes[column] = changes.get(column, Decimal("0")) + amount
+        return self.add(user_id, **changes)
+
+    # ---- Payout events ----
+    def payout_requested(self, user_id: int, amount: Decimal) -> "StatsDelta":
+        return self.add(user_id, pending_payout_amount=Decimal(str(amount or 0)))
+
+    def payout_closed(self, user_id: int, amount: Decimal, completed: bool) -> "StatsDelta":
+        """An open (pending/processing) payout was completed or rejected."""
+        amount = Decimal(str(amount or 0))
+        if completed:
+            return self.add(user_id, pending_payout_amount=-amount, total_payouts=1, total_payout_amount=amount)
+        return self.add(user_id, pending_payout_amount=-amount)
+
+    def __bool__(self) -> bool:
+        return any(any(v for v in row.values()) for row in self._changes.values())
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """One full row per affiliate, ordered by id so concurrent upserts lock in the same order."""
+        rows = []
+        for user_id in sorted(self._changes):
+            row = {column: _zero(column) for column in DELTA_COLUMNS}
+            row.update(self._changes[user_id])
+            row["affiliate_user_id"] = user_id
+            rows.append(row)
+        return rows
+
+
+class AffiliateStatsService:
+    """Applies `StatsDelta`s and reconciles `affiliate_stats` against source tables."""
+
+    async def apply(self, db: AsyncSession, delta: StatsDelta) -> None:
+        """Upsert every affiliate in the delta with one statement (does not commit)."""
+        if not delta:
+            return
+
+        rows = delta.rows()
+        for row in rows:
+            # Value used only when the row is created by this statement
+            row["available_balance"] = _available_balance(
+                row["approved_commission"], row["total_payout_amount"], row["pending_payout_amount"]
+            )
+
+        stmt = pg_insert(AffiliateStats).values(rows)
+        excluded = stmt.excluded
+        table = AffiliateStats.__table__.c
+
+        def updated(column: str):
+            # Rows created before a column existed may hold NULL
+            return func.coalesce(table[column], 0) + excluded[column]
+
+        set_ = {column: updated(column) for column in DELTA_COLUMNS}
+        # SET expressions see the old row, so derive the balance from old + delta
+        set_["available_balance"] = func.greatest(
+            0,
+            updated("approved_commission")
+            - updated("total_payout_amount")
+            - updated("pending_payout_amount"),
+        )
+        set_["updated_at"] = func.now()
+
+        await db.execute(
+            stmt.on_conflict_do_update(index_elements=[AffiliateStats.affiliate_user_id], set_=set_)
+        )
+
+    async def ensure_rows(self, db: AsyncSession, user_ids: Iterable[int]) -> None:
+        """Create zeroed rows for affiliates that have none yet (does not commit)."""
+        rows = [
+            {"affiliate_user_id": user_id, **{column: _zero(column) for column in DELTA_COLUMNS},
+             "available_balance": Decimal("0")}
+            for user_id in sorted(set(user_ids))
+        ]
+        if rows:
+            await db.execute(
+                pg_insert(AffiliateStats).values(rows).on_conflict_do_nothing(
+                    index_elements=[AffiliateStats.affiliate_user_id]
+                )
+            )
+
+    # ------------------------------------------------------------------
+    # Reconciliation
+    # ------------------------------------------------------------------
+    async def compute_expected(
+        self,
+        db: AsyncSession,
+        user_ids: Optional[Iterable[int]] = None,
+    ) -> Dict[int, Dict[str, Any]]:
+        """Recount every stats column from referrals, earnings and payouts (3 queries)."""
+        user_ids = list(user_ids) if user_ids is not None else None
+        expected: Dict[int, Dict[str, Any]] = defaultdict(
+            lambda: {column: _zero(column) for column in DELTA_COLUMNS}
+        )
+
+        referral_stmt = select(
+            Referral.referrer_id,
+            *[
+                func.count(Referral.id).filter(Referral.level == level).label(f"total_referrals_level{level}")
+                for level in (1, 2, 3)
+            ],
+            *[
+                func.count(Referral.id).filter(Referral.level == level, Referral.has_purchased == True).label(
+                    f"active_referrals_level{level}"
+                )
+                for level in (1, 2, 3)
+            ],
+        ).group_by(Referral.referrer_id)
+        if user_ids is not None:
+            referral_stmt = referral_stmt.where(Referral.referrer_id.in_(user_ids))
+
+        for row in (await db.execute(referral_stmt)).mappings():
+            target = expected[row["referrer_id"]]
+            for level in (1, 2, 3):
+                target[f"total_referrals_level{level}"] = row[f"total_referrals_level{level}"]
+                target[f"active_referrals_level{level}"] = row[f"active_referrals_level{level}"]
+            target["total_referrals"] = sum(row[f"total_referrals_level{level}"] for level in (1, 2, 3))
+            target["active_referrals"] = sum(row[f"active_referrals_level{level}"] for level in (1, 2, 3))
+
+        amount = ReferralEarning.commission_amount
+        earning_stmt = select(
+            ReferralEarning.user_id,
+            func.coalesce(func.sum(amount), 0).label("total_commission_earned"),
+            *[
+                func.coalesce(func.sum(amount).filter(ReferralEarning.status == status), 0).label(column)
+                for status, column in EARNING_STATUS_COLUMNS.items()
+            ],
+        ).group_by(ReferralEarning.user_id)
+        if user_ids is not None:
+            earning_stmt = earning_stmt.where(ReferralEarning.user_id.in_(user_ids))
+
+        for row in (await db.execute(earning_stmt)).mappings():
+            target = expected[row["user_id"]]
+            target["total_commission_earned"] = Decimal(row["total_commission_earned"])
+            for column in EARNING_STATUS_COLUMNS.values():
+                target[column] = Decimal(row[column])
+
+        completed = Payout.status == PayoutStatus.COMPLETED
+        payout_stmt = select(
+            Payout.affiliate_user_id,
+            func.count(Payout.id).filter(completed).label("total_payouts"),
+            func.coalesce(func.sum(Payout.amount).filter(completed), 0).label("total_payout_amount"),
+            func.coalesce(
+                func.sum(Payout.amount).filter(Payout.status.in_(OPEN_PAYOUT_STATUSES)), 0
+            ).label("pending_payout_amount"),
+        ).group_by(Payout.affiliate_user_id)
+        if user_ids is not None:
+            payout_stmt = payout_stmt.where(Payout.affiliate_user_id.in_(user_ids))
+
+        for row in (await db.execute(payout_stmt)).mappings():
+            target = expected[row["affiliate_user_id"]]
+            target["total_payouts"] = row["total_payouts"]
+            target["total_payout_amount"] = Decimal(row["total_payout_amount"])
+            target["pending_payout_amount"] = Decimal(row["pending_payout_amount"])
+
+        for values in expected.values():
+            values["available_balance"] = _available_balance(
+                values["approved_commission"], values["total_payout_amount"], values["pending_payout_amount"]
+            )
+        return dict(expected)
+
+    async def reconcile(
+        self,
+        db: AsyncSession,
+        user_ids: Optional[Iterable[int]] = None,
+        repair: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Compare stored counters with a fresh recount.
+
+        The comparison takes no locks. With repair=True, only the drifted
+        rows are then locked (in affiliate id order, like `apply`), recounted
+        and overwritten, missing rows for affiliates with activity are
+        created, and the transaction committed. Recounting under the lock
+        keeps a delta committed since the first pass from being overwritten
+        by stale absolute values, while a delta blocked on the lock is
+        applied on top of them afterwards.
+        """
+        user_ids = list(user_ids) if user_ids is not None else None
+
+        stored = await self._stored(db, user_ids)
+        expected = await self.compute_expected(db, user_ids)
+        now = datetime.now(timezone.utc)
+        drifted, _, creates = self._compare(stored, expected, now)
+
+        if repair:
+            drifted_ids = [entry["affiliate_user_id"] for entry in drifted]
+            if drifted_ids:
+                locked = await self._stored(db, drifted_ids, lock=True)
+                recount = await self.compute_expected(db, drifted_ids)
+                _, updates, _ = self._compare(locked, recount, now)
+                if updates:
+                    await db.execute(update(AffiliateStats), updates)
+            if creates:
+                await db.execute(pg_insert(AffiliateStats).values(creates).on_conflict_do_nothing(
+                    index_elements=[AffiliateStats.affiliate_user_id]
+                ))
+            await db.commit()
+
+        return {
+            "checked": len(stored),
+            "drifted": len(drifted),
+            "created": len(creates),
+            "repaired": repair,
+            "details": drifted[:50],
+        }
+
+    async def _stored(
+        self,
+        db: AsyncSession,
+        user_ids: Optional[List[int]],
+        lock: bool = False,
+    ) -> Dict[int, AffiliateStats]:
+        stmt = select(AffiliateStats).order_by(AffiliateStats.affiliate_user_id)
+        if user_ids is not None:
+            stmt = stmt.where(AffiliateStats.affiliate_user_id.in_(user_ids))
+        if lock:
+            stmt = stmt.with_for_update().execution_options(populate_existing=True)
+        return {row.affiliate_user_id: row for row in (await db.execute(stmt)).scalars()}
+
+    @staticmethod
+    def _compare(
+        stored: Dict[int, AffiliateStats],
+        expected: Dict[int, Dict[str, Any]],
+        now: datetime,
+    ):
+        """(drift details, row updates, rows to create) for stored vs expected."""
+        compared = DELTA_COLUMNS + ["available_balance"]
+        empty = {column: _zero(column) for column in compared}
+        empty["available_balance"] = Decimal("0")
+
+        drifted: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        creates: List[Dict[str, Any]] = []
+
+        for user_id in sorted(set(stored) | set(expected)):
+            want = expected.get(user_id, empty)
+            row = stored.get(user_id)
+            if row is None:
+                creates.append({"affiliate_user_id": user_id, **want, "last_calculated_at": now})
+                continue
+
+            diff = {
+                column: {"stored": getattr(row, column), "expected": want[column]}
+                for column in compared
+                if (getattr(row, column) or _zero(column)) != want[column]
+            }
+            if diff:
+                drifted.append({"affiliate_user_id": user_id, "columns": diff})
+                updates.append({"id": row.id, **{column: want[column] for column in compared}, "last_calculated_at": now})
+
+        return drifted, updates, creates
+
+
+async def reconcile_affiliate_stats() -> Dict[str, Any]:
+    """Run a full reconciliation in a fresh session (job worker / CLI)."""
+    async with AsyncSessionLocal() as db:
+        return await AffiliateStatsService().reconcile(db)
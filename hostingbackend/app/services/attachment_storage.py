@@ -0,0 +1,318 @@
+"""
+Storage backends for encrypted ticket attachments.
+
+`SecureFileService` encrypts into a local temp file and hands it to the
+configured backend; reads are ranged so a download (or an HTTP Range
+request) only fetches the encrypted segments it needs.
+
+- `LocalAttachmentStorage`: a directory on this host (ATTACHMENT_STORAGE_DIR),
+  outside the StaticFiles mount.
+- `S3AttachmentStorage`: any S3-compatible object store (AWS S3, MinIO,
+  R2, ...), spoken over httpx with SigV4 signing. Lets all API workers on
+  all hosts share one store.
+
+Select with ATTACHMENT_STORAGE_BACKEND = "local" | "s3".
+"""
+
+import asyncio
+import datetime
+import hashlib
+import hmac
+import os
+import shutil
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+
+import httpx
+
+from app.core.config import settings
+
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class StorageError(Exception):
+    """Raised when the backend cannot store or return an object."""
+
+
+class AttachmentStorage(ABC):
+    """Interface implemented by every backend; failures raise `StorageError`."""
+
+    name = "base"
+
+    @abstractmethod
+    async def put_file(self, key: str, local_path: Path) -> None:
+        """Store the file at `local_path` under `key` (the file may be moved)."""
+
+    @abstractmethod
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield bytes [start, end) of an object (to the end when `end` is None)."""
+
+    async def read_range(self, key: str, start: int, end: int) -> bytes:
+        return b"".join([block async for block in self.iter_range(key, start, end)])
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        """True if an object is stored under `key`."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove `key`; a missing object is not an error."""
+
+    async def aclose(self) -> None:
+        pass
+
+
+class LocalAttachmentStorage(AttachmentStorage):
+    """Objects are files under `root`; blocking I/O runs in the threadpool."""
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise StorageError(f"Invalid storage key: {key}")
+        return path
+
+    async def put_file(self, key: str, local_path: Path) -> None:
+        target = self._path(key)
+
+        def move() -> None:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # shutil.move semantics without a second copy when on the same device
+            try:
+                os.replace(local_path, target)
+            except OSError:
+                shutil.copyfile(local_path, target)
+
+        await asyncio.to_thread(move)
+
+    async def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        path = self._path(key)
+        try:
+            f = await asyncio.to_thread(open, path, "rb")
+        except FileNotFoundError as e:
+            raise StorageError(f"Object not found: {key}") from e
+        try:
+            await asyncio.to_thread(f.seek, start)
+            position = start
+            while end is None or position < end:
+                size = READ_BLOCK_SIZE if end is None else min(READ_BLOCK_SIZE, end - position)
+                block = await asyncio.to_thread(f.read, size)
+                if not block:
+                    break
+                position += len(block)
+                yield block
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self._path(key).exists)
+
+    async def delete(self, key: str) -> None:
+        path = self._path(key)
+
+        def remove() -> None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        await asyncio.to_thread(remove)
+
+
+class S3AttachmentStorage(AttachmentStorage):
+    """S3-compatible object store (path-style URLs, SigV4, unsigned payload)."""
+
+    name = "s3"
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        timeout: float = 30.0,
+    ):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.host = httpx.URL(self.endpoint_url).netloc.decode()
+
+        client_kwargs = {"timeout": httpx.Timeout(timeout, connect=5.0)}
+        if transport is not None:
+            client_kwargs["transport"] = transport
+        self._client = httpx.AsyncClient(**client_kwargs)
+
+    # ------------------------------------------------------------------
+    # SigV4
+    # ------------------------------------------------------------------
+    def _object_path(self, key: str) -> str:
+        return f"/{quote(self.bucket)}/{quote(key, safe='/')}"
+
+    def _sign(self, method: str, path: str, headers: dict) -> dict:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+
+        signed = {
+            **{k.lower(): str(v).strip() for k, v in headers.items()},
+            "host": self.host,
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": "UNSIGNED-PAYLOAD",
+        }
+        signed_names = ";".join(sorted(signed))
+        canonical_request = "\n".join([
+            method,
+            path,
+            "",
+            "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+            signed_names,
+            "UNSIGNED-PAYLOAD",
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+
+        def _hmac(key: bytes, msg: str) -> bytes:
+            return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+        signing_key = _hmac(_hmac(_hmac(_hmac(f"AWS4{self.secret_key}".encode(), date_stamp), self.region), "s3"), "aws4_request")
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        signed["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_names}, Signature={signature}"
+        )
+        signed.pop("host")
+        return signed
+
+    def _request(self, method: str, key: str, headers: Optional[dict] = None, **kwargs) -> httpx.Request:
+        path = self._object_path(key)
+        return self._client.build_request(
+            method,
+            f"{self.endpoint_url}{path}",
+            headers=self._sign(method, path, headers or {}),
+            **kwargs,
+        )
+
+    async def _send(self, request: httpx.Request, key: str, **kwargs) -> httpx.Response:
+        # Network failures surface as StorageError like any other backend failure
+        try:
+            return await self._client.send(request, **kwargs)
+        except httpx.HTTPError as e:
+            raise StorageError(f"S3 {request.method} {key} failed: {e}") from e
+
+    # ------------------------------------------------------------------
+    # Operations
+    # ------------------------------------------------------------------
+    async def put_file(self, key: str, local_path: Path) -> None:
+        size = await asyncio.to_thread(os.path.getsize, local_path)
+
+        async def body() -> AsyncIterator[bytes]:
+            f = await asyncio.to_thread(open, local_path, "rb")
+            try:
+                while True:
+                    block = await asyncio.to_thread(f.read, READ_BLOCK_SIZE)
+                    if not block:
+                        break
+                    yield block
+            finally:
+                await asyncio.to_thread(f.close)
+
+        request = self._request(
+            "PUT", key,
+            headers={"content-length": str(size), "content-type": "application/octet-stream"},
+            content=body(),
+        )
+        response = await self._send(request, key)
+        if response.status_code not in (200, 201):
+            raise StorageError(f"S3 PUT {key} failed with HTTP {response.status_code}")
+
+    async def iter_range(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        if end is not None and end <= start:
+            return
+        byte_range = f"bytes={start}-" if end is None else f"bytes={start}-{end - 1}"
+        request = self._request("GET", key, headers={"range": byte_range})
+        response = await self._send(request, key, stream=True)
+        try:
+            if response.status_code == 404:
+                raise StorageError(f"Object not found: {key}")
+            if response.status_code not in (200, 206):
+                raise StorageError(f"S3 GET {key} failed with HTTP {response.status_code}")
+            try:
+                async for block in response.aiter_bytes(READ_BLOCK_SIZE):
+                    yield block
+            except httpx.HTTPError as e:
+                raise StorageError(f"S3 GET {key} failed: {e}") from e
+        finally:
+            await response.aclose()
+
+    async def exists(self, key: str) -> bool:
+        response = await self._send(self._request("HEAD", key), key)
+        if response.status_code == 404:
+            return False
+        if response.status_code != 200:
+            raise StorageError(f"S3 HEAD {key} failed with HTTP {response.status_code}")
+        return True
+
+    async def delete(self, key: str) -> None:
+        response = await self._send(self._request("DELETE", key), key)
+        if response.status_code not in (200, 204, 404):
+            raise StorageError(f"S3 DELETE {key} failed with HTTP {response.status_code}")
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_storage: Optional[AttachmentStorage] = None
+
+# Rows written before storage backends existed keep a path relative to the app root
+legacy_storage = LocalAttachmentStorage(".")
+
+
+def get_attachment_storage() -> AttachmentStorage:
+    """Return this worker's configured backend, creating it on first use."""
+    global _storage
+    if _storage is None:
+        if settings.ATTACHMENT_STORAGE_BACKEND == "s3":
+            _storage = S3AttachmentStorage(
+                endpoint_url=settings.ATTACHMENT_S3_ENDPOINT_URL,
+                bucket=settings.ATTACHMENT_S3_BUCKET,
+                access_key=settings.ATTACHMENT_S3_ACCESS_KEY,
+                secret_key=settings.ATTACHMENT_S3_SECRET_KEY,
+                region=settings.ATTACHMENT_S3_REGION,
+            )
+        else:
+            _storage = LocalAttachmentStorage(settings.ATTACHMENT_STORAGE_DIR)
+    return _storage
+
+
+def storage_for(backend: Optional[str]) -> AttachmentStorage:
+    """Backend an attachment row was written to (None = pre-backend local path)."""
+    if backend is None:
+        return legacy_storage
+    storage = get_attachment_storage()
+    if storage.name != backend:
+        raise StorageError(f"Attachment stored in '{backend}' but this worker uses '{storage.name}'")
+    return storage
+
+
+async def close_attachment_storage() -> None:
+    global _storage
+    if _storage is not None:
+        await _storage.aclose()
+        _storage = None
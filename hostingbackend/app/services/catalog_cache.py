@@ -0,0 +1,221 @@
+"""
+In-process catalog cache: plans, addons, services, countries and
+commission rules/rates.
+
+Every worker keeps one immutable `CatalogSnapshot` and serves quote,
+order and commission pricing from it without touching the database.
+
+Invalidation:
+- Any flush that adds, changes or deletes a catalog row issues
+  `pg_notify('catalog_changed', <table>)` in the same transaction
+  (Session event below), so it is delivered only if the write commits.
+- `start_listener()` LISTENs on that channel in each API/worker process
+  and bumps the cache version; the next read reloads the snapshot.
+- CATALOG_CACHE_TTL_SECONDS bounds staleness if the listener is down.
+
+Cached rows are detached ORM objects: read them, never modify or add
+them to a session.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+import asyncpg
+from sqlalchemy import event, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import DATABASE_DIRECT_URL, AsyncSessionLocal, engine
+from app.models.addon import Addon
+from app.models.affiliate import CommissionRule
+from app.models.countries import Country
+from app.models.payment import ReferralCommissionRate, PaymentType
+from app.models.plan import HostingPlan
+from app.models.service import Service
+
+
+CATALOG_CHANNEL = "catalog_changed"
+CATALOG_MODELS = (HostingPlan, Addon, Service, Country, CommissionRule, ReferralCommissionRate)
+
+LISTENER_RETRY_SECONDS = 5
+
+
+@dataclass
+class CatalogSnapshot:
+    version: int
+    loaded_at: float
+    plans: Dict[int, HostingPlan] = field(default_factory=dict)
+    addons: Dict[int, Addon] = field(default_factory=dict)
+    addons_by_slug: Dict[str, Addon] = field(default_factory=dict)
+    services: Dict[int, Service] = field(default_factory=dict)
+    countries: Dict[str, Country] = field(default_factory=dict)  # by ISO code
+    commission_rules: List[CommissionRule] = field(default_factory=list)  # active, highest priority first
+    commission_rates: Dict[PaymentType, Dict[int, Decimal]] = field(default_factory=dict)
+
+    def plan(self, plan_id: int) -> Optional[HostingPlan]:
+        return self.plans.get(plan_id)
+
+    def active_addon_by_slug(self, slug: str) -> Optional[Addon]:
+        addon = self.addons_by_slug.get(slug)
+        return addon if addon is not None and addon.is_active else None
+
+    def active_addons(self, addon_ids: Iterable[int]) -> List[Addon]:
+        return [a for a in (self.addons.get(i) for i in dict.fromkeys(addon_ids)) if a is not None and a.is_active]
+
+    def active_services(self, service_ids: Iterable[int]) -> List[Service]:
+        return [s for s in (self.services.get(i) for i in dict.fromkeys(service_ids)) if s is not None and s.is_active]
+
+
+class CatalogCache:
+    """Versioned per-worker catalog snapshot with LISTEN/NOTIFY invalidation."""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._version = 0
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = asyncio.Lock()
+        self._listener_task: Optional[asyncio.Task] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self) -> None:
+        self._version += 1
+
+    def _current(self) -> Optional[CatalogSnapshot]:
+        snapshot = self._snapshot
+        if (
+            snapshot is not None
+            and snapshot.version == self._version
+            and time.monotonic() - snapshot.loaded_at < self.ttl_seconds
+        ):
+            return snapshot
+        return None
+
+    async def get(self) -> CatalogSnapshot:
+        snapshot = self._current()
+        if snapshot is not None:
+            return snapshot
+
+        async with self._lock:
+            snapshot = self._current()
+            if snapshot is None:
+                # An invalidation during the load leaves the version behind,
+                # so the next read loads again
+                snapshot = await self._load(self._version)
+                self._snapshot = snapshot
+            return snapshot
+
+    async def _load(self, version: int) -> CatalogSnapshot:
+        async with AsyncSessionLocal() as db:
+            plans = (await db.execute(select(HostingPlan))).scalars().all()
+            addons = (await db.execute(select(Addon))).scalars().all()
+            services = (await db.execute(select(Service))).scalars().all()
+            countries = (await db.execute(select(Country))).scalars().all()
+            rules = (await db.execute(
+                select(CommissionRule)
+                .where(CommissionRule.is_active == True)
+                .order_by(CommissionRule.priority.desc(), CommissionRule.id)
+            )).scalars().all()
+            rates = (await db.execute(
+                select(ReferralCommissionRate)
+                .where(ReferralCommissionRate.is_active == True)
+                .order_by(ReferralCommissionRate.level)
+            )).scalars().all()
+
+        commission_rates: Dict[PaymentType, Dict[int, Decimal]] = {}
+        for rate in rates:
+            commission_rates.setdefault(PaymentType(rate.payment_type), {})[rate.level] = Decimal(rate.commission_percent)
+
+        return CatalogSnapshot(
+            version=version,
+            loaded_at=time.monotonic(),
+            plans={p.id: p for p in plans},
+            addons={a.id: a for a in addons},
+            addons_by_slug={a.slug: a for a in addons if a.slug},
+            services={s.id: s for s in services},
+            countries={c.code: c for c in countries},
+            commission_rules=list(rules),
+            commission_rates=commission_rates,
+        )
+
+    # ==================== LISTEN/NOTIFY ====================
+
+    def start_listener(self) -> None:
+        """Start the background LISTEN task (call once per process, inside the event loop)."""
+        if engine.dialect.name != "postgresql":
+            return
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen_forever())
+
+    async def stop_listener(self) -> None:
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self.invalidate()
+
+    async def _listen_forever(self) -> None:
+        # LISTEN needs a session-level connection: go around PgBouncer
+        dsn = make_url(DATABASE_DIRECT_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                conn.add_termination_listener(lambda _conn: closed.set())
+                await conn.add_listener(CATALOG_CHANNEL, self._on_notify)
+                # Notifications sent while we were not listening are lost
+                self.invalidate()
+                await closed.wait()
+            except asyncio.CancelledError:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+                raise
+            except Exception as e:
+                print(f"⚠️ Catalog listener error: {e}")
+            await asyncio.sleep(LISTENER_RETRY_SECONDS)
+
+
+catalog_cache = CatalogCache(settings.CATALOG_CACHE_TTL_SECONDS)
+
+
+# ==================== Write hooks ====================
+
+@event.listens_for(Session, "after_flush")
+def _notify_catalog_writes(session, flush_context):
+    changed = {
+        obj.__tablename__
+        for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, CATALOG_MODELS)
+    }
+    if not changed:
+        return
+
+    session.info.setdefault("catalog_changed", set()).update(changed)
+    connection = session.connection()
+    if connection.dialect.name == "postgresql":
+        for table in sorted(changed):
+            connection.execute(text("SELECT pg_notify(:channel, :table)"), {"channel": CATALOG_CHANNEL, "table": table})
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_catalog_commit(session):
+    # This worker does not wait for its own notification
+    if session.info.pop("catalog_changed", None):
+        catalog_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_changes(session):
+    session.info.pop("catalog_changed", None)
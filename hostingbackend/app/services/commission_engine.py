@@ -0,0 +1,361 @@
+"""
+Commission engine shared by every commission writer.
+
+- Active `CommissionRule` / `ReferralCommissionRate` rows come from the
+  catalog cache and are matched in memory.
+- All levels of an order are computed in memory and written with one
+  multi-row INSERT ... ON CONFLICT DO NOTHING keyed on
+  (order_id, user_id, level), so re-running an order never duplicates an
+  earning and only the rows actually inserted reach affiliate_stats.
+  Postgres rejects those inserts unless the unique keys exist; on
+  databases created before them, `backfill_commissions.py --keys-only`
+  (a deploy step, run before the API and workers start) adds them.
+- `backfill` does the same for thousands of paid orders, one INSERT per
+  batch.
+- `remove_duplicates` clears rows written twice before the unique keys
+  existed, so the constraints can be added to an existing database.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import case, delete, exists, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.affiliate import Commission, CommissionRule, CommissionStatus, Payout
+from app.models.order import Order
+from app.models.payment import PaymentType
+from app.models.referrals import ReferralEarning
+from app.services.affiliate_stats_service import AffiliateStatsService, StatsDelta
+from app.services.catalog_cache import catalog_cache
+from app.services.referral_tree_service import ReferralTreeService
+
+
+# Used when no ReferralCommissionRate rows are configured for a payment type
+DEFAULT_RATES = {
+    PaymentType.SUBSCRIPTION: {1: Decimal('10.00'), 2: Decimal('5.00'), 3: Decimal('2.00')},
+    PaymentType.SERVER: {1: Decimal('8.00'), 2: Decimal('4.00'), 3: Decimal('2.00')},
+}
+
+MAX_LEVELS = 3
+
+
+@dataclass(frozen=True)
+class CommissionLine:
+    """One level of one order: who earns what."""
+    beneficiary_id: int
+    level: int
+    rate: Decimal
+    amount: Decimal
+    rule_id: Optional[int] = None
+    referral_id: Optional[int] = None
+
+
+def _rule_matches(rule: CommissionRule, level: int, product_type: str, order_amount: Decimal) -> bool:
+    return (
+        rule.level == level
+        and rule.product_type in (product_type, 'all', None)
+        and (rule.min_purchase_amount is None or rule.min_purchase_amount <= order_amount)
+        and (rule.max_purchase_amount is None or rule.max_purchase_amount >= order_amount)
+    )
+
+
+class CommissionRules:
+    """Commission rule and rate lookups served from the catalog cache."""
+
+    def invalidate(self) -> None:
+        catalog_cache.invalidate()
+
+    async def rule_for(
+        self,
+        db: AsyncSession,
+        level: int,
+        product_type: str,
+        order_amount: Decimal,
+    ) -> Optional[CommissionRule]:
+        """Highest-priority active rule for the level/product/amount."""
+        catalog = await catalog_cache.get()
+        for rule in catalog.commission_rules:
+            if _rule_matches(rule, level, product_type, order_amount):
+                return rule
+        return None
+
+    async def rates_for(self, db: AsyncSession, payment_type: PaymentType) -> Dict[int, Decimal]:
+        """{level: percent} for a payment type, falling back to DEFAULT_RATES."""
+        catalog = await catalog_cache.get()
+        return dict(catalog.commission_rates.get(payment_type) or DEFAULT_RATES[payment_type])
+
+
+commission_rules = CommissionRules()
+
+
+def _quantize(amount: Decimal) -> Decimal:
+    return amount.quantize(Decimal('0.01'))
+
+
+class CommissionEngine:
+    """Computes commission lines and writes them set-based."""
+
+    # ==================== Computing ====================
+
+    @staticmethod
+    def percentage_lines(
+        uplines: Dict[int, int],
+        rates: Dict[int, Decimal],
+        order_amount: Decimal,
+    ) -> List[CommissionLine]:
+        """Lines for a {level: beneficiary} chain and {level: percent} rates."""
+        lines = []
+        for level in range(1, MAX_LEVELS + 1):
+            beneficiary_id = uplines.get(level)
+            if not beneficiary_id:
+                break
+            rate = rates.get(level, Decimal('0.00'))
+            if rate <= 0:
+                continue
+            lines.append(CommissionLine(
+                beneficiary_id=beneficiary_id,
+                level=level,
+                rate=rate,
+                amount=_quantize(order_amount * rate / Decimal('100')),
+            ))
+        return lines
+
+    async def rule_lines(
+        self,
+        db: AsyncSession,
+        referrals: Iterable[Any],
+        product_type: str,
+        order_amount: Decimal,
+    ) -> List[CommissionLine]:
+        """Lines for `Referral` rows, each priced by its matching CommissionRule."""
+        lines = []
+        for referral in referrals:
+            rule = await commission_rules.rule_for(db, referral.level, product_type, order_amount)
+            if not rule:
+                continue
+            if rule.commission_type == 'percentage':
+                amount = order_amount * (rule.commission_value / 100)
+            else:
+                amount = rule.commission_value
+            lines.append(CommissionLine(
+                beneficiary_id=referral.referrer_id,
+                level=referral.level,
+                rate=rule.commission_value,
+                amount=_quantize(Decimal(amount)),
+                rule_id=rule.id,
+                referral_id=referral.id,
+            ))
+        return lines
+
+    # ==================== Writing ====================
+
+    async def record(
+        self,
+        db: AsyncSession,
+        order_id: int,
+        referred_user_id: int,
+        order_amount: Decimal,
+        lines: Sequence[CommissionLine],
+        earning_status: str = 'pending',
+        with_commissions: bool = False,
+    ) -> List[ReferralEarning]:
+        """
+        Write one order's lines (does not commit).
+
+        Returns only the earnings inserted by this call; lines that already
+        exist for the order are skipped.
+        """
+        rows = [
+            {
+                "order_id": order_id,
+                "referred_user_id": referred_user_id,
+                "order_amount": order_amount,
+                "line": line,
+            }
+            for line in lines
+        ]
+        return await self._write(db, rows, earning_status, with_commissions)
+
+    async def _write(
+        self,
+        db: AsyncSession,
+        rows: List[Dict[str, Any]],
+        earning_status: str,
+        with_commissions: bool,
+    ) -> List[ReferralEarning]:
+        if not rows:
+            return []
+
+        now = datetime.utcnow()
+        earning_values = [
+            {
+                "user_id": row["line"].beneficiary_id,
+                "referred_user_id": row["referred_user_id"],
+                "order_id": row["order_id"],
+                "level": row["line"].level,
+                "commission_rate": row["line"].rate,
+                "order_amount": row["order_amount"],
+                "commission_amount": row["line"].amount,
+                "status": earning_status,
+                "earned_at": now,
+            }
+            for row in rows
+        ]
+        stmt = (
+            pg_insert(ReferralEarning)
+            .values(earning_values)
+            .on_conflict_do_nothing(index_elements=["order_id", "user_id", "level"])
+            .returning(ReferralEarning)
+        )
+        inserted = list((await db.scalars(stmt)).all())
+
+        if with_commissions:
+            commission_values = [
+                {
+                    "affiliate_user_id": row["line"].beneficiary_id,
+                    "referral_id": row["line"].referral_id,
+                    "order_id": row["order_id"],
+                    "level": row["line"].level,
+                    "commission_rule_id": row["line"].rule_id,
+                    "order_amount": row["order_amount"],
+                    "commission_rate": row["line"].rate,
+                    "commission_amount": row["line"].amount,
+                    "currency": 'INR',
+                    "status": CommissionStatus.PENDING,
+                }
+                for row in rows
+            ]
+            await db.execute(
+                pg_insert(Commission)
+                .values(commission_values)
+                .on_conflict_do_nothing(index_elements=["order_id", "affiliate_user_id", "level"])
+            )
+
+        stats_delta = StatsDelta()
+        for earning in inserted:
+            stats_delta.earning_created(earning.user_id, earning.commission_amount, earning.status)
+        await AffiliateStatsService().apply(db, stats_delta)
+
+        return inserted
+
+    # ==================== Backfill ====================
+
+    async def backfill(
+        self,
+        db: AsyncSession,
+        order_ids: Optional[List[int]] = None,
+        batch_size: Optional[int] = None,
+        earning_status: str = 'pending',
+    ) -> Dict[str, int]:
+        """
+        Create missing earnings for paid orders that have none (commits per batch).
+
+        Orders are walked by id; each batch costs one order query, one
+        upline query and one INSERT regardless of its size.
+        """
+        batch_size = batch_size or settings.COMMISSION_BACKFILL_BATCH_SIZE
+        tree = ReferralTreeService()
+        report = {"orders_scanned": 0, "orders_credited": 0, "earnings_created": 0, "batches": 0}
+        after_id = 0
+
+        while True:
+            stmt = (
+                select(Order.id, Order.user_id, Order.total_amount, Order.payment_type)
+                .where(
+                    Order.payment_status == 'paid',
+                    Order.id > after_id,
+                    ~exists().where(ReferralEarning.order_id == Order.id),
+                )
+                .order_by(Order.id)
+                .limit(batch_size)
+            )
+            if order_ids:
+                stmt = stmt.where(Order.id.in_(order_ids))
+            orders = (await db.execute(stmt)).all()
+            if not orders:
+                break
+            after_id = orders[-1].id
+
+            uplines = await tree.get_uplines_bulk(db, list({o.user_id for o in orders}), MAX_LEVELS)
+            rows = []
+            for order in orders:
+                chain = uplines.get(order.user_id)
+                if not chain:
+                    continue
+                payment_type = PaymentType.SUBSCRIPTION if order.payment_type == 'subscription' else PaymentType.SERVER
+                rates = await commission_rules.rates_for(db, payment_type)
+                amount = Decimal(order.total_amount or 0)
+                for line in self.percentage_lines(chain, rates, amount):
+                    rows.append({
+                        "order_id": order.id,
+                        "referred_user_id": order.user_id,
+                        "order_amount": amount,
+                        "line": line,
+                    })
+
+            inserted = await self._write(db, rows, earning_status, with_commissions=False)
+            await db.commit()
+
+            report["orders_scanned"] += len(orders)
+            report["orders_credited"] += len({e.order_id for e in inserted})
+            report["earnings_created"] += len(inserted)
+            report["batches"] += 1
+
+        return report
+
+    async def remove_duplicates(self, db: AsyncSession) -> Dict[str, int]:
+        """
+        Delete duplicate earnings / commissions per unique key (commits).
+
+        The row kept per (order, beneficiary, level) is the one furthest
+        along (in a payout, then paid, approved, pending), then the oldest.
+        Earnings referenced by a payout are never deleted.
+        """
+        in_payout = exists().where(Payout.earning_id == ReferralEarning.id)
+        earnings = await self._delete_ranked(
+            db,
+            ReferralEarning,
+            (ReferralEarning.order_id, ReferralEarning.user_id, ReferralEarning.level),
+            (
+                case((in_payout, 0), else_=1),
+                case({'paid': 0, 'approved': 1, 'pending': 2}, value=ReferralEarning.status, else_=3),
+                ReferralEarning.id,
+            ),
+            ~in_payout,
+        )
+        commissions = await self._delete_ranked(
+            db,
+            Commission,
+            (Commission.order_id, Commission.affiliate_user_id, Commission.level),
+            (
+                case((Commission.payout_id.is_not(None), 0), else_=1),
+                case(
+                    (Commission.status == CommissionStatus.PAID, 0),
+                    (Commission.status == CommissionStatus.APPROVED, 1),
+                    (Commission.status == CommissionStatus.PENDING, 2),
+                    else_=3,
+                ),
+                Commission.id,
+            ),
+        )
+        await db.commit()
+        return {"earnings_deleted": earnings, "commissions_deleted": commissions}
+
+    async def _delete_ranked(self, db: AsyncSession, model, key, keep_first, *deletable) -> int:
+        # Rows with a NULL in the key never collide on the unique constraint
+        ranked = (
+            select(model.id, func.row_number().over(partition_by=key, order_by=keep_first).label("rank"))
+            .where(*[column.is_not(None) for column in key])
+            .subquery()
+        )
+        result = await db.execute(
+            delete(model)
+            .where(model.id.in_(select(ranked.c.id).where(ranked.c.rank > 1)), *deletable)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount or 0
@@ -2,13 +2,15 @@ from decimal import Decimal
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, update, case, func
 from fastapi import HTTPException
 
 from app.models.payment import PaymentTransaction, ReferralCommissionRate, PaymentType
 from app.models.referrals import ReferralEarning
 from app.models.users import UserProfile
 from app.models.order import Order
+from app.services.commission_engine import CommissionEngine, commission_rules
+from app.services.referral_tree_service import ReferralTreeService
 
 
 class CommissionService:
@@ -120,30 +122,23 @@ class CommissionService:
         )
         print(f"📊 [CommissionService] Commission rates: {commission_rates}")
 
-        # Distribute to each level
-        earnings = []
-        for level, referrer_id in referral_chain.items():
-            if referrer_id and level <= 3:  # Max 3 levels
-                rate = commission_rates.get(level, Decimal('0.00'))
-                if rate > 0:
-                    print(f"💸 [CommissionService] Creating commission for Level {level}, referrer_id={referrer_id}, rate={rate}%")
-                    earning = await self._create_earning(
-                        db=db,
-                        referrer_id=referrer_id,
-                        referred_user_id=user.id,
-                        order_id=payment_transaction.order_id,
-                        level=level,
-                        commission_rate=rate,
-                        order_amount=eligible_amount,
-                        payment_transaction=payment_transaction
-                    )
-                    earnings.append(earning)
-                    print(f"✅ [CommissionService] Created earning: id={earning.id}, amount=₹{earning.commission_amount}")
+        # All levels in one INSERT; levels already recorded for the order are skipped
+        engine = CommissionEngine()
+        lines = engine.percentage_lines(referral_chain, commission_rates, eligible_amount)
+        earnings = await engine.record(
+            db,
+            order_id=payment_transaction.order_id,
+            referred_user_id=user.id,
+            order_amount=eligible_amount,
+            lines=lines,
+            earning_status='approved',  # Automatically approve
+        )
+        await self._credit_referrer_balances(db, earnings)
 
         # Mark commission as distributed
         payment_transaction.commission_distributed = True
         payment_transaction.commission_distributed_at = datetime.utcnow()
-        
+
         await db.commit()
         
         print(f"✅ [CommissionService] Commission distribution complete. Created {len(earnings)} earnings.")
@@ -161,11 +156,8 @@ class CommissionService:
         Returns:
             Dict mapping level to referrer user_id
         """
-        return {
-            1: user.referral_level_1 or user.referred_by,  # L1 is direct referrer
-            2: user.referral_level_2,  # L2 is referrer's referrer
-            3: user.referral_level_3,  # L3 is referrer's referrer's referrer
-        }
+        uplines = await ReferralTreeService().resolve_uplines(db, user, max_depth=3)
+        return {level: uplines.get(level) for level in (1, 2, 3)}
 
     async def _get_commission_rates(
         self,
@@ -173,99 +165,56 @@ class CommissionService:
         payment_type: PaymentType
     ) -> Dict[int, Decimal]:
         """
-        Get active commission rates for a payment type
+        Get active commission rates for a payment type (cached per worker)
         
         Returns:
             Dict mapping level to commission percentage
         """
-        result = await db.execute(
-            select(ReferralCommissionRate).where(
-                and_(
-                    ReferralCommissionRate.payment_type == payment_type,
-                    ReferralCommissionRate.is_active == True
-                )
-            ).order_by(ReferralCommissionRate.level)
-        )
-        rates = result.scalars().all()
-
-        # Convert to dictionary
-        rate_dict = {}
-        for rate in rates:
-            rate_dict[rate.level] = rate.commission_percent
-
-        # Default rates if not configured
-        if not rate_dict:
-            if payment_type == PaymentType.SUBSCRIPTION:
-                rate_dict = {1: Decimal('10.00'), 2: Decimal('5.00'), 3: Decimal('2.00')}
-            else:  # SERVER
-                rate_dict = {1: Decimal('8.00'), 2: Decimal('4.00'), 3: Decimal('2.00')}
+        return await commission_rules.rates_for(db, payment_type)
 
-        return rate_dict
-
-    async def _create_earning(
+    async def _credit_referrer_balances(
         self,
         db: AsyncSession,
-        referrer_id: int,
-        referred_user_id: int,
-        order_id: Optional[int],
-        level: int,
-        commission_rate: Decimal,
-        order_amount: Decimal,
-        payment_transaction: PaymentTransaction
-    ) -> ReferralEarning:
+        earnings: List[ReferralEarning]
+    ) -> None:
         """
-        Create a referral earning record and update user balance
+        Add new earnings to the referrers' profile balances in one UPDATE
         
         Args:
             db: Database session
-            referrer_id: User receiving the commission
-            referred_user_id: User who made the purchase
-            order_id: Associated order ID
-            level: Referral level (1, 2, or 3)
-            commission_rate: Commission percentage
-            order_amount: Order amount for commission calculation
-            payment_transaction: Payment transaction
-        
-        Returns:
-            Created ReferralEarning
+            earnings: Earnings inserted for this payment
         """
-        # Calculate commission amount
-        commission_amount = (order_amount * commission_rate / Decimal('100')).quantize(Decimal('0.01'))
-
-        # Create earning record
-        earning = ReferralEarning(
-            user_id=referrer_id,
-            referred_user_id=referred_user_id,
-            order_id=order_id,
-            level=level,
-            commission_rate=commission_rate,
-            order_amount=order_amount,
-            commission_amount=commission_amount,
-            status='approved',  # Automatically approve
-            earned_at=datetime.utcnow()
-        )
-
-        db.add(earning)
-
-        # Update referrer's balance
-        result = await db.execute(
-            select(UserProfile).where(UserProfile.id == referrer_id)
+        if not earnings:
+            return
+
+        amounts: Dict[int, Decimal] = {}
+        l1_counts: Dict[int, int] = {}
+        l2_counts: Dict[int, int] = {}
+        l3_counts: Dict[int, int] = {}
+        for earning in earnings:
+            amounts[earning.user_id] = amounts.get(earning.user_id, Decimal('0.00')) + earning.commission_amount
+            if earning.level == 1:
+                l1_counts[earning.user_id] = l1_counts.get(earning.user_id, 0) + 1
+            elif earning.level == 2:
+                l2_counts[earning.user_id] = l2_counts.get(earning.user_id, 0) + 1
+            elif earning.level == 3:
+                l3_counts[earning.user_id] = l3_counts.get(earning.user_id, 0) + 1
+
+        def per_user(values, default):
+            return case(values, value=UserProfile.id, else_=default) if values else default
+
+        await db.execute(
+            update(UserProfile)
+            .where(UserProfile.id.in_(list(amounts)))
+            .values(
+                total_earnings=func.coalesce(UserProfile.total_earnings, 0) + per_user(amounts, 0),
+                available_balance=func.coalesce(UserProfile.available_balance, 0) + per_user(amounts, 0),
+                l1_referrals=func.coalesce(UserProfile.l1_referrals, 0) + per_user(l1_counts, 0),
+                l2_referrals=func.coalesce(UserProfile.l2_referrals, 0) + per_user(l2_counts, 0),
+                l3_referrals=func.coalesce(UserProfile.l3_referrals, 0) + per_user(l3_counts, 0),
+            )
+            .execution_options(synchronize_session=False)
         )
-        referrer = result.scalars().first()
-
-        if referrer:
-            referrer.total_earnings = (referrer.total_earnings or Decimal('0.00')) + commission_amount
-            referrer.available_balance = (referrer.available_balance or Decimal('0.00')) + commission_amount
-            
-            # Update referral statistics
-            if level == 1:
-                referrer.l1_referrals = (referrer.l1_referrals or 0) + 1
-            elif level == 2:
-                referrer.l2_referrals = (referrer.l2_referrals or 0) + 1
-            elif level == 3:
-                referrer.l3_referrals = (referrer.l3_referrals or 0) + 1
-
-        return earning
 
     async def seed_default_commission_rates(self, db: AsyncSession):
         """
@@ -4,6 +4,7 @@ from typing import List, Optional
 
 from app.models.countries import Country
 from app.schemas.countries import CountryCreate, CountryUpdate
+from app.services.search_service import SearchService
 
 
 class CountryService:
@@ -102,20 +103,8 @@ class CountryService:
         active_only: bool = True,
         limit: int = 20
     ) -> List[Country]:
-        """Search countries by name or code"""
-        query = select(Country).where(
-            (func.lower(Country.name).like(f"%{search_term.lower()}%")) |
-            (func.lower(Country.code).like(f"%{search_term.upper()}%")) |
-            (func.lower(Country.alpha3_code).like(f"%{search_term.upper()}%"))
-        )
-        
-        if active_only:
-            query = query.where(Country.is_active.is_(True))
-        
-        query = query.order_by(Country.name).limit(limit)
-        
-        result = await db.execute(query)
-        return result.scalars().all()
+        """Search countries by name (ranked trigram match) or exact ISO code"""
+        return await SearchService().search_countries(db, search_term, active_only=active_only, limit=limit)
 
     async def bulk_create_countries(
         self, 
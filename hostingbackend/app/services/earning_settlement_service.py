@@ -0,0 +1,215 @@
+"""
+Set-based status changes for referral earnings (approval and payout).
+
+Each batch of ids is moved with a single
+
+    UPDATE referral_earnings SET status = :to
+    FROM (SELECT id, status FROM referral_earnings
+          WHERE id = ANY(:ids) AND status = ANY(:from) FOR UPDATE) AS old
+    WHERE referral_earnings.id = old.id
+    RETURNING id, user_id, commission_amount, old.status
+
+so the ids travel as one array parameter (no 32k bind limit), rows that
+changed status concurrently are simply not matched, and the affiliate_stats
+delta is built from exactly the rows that moved. Each batch is one short
+transaction together with its stats delta.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import Integer, String, any_, bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.affiliate import Commission, CommissionStatus
+from app.models.referrals import ReferralEarning
+from app.services.affiliate_stats_service import AffiliateStatsService, StatsDelta
+
+
+# Earning statuses a transition may start from
+APPROVABLE = ('pending',)
+PAYABLE = ('approved',)
+
+
+@dataclass
+class SettlementResult:
+    """Per-id outcome of a bulk transition."""
+    updated: List[int] = field(default_factory=list)
+    not_found: List[int] = field(default_factory=list)
+    wrong_status: Dict[int, str] = field(default_factory=dict)  # id -> status it was in
+    amount: Decimal = Decimal('0')
+
+    @property
+    def failed(self) -> List[int]:
+        return self.not_found + list(self.wrong_status)
+
+    def merge(self, other: "SettlementResult") -> None:
+        self.updated += other.updated
+        self.not_found += other.not_found
+        self.wrong_status.update(other.wrong_status)
+        self.amount += other.amount
+
+
+class EarningSettlementService:
+    """Bulk approve / mark paid for ReferralEarning rows."""
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or settings.EARNING_SETTLEMENT_BATCH_SIZE
+
+    # ==================== Public API ====================
+
+    async def approve(self, db: AsyncSession, earning_ids: Sequence[int]) -> SettlementResult:
+        """pending -> approved (commits per batch)."""
+        return await self._settle(db, earning_ids, APPROVABLE, 'approved')
+
+    async def mark_paid(self, db: AsyncSession, earning_ids: Sequence[int]) -> SettlementResult:
+        """approved -> paid (commits per batch)."""
+        return await self._settle(db, earning_ids, PAYABLE, 'paid')
+
+    async def transition(
+        self,
+        db: AsyncSession,
+        earning_ids: Sequence[int],
+        from_statuses: Iterable[str],
+        to_status: str,
+        stats_delta: StatsDelta,
+    ) -> SettlementResult:
+        """
+        Move one batch of earnings inside the caller's transaction.
+
+        Does not commit; the stats change of every moved row is added to
+        `stats_delta` for the caller to apply.
+        """
+        ids = list(dict.fromkeys(earning_ids))
+        result = SettlementResult()
+        if not ids:
+            return result
+
+        from_statuses = list(from_statuses)
+        old = (
+            select(ReferralEarning.id, ReferralEarning.status)
+            .where(
+                ReferralEarning.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))),
+                ReferralEarning.status == any_(bindparam("from_statuses", from_statuses, type_=ARRAY(String))),
+            )
+            .with_for_update()
+            .subquery("old")
+        )
+        values = {"status": to_status}
+        if to_status == 'paid':
+            values["paid_at"] = datetime.utcnow()
+
+        stmt = (
+            update(ReferralEarning)
+            .where(ReferralEarning.id == old.c.id)
+            .values(**values)
+            .returning(ReferralEarning.id, ReferralEarning.user_id, ReferralEarning.commission_amount, old.c.status)
+            .execution_options(synchronize_session=False)
+        )
+        moved = (await db.execute(stmt)).all()
+
+        for earning_id, user_id, amount, old_status in moved:
+            stats_delta.earning_status_changed(user_id, amount, old_status, to_status)
+            result.updated.append(earning_id)
+            result.amount += Decimal(amount or 0)
+
+        if len(moved) < len(ids):
+            await self._explain_skipped(db, ids, set(result.updated), result)
+        return result
+
+    async def mark_paid_up_to(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        amount: Decimal,
+        stats_delta: StatsDelta,
+    ) -> SettlementResult:
+        """
+        Pay an affiliate's approved earnings, oldest first, until `amount` is covered.
+
+        An earning is included while the running total before it is still
+        below `amount` (the last one may overshoot). Does not commit.
+        """
+        running = func.sum(ReferralEarning.commission_amount).over(
+            order_by=(ReferralEarning.earned_at, ReferralEarning.id)
+        )
+        candidates = (
+            select(ReferralEarning.id, (running - ReferralEarning.commission_amount).label("paid_before"))
+            .where(ReferralEarning.user_id == user_id, ReferralEarning.status == 'approved')
+            .subquery()
+        )
+        ids = (await db.execute(
+            select(candidates.c.id).where(candidates.c.paid_before < amount)
+        )).scalars().all()
+        return await self.transition(db, ids, PAYABLE, 'paid', stats_delta)
+
+    async def mark_commissions_paid_up_to(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        amount: Decimal,
+        payout_id: int,
+        limit: int = 100,
+    ) -> int:
+        """Same for legacy Commission rows (oldest `limit` unpaid approved ones); returns rows updated."""
+        oldest = (
+            select(Commission.id, Commission.commission_amount, Commission.created_at)
+            .where(
+                Commission.affiliate_user_id == user_id,
+                Commission.status == CommissionStatus.APPROVED,
+                Commission.payout_id == None,
+            )
+            .order_by(Commission.created_at, Commission.id)
+            .limit(limit)
+            .subquery()
+        )
+        running = func.sum(oldest.c.commission_amount).over(order_by=(oldest.c.created_at, oldest.c.id))
+        candidates = select(oldest.c.id, (running - oldest.c.commission_amount).label("paid_before")).subquery()
+
+        result = await db.execute(
+            update(Commission)
+            .where(Commission.id.in_(select(candidates.c.id).where(candidates.c.paid_before < amount)))
+            .values(status=CommissionStatus.PAID, paid_at=datetime.utcnow(), payout_id=payout_id)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount or 0
+
+    # ==================== Internals ====================
+
+    async def _settle(
+        self,
+        db: AsyncSession,
+        earning_ids: Sequence[int],
+        from_statuses: Iterable[str],
+        to_status: str,
+    ) -> SettlementResult:
+        ids = list(dict.fromkeys(earning_ids))
+        from_statuses = list(from_statuses)
+        total = SettlementResult()
+        stats = AffiliateStatsService()
+
+        for start in range(0, len(ids), self.batch_size):
+            stats_delta = StatsDelta()
+            batch = await self.transition(db, ids[start:start + self.batch_size], from_statuses, to_status, stats_delta)
+            await stats.apply(db, stats_delta)
+            await db.commit()
+            total.merge(batch)
+
+        return total
+
+    @staticmethod
+    async def _explain_skipped(db: AsyncSession, ids: List[int], updated: set, result: SettlementResult) -> None:
+        skipped = [i for i in ids if i not in updated]
+        current = dict((await db.execute(
+            select(ReferralEarning.id, ReferralEarning.status)
+            .where(ReferralEarning.id == any_(bindparam("skipped_ids", skipped, type_=ARRAY(Integer))))
+        )).all())
+        for earning_id in skipped:
+            if earning_id in current:
+                result.wrong_status[earning_id] = current[earning_id]
+            else:
+                result.not_found.append(earning_id)
@@ -1,15 +1,12 @@
+import asyncio
 import os
 import hashlib
 import secrets
 import mimetypes
 from pathlib import Path
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO, Optional, Tuple
 from datetime import datetime
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
-import base64
 
 from fastapi import UploadFile, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -17,6 +14,7 @@ from sqlalchemy import select
 
 from app.models.ticket_attachment import (
     TicketAttachment, 
+    ENCRYPTION_VERSION_STREAM,
     ALLOWED_EXTENSIONS, 
     ALLOWED_MIME_TYPES,
     MAX_FILE_SIZE,
@@ -25,41 +23,66 @@ from app.models.ticket_attachment import (
 from app.models.support import SupportTicket
 from app.models.users import UserProfile
 from app.core.config import settings
+from app.core.permissions import UserAccess
+from app.services.attachment_storage import (
+    AttachmentStorage,
+    StorageError,
+    get_attachment_storage,
+    storage_for,
+)
+from app.utils.stream_crypto import (
+    HEADER_SIZE,
+    TAG_SIZE,
+    SegmentDecryptor,
+    SegmentEncryptor,
+    StreamCryptoError,
+    master_key_id,
+    new_data_key,
+    wrap_key,
+    unwrap_key,
+)
+
+
+@dataclass
+class AttachmentDownload:
+    """Decrypted body of a download plus what the response headers need."""
+    stream: AsyncIterator[bytes]
+    filename: str
+    mime_type: str
+    file_size: int  # whole file
+    start: int      # first byte sent
+    end: int        # one past the last byte sent
+    
+    @property
+    def partial(self) -> bool:
+        return self.start != 0 or self.end != self.file_size
+
+
+def parse_range_header(value: Optional[str]) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """
+    Parse a single `bytes=first-last` range (either side may be empty).
+    Returns None for a missing, malformed or multi-range header, in which
+    case the whole file is served.
+    """
+    if not value or not value.startswith('bytes=') or ',' in value:
+        return None
+    first, sep, last = value[len('bytes='):].strip().partition('-')
+    if not sep or (not first and not last):
+        return None
+    try:
+        return (int(first) if first else None, int(last) if last else None)
+    except ValueError:
+        return None
 
 
 class SecureFileService:
     """Service for handling secure file uploads with encryption"""
     
     def __init__(self):
-        self.upload_dir = Path("app/static/uploads/tickets")
-        self.upload_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Encryption key derivation
-        self.master_key = settings.SECRET_KEY.encode()
-    
-    def _generate_encryption_key(self, file_id: str) -> Tuple[bytes, str]:
-        """Generate a unique encryption key for each file"""
-        salt = secrets.token_bytes(32)
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(self.master_key + file_id.encode()))
-        key_id = hashlib.sha256(salt).hexdigest()
-        return key, key_id
-    
-    def _encrypt_file(self, file_data: bytes, encryption_key: bytes) -> bytes:
-        """Encrypt file data using Fernet symmetric encryption"""
-        fernet = Fernet(encryption_key)
-        return fernet.encrypt(file_data)
-    
-    def _decrypt_file(self, encrypted_data: bytes, encryption_key: bytes) -> bytes:
-        """Decrypt file data"""
-        fernet = Fernet(encryption_key)
-        return fernet.decrypt(encrypted_data)
+        self.storage: AttachmentStorage = get_attachment_storage()
+        # Uploads are encrypted here before being handed to the storage backend
+        self.staging_dir = Path(settings.ATTACHMENT_STORAGE_DIR) / ".staging"
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
     
     def _calculate_file_hash(self, file_data: bytes) -> str:
         """Calculate SHA-256 hash of file for integrity verification"""
@@ -164,33 +187,28 @@ class SecureFileService:
                 detail=f"File type .{extension} not allowed"
             )
         
-        # 4. Read and validate file
-        file_data = await file.read()
-        file_size = len(file_data)
-        
-        if file_size == 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Empty file not allowed"
-            )
+        # 4. Validate MIME type
+        mime_type = file.content_type or mimetypes.guess_type(file.filename)[0] or 'application/octet-stream'
         
-        if file_size > MAX_FILE_SIZE:
+        if not self._validate_mime_type(mime_type):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File size exceeds maximum {MAX_FILE_SIZE / (1024*1024)}MB"
+                detail=f"MIME type {mime_type} not allowed"
             )
         
-        # 5. Validate MIME type
-        mime_type = file.content_type or mimetypes.guess_type(file.filename)[0] or 'application/octet-stream'
+        # 5. Read the first chunk for the empty check and security scan
+        chunk_size = settings.ATTACHMENT_CHUNK_SIZE
+        first_chunk = await self._read_exact(file, chunk_size)
         
-        if not self._validate_mime_type(mime_type):
+        if not first_chunk:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"MIME type {mime_type} not allowed"
+                detail="Empty file not allowed"
             )
         
-        # 6. Security scan
-        scan_status, scan_result = self._scan_file_content(file_data)
+        # 6. Security scan (signatures live in the first KB; files under
+        #    100 bytes are entirely inside the first chunk)
+        scan_status, scan_result = self._scan_file_content(first_chunk)
         
         if scan_status == 'infected':
             raise HTTPException(
@@ -198,22 +216,33 @@ class SecureFileService:
                 detail=f"File rejected: {scan_result}"
             )
         
-        # 7. Calculate file hash
-        file_hash = self._calculate_file_hash(file_data)
-        
-        # 8. Generate unique file ID and encryption key
+        # 7-10. Encrypt chunk by chunk under a fresh data key while hashing,
+        #       writing to a temp file off the event loop
         file_id = secrets.token_urlsafe(16)
-        encryption_key, key_id = self._generate_encryption_key(file_id)
-        
-        # 9. Encrypt file
-        encrypted_data = self._encrypt_file(file_data, encryption_key)
-        
-        # 10. Save encrypted file
-        encrypted_filename = f"{file_id}.enc"
-        file_path = self.upload_dir / encrypted_filename
-        
-        with open(file_path, 'wb') as f:
-            f.write(encrypted_data)
+        data_key = new_data_key()
+        staged_path = self.staging_dir / f"{file_id}.enc"
+        file_size, file_hash = await self._encrypt_to_file(file, first_chunk, data_key, staged_path, chunk_size)
+        
+        # Identical content is stored once: reuse the blob (and its wrapped key)
+        original = await self._find_duplicate(db, file_hash, file_size)
+        if original:
+            await asyncio.to_thread(self._remove_quietly, staged_path)
+            storage_path = original.storage_path
+            key_id = original.encryption_key_id
+            wrapped = original.wrapped_key
+        else:
+            storage_path = f"tickets/{file_id}.enc"
+            try:
+                await self.storage.put_file(storage_path, staged_path)
+            except StorageError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"Attachment storage unavailable: {e}"
+                )
+            finally:
+                await asyncio.to_thread(self._remove_quietly, staged_path)
+            key_id = master_key_id()
+            wrapped = wrap_key(data_key, file_id)
         
         # 11. Create database record
         attachment = TicketAttachment(
@@ -224,8 +253,11 @@ class SecureFileService:
             file_extension=extension,
             mime_type=mime_type,
             file_size=file_size,
-            storage_path=str(file_path),
+            storage_path=storage_path,
+            storage_backend=self.storage.name,
             encryption_key_id=key_id,
+            encryption_version=ENCRYPTION_VERSION_STREAM,
+            wrapped_key=wrapped,
             file_hash=file_hash,
             is_safe=(scan_status == 'clean'),
             scan_status=scan_status,
@@ -238,16 +270,47 @@ class SecureFileService:
         
         return attachment
     
+    async def _find_duplicate(self, db: AsyncSession, file_hash: str, file_size: int) -> Optional[TicketAttachment]:
+        """An existing blob with the same plaintext that this worker can read back"""
+        stmt = (
+            select(TicketAttachment)
+            .where(
+                TicketAttachment.file_hash == file_hash,
+                TicketAttachment.file_size == file_size,
+                TicketAttachment.encryption_version == ENCRYPTION_VERSION_STREAM,
+                TicketAttachment.encryption_key_id == master_key_id(),
+                TicketAttachment.storage_backend == self.storage.name,
+            )
+            .order_by(TicketAttachment.id)
+            .limit(1)
+        )
+        original = (await db.execute(stmt)).scalar_one_or_none()
+        if not original:
+            return None
+        try:
+            found = await self.storage.exists(original.storage_path)
+        except StorageError:
+            # Can't confirm the blob is there: store this upload on its own
+            return None
+        return original if found else None
+    
     async def download_file(
         self,
         db: AsyncSession,
         attachment_id: int,
-        user: UserProfile
-    ) -> Tuple[bytes, str, str]:
+        user: UserProfile,
+        access: UserAccess,
+        byte_range: Optional[Tuple[Optional[int], Optional[int]]] = None
+    ) -> AttachmentDownload:
         """
         Decrypt and download file securely
-        Admins and support staff can download any attachment
+        Support staff (and admins) can download any attachment
         Users can only download attachments from their own tickets
+        
+        `byte_range` is an inclusive (first, last) pair from
+        `parse_range_header`. Only the encrypted segments covering the range
+        are fetched from storage, and they are decrypted as the response is
+        sent.
         """
         # Get attachment
         stmt = select(TicketAttachment).where(
@@ -274,63 +337,239 @@ class SecureFileService:
                 detail="Ticket not found"
             )
         
-        # Check access: admin/support can access any ticket, users only their own
-        is_admin_or_support = user.role in ['admin', 'super_admin', 'support']
+        # Check access: support can access any ticket, users only their own
         is_ticket_owner = ticket.user_id == user.id
         
-        if not (is_admin_or_support or is_ticket_owner):
+        if not (access.is_support or is_ticket_owner):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access denied"
             )
         
+        # Fernet (version 1) files were keyed with a random salt that was
+        # never stored, so they cannot be decrypted
+        if attachment.encryption_version != ENCRYPTION_VERSION_STREAM:
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Attachment uses the legacy encryption format and cannot be decrypted"
+            )
+        
         # Read encrypted file
-        if not os.path.exists(attachment.storage_path):
+        start, end = self._resolve_range(byte_range, attachment.file_size)
+        
+        try:
+            storage = storage_for(attachment.storage_backend)
+            found = await storage.exists(attachment.storage_path)
+        except StorageError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Attachment storage unavailable: {e}"
+            )
+        if not found:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="File not found on server"
             )
         
-        with open(attachment.storage_path, 'rb') as f:
-            encrypted_data = f.read()
-        
-        # Recreate encryption key
         file_id = Path(attachment.storage_path).stem.replace('.enc', '')
-        encryption_key, _ = self._generate_encryption_key(file_id)
         
-        # Decrypt file
+        # Unwrap the data key and check the header before any byte is sent
         try:
-            decrypted_data = self._decrypt_file(encrypted_data, encryption_key)
-        except Exception as e:
+            data_key = unwrap_key(attachment.wrapped_key, file_id)
+            stream = self._decrypt_range(
+                storage, attachment.storage_path, data_key, attachment.file_size, start, end
+            )
+            first = await stream.__anext__()
+        except (StreamCryptoError, StorageError, StopAsyncIteration):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to decrypt file"
             )
+        body = self._prepend(first, stream)
         
-        # Verify integrity
-        current_hash = self._calculate_file_hash(decrypted_data)
-        if current_hash != attachment.file_hash:
+        # Update download stats
+        # Players and resumable clients issue many range requests per download
+        if start == 0:
+            attachment.downloaded_count += 1
+            attachment.last_downloaded_at = datetime.utcnow()
+            await db.commit()
+        
+        return AttachmentDownload(
+            stream=body,
+            filename=attachment.original_filename,
+            mime_type=attachment.mime_type,
+            file_size=attachment.file_size,
+            start=start,
+            end=end,
+        )
+    
+    @staticmethod
+    def _resolve_range(
+        byte_range: Optional[Tuple[Optional[int], Optional[int]]],
+        file_size: int
+    ) -> Tuple[int, int]:
+        """Turn an inclusive HTTP range into [start, end) within the file"""
+        if byte_range is None:
+            return 0, file_size
+        first, last = byte_range
+        if first is None:
+            # Suffix range: the last N bytes
+            start, end = max(file_size - last, 0), file_size
+        else:
+            start = first
+            end = file_size if last is None else min(last + 1, file_size)
+        if start >= file_size or end <= start:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="File integrity check failed"
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="Requested range not satisfiable",
+                headers={"Content-Range": f"bytes */{file_size}"}
             )
+        return start, end
+    
+    # ==================== Streaming helpers ====================
+    
+    @staticmethod
+    async def _read_exact(file: UploadFile, size: int) -> bytes:
+        """Read `size` bytes, fewer only at end of file"""
+        buffer = b''
+        while len(buffer) < size:
+            chunk = await file.read(size - len(buffer))
+            if not chunk:
+                break
+            buffer += chunk
+        return buffer
+    
+    @staticmethod
+    def _write_segment(out: BinaryIO, encryptor: SegmentEncryptor, hasher, chunk: bytes, last: bool) -> None:
+        hasher.update(chunk)
+        out.write(encryptor.encrypt(chunk, last=last))
+    
+    async def _encrypt_to_file(
+        self,
+        file: UploadFile,
+        first_chunk: bytes,
+        data_key: bytes,
+        file_path: Path,
+        chunk_size: int
+    ) -> Tuple[int, str]:
+        """
+        Stream the upload into an encrypted file.
         
-        # Update download stats
-        attachment.downloaded_count += 1
-        attachment.last_downloaded_at = datetime.utcnow()
-        await db.commit()
+        Holds at most two chunks in memory; hashing, encryption and disk
+        writes run in the threadpool. The file only appears under its
+        final name once complete. Returns (plaintext size, SHA-256).
+        """
+        encryptor = SegmentEncryptor(data_key, chunk_size)
+        hasher = hashlib.sha256()
+        temp_path = file_path.with_suffix('.part')
+        file_size = 0
+        
+        out = await asyncio.to_thread(open, temp_path, 'wb')
+        try:
+            await asyncio.to_thread(out.write, encryptor.header)
+            chunk = first_chunk
+            while True:
+                # Read ahead one chunk so the final segment can be flagged
+                next_chunk = await self._read_exact(file, chunk_size)
+                file_size += len(chunk)
+                if file_size > MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"File size exceeds maximum {MAX_FILE_SIZE / (1024*1024)}MB"
+                    )
+                await asyncio.to_thread(self._write_segment, out, encryptor, hasher, chunk, not next_chunk)
+                if not next_chunk:
+                    break
+                chunk = next_chunk
+            await asyncio.to_thread(out.close)
+            await asyncio.to_thread(os.replace, temp_path, file_path)
+        except BaseException:
+            await asyncio.to_thread(out.close)
+            await asyncio.to_thread(self._remove_quietly, temp_path)
+            raise
+        
+        return file_size, hasher.hexdigest()
+    
+    @staticmethod
+    def _remove_quietly(path: Path) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    
+    @staticmethod
+    async def _decrypt_range(
+        storage: AttachmentStorage,
+        key: str,
+        data_key: bytes,
+        file_size: int,
+        start: int,
+        end: int
+    ) -> AsyncIterator[bytes]:
+        """
+        Yield plaintext bytes [start, end) of a segmented file.
         
-        return decrypted_data, attachment.original_filename, attachment.mime_type
+        Fetches the header plus only the segments overlapping the range in
+        one ranged read; each segment is still authenticated, including the
+        final-segment flag, so truncation is detected.
+        """
+        header = await storage.read_range(key, 0, HEADER_SIZE)
+        decryptor = SegmentDecryptor(data_key, header)
+        chunk_size = decryptor.chunk_size
+        total_segments = max(1, -(-file_size // chunk_size))
+        first_segment = start // chunk_size
+        last_segment = (end - 1) // chunk_size
+        
+        def segment_length(index: int) -> int:
+            return min(chunk_size, file_size - index * chunk_size) + TAG_SIZE
+        
+        read_start = HEADER_SIZE + first_segment * decryptor.segment_size
+        read_end = HEADER_SIZE + last_segment * decryptor.segment_size + segment_length(last_segment)
+        decryptor.seek_segment(first_segment)
+        
+        blocks = storage.iter_range(key, read_start, read_end)
+        buffer = bytearray()
+        sent = 0
+        try:
+            for index in range(first_segment, last_segment + 1):
+                needed = segment_length(index)
+                while len(buffer) < needed:
+                    block = await blocks.__anext__()
+                    buffer += block
+                segment = bytes(buffer[:needed])
+                del buffer[:needed]
+                chunk = await asyncio.to_thread(decryptor.decrypt, segment, index == total_segments - 1)
+                offset = index * chunk_size
+                piece = chunk[max(start - offset, 0):end - offset]
+                sent += len(piece)
+                yield piece
+        except StopAsyncIteration:
+            raise StreamCryptoError("Encrypted file is shorter than its stored size")
+        finally:
+            await blocks.aclose()
+        if sent != end - start:
+            raise StreamCryptoError("Decrypted size does not match the stored size")
+    
+    @staticmethod
+    async def _prepend(first: bytes, rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        try:
+            yield first
+            async for chunk in rest:
+                yield chunk
+        finally:
+            # Closes the file when the client disconnects mid-download
+            await rest.aclose()
     
     async def delete_file(
         self,
         db: AsyncSession,
         attachment_id: int,
-        user: UserProfile
+        user: UserProfile,
+        access: UserAccess
     ) -> bool:
         """
         Soft delete attachment
-        Admins can delete any attachment
+        Support staff (and admins) can delete any attachment
         Users can only delete their own pending attachments
         """
         stmt = select(TicketAttachment).where(TicketAttachment.id == attachment_id)
@@ -343,11 +582,10 @@ class SecureFileService:
                 detail="Attachment not found"
             )
         
-        # Verify ownership or admin access
-        is_admin_or_support = user.role in ['admin', 'super_admin', 'support']
+        # Verify ownership or support access
         is_owner = attachment.user_id == user.id
         
-        if not (is_admin_or_support or is_owner):
+        if not (access.is_support or is_owner):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access denied"
@@ -247,6 +247,9 @@ from decimal import Decimal
 from app.models.invoice import Invoice
 from app.models.users import UserProfile
 from app.schemas.invoice import InvoiceStats
+from app.services.number_allocator import number_allocator
+from app.services.revenue_rollup_service import RevenueRollupService
+from app.utils.pagination import keyset_page
 
 
 class InvoiceService:
@@ -255,14 +258,14 @@ class InvoiceService:
     # ---------------------
 
     async def get_user_invoices(
-        self, db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100
+        self, db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
     ) -> List[Invoice]:
         result = await db.execute(
-            select(Invoice)
-            .where(Invoice.user_id == user_id)
-            .order_by(Invoice.created_at.desc())
-            .offset(skip)
-            .limit(limit)
+            keyset_page(
+                select(Invoice).where(Invoice.user_id == user_id),
+                Invoice.created_at, Invoice.id, cursor, limit, skip
+            )
         )
         return result.scalars().all()
     
@@ -436,48 +439,30 @@ class InvoiceService:
 
 
     async def get_monthly_revenue(self, db: AsyncSession) -> Decimal:
-        start_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        result = await db.execute(
-            select(func.sum(Invoice.total_amount)).where(
-                Invoice.payment_status == "paid",
-                Invoice.payment_date >= start_of_month,
-            )
-        )
-        return result.scalar() or Decimal("0.0")
+        """Paid invoice amount for the current month (by payment date, from the rollups)."""
+        return await RevenueRollupService().month_total(db, "invoice", "paid")
 
     async def get_invoice_stats(self, db: AsyncSession) -> InvoiceStats:
-        total_invoices = (await db.execute(select(func.count(Invoice.id)))).scalar()
-        paid_invoices = (await db.execute(
-            select(func.count(Invoice.id)).where(Invoice.payment_status == "paid")
-        )).scalar()
-        pending_invoices = (await db.execute(
-            select(func.count(Invoice.id)).where(Invoice.payment_status == "pending")
-        )).scalar()
-        overdue_invoices = (await db.execute(
-            select(func.count(Invoice.id)).where(Invoice.payment_status == "overdue")
-        )).scalar()
-
-        total_revenue = (
-            await db.execute(
-                select(func.sum(Invoice.total_amount)).where(Invoice.payment_status == "paid")
-            )
-        ).scalar() or Decimal("0.0")
-
-        pending_amount = (
-            await db.execute(
-                select(func.sum(Invoice.balance_due)).where(
+        row = (await db.execute(
+            select(
+                func.count(Invoice.id).label("total_invoices"),
+                func.count(Invoice.id).filter(Invoice.payment_status == "paid").label("paid_invoices"),
+                func.count(Invoice.id).filter(Invoice.payment_status == "pending").label("pending_invoices"),
+                func.count(Invoice.id).filter(Invoice.payment_status == "overdue").label("overdue_invoices"),
+                func.sum(Invoice.total_amount).filter(Invoice.payment_status == "paid").label("total_revenue"),
+                func.sum(Invoice.balance_due).filter(
                     Invoice.payment_status.in_(["pending", "overdue"])
-                )
+                ).label("pending_amount"),
             )
-        ).scalar() or Decimal("0.0")
+        )).one()
 
         return InvoiceStats(
-            total_invoices=total_invoices or 0,
-            paid_invoices=paid_invoices or 0,
-            pending_invoices=pending_invoices or 0,
-            overdue_invoices=overdue_invoices or 0,
-            total_revenue=total_revenue,
-            pending_amount=pending_amount,
+            total_invoices=row.total_invoices or 0,
+            paid_invoices=row.paid_invoices or 0,
+            pending_invoices=row.pending_invoices or 0,
+            overdue_invoices=row.overdue_invoices or 0,
+            total_revenue=row.total_revenue or Decimal("0.0"),
+            pending_amount=row.pending_amount or Decimal("0.0"),
         )
 
     async def get_user_recent_invoices(
@@ -525,22 +510,5 @@ class InvoiceService:
     # ---------------------
 
     async def _generate_invoice_number(self, db: AsyncSession) -> str:
-        """Generate a unique invoice number"""
-        year = datetime.now().year
-        base_number = f"INV-{year}-"
-
-        result = await db.execute(
-            select(Invoice.invoice_number)
-            .where(Invoice.invoice_number.like(f"{base_number}%"))
-            .order_by(Invoice.invoice_number.desc())
-            .limit(1)
-        )
-        last_invoice = result.scalar_one_or_none()
-
-        if last_invoice:
-            last_number = int(last_invoice.split("-")[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-
-        return f"{base_number}{new_number:04d}"
+        """Generate a unique invoice number (INV-YYYY-NNNN, sequence-backed)"""
+        return await number_allocator.next_number("invoice")
@@ -0,0 +1,282 @@
+import random
+import socket
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select, and_, or_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.job import BackgroundJob, JobStatus
+
+
+JobHandler = Callable[[AsyncSession, BackgroundJob], Awaitable[Optional[Dict[str, Any]]]]
+
+# job_type -> handler; populated by the modules that define job types
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def register_job_handler(job_type: str):
+    """Decorator registering the coroutine that executes a job type."""
+    def decorator(handler: JobHandler) -> JobHandler:
+        JOB_HANDLERS[job_type] = handler
+        return handler
+    return decorator
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueueService:
+    """
+    Postgres-backed job queue (transactional outbox).
+
+    - `enqueue` only adds the row to the caller's session; it is committed
+      together with the business change that produced it.
+    - `claim_batch` hands rows to a worker with FOR UPDATE SKIP LOCKED, so
+      any number of workers can poll concurrently.
+    - Failed jobs are retried with exponential backoff until max_attempts,
+      then parked as DEAD for inspection.
+    """
+
+    # A RUNNING job whose worker stopped heartbeating for this long is reclaimed
+    LEASE_SECONDS = 300
+    BACKOFF_BASE_SECONDS = 5
+    BACKOFF_CAP_SECONDS = 900
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        job_type: str,
+        payload: Dict[str, Any],
+        dedupe_key: Optional[str] = None,
+        run_after: Optional[datetime] = None,
+        max_attempts: Optional[int] = None,
+    ) -> BackgroundJob:
+        """
+        Stage a job in the current transaction (does not commit).
+
+        With a dedupe_key, an existing job for the same key is returned
+        instead of creating a second one. The insert is
+        ON CONFLICT (dedupe_key) DO NOTHING, so two deliveries racing on the
+        same key both get the one row instead of an IntegrityError.
+        """
+        values = {
+            "job_type": job_type,
+            "payload": payload,
+            "dedupe_key": dedupe_key,
+            "status": JobStatus.PENDING,
+            "attempts": 0,
+            "completed_stages": [],
+            "run_after": run_after or _utcnow(),
+        }
+        if max_attempts is not None:
+            values["max_attempts"] = max_attempts
+
+        if dedupe_key:
+            stmt = (
+                pg_insert(BackgroundJob)
+                .values(**values)
+                .on_conflict_do_nothing(index_elements=[BackgroundJob.dedupe_key])
+                .returning(BackgroundJob)
+            )
+            job = (await db.scalars(stmt)).one_or_none()
+            if job is None:
+                job = await self.get_job_by_dedupe_key(db, dedupe_key)
+            return job
+
+        job = BackgroundJob(**values)
+        db.add(job)
+        await db.flush()
+        return job
+
+    async def get_job(self, db: AsyncSession, job_id: int) -> Optional[BackgroundJob]:
+        result = await db.execute(select(BackgroundJob).where(BackgroundJob.id == job_id))
+        return result.scalar_one_or_none()
+
+    async def get_job_by_dedupe_key(self, db: AsyncSession, dedupe_key: str) -> Optional[BackgroundJob]:
+        result = await db.execute(select(BackgroundJob).where(BackgroundJob.dedupe_key == dedupe_key))
+        return result.scalar_one_or_none()
+
+    async def claim_batch(
+        self,
+        db: AsyncSession,
+        worker_id: str,
+        limit: int = 10,
+        job_types: Optional[List[str]] = None,
+    ) -> List[BackgroundJob]:
+        """
+        Lock up to `limit` runnable jobs for this worker and commit the claim.
+
+        Every claimed job's lease starts now: claim only what will start
+        running within LEASE_SECONDS (the worker claims one at a time).
+        """
+        now = _utcnow()
+        lease_expired = now - timedelta(seconds=self.LEASE_SECONDS)
+
+        stmt = (
+            select(BackgroundJob)
+            .where(
+                or_(
+                    and_(
+                        BackgroundJob.status.in_([JobStatus.PENDING, JobStatus.FAILED]),
+                        BackgroundJob.run_after <= now,
+                    ),
+                    and_(
+                        BackgroundJob.status == JobStatus.RUNNING,
+                        BackgroundJob.locked_at < lease_expired,
+                    ),
+                )
+            )
+            .order_by(BackgroundJob.run_after, BackgroundJob.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        if job_types:
+            stmt = stmt.where(BackgroundJob.job_type.in_(job_types))
+
+        result = await db.execute(stmt)
+        jobs = result.scalars().all()
+
+        for job in jobs:
+            job.status = JobStatus.RUNNING
+            job.locked_at = now
+            job.locked_by = worker_id
+            job.attempts = (job.attempts or 0) + 1
+
+        await db.commit()
+        return jobs
+
+    async def claim_job(self, db: AsyncSession, job_id: int, worker_id: str) -> Optional[BackgroundJob]:
+        """Claim one specific job (e.g. to run it inline); None if it is busy or finished."""
+        result = await db.execute(
+            select(BackgroundJob)
+            .where(
+                BackgroundJob.id == job_id,
+                BackgroundJob.status.in_([JobStatus.PENDING, JobStatus.FAILED]),
+            )
+            .with_for_update(skip_locked=True)
+        )
+        job = result.scalar_one_or_none()
+        if job is None:
+            return None
+
+        job.status = JobStatus.RUNNING
+        job.locked_at = _utcnow()
+        job.locked_by = worker_id
+        job.attempts = (job.attempts or 0) + 1
+        await db.commit()
+        return job
+
+    async def mark_succeeded(
+        self,
+        db: AsyncSession,
+        job: BackgroundJob,
+        result: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        job.status = JobStatus.SUCCEEDED
+        job.result = {**(job.result or {}), **(result or {})}
+        job.last_error = None
+        job.locked_at = None
+        job.locked_by = None
+        job.finished_at = _utcnow()
+        await db.commit()
+
+    async def mark_failed(self, db: AsyncSession, job: BackgroundJob, error: str) -> None:
+        job.last_error = error[:4000]
+        job.locked_at = None
+        job.locked_by = None
+
+        if (job.attempts or 0) >= (job.max_attempts or 1):
+            job.status = JobStatus.DEAD
+            job.finished_at = _utcnow()
+        else:
+            job.status = JobStatus.FAILED
+            delay = min(
+                self.BACKOFF_CAP_SECONDS,
+                self.BACKOFF_BASE_SECONDS * (2 ** max(0, (job.attempts or 1) - 1)),
+            )
+            job.run_after = _utcnow() + timedelta(seconds=random.uniform(delay / 2, delay))
+
+        await db.commit()
+
+    async def run_job(self, db: AsyncSession, job: BackgroundJob) -> bool:
+        """
+        Execute a claimed job with its registered handler.
+
+        Returns True on success. Errors are recorded on the job row and
+        never propagate, so one bad job cannot stop a worker.
+        """
+        handler = JOB_HANDLERS.get(job.job_type)
+        if handler is None:
+            await self.mark_failed(db, job, f"No handler registered for job type '{job.job_type}'")
+            return False
+
+        job_id = job.id
+        try:
+            result = await handler(db, job)
+        except Exception as e:
+            await db.rollback()
+            # The rollback expired the job row; reload before recording the failure
+            job = await self.get_job(db, job_id)
+            if job is not None:
+                await self.mark_failed(db, job, f"{type(e).__name__}: {e}")
+            return False
+
+        await self.mark_succeeded(db, job, result)
+        return True
+
+    async def get_queue_stats(self, db: AsyncSession) -> Dict[str, Any]:
+        """Queue depth per job type/status plus average stage latency of recent jobs."""
+        result = await db.execute(
+            select(BackgroundJob.job_type, BackgroundJob.status, func.count(BackgroundJob.id))
+            .group_by(BackgroundJob.job_type, BackgroundJob.status)
+        )
+        depth: Dict[str, Dict[str, int]] = {}
+        for job_type, status, count in result.all():
+            status_value = status.value if hasattr(status, "value") else status
+            depth.setdefault(job_type, {})[status_value] = count
+
+        recent = await db.execute(
+            select(BackgroundJob.job_type, BackgroundJob.stage_timings)
+            .where(BackgroundJob.status == JobStatus.SUCCEEDED)
+            .order_by(BackgroundJob.id.desc())
+            .limit(500)
+        )
+        totals: Dict[str, Dict[str, List[float]]] = {}
+        for job_type, timings in recent.all():
+            for stage, ms in (timings or {}).items():
+                totals.setdefault(job_type, {}).setdefault(stage, []).append(float(ms))
+
+        stage_latency = {
+            job_type: {
+                stage: {
+                    "samples": len(values),
+                    "avg_ms": round(sum(values) / len(values), 2),
+                    "max_ms": round(max(values), 2),
+                }
+                for stage, values in stages.items()
+            }
+            for job_type, stages in totals.items()
+        }
+
+        return {"depth": depth, "stage_latency": stage_latency}
+
+
+class StageTimer:
+    """Times pipeline stages and records them on the job row."""
+
+    def __init__(self, job: BackgroundJob):
+        self.job = job
+        self.timings: Dict[str, float] = dict(job.stage_timings or {})
+
+    def record(self, stage: str, started: float) -> None:
+        self.timings[stage] = round((time.perf_counter() - started) * 1000, 2)
+        self.job.stage_timings = dict(self.timings)
@@ -0,0 +1,119 @@
+"""
+Collision-free order, invoice and ticket numbers.
+
+Each series has one Postgres sequence per year (e.g. `invoice_number_2026_seq`).
+A worker reserves NUMBER_BLOCK_SIZE values with a single `nextval` call on
+its own connection and hands them out from memory, so the create path
+itself issues no query. Values are unique across workers; numbers from a
+block that a worker never used are skipped, not reused.
+
+The sequence for a new year is created on first use, starting after the
+highest number already stored for that prefix.
+"""
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import engine
+
+
+@dataclass(frozen=True)
+class NumberSeries:
+    prefix: str
+    table: str
+    column: str
+    width: int
+
+    def sequence_name(self, year: int) -> str:
+        return f"{self.column}_{year}_seq"
+
+    def format(self, year: int, value: int) -> str:
+        return f"{self.prefix}-{year}-{value:0{self.width}d}"
+
+
+SERIES: Dict[str, NumberSeries] = {
+    "order": NumberSeries(prefix="ORD", table="orders", column="order_number", width=6),
+    "invoice": NumberSeries(prefix="INV", table="invoices", column="invoice_number", width=4),
+    "ticket": NumberSeries(prefix="TICK", table="support_tickets", column="ticket_number", width=4),
+}
+
+
+class NumberAllocator:
+    """Per-worker block allocator over yearly Postgres sequences."""
+
+    def __init__(self, block_size: int):
+        self.block_size = max(1, block_size)
+        self._blocks: Dict[Tuple[str, int], Deque[int]] = {}
+        self._sequences: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    async def next_number(self, kind: str, year: Optional[int] = None) -> str:
+        """Next number of a series, e.g. next_number("invoice") -> 'INV-2026-0042'."""
+        series = SERIES[kind]
+        year = year or datetime.now().year
+        key = (kind, year)
+
+        async with self._lock:
+            block = self._blocks.get(key)
+            if not block:
+                block = deque(await self._reserve(series, year))
+                self._blocks[key] = block
+                # Blocks for past years are never used again
+                for stale in [k for k in self._blocks if k[0] == kind and k[1] < year]:
+                    del self._blocks[stale]
+            value = block.popleft()
+
+        return series.format(year, value)
+
+    async def next_numbers(self, kind: str, count: int, year: Optional[int] = None) -> List[str]:
+        """`count` numbers of a series in one round trip (bulk creation; bypasses the block)."""
+        if count <= 0:
+            return []
+        series = SERIES[kind]
+        year = year or datetime.now().year
+        async with self._lock:
+            values = await self._reserve(series, year, count)
+        return [series.format(year, value) for value in values]
+
+    async def _reserve(self, series: NumberSeries, year: int, count: Optional[int] = None):
+        sequence = series.sequence_name(year)
+        async with engine.begin() as conn:
+            if sequence not in self._sequences:
+                await self._ensure_sequence(conn, series, year, sequence)
+                self._sequences.add(sequence)
+
+            result = await conn.execute(
+                text(f"SELECT nextval('{sequence}') FROM generate_series(1, :n)"),
+                {"n": count or self.block_size},
+            )
+            return sorted(result.scalars().all())
+
+    async def _ensure_sequence(self, conn, series: NumberSeries, year: int, sequence: str) -> None:
+        # Serialize creation across workers; the lock is released at commit
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": sequence})
+        exists = (await conn.execute(text("SELECT to_regclass(:name)"), {"name": sequence})).scalar()
+        if exists:
+            return
+
+        # Continue after numbers issued before the sequence existed
+        prefix = f"{series.prefix}-{year}-"
+        last = (await conn.execute(
+            text(
+                f"SELECT max(CAST(substr({series.column}, :start) AS BIGINT)) "
+                f"FROM {series.table} "
+                f"WHERE {series.column} LIKE :pattern "
+                f"AND substr({series.column}, :start) ~ '^[0-9]+$'"
+            ),
+            {"start": len(prefix) + 1, "pattern": f"{prefix}%"},
+        )).scalar() or 0
+
+        await conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {sequence} START WITH {int(last) + 1}"))
+
+
+number_allocator = NumberAllocator(settings.NUMBER_BLOCK_SIZE)
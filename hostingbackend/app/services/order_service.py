@@ -1,23 +1,40 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List, Optional, Dict, Any
+from sqlalchemy import select, func, insert
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
 from decimal import Decimal
-import secrets
-import string
 
 from app.models.order import Order
 from app.models.plan import HostingPlan
 from app.models.users import UserProfile
 from app.models.invoice import Invoice
-from app.models.addon import Addon
-from app.models.service import Service
 from app.models.order_addon import OrderAddon
 from app.models.order_service import OrderService as OrderServiceModel
 from app.schemas.order import OrderCreate, OrderUpdate, OrderSummary, InvoiceResponse
-from app.models.referrals import ReferralEarning
+from app.services.commission_engine import CommissionEngine
 from app.services.referral_service import ReferralService
+from app.services.referral_tree_service import ReferralTreeService
+from app.services.number_allocator import number_allocator
+from app.services.catalog_cache import catalog_cache
+from app.services.revenue_rollup_service import RevenueDelta, RevenueRollupService
 from app.models.payment import PaymentTransaction
+from app.utils.pagination import keyset_page
+from app.utils.query_stats import count_statements
+from app.core.config import settings
+
+
+# asyncpg accepts at most 32767 bind parameters per statement
+MAX_BIND_PARAMS = 32000
+
+
+def _insert_chunks(model, rows: List[Dict[str, Any]]):
+    """Split rows for multi-row INSERTs so each statement stays under the bind limit."""
+    if not rows:
+        return
+    per_row = len(model.__table__.columns)
+    size = max(1, MAX_BIND_PARAMS // per_row)
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
 
 
 class OrderService:
@@ -68,11 +85,12 @@ class OrderService:
         skip: int = 0,
         limit: int = 100,
         status: Optional[str] = None,
+        cursor: Optional[str] = None,
     ) -> List[Order]:
         query = select(Order).where(Order.user_id == user_id)
         if status and status != "all":
             query = query.where(Order.order_status == status)
-        query = query.order_by(Order.created_at.desc()).offset(skip).limit(limit)
+        query = keyset_page(query, Order.created_at, Order.id, cursor, limit, skip)
 
         result = await db.execute(query)
         return result.scalars().all()
@@ -94,11 +112,12 @@ class OrderService:
         skip: int = 0,
         limit: int = 100,
         status: Optional[str] = None,
+        cursor: Optional[str] = None,
     ) -> List[Order]:
         query = select(Order)
         if status and status != "all":
             query = query.where(Order.order_status == status)
-        query = query.order_by(Order.created_at.desc()).offset(skip).limit(limit)
+        query = keyset_page(query, Order.created_at, Order.id, cursor, limit, skip)
 
         result = await db.execute(query)
         return result.scalars().all()
@@ -110,6 +129,7 @@ class OrderService:
         limit: int = 100,
         status: Optional[str] = None,
         payment_status: Optional[str] = None,
+        cursor: Optional[str] = None,
     ) -> List[Dict[str, Any]]:
         query = (
             select(Order, HostingPlan, UserProfile, PaymentTransaction)
@@ -123,7 +143,7 @@ class OrderService:
         if payment_status and payment_status != "all":
             query = query.where(Order.payment_status == payment_status)
 
-        query = query.order_by(Order.created_at.desc()).offset(skip).limit(limit)
+        query = keyset_page(query, Order.created_at, Order.id, cursor, limit, skip)
         result = await db.execute(query)
         rows = result.all()
 
@@ -196,367 +216,415 @@ class OrderService:
         self, db: AsyncSession, user_id: int, order_data
     ) -> Dict[str, Any]:
         try:
-            # ✅ 1️⃣ Fetch hosting plan
-            result = await db.execute(select(HostingPlan).where(HostingPlan.id == order_data.plan_id))
-            plan = result.scalar_one_or_none()
-            if not plan:
-                raise ValueError("Hosting plan not found")
+            drafts = await self._create_orders(db, [(user_id, order_data)])
+            await db.commit()
 
-            # ✅ 2️⃣ Generate unique order number
-            order_number = await self._generate_order_number(db)
-
-            # ✅ 3️⃣ Billing cycle → discount %
-            discount_map = {
-                "monthly": Decimal("5.00"),
-                "quarterly": Decimal("10.00"),
-                "semi-annually": Decimal("15.00"),
-                "annually": Decimal("20.00"),
-                "biennially": Decimal("25.00"),
-                "triennially": Decimal("35.00"),
-            }
-            discount_percent = discount_map.get(order_data.billing_cycle.lower(), Decimal("0.00"))
+            # ✅ Server creation will happen ONLY after payment is verified
+            # This prevents duplicate server creation
+            # Payment webhook will handle server provisioning
+            await self._record_completed_commissions(db, drafts)
 
-            # ✅ 4️⃣ Calculate base totals from hosting plan
-            plan_subtotal = Decimal(order_data.total_amount)
-            plan_discount_amount = (plan_subtotal * discount_percent) / Decimal("100.00")
-            plan_discounted_total = plan_subtotal - plan_discount_amount
+            # ✅ Return combined response with addons and services
+            return drafts[0]["response"]
 
-            # ✅ 5️⃣ Process Addons
-            addon_total = Decimal("0.00")
-            addon_records = []
-            invoice_addon_items = []
+        except Exception as e:
+            await db.rollback()
+            raise ValueError(f"❌ Error creating order: {str(e)}")
 
-            if order_data.addon_ids:
-                addon_result = await db.execute(
-                    select(Addon).where(Addon.id.in_(order_data.addon_ids), Addon.is_active == True)
-                )
-                addons = addon_result.scalars().all()
-
-                for addon in addons:
-                    unit_price = Decimal(str(addon.price))
-                    quantity = Decimal("1")  # Default quantity, can be extended later
-                    subtotal = unit_price * quantity
-
-                    # Apply same discount as plan
-                    addon_discount = (subtotal * discount_percent) / Decimal("100.00")
-                    addon_discounted = subtotal - addon_discount
-                    addon_tax = (addon_discounted * Decimal("18.00")) / Decimal("100.00")
-                    addon_item_total = addon_discounted + addon_tax
-
-                    addon_total += addon_item_total
-
-                    # Store for OrderAddon creation later
-                    addon_records.append({
-                        "addon_id": addon.id,
-                        "unit_price": unit_price,
-                        "quantity": quantity,
-                        "subtotal": subtotal,
-                        "discount_amount": addon_discount,
-                        "tax_amount": addon_tax,
-                        "total_amount": addon_item_total,
-                        "billing_type": addon.billing_type,
-                    })
-
-                    # Invoice line item
-                    invoice_addon_items.append({
-                        "description": f"{addon.name} - {addon.category.value}",
-                        "quantity": int(quantity),
-                        "unit_price": float(unit_price),
-                        "discount_percent": float(discount_percent),
-                        "discount_amount": float(addon_discount),
-                        "subtotal_after_discount": float(addon_discounted),
-                        "gst_percent": 18.0,
-                        "gst_amount": float(addon_tax),
-                        "total_amount": float(addon_item_total)
-                    })
-
-            # ✅ 6️⃣ Process Services
-            service_total = Decimal("0.00")
-            service_records = []
-            invoice_service_items = []
-
-            if order_data.service_ids:
-                service_result = await db.execute(
-                    select(Service).where(Service.id.in_(order_data.service_ids), Service.is_active == True)
-                )
-                services = service_result.scalars().all()
-
-                for service in services:
-                    unit_price = Decimal(str(service.price))  # ✅ Changed from base_price to price
-                    quantity = Decimal("1")
-                    subtotal = unit_price * quantity
-
-                    # Apply same discount as plan
-                    service_discount = (subtotal * discount_percent) / Decimal("100.00")
-                    service_discounted = subtotal - service_discount
-                    service_tax = (service_discounted * Decimal("18.00")) / Decimal("100.00")
-                    service_item_total = service_discounted + service_tax
-
-                    service_total += service_item_total
-
-                    # Store for OrderService creation later
-                    service_records.append({
-                        "service_id": service.id,
-                        "unit_price": unit_price,
-                        "quantity": quantity,
-                        "subtotal": subtotal,
-                        "discount_amount": service_discount,
-                        "tax_amount": service_tax,
-                        "total_amount": service_item_total,
-                        "service_status": "pending",
-                    })
-
-                    # Invoice line item
-                    invoice_service_items.append({
-                        "description": f"{service.name} - {service.category.value}",
-                        "quantity": int(quantity),
-                        "unit_price": float(unit_price),
-                        "discount_percent": float(discount_percent),
-                        "discount_amount": float(service_discount),
-                        "subtotal_after_discount": float(service_discounted),
-                        "gst_percent": 18.0,
-                        "gst_amount": float(service_tax),
-                        "total_amount": float(service_item_total)
-                    })
-
-            # ✅ 7️⃣ Calculate final totals (Plan + Addons + Services)
-            # Base billing cycle discount
-            billing_cycle_discount = plan_discount_amount + sum(a["discount_amount"] for a in addon_records) + sum(s["discount_amount"] for s in service_records)
-            
-            # Add promo discount from frontend if provided
-            promo_discount = order_data.discount_amount or Decimal("0.00")
-            
-            # Total discount is sum of billing cycle discount + promo discount
-            total_discount_amount = billing_cycle_discount + promo_discount
-            
-            # Calculate discounted total (subtracting promo discount as well)
-            base_discounted = plan_discounted_total + sum(a["subtotal"] - a["discount_amount"] for a in addon_records) + sum(s["subtotal"] - s["discount_amount"] for s in service_records)
-            total_discounted = base_discounted - promo_discount
-            
-            # Ensure total doesn't go below zero
-            if total_discounted < 0:
-                total_discounted = Decimal("0.00")
-
-            # GST calculation (18% on total discounted amount)
-            gst_amount = (total_discounted * Decimal("18.00")) / Decimal("100.00")
-
-            # Grand total for customer invoice
-            grand_total = total_discounted + gst_amount
-
-            # ✅ 7️⃣.5️⃣ Calculate service period dates
-            # Use dates from order_data if provided, otherwise calculate from billing cycle
-            if order_data.service_start_date and order_data.service_end_date:
-                service_start_date = order_data.service_start_date
-                service_end_date = order_data.service_end_date
-            else:
-                service_start_date, service_end_date = self._calculate_service_dates(order_data.billing_cycle)
-
-            # ✅ 8️⃣ Create Order
-            new_order = Order(
-                user_id=user_id,
-                plan_id=order_data.plan_id,
-                order_number=order_number,
-                billing_cycle=order_data.billing_cycle,
-                total_amount=plan_subtotal + sum(a["subtotal"] for a in addon_records) + sum(s["subtotal"] for s in service_records),
-                discount_amount=total_discount_amount,
-                tax_amount=gst_amount,
-                grand_total=grand_total,
-                server_details=order_data.server_details,  # Kept for backward compatibility
-                order_status="active" if order_data.payment_status == 'paid' else "pending",
-                payment_status=order_data.payment_status or "pending",
-                payment_method=order_data.payment_method,
-                razorpay_order_id=order_data.razorpay_order_id,
-                razorpay_payment_id=order_data.razorpay_payment_id,
-                paid_at=order_data.paid_at,
-                currency="INR",
-                service_start_date=service_start_date,  # 🆕 Set service start date
-                service_end_date=service_end_date,  # 🆕 Set service end date
-                promo_code=order_data.promo_code,  # 🆕 Store promo code
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow(),
-            )
+    async def bulk_create_orders(
+        self, db: AsyncSession, items: List[Tuple[int, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Create many orders plus their invoices in one transaction (reseller and
+        migration imports). `items` is a list of (user_id, OrderCreate).
 
-            db.add(new_order)
-            await db.flush()  # Get new_order.id
+        All orders are priced from the catalog cache first, then written with
+        one multi-row INSERT per table, so the statement count does not grow
+        with the number of orders. Any invalid item rolls back the whole batch.
+        """
+        if len(items) > settings.ORDER_BULK_CREATE_MAX:
+            raise ValueError(f"At most {settings.ORDER_BULK_CREATE_MAX} orders per bulk request")
 
-            # ✅ 9️⃣ Create OrderAddon records
-            for addon_data in addon_records:
-                # Fetch addon details for metadata
-                addon_result = await db.execute(
-                    select(Addon).where(Addon.id == addon_data["addon_id"])
-                )
-                addon = addon_result.scalar_one()
-                
-                order_addon = OrderAddon(
-                    order_id=new_order.id,
-                    addon_id=addon_data["addon_id"],
-                    addon_name=addon.name,
-                    addon_category=addon.category.value,
-                    addon_description=addon.description,
-                    unit_price=addon_data["unit_price"],
-                    quantity=addon_data["quantity"],
-                    subtotal=addon_data["subtotal"],
-                    discount_amount=addon_data["discount_amount"],
-                    tax_amount=addon_data["tax_amount"],
-                    total_amount=addon_data["total_amount"],
-                    billing_type=addon_data["billing_type"],
-                    unit_label=addon.unit_label,
-                    is_active=True,
-                )
-                db.add(order_addon)
+        try:
+            async with count_statements(db) as stats:
+                drafts = await self._create_orders(db, items)
+            await db.commit()
+            await self._record_completed_commissions(db, drafts)
 
-            # ✅ 🔟 Create OrderService records
-            for service_data in service_records:
-                # Fetch service details for metadata
-                service_result = await db.execute(
-                    select(Service).where(Service.id == service_data["service_id"])
-                )
-                service = service_result.scalar_one()
-                
-                order_service = OrderServiceModel(
-                    order_id=new_order.id,
-                    service_id=service_data["service_id"],
-                    service_name=service.name,
-                    service_category=service.category.value,
-                    service_description=service.description,
-                    unit_price=service_data["unit_price"],
-                    quantity=service_data["quantity"],
-                    subtotal=service_data["subtotal"],
-                    discount_amount=service_data["discount_amount"],
-                    tax_amount=service_data["tax_amount"],
-                    total_amount=service_data["total_amount"],
-                    billing_type=service.billing_type,
-                    duration_hours=service.duration_hours,
-                    sla_response_time=service.sla_response_time,
-                    service_status=service_data["service_status"],
-                )
-                db.add(order_service)
-
-            # ✅ 1️⃣1️⃣ Create Invoice with all line items
-            invoice_number = await self._generate_invoice_number(db)
-
-            # Build complete invoice items array: plan + addons + services
-            plan_item = {
-                "description": f"{plan.name} - {order_data.billing_cycle.title()} Plan",
-                "quantity": 1,
-                "amount": float(grand_total),
-                "unit_price": float(plan_subtotal),
-                "discount_percent": float(discount_percent),
-                "discount_amount": float(plan_discount_amount),
-                "subtotal_after_discount": float(plan_discounted_total),
-                "gst_percent": 18.0,
-                "gst_amount": float((plan_discounted_total * Decimal("18.00")) / Decimal("100.00")),
-                "total_amount": float(plan_discounted_total + (plan_discounted_total * Decimal("18.00")) / Decimal("100.00"))
+            # Plus the order and invoice number reservations, one round trip
+            # each on the allocator's own connection
+            statements = stats.count + (2 if len(drafts) > 1 else 0)
+            return {
+                "created": len(drafts),
+                "statements": statements,
+                "statements_per_order": round(statements / len(drafts), 3) if drafts else 0.0,
+                "orders": [draft["response"] for draft in drafts],
             }
 
-            invoice_items = [plan_item] + invoice_addon_items + invoice_service_items
+        except Exception as e:
+            await db.rollback()
+            raise ValueError(f"❌ Error creating orders: {str(e)}")
+
+    async def _create_orders(
+        self, db: AsyncSession, items: List[Tuple[int, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Price and insert orders, line items and invoices (no commit); returns the drafts."""
+        if not items:
+            return []
+
+        # Plan, addons and services are priced from the catalog cache; the
+        # same catalog rows are reused for the line item snapshots
+        catalog = await catalog_cache.get()
+        for _, order_data in items:
+            if not catalog.plan(order_data.plan_id):
+                raise ValueError("Hosting plan not found")
 
-            new_invoice = Invoice(
-                user_id=user_id,
-                order_id=new_order.id,
+        order_numbers = await self._reserve_numbers("order", len(items))
+        invoice_numbers = await self._reserve_numbers("invoice", len(items))
+
+        drafts = [
+            self._price_order(
+                catalog,
+                catalog.plan(order_data.plan_id),
+                user_id,
+                order_data,
+                order_number=order_number,
                 invoice_number=invoice_number,
-                invoice_date=datetime.utcnow(),
-                due_date=datetime.utcnow() + timedelta(days=7),
-                subtotal=total_discounted,
-                tax_amount=gst_amount,
-                total_amount=grand_total,
-                amount_paid=Decimal("0.00"),
-                balance_due=grand_total,
-                status="unpaid",
-                payment_status="pending",
-                currency="INR",
-                tax_rate=Decimal("18.00"),
-                late_fee=Decimal("0.00"),
-                days_overdue=0,
-                items=invoice_items,
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow(),
             )
+            for (user_id, order_data), order_number, invoice_number in zip(items, order_numbers, invoice_numbers)
+        ]
+
+        # ✅ Orders: one INSERT ... RETURNING for the whole batch
+        order_ids = {}
+        for chunk in _insert_chunks(Order, [d["order"] for d in drafts]):
+            result = await db.execute(
+                insert(Order).values(chunk).returning(Order.id, Order.order_number)
+            )
+            order_ids.update({number: order_id for order_id, number in result.all()})
+
+        addon_rows, service_rows, invoice_rows = [], [], []
+        for draft in drafts:
+            order_id = order_ids[draft["order"]["order_number"]]
+            draft["order_id"] = order_id
+            addon_rows += [{**row, "order_id": order_id} for row in draft["addons"]]
+            service_rows += [{**row, "order_id": order_id} for row in draft["services"]]
+            invoice_rows.append({**draft["invoice"], "order_id": order_id})
+
+        # ✅ Line items and invoices: one multi-row INSERT per table
+        for chunk in _insert_chunks(OrderAddon, addon_rows):
+            await db.execute(insert(OrderAddon).values(chunk))
+        for chunk in _insert_chunks(OrderServiceModel, service_rows):
+            await db.execute(insert(OrderServiceModel).values(chunk))
+
+        invoice_ids = {}
+        for chunk in _insert_chunks(Invoice, invoice_rows):
+            result = await db.execute(
+                insert(Invoice).values(chunk).returning(Invoice.id, Invoice.invoice_number)
+            )
+            invoice_ids.update({number: invoice_id for invoice_id, number in result.all()})
 
-            db.add(new_invoice)
+        # Core INSERTs bypass the ORM flush hook: roll the new rows up explicitly
+        revenue = RevenueDelta()
+        for draft in drafts:
+            revenue.order(draft["order"]).invoice(draft["invoice"])
+        await RevenueRollupService().apply(db, revenue)
 
-            # ✅ 1️⃣2️⃣ Commit all changes
-            await db.commit()
-            await db.refresh(new_order)
-            await db.refresh(new_invoice)
+        for draft in drafts:
+            draft["response"] = self._order_response(draft, invoice_ids[draft["invoice"]["invoice_number"]])
+        return drafts
 
-            # ✅ 1️⃣3️⃣ Server creation will happen ONLY after payment is verified
-            # This prevents duplicate server creation
-            # Payment webhook will handle server provisioning
+    def _price_order(
+        self,
+        catalog,
+        plan,
+        user_id: int,
+        order_data,
+        order_number: str,
+        invoice_number: str,
+    ) -> Dict[str, Any]:
+        """Compute an order, its line item snapshots and its invoice as column dicts."""
+        now = datetime.utcnow()
+
+        # ✅ Billing cycle → discount %
+        discount_map = {
+            "monthly": Decimal("5.00"),
+            "quarterly": Decimal("10.00"),
+            "semi-annually": Decimal("15.00"),
+            "annually": Decimal("20.00"),
+            "biennially": Decimal("25.00"),
+            "triennially": Decimal("35.00"),
+        }
+        discount_percent = discount_map.get(order_data.billing_cycle.lower(), Decimal("0.00"))
+
+        # ✅ Calculate base totals from hosting plan
+        plan_subtotal = Decimal(order_data.total_amount)
+        plan_discount_amount = (plan_subtotal * discount_percent) / Decimal("100.00")
+        plan_discounted_total = plan_subtotal - plan_discount_amount
+
+        # ✅ Process Addons
+        addon_records = []
+        invoice_addon_items = []
+
+        if order_data.addon_ids:
+            for addon in catalog.active_addons(order_data.addon_ids):
+                unit_price = Decimal(str(addon.price))
+                quantity = Decimal("1")  # Default quantity, can be extended later
+                subtotal = unit_price * quantity
+
+                # Apply same discount as plan
+                addon_discount = (subtotal * discount_percent) / Decimal("100.00")
+                addon_discounted = subtotal - addon_discount
+                addon_tax = (addon_discounted * Decimal("18.00")) / Decimal("100.00")
+                addon_item_total = addon_discounted + addon_tax
+
+                # OrderAddon snapshot
+                addon_records.append({
+                    "addon_id": addon.id,
+                    "addon_name": addon.name,
+                    "addon_category": addon.category.value,
+                    "addon_description": addon.description,
+                    "unit_price": unit_price,
+                    "quantity": int(quantity),
+                    "subtotal": subtotal,
+                    "discount_amount": addon_discount,
+                    "tax_amount": addon_tax,
+                    "total_amount": addon_item_total,
+                    "billing_type": addon.billing_type,
+                    "unit_label": addon.unit_label,
+                    "is_active": True,
+                })
+
+                # Invoice line item
+                invoice_addon_items.append({
+                    "description": f"{addon.name} - {addon.category.value}",
+                    "quantity": int(quantity),
+                    "unit_price": float(unit_price),
+                    "discount_percent": float(discount_percent),
+                    "discount_amount": float(addon_discount),
+                    "subtotal_after_discount": float(addon_discounted),
+                    "gst_percent": 18.0,
+                    "gst_amount": float(addon_tax),
+                    "total_amount": float(addon_item_total)
+                })
+
+        # ✅ Process Services
+        service_records = []
+        invoice_service_items = []
+
+        if order_data.service_ids:
+            for service in catalog.active_services(order_data.service_ids):
+                unit_price = Decimal(str(service.price))
+                quantity = Decimal("1")
+                subtotal = unit_price * quantity
+
+                # Apply same discount as plan
+                service_discount = (subtotal * discount_percent) / Decimal("100.00")
+                service_discounted = subtotal - service_discount
+                service_tax = (service_discounted * Decimal("18.00")) / Decimal("100.00")
+                service_item_total = service_discounted + service_tax
+
+                # OrderService snapshot
+                service_records.append({
+                    "service_id": service.id,
+                    "service_name": service.name,
+                    "service_category": service.category.value,
+                    "service_description": service.description,
+                    "unit_price": unit_price,
+                    "quantity": int(quantity),
+                    "subtotal": subtotal,
+                    "discount_amount": service_discount,
+                    "tax_amount": service_tax,
+                    "total_amount": service_item_total,
+                    "billing_type": service.billing_type,
+                    "duration_hours": service.duration_hours,
+                    "sla_response_time": service.sla_response_time,
+                    "service_status": "pending",
+                })
+
+                # Invoice line item
+                invoice_service_items.append({
+                    "description": f"{service.name} - {service.category.value}",
+                    "quantity": int(quantity),
+                    "unit_price": float(unit_price),
+                    "discount_percent": float(discount_percent),
+                    "discount_amount": float(service_discount),
+                    "subtotal_after_discount": float(service_discounted),
+                    "gst_percent": 18.0,
+                    "gst_amount": float(service_tax),
+                    "total_amount": float(service_item_total)
+                })
+
+        # ✅ Calculate final totals (Plan + Addons + Services)
+        # Base billing cycle discount
+        billing_cycle_discount = plan_discount_amount + sum(a["discount_amount"] for a in addon_records) + sum(s["discount_amount"] for s in service_records)
+
+        # Add promo discount from frontend if provided
+        promo_discount = order_data.discount_amount or Decimal("0.00")
+
+        # Total discount is sum of billing cycle discount + promo discount
+        total_discount_amount = billing_cycle_discount + promo_discount
+
+        # Calculate discounted total (subtracting promo discount as well)
+        base_discounted = plan_discounted_total + sum(a["subtotal"] - a["discount_amount"] for a in addon_records) + sum(s["subtotal"] - s["discount_amount"] for s in service_records)
+        total_discounted = base_discounted - promo_discount
+
+        # Ensure total doesn't go below zero
+        if total_discounted < 0:
+            total_discounted = Decimal("0.00")
+
+        # GST calculation (18% on total discounted amount)
+        gst_amount = (total_discounted * Decimal("18.00")) / Decimal("100.00")
+
+        # Grand total for customer invoice
+        grand_total = total_discounted + gst_amount
+
+        # ✅ Service period: from order_data if provided, otherwise from billing cycle
+        if order_data.service_start_date and order_data.service_end_date:
+            service_start_date = order_data.service_start_date
+            service_end_date = order_data.service_end_date
+        else:
+            service_start_date, service_end_date = self._calculate_service_dates(order_data.billing_cycle)
+
+        order = {
+            "user_id": user_id,
+            "plan_id": order_data.plan_id,
+            "order_number": order_number,
+            "billing_cycle": order_data.billing_cycle,
+            "total_amount": plan_subtotal + sum(a["subtotal"] for a in addon_records) + sum(s["subtotal"] for s in service_records),
+            "discount_amount": total_discount_amount,
+            "tax_amount": gst_amount,
+            "grand_total": grand_total,
+            "server_details": order_data.server_details,  # Kept for backward compatibility
+            "order_status": "active" if order_data.payment_status == 'paid' else "pending",
+            "payment_status": order_data.payment_status or "pending",
+            "payment_method": order_data.payment_method,
+            "razorpay_order_id": order_data.razorpay_order_id,
+            "razorpay_payment_id": order_data.razorpay_payment_id,
+            "paid_at": order_data.paid_at,
+            "currency": "INR",
+            "service_start_date": service_start_date,
+            "service_end_date": service_end_date,
+            "promo_code": order_data.promo_code,
+            "created_at": now,
+            "updated_at": now,
+        }
 
+        # ✅ Invoice with all line items: plan + addons + services
+        plan_item = {
+            "description": f"{plan.name} - {order_data.billing_cycle.title()} Plan",
+            "quantity": 1,
+            "amount": float(grand_total),
+            "unit_price": float(plan_subtotal),
+            "discount_percent": float(discount_percent),
+            "discount_amount": float(plan_discount_amount),
+            "subtotal_after_discount": float(plan_discounted_total),
+            "gst_percent": 18.0,
+            "gst_amount": float((plan_discounted_total * Decimal("18.00")) / Decimal("100.00")),
+            "total_amount": float(plan_discounted_total + (plan_discounted_total * Decimal("18.00")) / Decimal("100.00"))
+        }
+
+        invoice = {
+            "user_id": user_id,
+            "invoice_number": invoice_number,
+            "invoice_date": now,
+            "due_date": now + timedelta(days=7),
+            "subtotal": total_discounted,
+            "tax_amount": gst_amount,
+            "total_amount": grand_total,
+            "amount_paid": Decimal("0.00"),
+            "balance_due": grand_total,
+            "status": "unpaid",
+            "payment_status": "pending",
+            "currency": "INR",
+            "tax_rate": Decimal("18.00"),
+            "late_fee": Decimal("0.00"),
+            "days_overdue": 0,
+            "items": [plan_item] + invoice_addon_items + invoice_service_items,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+        return {
+            "order": order,
+            "addons": addon_records,
+            "services": service_records,
+            "invoice": invoice,
+            "plan_type": "recurring" if order_data.billing_cycle.lower() == "monthly" else "longterm",
+        }
 
-            # ✅ 1️⃣4️⃣ Auto Commission (optional)
-            # If payment_status == "completed" → auto distribute commission
-            if new_order.order_status == "completed":
-                referral_service = ReferralService()
+    @staticmethod
+    def _order_response(draft: Dict[str, Any], invoice_id: int) -> Dict[str, Any]:
+        """Order + invoice response built from the inserted values (no re-read)."""
+        order, invoice = draft["order"], draft["invoice"]
+        return {
+            "order": {
+                "id": draft["order_id"],
+                "user_id": order["user_id"],
+                "plan_id": order["plan_id"],
+                "order_number": order["order_number"],
+                "order_status": order["order_status"],
+                "payment_status": order["payment_status"],
+                "billing_cycle": order["billing_cycle"],
+                "total_amount": float(order["total_amount"]),
+                "discount_amount": float(order["discount_amount"]),
+                "tax_amount": float(order["tax_amount"]),
+                "grand_total": float(order["grand_total"]),
+                "currency": order["currency"],
+                "server_details": order["server_details"],
+                "addons": [
+                    {
+                        "addon_id": a["addon_id"],
+                        "unit_price": float(a["unit_price"]),
+                        "quantity": float(a["quantity"]),
+                        "total": float(a["total_amount"])
+                    }
+                    for a in draft["addons"]
+                ],
+                "services": [
+                    {
+                        "service_id": s["service_id"],
+                        "unit_price": float(s["unit_price"]),
+                        "quantity": float(s["quantity"]),
+                        "total": float(s["total_amount"])
+                    }
+                    for s in draft["services"]
+                ],
+                "created_at": order["created_at"],
+                "updated_at": order["updated_at"],
+            },
+            "invoice": {
+                "id": invoice_id,
+                "invoice_number": invoice["invoice_number"],
+                "order_id": draft["order_id"],
+                "user_id": invoice["user_id"],
+                "total_amount": float(invoice["total_amount"]),
+                "subtotal": float(invoice["subtotal"]),
+                "tax_amount": float(invoice["tax_amount"]),
+                "items": invoice["items"],
+                "invoice_date": invoice["invoice_date"],
+                "due_date": invoice["due_date"],
+                "created_at": invoice["created_at"],
+                "updated_at": invoice["updated_at"],
+                "status": invoice["status"],
+                "payment_status": invoice["payment_status"],
+                "currency": invoice["currency"],
+            },
+        }
+
+    async def _record_completed_commissions(self, db: AsyncSession, drafts: List[Dict[str, Any]]) -> None:
+        """Auto commission for orders created as completed (after commit)."""
+        referral_service = ReferralService()
+        for draft in drafts:
+            order = draft["order"]
+            if order["order_status"] == "completed":
                 await referral_service.record_commission_earnings(
                     db=db,
-                    user_id=new_order.user_id,
-                    order_id=new_order.id,
-                    plan_amount=new_order.grand_total,
-                    plan_type="recurring" if order_data.billing_cycle.lower() == "monthly" else "longterm",
+                    user_id=order["user_id"],
+                    order_id=draft["order_id"],
+                    plan_amount=order["grand_total"],
+                    plan_type=draft["plan_type"],
                 )
 
-            # ✅ 1️⃣5️⃣ Return combined response with addons and services
-            return {
-                "order": {
-                    "id": new_order.id,
-                    "user_id": new_order.user_id,
-                    "plan_id": new_order.plan_id,
-                    "order_number": new_order.order_number,
-                    "order_status": new_order.order_status,
-                    "payment_status": new_order.payment_status,
-                    "billing_cycle": new_order.billing_cycle,
-                    "total_amount": float(new_order.total_amount),
-                    "discount_amount": float(new_order.discount_amount),
-                    "tax_amount": float(new_order.tax_amount),
-                    "grand_total": float(new_order.grand_total),
-                    "currency": new_order.currency,
-                    "server_details": new_order.server_details,
-                    "addons": [
-                        {
-                            "addon_id": a["addon_id"],
-                            "unit_price": float(a["unit_price"]),
-                            "quantity": float(a["quantity"]),
-                            "total": float(a["total_amount"])
-                        }
-                        for a in addon_records
-                    ],
-                    "services": [
-                        {
-                            "service_id": s["service_id"],
-                            "unit_price": float(s["unit_price"]),
-                            "quantity": float(s["quantity"]),
-                            "total": float(s["total_amount"])
-                        }
-                        for s in service_records
-                    ],
-                    "created_at": new_order.created_at,
-                    "updated_at": new_order.updated_at,
-                },
-                "invoice": {
-                    "id": new_invoice.id,
-                    "invoice_number": new_invoice.invoice_number,
-                    "order_id": new_invoice.order_id,
-                    "user_id": new_invoice.user_id,
-                    "total_amount": float(new_invoice.total_amount),
-                    "subtotal": float(new_invoice.subtotal),
-                    "tax_amount": float(new_invoice.tax_amount),
-                    "items": new_invoice.items,
-                    "invoice_date": new_invoice.invoice_date,
-                    "due_date": new_invoice.due_date,
-                    "created_at": new_invoice.created_at,
-                    "updated_at": new_invoice.updated_at,
-                    "status": new_invoice.status,
-                    "payment_status": new_invoice.payment_status,
-                    "currency": new_invoice.currency,
-                },
-            }
-
-        except Exception as e:
-            await db.rollback()
-            raise ValueError(f"❌ Error creating order: {str(e)}")
-
 
     async def update_order(
         self, db: AsyncSession, order_id: int, order_update: OrderUpdate
@@ -635,43 +703,27 @@ class OrderService:
 
         # 4️⃣ Commission structure (percentages)
         commission_structure = {
-            1: 10.0,
-            2: 5.0,
-            3: 2.0,
+            1: Decimal("10.00"),
+            2: Decimal("5.00"),
+            3: Decimal("2.00"),
         }
 
-        # 5️⃣ Detect referral direction and traverse up
-        current_user = buyer
-        current_level = 1
-        order_amount = float(order.grand_total or 0)
-
-        while current_user.referred_by and current_level <= len(commission_structure):
-            # find the referrer (upline)
-            result = await db.execute(select(UserProfile).filter(UserProfile.id == current_user.referred_by))
-            referrer = result.scalars().first()
-            if not referrer:
-                break
-
-            commission_rate = commission_structure[current_level]
-            commission_amount = round(order_amount * (commission_rate / 100), 2)
-
-            # Create referral earning record
-            earning = ReferralEarning(
-                user_id=buyer.id,
-                referred_user_id=referrer.id,
-                order_id=order.id,
-                level=current_level,
-                commission_rate=commission_rate,
-                order_amount=order_amount,
-                commission_amount=commission_amount,
-                status="pending",
-                earned_at=datetime.utcnow(),
-            )
-            db.add(earning)
-
-            # Move up the chain
-            current_user = referrer
-            current_level += 1
+        # 5️⃣ Uplines from the closure table in one query
+        uplines = await ReferralTreeService().resolve_uplines(
+            db, buyer, max_depth=len(commission_structure)
+        )
+        order_amount = Decimal(str(order.grand_total or 0))
+
+        # 6️⃣ One INSERT for every level; affiliate_stats gets the same delta
+        engine = CommissionEngine()
+        await engine.record(
+            db,
+            order_id=order.id,
+            referred_user_id=buyer.id,
+            order_amount=order_amount,
+            lines=engine.percentage_lines(uplines, commission_structure, order_amount),
+            earning_status="pending",
+        )
 
         await db.commit()
         await db.refresh(order)
@@ -690,60 +742,35 @@ class OrderService:
         return result.scalars().all()
 
     async def get_order_stats(self, db: AsyncSession) -> OrderSummary:
-        total_orders = await self.get_total_orders(db)
-
-        pending = await db.execute(
-            select(func.count(Order.id)).where(Order.order_status == "pending")
-        )
-        completed = await db.execute(
-            select(func.count(Order.id)).where(Order.order_status == "completed")
-        )
-        cancelled = await db.execute(
-            select(func.count(Order.id)).where(Order.order_status == "cancelled")
-        )
-
-        total_revenue_result = await db.execute(
-            select(func.sum(Order.total_amount)).where(Order.payment_status == "paid")
-        )
-        total_revenue = total_revenue_result.scalar() or Decimal("0.0")
-
-        start_of_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_revenue_result = await db.execute(
-            select(func.sum(Order.total_amount)).where(
-                Order.payment_status == "paid", Order.created_at >= start_of_month
+        row = (await db.execute(
+            select(
+                func.count(Order.id).label("total_orders"),
+                func.count(Order.id).filter(Order.order_status == "pending").label("pending_orders"),
+                func.count(Order.id).filter(Order.order_status == "completed").label("completed_orders"),
+                func.count(Order.id).filter(Order.order_status == "cancelled").label("cancelled_orders"),
             )
-        )
-        monthly_revenue = monthly_revenue_result.scalar() or Decimal("0.0")
+        )).one()
 
+        # Revenue (paid orders) from the monthly rollups
+        rollups = RevenueRollupService()
         return OrderSummary(
-            total_orders=total_orders,
-            pending_orders=pending.scalar() or 0,
-            completed_orders=completed.scalar() or 0,
-            cancelled_orders=cancelled.scalar() or 0,
-            total_revenue=total_revenue,
-            monthly_revenue=monthly_revenue,
+            total_orders=row.total_orders or 0,
+            pending_orders=row.pending_orders or 0,
+            completed_orders=row.completed_orders or 0,
+            cancelled_orders=row.cancelled_orders or 0,
+            total_revenue=await rollups.total(db, "order", "paid"),
+            monthly_revenue=await rollups.month_total(db, "order", "paid"),
         )
 
     # -----------------------------
     # 🔹 PRIVATE HELPERS
     # -----------------------------
-    async def _generate_order_number(self, db: AsyncSession, length: int = 10) -> str:
-        chars = string.ascii_uppercase + string.digits
-        while True:
-            number = "ORD-" + "".join(secrets.choice(chars) for _ in range(length))
-            result = await db.execute(select(Order).where(Order.order_number == number))
-            if not result.scalar_one_or_none():
-                return number
-
-    async def _generate_invoice_number(self, db: AsyncSession, length: int = 6) -> str:
-        chars = string.digits
-        while True:
-            number = "INV-" + "".join(secrets.choice(chars) for _ in range(length))
-            result = await db.execute(
-                select(Invoice).where(Invoice.invoice_number == number)
-            )
-            if not result.scalar_one_or_none():
-                return number
+    async def _reserve_numbers(self, kind: str, count: int) -> List[str]:
+        # A single order draws from the per-worker block (usually no query);
+        # a batch reserves its whole range in one round trip
+        if count == 1:
+            return [await number_allocator.next_number(kind)]
+        return await number_allocator.next_numbers(kind, count)
 
    # ====================== Razorpay Integration Helpers ====================== #
 
@@ -119,7 +119,9 @@ class PaymentService:
         db: AsyncSession,
         razorpay_order_id: str,
         razorpay_payment_id: str,
-        razorpay_signature: str
+        razorpay_signature: str,
+        fetch_details: bool = True,
+        commit: bool = True
     ) -> PaymentTransaction:
         """
         Verify Razorpay payment and mark transaction as paid
@@ -129,6 +131,10 @@ class PaymentService:
             razorpay_order_id: Razorpay order ID
             razorpay_payment_id: Razorpay payment ID
             razorpay_signature: Razorpay signature for verification
+            fetch_details: Fetch the payment entity from Razorpay now
+                (the post-payment pipeline does this later when False)
+            commit: Commit here; pass False to enqueue follow-up jobs
+                in the same transaction
         
         Returns:
             Updated PaymentTransaction
@@ -146,11 +152,11 @@ class PaymentService:
                 detail="Invalid payment signature"
             )
 
-        # Find payment transaction
+        # Find payment transaction (locked: the webhook drain may be settling it too)
         result = await db.execute(
             select(PaymentTransaction).where(
                 PaymentTransaction.razorpay_order_id == razorpay_order_id
-            )
+            ).with_for_update()
         )
         payment_transaction = result.scalars().first()
 
@@ -161,16 +167,18 @@ class PaymentService:
             )
 
         # Fetch payment details from Razorpay
-        payment_details = await self.razorpay_service.fetch_payment_details(
-            razorpay_payment_id
-        )
+        payment_details = {}
+        if fetch_details:
+            payment_details = await self.razorpay_service.fetch_payment_details(
+                razorpay_payment_id
+            )
 
         # Update payment transaction
         payment_transaction.razorpay_payment_id = razorpay_payment_id
         payment_transaction.razorpay_signature = razorpay_signature
         payment_transaction.payment_status = PaymentStatus.PAID
-        payment_transaction.payment_method = payment_details.get('method', 'unknown')
-        payment_transaction.paid_at = datetime.utcnow()
+        payment_transaction.payment_method = payment_details.get('method', payment_transaction.payment_method or 'unknown')
+        payment_transaction.paid_at = payment_transaction.paid_at or datetime.utcnow()
         
         # Store additional Razorpay metadata
         if payment_details:
@@ -179,8 +187,11 @@ class PaymentService:
                 'razorpay_details': payment_details
             }
 
-        await db.commit()
-        await db.refresh(payment_transaction)
+        if commit:
+            await db.commit()
+            await db.refresh(payment_transaction)
+        else:
+            await db.flush()
 
         return payment_transaction
 
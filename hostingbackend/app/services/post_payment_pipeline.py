@@ -0,0 +1,415 @@
+"""
+Post-payment processing pipeline.
+
+`/payments/verify-payment` only verifies the Razorpay signature, marks the
+PaymentTransaction as PAID and enqueues a `post_payment` job in the same
+transaction. Everything else runs here, in a worker, as a sequence of
+idempotent stages:
+
+    invoice payments       gateway_details → settle_invoice
+    subscription payments  gateway_details → activate_subscription
+    server payments        gateway_details → create_order → distribute_commission
+                           → provision_server → activate_affiliate
+
+Each stage checks whether its effect already exists before acting, and the
+job row records completed stages, so a retry after a crash resumes where the
+previous attempt stopped without duplicating orders, servers or earnings.
+"""
+
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.invoice import Invoice
+from app.models.job import BackgroundJob
+from app.models.order import Order
+from app.models.order_addon import OrderAddon
+from app.models.payment import PaymentTransaction, PaymentType
+from app.models.plan import HostingPlan
+from app.models.server import Server
+from app.models.users import UserProfile
+from app.services.job_queue_service import JobQueueService, StageTimer, register_job_handler
+
+
+POST_PAYMENT_JOB = "post_payment"
+
+CYCLE_DAYS = {
+    'monthly': 30,
+    'quarterly': 90,
+    'semi_annual': 180,
+    'semi-annually': 180,
+    'semiannually': 180,
+    'annual': 365,
+    'annually': 365,
+    'biennial': 730,
+    'biennially': 730,
+    'triennial': 1095,
+    'triennially': 1095,
+    'one_time': 30
+}
+
+
+class PostPaymentPipeline:
+    """Runs the provisioning/commission/affiliate work for a paid transaction."""
+
+    def __init__(self):
+        self.job_queue = JobQueueService()
+
+    # ------------------------------------------------------------------
+    # Enqueueing
+    # ------------------------------------------------------------------
+    @staticmethod
+    def dedupe_key(payment_transaction: PaymentTransaction) -> str:
+        return f"{POST_PAYMENT_JOB}:{payment_transaction.razorpay_order_id}"
+
+    async def enqueue(self, db: AsyncSession, payment_transaction: PaymentTransaction) -> BackgroundJob:
+        """Stage the job in the caller's transaction (idempotent per Razorpay order)."""
+        return await self.job_queue.enqueue(
+            db,
+            job_type=POST_PAYMENT_JOB,
+            payload={
+                "payment_transaction_id": payment_transaction.id,
+                "user_id": payment_transaction.user_id,
+                "razorpay_order_id": payment_transaction.razorpay_order_id,
+                "razorpay_payment_id": payment_transaction.razorpay_payment_id,
+            },
+            dedupe_key=self.dedupe_key(payment_transaction),
+        )
+
+    @staticmethod
+    def stages_for(payment_transaction: PaymentTransaction) -> List[str]:
+        metadata = payment_transaction.payment_metadata or {}
+        if metadata.get('payment_for') == 'invoice':
+            return ["gateway_details", "settle_invoice"]
+        if payment_transaction.payment_type == PaymentType.SUBSCRIPTION:
+            return ["gateway_details", "activate_subscription"]
+        return [
+            "gateway_details",
+            "create_order",
+            "distribute_commission",
+            "provision_server",
+            "activate_affiliate",
+        ]
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+    async def run(self, db: AsyncSession, job: BackgroundJob) -> Dict[str, Any]:
+        result = await db.execute(
+            select(PaymentTransaction).where(
+                PaymentTransaction.id == job.payload["payment_transaction_id"]
+            )
+        )
+        payment_transaction = result.scalars().first()
+        if not payment_transaction:
+            raise ValueError(f"Payment transaction {job.payload['payment_transaction_id']} not found")
+
+        completed = list(job.completed_stages or [])
+        outcome: Dict[str, Any] = dict(job.result or {})
+        timer = StageTimer(job)
+
+        for stage in self.stages_for(payment_transaction):
+            if stage in completed:
+                continue
+
+            started = time.perf_counter()
+            await getattr(self, f"_stage_{stage}")(db, payment_transaction, outcome)
+            timer.record(stage, started)
+
+            # Checkpoint after every stage so retries skip finished work
+            completed = completed + [stage]
+            job.completed_stages = completed
+            job.result = dict(outcome)
+            await db.commit()
+
+        return outcome
+
+    # ------------------------------------------------------------------
+    # Stages
+    # ------------------------------------------------------------------
+    async def _stage_gateway_details(self, db: AsyncSession, txn: PaymentTransaction, outcome: Dict[str, Any]):
+        """Fetch the payment entity from Razorpay (payment method, etc.)."""
+        if (txn.payment_metadata or {}).get('razorpay_details'):
+            return
+
+        from app.services.razorpay_service import RazorpayService
+
+        payment_details = await RazorpayService().fetch_payment_details(txn.razorpay_payment_id)
+        if payment_details.get('error'):
+            # Let the queue retry; the gateway may be briefly unavailable
+            raise RuntimeError(f"Could not fetch payment details: {payment_details['error']}")
+
+        txn.payment_method = payment_details.get('method', txn.payment_method or 'unknown')
+        txn.payment_metadata = {
+            **(txn.payment_metadata or {}),
+            'razorpay_details': payment_details
+        }
+        await db.commit()
+
+    async def _stage_settle_invoice(self, db: AsyncSession, txn: PaymentTransaction, outcome: Dict[str, Any]):
+        """Mark the invoice (and its order) paid and provision the order's server."""
+        invoice_id = (txn.payment_metadata or {}).get('invoice_id')
+        outcome['invoice_id'] = invoice_id
+        if not invoice_id:
+            return
+
+        invoice_result = await db.execute(select(Invoice).where(Invoice.id == invoice_id))
+        invoice_obj = invoice_result.scalars().first()
+        if not invoice_obj:
+            return
+
+        invoice_obj.payment_status = 'paid'
+        invoice_obj.status = 'paid'
+        invoice_obj.amount_paid = invoice_obj.total_amount
+        invoice_obj.balance_due = 0
+        invoice_obj.payment_date = txn.paid_at
+        invoice_obj.paid_at = txn.paid_at
+        invoice_obj.payment_method = 'razorpay'
+        invoice_obj.payment_reference = txn.razorpay_payment_id
+
+        if invoice_obj.order_id:
+            order_result = await db.execute(select(Order).where(Order.id == invoice_obj.order_id))
+            order_obj = order_result.scalars().first()
+
+            if order_obj and order_obj.plan_id:
+                order_obj.payment_status = 'paid'
+                order_obj.order_status = 'completed'
+                order_obj.razorpay_order_id = txn.razorpay_order_id
+                order_obj.razorpay_payment_id = txn.razorpay_payment_id
+                order_obj.paid_at = txn.paid_at
+
+                if not await self._server_for_order(db, order_obj.id):
+                    server = await self._create_server_for_order(db, txn.user_id, order_obj)
+                    if server:
+                        outcome['server_id'] = server.id
+
+        await db.commit()
+
+    async def _stage_activate_subscription(self, db: AsyncSession, txn: PaymentTransaction, outcome: Dict[str, Any]):
+        """₹499 premium: create the affiliate subscription and flag the user."""
+        from app.services.affiliate_service import AffiliateService
+        from app.schemas.affiliate import AffiliateSubscriptionCreate
+
+        subscription_data = AffiliateSubscriptionCreate(
+            subscription_type='premium',
+            payment_method='razorpay',
+            payment_id=txn.razorpay_payment_id,
+            transaction_id=str(txn.id),
+            amount_paid=float(txn.total_amount)
+        )
+
+        # Returns the existing subscription if one was already created
+        affiliate_sub = await AffiliateService().create_affiliate_subscription(
+            db=db,
+            user_id=txn.user_id,
+            subscription_data=subscription_data
+        )
+        outcome['affiliate_subscription_id'] = affiliate_sub.id
+        outcome['order_number'] = f'SUB-{affiliate_sub.id}'
+
+        result = await db.execute(select(UserProfile).where(UserProfile.id == txn.user_id))
+        user = result.scalars().first()
+        if user and user.subscription_status != 'active':
+            user.subscription_status = 'active'
+            user.subscription_start = datetime.utcnow()
+            await db.commit()
+
+    async def _stage_create_order(self, db: AsyncSession, txn: PaymentTransaction, outcome: Dict[str, Any]):
+        """Create the Order + Invoice for a server purchase and copy payment details onto them."""
+        from app.schemas.order import OrderCreate
+        from app.services.order_service import OrderService
+
+        metadata = txn.payment_metadata or {}
+
+        order_obj = await self._order_for_transaction(db, txn)
+        if order_obj is None:
+            billing_cycle = txn.billing_cycle or metadata.get('billing_cycle')
+            if not billing_cycle:
+                print(f"⚠️  WARNING: No billing_cycle found for payment {txn.id}, defaulting to monthly")
+                billing_cycle = 'monthly'
+
+            order_create = OrderCreate(
+                plan_id=metadata.get('plan_id'),
+                billing_cycle=billing_cycle,
+                total_amount=txn.total_amount,
+                status='active',
+                payment_status='paid',
+                payment_method=txn.payment_method or 'razorpay',
+                razorpay_order_id=txn.razorpay_order_id,
+                razorpay_payment_id=txn.razorpay_payment_id,
+                paid_at=txn.paid_at or datetime.utcnow(),
+                discount_amount=Decimal(str(metadata.get('discount_amount') or 0)),
+                promo_code=metadata.get('promo_code')
+            )
+
+            order = await OrderService().create_order(db, txn.user_id, order_create)
+            order_data = order.get('order', {}) if isinstance(order, dict) else order
+            order_id = order_data.get('id') if isinstance(order_data, dict) else order_data.id
+
+            result = await db.execute(select(Order).where(Order.id == order_id))
+            order_obj = result.scalars().first()
+
+        txn.order_id = order_obj.id
+        outcome['order_id'] = order_obj.id
+        outcome['order_number'] = order_obj.order_number
+
+        order_obj.payment_type = txn.payment_type.value
+        order_obj.activation_type = txn.activation_type.value
+        order_obj.razorpay_order_id = txn.razorpay_order_id
+        order_obj.razorpay_payment_id = txn.razorpay_payment_id
+        order_obj.paid_at = txn.paid_at
+        order_obj.order_status = 'completed'
+        order_obj.payment_status = 'paid'
+
+        # Promo code and discount/tax as calculated at checkout
+        order_obj.promo_code = metadata.get('promo_code')
+        if metadata.get('discount_amount') is not None:
+            order_obj.discount_amount = Decimal(str(metadata.get('discount_amount')))
+        if metadata.get('tax_amount') is not None:
+            order_obj.tax_amount = Decimal(str(metadata.get('tax_amount')))
+
+        if not order_obj.service_start_date or not order_obj.service_end_date:
+            service_start = txn.paid_at or datetime.utcnow()
+            days = CYCLE_DAYS.get((order_obj.billing_cycle or 'monthly').lower(), 30)
+            order_obj.service_start_date = service_start
+            order_obj.service_end_date = service_start + timedelta(days=days)
+
+        # Addon snapshots from checkout metadata (skip if a previous attempt wrote them)
+        selected_addons = [a for a in metadata.get('addons', []) if a.get('addon_id', 0) != 0]
+        if selected_addons:
+            existing = await db.execute(
+                select(OrderAddon.id).where(OrderAddon.order_id == order_obj.id).limit(1)
+            )
+            if existing.first() is None:
+                tax_rate = Decimal('0.18')  # 18% GST
+                for addon_data in selected_addons:
+                    subtotal = Decimal(str(addon_data.get('subtotal', 0)))
+                    tax_amount = subtotal * tax_rate
+                    db.add(OrderAddon(
+                        order_id=order_obj.id,
+                        addon_id=addon_data.get('addon_id'),
+                        addon_name=addon_data.get('addon_name', ''),
+                        addon_category=addon_data.get('category', 'GENERAL'),
+                        addon_description=addon_data.get('description', ''),
+                        quantity=addon_data.get('quantity', 1),
+                        unit_price=Decimal(str(addon_data.get('unit_price', 0))),
+                        subtotal=subtotal,
+                        discount_percent=Decimal('0'),
+                        discount_amount=Decimal('0'),
+                        tax_percent=tax_rate * 100,
+                        tax_amount=tax_amount,
+                        total_amount=subtotal + tax_amount,
+                        billing_type='monthly',
+                        currency='INR',
+                        unit_label=addon_data.get('unit_label', ''),
+                        is_active=1
+                    ))
+
+        invoice_result = await db.execute(select(Invoice).where(Invoice.order_id == order_obj.id))
+        invoice_obj = invoice_result.scalars().first()
+        if invoice_obj:
+            invoice_obj.payment_status = 'paid'
+            invoice_obj.status = 'paid'
+            invoice_obj.amount_paid = invoice_obj.total_amount
+            invoice_obj.balance_due = 0
+            invoice_obj.payment_date = txn.paid_at
+            invoice_obj.paid_at = txn.paid_at
+            invoice_obj.payment_method = 'razorpay'
+            invoice_obj.payment_reference = txn.razorpay_payment_id
+
+        await db.commit()
+
+    async def _stage_distribute_commission(self, db: AsyncSession, txn: PaymentTransaction, outcome: Dict[str, Any]):
+        """L1–L3 referral earnings (CommissionService is idempotent per transaction)."""
+        from app.services.commission_service import CommissionService
+
+        earnings = []
+        if txn.requires_commission():
+            earnings = await CommissionService().distribute_commission(
+                db=db,
+                payment_transaction_id=txn.id
+            )
+        outcome['commission'] = {
+            "distributed": txn.commission_distributed,
+            "earnings_count": len(earnings),
+            "total_distributed": sum(float(e.commission_amount) for e in earnings)
+        }
+
+    async def _stage_provision_server(self, db: AsyncSession, txn: PaymentTransaction, outcome: Dict[str, Any]):
+        """Create the customer's server for the order (once)."""
+        order_obj = await self._order_for_transaction(db, txn)
+        if not order_obj or not order_obj.plan_id:
+            return
+
+        server = await self._server_for_order(db, order_obj.id)
+        if server is None:
+            server = await self._create_server_for_order(db, txn.user_id, order_obj)
+
+        if server:
+            outcome['server_id'] = server.id
+            outcome['hostname'] = server.hostname
+
+    async def _stage_activate_affiliate(self, db: AsyncSession, txn: PaymentTransaction, outcome: Dict[str, Any]):
+        """Free affiliate subscription that comes with a server purchase."""
+        from app.services.affiliate_service import AffiliateService
+
+        affiliate_sub = await AffiliateService().check_and_activate_from_server_purchase(db, txn.user_id)
+        outcome['affiliate_activated'] = affiliate_sub is not None
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    async def _order_for_transaction(self, db: AsyncSession, txn: PaymentTransaction) -> Optional[Order]:
+        if txn.order_id:
+            stmt = select(Order).where(Order.id == txn.order_id)
+        else:
+            stmt = select(Order).where(Order.razorpay_order_id == txn.razorpay_order_id)
+        result = await db.execute(stmt)
+        return result.scalars().first()
+
+    async def _server_for_order(self, db: AsyncSession, order_id: int) -> Optional[Server]:
+        result = await db.execute(select(Server).where(Server.order_id == order_id))
+        return result.scalars().first()
+
+    async def _create_server_for_order(self, db: AsyncSession, user_id: int, order_obj: Order) -> Optional[Server]:
+        from app.schemas.server import ServerCreate
+        from app.services.server_service import ServerService
+
+        result = await db.execute(select(HostingPlan).where(HostingPlan.id == order_obj.plan_id))
+        plan = result.scalar_one_or_none()
+        if not plan:
+            return None
+
+        server_data = ServerCreate(
+            server_name=f'{plan.name} Server',
+            hostname=f'server-{user_id}-{order_obj.id}.bidua.com',
+            server_type='VPS',
+            operating_system='Ubuntu 22.04 LTS',
+            vcpu=plan.cpu_cores,
+            ram_gb=plan.ram_gb,
+            storage_gb=plan.storage_gb,
+            bandwidth_gb=plan.bandwidth_gb or 1000,
+            plan_id=plan.id,
+            monthly_cost=plan.base_price,
+            billing_cycle=order_obj.billing_cycle or 'monthly'
+        )
+
+        server = await ServerService().create_user_server(
+            db,
+            user_id,
+            server_data,
+            order_id=order_obj.id,
+            created_date=order_obj.service_start_date or datetime.utcnow(),
+            expiry_date=order_obj.service_end_date
+        )
+        print(f"✅ Server created: {server.id} for order {order_obj.id}")
+        return server
+
+
+@register_job_handler(POST_PAYMENT_JOB)
+async def run_post_payment_job(db: AsyncSession, job: BackgroundJob) -> Dict[str, Any]:
+    return await PostPaymentPipeline().run(db, job)
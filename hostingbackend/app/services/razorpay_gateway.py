@@ -0,0 +1,263 @@
+"""
+Async Razorpay gateway client.
+
+The official `razorpay.Client` is built on `requests` and blocks the event
+loop for the full duration of every gateway call. This adapter talks to the
+Razorpay REST API with a pooled `httpx.AsyncClient` (HTTP/2 when the `h2`
+package is available) and adds:
+
+- per-call connect/read timeouts
+- bounded retries with full-jitter exponential backoff
+- a circuit breaker that fails fast while the gateway is unhealthy
+- local HMAC signature checks (no network, no thread hop)
+
+One gateway instance is shared per worker via `get_razorpay_gateway()` so
+connections are reused across requests.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import random
+import time
+from typing import Any, Dict, Optional, Union
+
+import httpx
+
+from app.core.config import settings
+
+
+class GatewayError(Exception):
+    """Razorpay rejected the call or returned an unusable response."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, payload: Optional[dict] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.payload = payload or {}
+
+
+class GatewayUnavailableError(GatewayError):
+    """Razorpay could not be reached, timed out, or the circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Minimal closed → open → half-open breaker.
+
+    After `failure_threshold` consecutive failures calls are rejected for
+    `reset_timeout` seconds; the next call after that is let through as a
+    probe and closes the circuit again on success.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class RazorpayGateway:
+    """Non-blocking client for the subset of the Razorpay API we use."""
+
+    RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        key_id: str,
+        key_secret: str,
+        base_url: str = "https://api.razorpay.com/v1",
+        timeout: float = 10.0,
+        connect_timeout: float = 3.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_cap: float = 2.0,
+        breaker: Optional[CircuitBreaker] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        max_connections: int = 50,
+    ):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker()
+
+        client_kwargs: Dict[str, Any] = {
+            "base_url": self.base_url,
+            "auth": (key_id, key_secret),
+            "timeout": httpx.Timeout(timeout, connect=connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            "headers": {"Content-Type": "application/json"},
+        }
+        if transport is not None:
+            client_kwargs["transport"] = transport
+        else:
+            client_kwargs["http2"] = _http2_available()
+        self._client = httpx.AsyncClient(**client_kwargs)
+
+    # ------------------------------------------------------------------
+    # API calls
+    # ------------------------------------------------------------------
+    async def create_order(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """POST /orders. Only retried when the request never reached Razorpay."""
+        return await self._request("POST", "/orders", json=data, idempotent=False)
+
+    async def fetch_payment(self, payment_id: str) -> Dict[str, Any]:
+        """GET /payments/{id}."""
+        return await self._request("GET", f"/payments/{payment_id}", idempotent=True)
+
+    async def fetch_order(self, order_id: str) -> Dict[str, Any]:
+        """GET /orders/{id}."""
+        return await self._request("GET", f"/orders/{order_id}", idempotent=True)
+
+    # ------------------------------------------------------------------
+    # Signatures (pure CPU, safe to call from async code)
+    # ------------------------------------------------------------------
+    def verify_payment_signature(self, order_id: str, payment_id: str, signature: str) -> bool:
+        return self._verify(f"{order_id}|{payment_id}", signature, self.key_secret)
+
+    def verify_webhook_signature(
+        self,
+        body: Union[str, bytes],
+        signature: Optional[str],
+        secret: Optional[str] = None,
+    ) -> bool:
+        return self._verify(body, signature, secret or self.key_secret)
+
+    @staticmethod
+    def _verify(body: Union[str, bytes], signature: Optional[str], secret: str) -> bool:
+        if not signature:
+            return False
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    async def _request(self, method: str, path: str, idempotent: bool, **kwargs) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            raise GatewayUnavailableError("Razorpay circuit is open")
+
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as exc:
+                # Nothing reached the gateway, so even POSTs are safe to retry
+                if attempt < self.max_retries:
+                    attempt += 1
+                    await self._backoff(attempt)
+                    continue
+                self.breaker.record_failure()
+                raise GatewayUnavailableError(f"Razorpay unreachable: {exc}") from exc
+            except httpx.TransportError as exc:
+                if idempotent and attempt < self.max_retries:
+                    attempt += 1
+                    await self._backoff(attempt)
+                    continue
+                self.breaker.record_failure()
+                raise GatewayUnavailableError(f"Razorpay request failed: {exc}") from exc
+
+            if response.status_code in self.RETRYABLE_STATUS:
+                if idempotent and attempt < self.max_retries:
+                    attempt += 1
+                    await self._backoff(attempt)
+                    continue
+                self.breaker.record_failure()
+                raise GatewayUnavailableError(
+                    f"Razorpay returned {response.status_code}",
+                    status_code=response.status_code,
+                    payload=_safe_json(response),
+                )
+
+            # The gateway answered; 4xx is a caller problem, not an outage
+            self.breaker.record_success()
+            payload = _safe_json(response)
+            if response.status_code >= 400:
+                error = payload.get("error", {}) if isinstance(payload, dict) else {}
+                raise GatewayError(
+                    error.get("description") or f"Razorpay returned {response.status_code}",
+                    status_code=response.status_code,
+                    payload=payload,
+                )
+            return payload
+
+    async def _backoff(self, attempt: int) -> None:
+        delay = min(self.backoff_cap, self.backoff_base * (2 ** (attempt - 1)))
+        await asyncio.sleep(random.uniform(0, delay))
+
+
+def _safe_json(response: httpx.Response) -> Dict[str, Any]:
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+_gateway: Optional[RazorpayGateway] = None
+
+
+def get_razorpay_gateway() -> RazorpayGateway:
+    """Return this worker's shared gateway, creating it on first use."""
+    global _gateway
+    if _gateway is None:
+        _gateway = RazorpayGateway(
+            key_id=settings.RAZORPAY_KEY_ID,
+            key_secret=settings.RAZORPAY_KEY_SECRET,
+            base_url=settings.RAZORPAY_API_BASE_URL,
+            timeout=settings.RAZORPAY_TIMEOUT_SECONDS,
+            connect_timeout=settings.RAZORPAY_CONNECT_TIMEOUT_SECONDS,
+            max_retries=settings.RAZORPAY_MAX_RETRIES,
+            breaker=CircuitBreaker(
+                failure_threshold=settings.RAZORPAY_CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=settings.RAZORPAY_CIRCUIT_RESET_SECONDS,
+            ),
+        )
+    return _gateway
+
+
+async def close_razorpay_gateway() -> None:
+    global _gateway
+    if _gateway is not None:
+        await _gateway.aclose()
+        _gateway = None
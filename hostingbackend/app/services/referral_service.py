@@ -8,6 +8,8 @@ from typing import List, Dict, Any
 from app.models.referrals import ReferralEarning, ReferralPayout
 from app.models.users import UserProfile
 from app.schemas.referrals import ReferralPayoutCreate, ReferralStats
+from app.services.referral_tree_service import ReferralTreeService
+from app.services.commission_engine import CommissionEngine
 
 
 class ReferralService:
@@ -49,36 +51,21 @@ class ReferralService:
             else self.LONGTERM_COMMISSIONS
         )
 
-        current_referrer_id = user.referred_by
-
-        for level, percent in structure.items():
-            if not current_referrer_id:
-                break
-
-            commission_amount = plan_amount * percent
-
-            earning = ReferralEarning(
-                # user_id=current_referrer_id,        # Who earned
-                # referred_user_id=user_id,           # Who made the purchase
-
-                user_id=current_referrer_id,        # ✅ The referrer who earned
-                referred_user_id=user_id, 
-                order_id=order_id,
-                level=level,
-                commission_rate=percent * 100,
-                order_amount=plan_amount,
-                commission_amount=commission_amount,
-                status="pending",
-            )
-
-            db.add(earning)
-            await db.flush()
-
-            # Find next-level referrer
-            next_ref = await db.execute(
-                select(UserProfile.referred_by).where(UserProfile.id == current_referrer_id)
-            )
-            current_referrer_id = next_ref.scalar_one_or_none()
+        uplines = await ReferralTreeService().resolve_uplines(db, user, max_depth=len(structure))
+
+        # All levels in one INSERT; re-running for the same order is a no-op
+        await CommissionEngine().record(
+            db,
+            order_id=order_id,
+            referred_user_id=user_id,
+            order_amount=plan_amount,
+            lines=CommissionEngine.percentage_lines(
+                uplines,
+                {level: percent * 100 for level, percent in structure.items()},
+                Decimal(plan_amount),
+            ),
+            earning_status="pending",
+        )
 
         await db.commit()
 
@@ -88,33 +75,11 @@ class ReferralService:
     async def get_user_referral_stats(self, db: AsyncSession, user_id: int) -> ReferralStats:
         """Return detailed stats for user's referrals and earnings."""
 
-        # --- Level 1 ---
-        l1_result = await db.execute(select(func.count(UserProfile.id)).where(UserProfile.referred_by == user_id))
-        l1_referrals = l1_result.scalar() or 0
-
-        # --- Level 2 ---
-        l2_result = await db.execute(
-            select(func.count(UserProfile.id)).where(
-                UserProfile.referred_by.in_(
-                    select(UserProfile.id).where(UserProfile.referred_by == user_id)
-                )
-            )
-        )
-        l2_referrals = l2_result.scalar() or 0
-
-        # --- Level 3 ---
-        l3_result = await db.execute(
-            select(func.count(UserProfile.id)).where(
-                UserProfile.referred_by.in_(
-                    select(UserProfile.id).where(
-                        UserProfile.referred_by.in_(
-                            select(UserProfile.id).where(UserProfile.referred_by == user_id)
-                        )
-                    )
-                )
-            )
-        )
-        l3_referrals = l3_result.scalar() or 0
+        # --- Levels 1-3 from the closure table (one GROUP BY) ---
+        downline = await ReferralTreeService().get_downline_counts(db, user_id, max_depth=3)
+        l1_referrals = downline[1]
+        l2_referrals = downline[2]
+        l3_referrals = downline[3]
 
         total_referrals = l1_referrals + l2_referrals + l3_referrals
 
@@ -289,23 +254,26 @@ class ReferralService:
     # --------------------------------------------------------
     async def get_admin_referral_stats(self, db: AsyncSession) -> Dict[str, Any]:
         """Get overall system-wide referral stats for admin dashboard."""
-        total_payouts = (await db.execute(select(func.count(ReferralPayout.id)))).scalar() or 0
-        approved_payouts = (
-            await db.execute(select(func.count(ReferralPayout.id)).where(ReferralPayout.status == "approved"))
-        ).scalar() or 0
-        rejected_payouts = (
-            await db.execute(select(func.count(ReferralPayout.id)).where(ReferralPayout.status == "rejected"))
-        ).scalar() or 0
-        pending_payouts = (
-            await db.execute(select(func.count(ReferralPayout.id)).where(ReferralPayout.status == "requested"))
-        ).scalar() or 0
-
-        total_earnings = (
-            await db.execute(select(func.sum(ReferralEarning.commission_amount)))
-        ).scalar() or 0
-        total_withdrawn = (
-            await db.execute(select(func.sum(ReferralPayout.net_amount)))
-        ).scalar() or 0
+        # Payout counters as FILTERed aggregates; earnings total as a scalar subquery,
+        # so the whole card is a single round trip
+        earnings_total = select(func.sum(ReferralEarning.commission_amount)).scalar_subquery()
+        row = (await db.execute(
+            select(
+                func.count(ReferralPayout.id).label("total_payouts"),
+                func.count(ReferralPayout.id).filter(ReferralPayout.status == "approved").label("approved_payouts"),
+                func.count(ReferralPayout.id).filter(ReferralPayout.status == "rejected").label("rejected_payouts"),
+                func.count(ReferralPayout.id).filter(ReferralPayout.status == "requested").label("pending_payouts"),
+                func.sum(ReferralPayout.net_amount).label("total_withdrawn"),
+                earnings_total.label("total_earnings"),
+            )
+        )).one()
+
+        total_payouts = row.total_payouts or 0
+        approved_payouts = row.approved_payouts or 0
+        rejected_payouts = row.rejected_payouts or 0
+        pending_payouts = row.pending_payouts or 0
+        total_earnings = row.total_earnings or 0
+        total_withdrawn = row.total_withdrawn or 0
 
         return {
             "total_payouts": total_payouts,
@@ -0,0 +1,225 @@
+"""
+Referral ancestry backed by the `referral_closure` table.
+
+Replaces walking `UserProfile.referred_by` one SELECT per level:
+
+- `get_uplines`         → {depth: ancestor_id}, one indexed query
+- `resolve_uplines`     → same, falling back to referral_level_* columns
+- `get_downline_counts` → {depth: count}, one GROUP BY
+- `add_referral`        → one INSERT ... SELECT on signup
+
+`rebuild` recreates the table from `referred_by` with a recursive CTE
+(see backfill_referral_closure.py). Until it has run, users from before
+the table have no rows: `add_referral` seeds a referrer's ancestry from
+its referral_level_* columns and `resolve_uplines` fills missing depths
+from them, so L2/L3 uplines are not lost in the meantime.
+"""
+
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, func, delete, literal, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.affiliate import ReferralClosure
+from app.models.users import UserProfile
+
+
+# Deepest level paid commission today; the table itself stores every depth
+DEFAULT_MAX_DEPTH = 3
+
+
+def legacy_uplines(user, max_depth: int = DEFAULT_MAX_DEPTH) -> Dict[int, int]:
+    """{depth: ancestor user id} from the denormalized referral_level_* columns."""
+    levels = {
+        1: user.referral_level_1 or user.referred_by,
+        2: user.referral_level_2,
+        3: user.referral_level_3,
+    }
+    return {level: uid for level, uid in levels.items() if uid and level <= max_depth}
+
+
+class ReferralTreeService:
+    """Upline/downline lookups and maintenance of the closure table."""
+
+    async def add_referral(self, db: AsyncSession, user_id: int, referrer_id: int) -> None:
+        """
+        Attach `user_id` under `referrer_id` (does not commit).
+
+        Inserts (referrer, user, 1) plus one row per ancestor of the
+        referrer, in a single statement. Re-running is a no-op.
+        """
+        if not referrer_id or referrer_id == user_id:
+            return
+
+        await self._seed_legacy_ancestry(db, referrer_id)
+
+        ancestors = (
+            select(
+                ReferralClosure.ancestor_id,
+                literal(user_id).label("descendant_id"),
+                (ReferralClosure.depth + 1).label("depth"),
+            )
+            .where(ReferralClosure.descendant_id == referrer_id)
+            # A referrer can never sit below the user it refers
+            .where(ReferralClosure.ancestor_id != user_id)
+        )
+        direct = select(
+            literal(referrer_id).label("ancestor_id"),
+            literal(user_id).label("descendant_id"),
+            literal(1).label("depth"),
+        )
+
+        stmt = pg_insert(ReferralClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            direct.union_all(ancestors),
+        ).on_conflict_do_nothing(index_elements=["ancestor_id", "descendant_id"])
+        await db.execute(stmt)
+
+    async def get_uplines(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+    ) -> Dict[int, int]:
+        """{depth: ancestor user id} for depths 1..max_depth."""
+        result = await db.execute(
+            select(ReferralClosure.depth, ReferralClosure.ancestor_id)
+            .where(
+                ReferralClosure.descendant_id == user_id,
+                ReferralClosure.depth <= max_depth,
+            )
+            .order_by(ReferralClosure.depth)
+        )
+        return {depth: ancestor_id for depth, ancestor_id in result.all()}
+
+    async def get_uplines_bulk(
+        self,
+        db: AsyncSession,
+        user_ids: List[int],
+        max_depth: int = DEFAULT_MAX_DEPTH,
+    ) -> Dict[int, Dict[int, int]]:
+        """{user_id: {depth: ancestor user id}} for many users in one query."""
+        if not user_ids:
+            return {}
+        result = await db.execute(
+            select(ReferralClosure.descendant_id, ReferralClosure.depth, ReferralClosure.ancestor_id)
+            .where(
+                ReferralClosure.descendant_id.in_(user_ids),
+                ReferralClosure.depth <= max_depth,
+            )
+        )
+        uplines: Dict[int, Dict[int, int]] = {}
+        for descendant_id, depth, ancestor_id in result.all():
+            uplines.setdefault(descendant_id, {})[depth] = ancestor_id
+        return uplines
+
+    async def resolve_uplines(
+        self,
+        db: AsyncSession,
+        user: UserProfile,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+    ) -> Dict[int, int]:
+        """
+        Uplines for commission payouts.
+
+        Depths missing from the closure table (users whose ancestry predates
+        it and has not been backfilled) fall back to the denormalized
+        referral_level_* columns; closure rows win where both exist.
+        """
+        uplines = await self.get_uplines(db, user.id, max_depth)
+        for level, uid in legacy_uplines(user, max_depth).items():
+            uplines.setdefault(level, uid)
+        return dict(sorted(uplines.items()))
+
+    async def get_downline_counts(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+    ) -> Dict[int, int]:
+        """{depth: number of users} below `user_id`, every depth present (0 if empty)."""
+        result = await db.execute(
+            select(ReferralClosure.depth, func.count())
+            .where(
+                ReferralClosure.ancestor_id == user_id,
+                ReferralClosure.depth <= max_depth,
+            )
+            .group_by(ReferralClosure.depth)
+        )
+        counts = {depth: 0 for depth in range(1, max_depth + 1)}
+        counts.update({depth: count for depth, count in result.all()})
+        return counts
+
+    async def get_downline_ids(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        depth: Optional[int] = None,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+    ) -> List[int]:
+        """Descendant user ids at one depth, or at every depth up to max_depth."""
+        stmt = select(ReferralClosure.descendant_id).where(ReferralClosure.ancestor_id == user_id)
+        if depth is not None:
+            stmt = stmt.where(ReferralClosure.depth == depth)
+        else:
+            stmt = stmt.where(ReferralClosure.depth <= max_depth)
+        result = await db.execute(stmt)
+        return list(result.scalars().all())
+
+    async def _seed_legacy_ancestry(self, db: AsyncSession, user_id: int) -> None:
+        """Closure rows for a user with none yet, from its referral_level_* columns."""
+        has_rows = (await db.execute(
+            select(ReferralClosure.depth).where(ReferralClosure.descendant_id == user_id).limit(1)
+        )).first()
+        if has_rows:
+            return
+
+        user = (await db.execute(
+            select(
+                UserProfile.referred_by,
+                UserProfile.referral_level_1,
+                UserProfile.referral_level_2,
+                UserProfile.referral_level_3,
+            ).where(UserProfile.id == user_id)
+        )).first()
+        if user is None:
+            return
+
+        rows = [
+            {"ancestor_id": ancestor_id, "descendant_id": user_id, "depth": depth}
+            for depth, ancestor_id in legacy_uplines(user).items()
+            if ancestor_id != user_id
+        ]
+        if rows:
+            await db.execute(
+                pg_insert(ReferralClosure).values(rows)
+                .on_conflict_do_nothing(index_elements=["ancestor_id", "descendant_id"])
+            )
+
+    async def rebuild(self, db: AsyncSession) -> int:
+        """Recreate the whole table from users_profiles.referred_by (commits)."""
+        await db.execute(delete(ReferralClosure))
+        await db.execute(text(
+            """
+            INSERT INTO referral_closure (ancestor_id, descendant_id, depth)
+            WITH RECURSIVE chain (ancestor_id, descendant_id, depth) AS (
+                SELECT referred_by, id, 1
+                FROM users_profiles
+                WHERE referred_by IS NOT NULL AND referred_by <> id
+                UNION ALL
+                SELECT u.referred_by, c.descendant_id, c.depth + 1
+                FROM chain c
+                JOIN users_profiles u ON u.id = c.ancestor_id
+                WHERE u.referred_by IS NOT NULL
+                  AND u.referred_by <> c.descendant_id
+                  AND c.depth < 64
+            )
+            SELECT ancestor_id, descendant_id, MIN(depth)
+            FROM chain
+            GROUP BY ancestor_id, descendant_id
+            """
+        ))
+        total = (await db.execute(select(func.count()).select_from(ReferralClosure))).scalar() or 0
+        await db.commit()
+        return total
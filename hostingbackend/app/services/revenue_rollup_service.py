@@ -0,0 +1,357 @@
+"""
+Incremental maintenance of `revenue_rollups`.
+
+Revenue figures (admin stats, revenue pace, order stats, monthly invoice
+revenue, revenue charts) used to SUM `orders` / `invoices` over date ranges
+and join `hosting_plans` on every request. They now read day/month buckets:
+
+    orders    bucketed by created_at, per plan, billing cycle and payment status
+    invoices  bucketed by payment date (invoice date while unpaid), per payment status
+
+Every change records what moved in a `RevenueDelta` - an order counted
+under its old bucket is subtracted there and added to its new one - and
+applies it with one upsert in the originating transaction:
+
+    INSERT INTO revenue_rollups (...) VALUES (...), (...)
+    ON CONFLICT (period, source, payment_status, period_start, plan_id, billing_cycle)
+    DO UPDATE SET count = revenue_rollups.count + excluded.count, amount = ...
+
+ORM changes to Order / Invoice rows are picked up by a `before_flush`
+hook, so every payment, refund and status path is covered without
+touching it; bulk Core INSERTs (OrderService._create_orders, renewal
+invoices) apply their delta explicitly. `rebuild` recomputes whole months
+from the source tables (backfill CLI, and the job worker for the current
+and previous month to repair drift from raw SQL).
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Date, delete, event, func, insert, inspect, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.database import AsyncSessionLocal
+from app.models.invoice import Invoice
+from app.models.order import Order
+from app.models.plan import HostingPlan
+from app.models.revenue_rollup import RevenueRollup
+
+
+PERIODS = ("day", "month")
+SOURCES = ("order", "invoice")
+BREAKDOWNS = ("plan_type", "billing_cycle", "payment_status")
+
+# Attributes that decide an order's / invoice's bucket and amount
+ORDER_FIELDS = ("created_at", "plan_id", "billing_cycle", "payment_status", "total_amount")
+INVOICE_FIELDS = ("payment_date", "invoice_date", "created_at", "payment_status", "total_amount")
+
+BucketKey = Tuple[str, str, str, date, int, str]  # period, source, payment_status, period_start, plan_id, billing_cycle
+
+
+def utc_day(value: Optional[datetime]) -> date:
+    """UTC calendar day of a timestamp (naive values are taken as UTC)."""
+    if value is None:
+        return datetime.now(timezone.utc).date()
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).date()
+    return value.date() if isinstance(value, datetime) else value
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class RevenueDelta:
+    """Accumulates per-bucket count/amount changes for one transaction."""
+
+    def __init__(self):
+        self._changes: Dict[BucketKey, List[Any]] = defaultdict(lambda: [0, Decimal("0")])
+
+    def add(
+        self,
+        source: str,
+        when: Optional[datetime],
+        payment_status: Optional[str],
+        amount,
+        plan_id: Optional[int] = None,
+        billing_cycle: Optional[str] = None,
+        sign: int = 1,
+    ) -> "RevenueDelta":
+        day = utc_day(when)
+        dimensions = (payment_status or "", plan_id or 0, (billing_cycle or "").lower())
+        for period, start in (("day", day), ("month", month_start(day))):
+            key = (period, source, dimensions[0], start, dimensions[1], dimensions[2])
+            change = self._changes[key]
+            change[0] += sign
+            change[1] += sign * Decimal(str(amount or 0))
+        return self
+
+    def order(self, values: Dict[str, Any], sign: int = 1) -> "RevenueDelta":
+        """`values`: an order's ORDER_FIELDS (row dict or attribute snapshot)."""
+        return self.add(
+            "order", values.get("created_at"), values.get("payment_status"), values.get("total_amount"),
+            plan_id=values.get("plan_id"), billing_cycle=values.get("billing_cycle"), sign=sign,
+        )
+
+    def invoice(self, values: Dict[str, Any], sign: int = 1) -> "RevenueDelta":
+        """`values`: an invoice's INVOICE_FIELDS (row dict or attribute snapshot)."""
+        when = values.get("payment_date") or values.get("invoice_date") or values.get("created_at")
+        return self.add("invoice", when, values.get("payment_status"), values.get("total_amount"), sign=sign)
+
+    def __bool__(self) -> bool:
+        return any(count or amount for count, amount in self._changes.values())
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """One row per changed bucket, ordered by key so concurrent upserts lock in the same order."""
+        rows = []
+        for key in sorted(self._changes):
+            count, amount = self._changes[key]
+            if not count and not amount:
+                continue
+            period, source, payment_status, period_start, plan_id, billing_cycle = key
+            rows.append({
+                "period": period, "source": source, "payment_status": payment_status,
+                "period_start": period_start, "plan_id": plan_id, "billing_cycle": billing_cycle,
+                "count": count, "amount": amount,
+            })
+        return rows
+
+
+def _upsert(delta: RevenueDelta):
+    stmt = pg_insert(RevenueRollup).values(delta.rows())
+    table = RevenueRollup.__table__.c
+    return stmt.on_conflict_do_update(
+        constraint="uq_revenue_rollup_bucket",
+        set_={
+            "count": table["count"] + stmt.excluded["count"],
+            "amount": table["amount"] + stmt.excluded["amount"],
+            "updated_at": func.now(),
+        },
+    )
+
+
+# Order / Invoice columns bucketed by `rebuild`, matching RevenueDelta.order / .invoice
+def _source_query(source: str, period: str, start: date, end: date):
+    # Constants are inlined: Postgres matches GROUP BY expressions by their text
+    if source == "order":
+        when = Order.created_at
+        status = Order.payment_status
+        plan_columns = [Order.plan_id, func.lower(Order.billing_cycle)]
+        grouped = plan_columns
+        amount = Order.total_amount
+    else:
+        when = func.coalesce(Invoice.payment_date, Invoice.invoice_date, Invoice.created_at)
+        status = Invoice.payment_status
+        plan_columns = [literal_column("0"), literal_column("''")]
+        grouped = []
+        amount = Invoice.total_amount
+
+    bucket = func.date_trunc(literal_column(f"'{period}'"), func.timezone(literal_column("'UTC'"), when)).cast(Date)
+    lower = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+    upper = datetime(end.year, end.month, end.day, tzinfo=timezone.utc)
+    return (
+        select(
+            literal_column(f"'{period}'"), literal_column(f"'{source}'"), status, bucket, *plan_columns,
+            func.count(), func.coalesce(func.sum(amount), 0),
+        )
+        .where(when >= lower, when < upper)
+        .group_by(bucket, status, *grouped)
+    )
+
+
+class RevenueRollupService:
+    """Applies `RevenueDelta`s, rebuilds months and serves revenue reads from `revenue_rollups`."""
+
+    async def apply(self, db: AsyncSession, delta: RevenueDelta) -> None:
+        """Upsert every bucket in the delta with one statement (does not commit)."""
+        if delta:
+            await db.execute(_upsert(delta))
+
+    # ------------------------------------------------------------------
+    # Rebuild / backfill
+    # ------------------------------------------------------------------
+    async def rebuild(self, db: AsyncSession, start: date, end: date) -> int:
+        """
+        Recompute every bucket of the months covering [start, end) from
+        orders and invoices (does not commit); returns the rows written.
+        """
+        start = month_start(start)
+        end = add_months(month_start(end), 1) if end.day != 1 else end
+
+        # One rebuild at a time; concurrent deltas wait on the deleted rows
+        await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('revenue_rollups'))"))
+        await db.execute(
+            delete(RevenueRollup).where(RevenueRollup.period_start >= start, RevenueRollup.period_start < end)
+        )
+        columns = ["period", "source", "payment_status", "period_start", "plan_id", "billing_cycle", "count", "amount"]
+        written = 0
+        for period in PERIODS:
+            for source in SOURCES:
+                result = await db.execute(
+                    insert(RevenueRollup).from_select(columns, _source_query(source, period, start, end))
+                )
+                written += result.rowcount or 0
+        return written
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+    async def total(
+        self,
+        db: AsyncSession,
+        source: str = "order",
+        payment_status: str = "paid",
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+    ) -> Decimal:
+        """Amount over the months in [start, end) (all time without bounds)."""
+        stmt = select(func.coalesce(func.sum(RevenueRollup.amount), 0)).where(
+            RevenueRollup.period == "month",
+            RevenueRollup.source == source,
+            RevenueRollup.payment_status == payment_status,
+        )
+        if start is not None:
+            stmt = stmt.where(RevenueRollup.period_start >= month_start(start))
+        if end is not None:
+            stmt = stmt.where(RevenueRollup.period_start < end)
+        return Decimal((await db.execute(stmt)).scalar() or 0)
+
+    async def month_total(self, db: AsyncSession, source: str = "order", payment_status: str = "paid") -> Decimal:
+        """Amount for the current (UTC) month."""
+        this_month = month_start(utc_day(None))
+        return await self.total(db, source, payment_status, this_month, add_months(this_month, 1))
+
+    async def series(
+        self,
+        db: AsyncSession,
+        period: str = "month",
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        source: str = "order",
+        payment_status: Optional[str] = "paid",
+        by: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Buckets in [start, end), optionally split by plan_type, billing_cycle
+        or payment_status: [{"period_start", "key", "count", "amount"}, ...].
+        """
+        keys = {
+            "plan_type": func.coalesce(HostingPlan.plan_type, "other"),
+            "billing_cycle": RevenueRollup.billing_cycle,
+            "payment_status": RevenueRollup.payment_status,
+        }
+        grouped = [RevenueRollup.period_start] + ([keys[by]] if by else [])
+        stmt = (
+            select(
+                RevenueRollup.period_start,
+                (keys[by] if by else literal_column("NULL")).label("key"),
+                func.sum(RevenueRollup.count).label("count"),
+                func.sum(RevenueRollup.amount).label("amount"),
+            )
+            .where(RevenueRollup.period == period, RevenueRollup.source == source)
+            .group_by(*grouped)
+            .order_by(*grouped)
+        )
+        if by == "plan_type":
+            stmt = stmt.outerjoin(HostingPlan, HostingPlan.id == RevenueRollup.plan_id)
+        if payment_status is not None:
+            stmt = stmt.where(RevenueRollup.payment_status == payment_status)
+        if start is not None:
+            stmt = stmt.where(RevenueRollup.period_start >= start)
+        if end is not None:
+            stmt = stmt.where(RevenueRollup.period_start < end)
+
+        return [
+            {"period_start": row.period_start, "key": row.key, "count": int(row.count or 0), "amount": row.amount or Decimal("0")}
+            for row in (await db.execute(stmt)).all()
+        ]
+
+
+async def rebuild_recent_revenue_rollups(months: int = 2) -> int:
+    """Rebuild the current and previous month(s) in a fresh session (job worker)."""
+    this_month = month_start(utc_day(None))
+    async with AsyncSessionLocal() as db:
+        written = await RevenueRollupService().rebuild(db, add_months(this_month, 1 - months), add_months(this_month, 1))
+        await db.commit()
+        return written
+
+
+# ==================== ORM hook ====================
+
+def _snapshot(obj, fields) -> Dict[str, Any]:
+    return {name: getattr(obj, name) for name in fields}
+
+
+def _pending_snapshot(obj, fields) -> Dict[str, Any]:
+    """Values a pending row will be inserted with.
+
+    Column defaults are only applied by the INSERT itself, so an attribute
+    that was never set takes its column's Python-side default here (e.g. an
+    order created without payment_status is bucketed as 'pending').
+    Server defaults (created_at) stay None and count as today.
+    """
+    values = _snapshot(obj, fields)
+    columns = obj.__table__.c
+    for name in fields:
+        default = columns[name].default
+        if name in obj.__dict__ or default is None:
+            continue
+        if default.is_scalar:
+            values[name] = default.arg
+        elif default.is_callable:
+            values[name] = default.arg(None)
+    return values
+
+
+def _changed(obj, fields) -> bool:
+    attrs = inspect(obj).attrs
+    return any(attrs[name].history.has_changes() for name in fields)
+
+
+def _stored_values(session, model, fields, ids) -> Dict[int, Dict[str, Any]]:
+    """Pre-flush values of changed rows, read back from the database.
+
+    Attribute history cannot tell a NULL that was loaded from a column that
+    was never loaded (e.g. on a freshly inserted row), so the old bucket is
+    taken from the row itself: one primary-key query per model and flush.
+    """
+    if not ids:
+        return {}
+    columns = [getattr(model, name) for name in fields]
+    rows = session.connection().execute(select(model.id, *columns).where(model.id.in_(ids))).all()
+    return {row[0]: dict(zip(fields, row[1:])) for row in rows}
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_revenue_changes(session, flush_context, instances):
+    delta = RevenueDelta()
+    for obj in session.new:
+        if isinstance(obj, Order):
+            delta.order(_pending_snapshot(obj, ORDER_FIELDS))
+        elif isinstance(obj, Invoice):
+            delta.invoice(_pending_snapshot(obj, INVOICE_FIELDS))
+
+    for model, fields, add in ((Order, ORDER_FIELDS, delta.order), (Invoice, INVOICE_FIELDS, delta.invoice)):
+        deleted = [obj for obj in session.deleted if isinstance(obj, model)]
+        updated = [
+            obj for obj in session.dirty
+            if isinstance(obj, model) and obj not in session.deleted and _changed(obj, fields)
+        ]
+        stored = _stored_values(session, model, fields, [obj.id for obj in deleted + updated])
+        for obj in deleted + updated:
+            if obj.id in stored:
+                add(stored[obj.id], sign=-1)
+        for obj in updated:
+            add(_snapshot(obj, fields))
+
+    if delta:
+        session.connection().execute(_upsert(delta))
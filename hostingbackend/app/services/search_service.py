@@ -0,0 +1,182 @@
+"""
+Trigram search over users, countries, orders, invoices and tickets.
+
+Every searchable column has a pg_trgm index (see the model
+`__table_args__`) serving:
+
+    col ILIKE '%term%'   substring match (terms of SEARCH_MIN_LENGTH+ chars)
+    col % 'term'         fuzzy match, similarity above pg_trgm.similarity_threshold
+    ORDER BY col <-> 'term'   nearest by trigram distance (GiST only)
+
+Ranking (exact match, then prefix, then `similarity(col, term)`) cannot
+be read from an index, and a common term ("gmail") matches most of the
+table, so rows are ranked only among a bounded candidate set: per column
+at most SEARCH_CANDIDATES substring matches plus, for text columns, the
+SEARCH_CANDIDATES nearest fuzzy matches from a KNN scan of the
+`gist_trgm_ops` index, which stops once it has them. Numbers (order /
+invoice / ticket) keep GIN indexes and only take substring matches plus
+an exact btree lookup: a fuzzy match on "ORD-2026-000123" returns every
+other order of 2026.
+
+On databases without pg_trgm (SQLite in local development) the fuzzy
+candidates and similarity are left out.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import Float, case, func, or_, select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.countries import Country
+from app.models.invoice import Invoice
+from app.models.order import Order
+from app.models.support import SupportTicket
+from app.models.users import UserProfile
+
+
+SEARCH_MIN_LENGTH = 3  # Shorter terms have no trigram to look up
+SEARCH_CANDIDATES = 100  # Rows per candidate source; bounds the rows ranked per search
+SEARCH_TYPES = ("users", "orders", "invoices", "tickets")
+
+
+def escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def contains(column, term: str):
+    """`column ILIKE '%term%'` with LIKE wildcards in the term escaped."""
+    return column.ilike(f"%{escape_like(term)}%", escape="\\")
+
+
+def has_trigrams(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def text_match(columns: Sequence, term: str, fuzzy: bool = False):
+    """Substring (and with `fuzzy`, pg_trgm similarity) match on any of `columns`."""
+    clauses = [contains(column, term) for column in columns]
+    if fuzzy:
+        clauses += [column.op("%")(term) for column in columns]
+    return or_(*clauses)
+
+
+def candidates(
+    model,
+    term: str,
+    columns: Sequence,
+    fuzzy: Sequence = (),
+    exact: Sequence = (),
+    exact_term: Optional[str] = None,
+):
+    """
+    Ids of the rows worth ranking, each source capped at SEARCH_CANDIDATES.
+
+    Substring matches on `columns` (index scan, unordered), the nearest
+    trigram matches on `fuzzy` (GiST KNN: `%` filter, `<->` order) and
+    `exact` columns equal to `exact_term` (default: the term).
+    """
+    sources = [select(model.id).where(contains(column, term)).limit(SEARCH_CANDIDATES) for column in columns]
+    sources += [
+        select(model.id)
+        .where(column.op("%")(term))
+        .order_by(column.op("<->", return_type=Float)(term))
+        .limit(SEARCH_CANDIDATES)
+        for column in fuzzy
+    ]
+    sources += [select(model.id).where(column == (exact_term or term)) for column in exact]
+    # LIMIT / ORDER BY inside a UNION need their own subquery
+    return union(*[select(source.subquery().c.id) for source in sources])
+
+
+def rank(columns: Sequence, term: str, similarity: bool = True):
+    """Order-by clauses: exact match, then prefix match, then (pg_trgm) best similarity."""
+    exact = case(*[(func.lower(column) == term.lower(), 1) for column in columns], else_=0)
+    prefix = case(*[(column.ilike(f"{escape_like(term)}%", escape="\\"), 1) for column in columns], else_=0)
+    clauses = [exact.desc(), prefix.desc()]
+    if similarity:
+        clauses.append(func.greatest(*[func.similarity(column, term) for column in columns]).desc())
+    return clauses
+
+
+class SearchService:
+    async def search_users(self, db: AsyncSession, term: str, limit: int = 10) -> List[UserProfile]:
+        columns = (UserProfile.email, UserProfile.full_name)
+        trigrams = has_trigrams(db)
+        stmt = (
+            select(UserProfile)
+            .where(UserProfile.id.in_(candidates(
+                UserProfile, term, columns, fuzzy=columns if trigrams else (), exact=(UserProfile.email,),
+            )))
+            .order_by(*rank(columns, term, trigrams), UserProfile.id)
+            .limit(limit)
+        )
+        return (await db.execute(stmt)).scalars().all()
+
+    async def search_countries(self, db: AsyncSession, term: str, active_only: bool = True, limit: int = 20) -> List[Country]:
+        # ISO codes are 2-3 characters: compared exactly, never by trigrams
+        code = term.upper()
+        trigrams = has_trigrams(db)
+        matches = candidates(
+            Country, term, (Country.name,), fuzzy=(Country.name,) if trigrams else (),
+            exact=(Country.code, Country.alpha3_code), exact_term=code,
+        )
+        stmt = (
+            select(Country)
+            .where(Country.id.in_(matches))
+            .order_by(case((or_(Country.code == code, Country.alpha3_code == code), 1), else_=0).desc(),
+                      *rank((Country.name,), term, trigrams), Country.name)
+            .limit(limit)
+        )
+        if active_only:
+            stmt = stmt.where(Country.is_active.is_(True))
+        return (await db.execute(stmt)).scalars().all()
+
+    async def search_orders(self, db: AsyncSession, term: str, limit: int = 10) -> List[Order]:
+        stmt = (
+            select(Order)
+            .where(Order.id.in_(candidates(Order, term, (Order.order_number,), exact=(Order.order_number,))))
+            .order_by(*rank((Order.order_number,), term, similarity=False), Order.id.desc())
+            .limit(limit)
+        )
+        return (await db.execute(stmt)).scalars().all()
+
+    async def search_invoices(self, db: AsyncSession, term: str, limit: int = 10) -> List[Invoice]:
+        stmt = (
+            select(Invoice)
+            .where(Invoice.id.in_(candidates(Invoice, term, (Invoice.invoice_number,), exact=(Invoice.invoice_number,))))
+            .order_by(*rank((Invoice.invoice_number,), term, similarity=False), Invoice.id.desc())
+            .limit(limit)
+        )
+        return (await db.execute(stmt)).scalars().all()
+
+    async def search_tickets(self, db: AsyncSession, term: str, limit: int = 10) -> List[SupportTicket]:
+        trigrams = has_trigrams(db)
+        columns = (SupportTicket.ticket_number, SupportTicket.subject)
+        # Only the subject is fuzzy-matched (see the module docstring)
+        matches = candidates(
+            SupportTicket, term, columns,
+            fuzzy=(SupportTicket.subject,) if trigrams else (), exact=(SupportTicket.ticket_number,),
+        )
+        stmt = (
+            select(SupportTicket)
+            .where(SupportTicket.id.in_(matches))
+            .order_by(*rank(columns, term, trigrams), SupportTicket.id.desc())
+            .limit(limit)
+        )
+        return (await db.execute(stmt)).scalars().all()
+
+    async def search(
+        self,
+        db: AsyncSession,
+        term: str,
+        types: Optional[Sequence[str]] = None,
+        limit: int = 10,
+    ) -> Dict[str, List[Any]]:
+        """Top `limit` matches per entity type (all of SEARCH_TYPES by default)."""
+        searches = {
+            "users": self.search_users,
+            "orders": self.search_orders,
+            "invoices": self.search_invoices,
+            "tickets": self.search_tickets,
+        }
+        return {kind: await searches[kind](db, term, limit) for kind in (types or SEARCH_TYPES)}
@@ -0,0 +1,271 @@
+"""
+Server lifecycle: renewal invoices, renewals, suspension and termination.
+
+`run_server_lifecycle()` is called periodically by the lifecycle scheduler
+(app.workers.lifecycle_scheduler) on one leader at a time. Each pass works
+through servers in batches of SERVER_LIFECYCLE_BATCH_SIZE, every batch one
+set-based statement (or a few) in its own short transaction:
+
+    renew      servers whose renewal invoice is paid: expiry extended by one
+               billing cycle, link cleared, suspended servers reactivated
+    invoice    active servers expiring within SERVER_RENEWAL_LEAD_DAYS whose
+               owner has auto-renewal on (no BillingSettings row = on) and no
+               open renewal invoice: one multi-row INSERT of invoices, linked
+               back through servers.renewal_invoice_id
+    suspend    active servers expired more than SERVER_SUSPEND_GRACE_DAYS ago;
+               suspended_at is stamped
+    terminate  servers suspended (suspended_at) more than SERVER_TERMINATE_AFTER_DAYS
+               ago; a server is never suspended and terminated in the same pass,
+               and one without suspended_at (suspended by hand) is left alone
+
+Batches lock their rows with FOR UPDATE SKIP LOCKED and every predicate
+excludes rows already handled, so a pass that overlaps another one (e.g.
+during a leader hand-over) never invoices or renews a server twice.
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import Integer, any_, bindparam, case, func, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.billing import BillingSettings
+from app.models.invoice import Invoice
+from app.models.server import Server
+from app.services.number_allocator import number_allocator
+from app.services.order_service import MAX_BIND_PARAMS
+from app.services.post_payment_pipeline import CYCLE_DAYS
+from app.services.revenue_rollup_service import RevenueDelta, RevenueRollupService
+
+
+GST_RATE = Decimal("18.00")
+
+
+def cycle_days(billing_cycle: Optional[str]) -> int:
+    return CYCLE_DAYS.get((billing_cycle or "monthly").lower(), 30)
+
+
+def cycle_interval(cycles: int = 1):
+    """SQL interval of `cycles` billing cycles of each server row."""
+    days = case(CYCLE_DAYS, value=func.lower(func.coalesce(Server.billing_cycle, "monthly")), else_=30)
+    return func.make_interval(0, 0, 0, days * cycles)
+
+
+@dataclass
+class LifecycleReport:
+    renewed: int = 0
+    invoiced: int = 0
+    suspended: int = 0
+    terminated: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> int:
+        return self.renewed + self.invoiced + self.suspended + self.terminated
+
+
+class ServerLifecycleService:
+    """One batch of each lifecycle transition per call (no commit)."""
+
+    def __init__(self, batch_size: Optional[int] = None):
+        batch_size = batch_size or settings.SERVER_LIFECYCLE_BATCH_SIZE
+        # A batch of renewal invoices is inserted with one statement
+        self.batch_size = max(1, min(batch_size, MAX_BIND_PARAMS // len(Invoice.__table__.columns)))
+
+    async def extend_expiry(self, db: AsyncSession, server_ids: Sequence[int], cycles: int = 1) -> List[int]:
+        """Extend expiry by `cycles` billing cycles of each server; returns the ids updated."""
+        if not server_ids:
+            return []
+        result = await db.execute(
+            update(Server)
+            .where(Server.id == any_(bindparam("server_ids", list(server_ids), type_=ARRAY(Integer))))
+            .values(
+                expiry_date=func.coalesce(Server.expiry_date, func.now()) + cycle_interval(cycles),
+            )
+            .returning(Server.id)
+            .execution_options(synchronize_session=False)
+        )
+        return list(result.scalars().all())
+
+    async def apply_paid_renewals(self, db: AsyncSession) -> int:
+        """Renew servers whose renewal invoice has been paid."""
+        paid = (
+            select(Server.id)
+            .join(Invoice, Invoice.id == Server.renewal_invoice_id)
+            .where(
+                Invoice.payment_status == "paid",
+                Server.server_status.in_(("active", "suspended")),
+            )
+            .limit(self.batch_size)
+            .with_for_update(of=Server, skip_locked=True)
+        )
+        # A server renewed after its expiry starts the new cycle today
+        result = await db.execute(
+            update(Server)
+            .where(Server.id.in_(paid.scalar_subquery()))
+            .values(
+                expiry_date=func.greatest(Server.expiry_date, func.now()) + cycle_interval(),
+                renewal_invoice_id=None,
+                server_status="active",
+                suspended_at=None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount or 0
+
+    async def create_renewal_invoices(self, db: AsyncSession, now: datetime) -> int:
+        """Invoice the next batch of auto-renewing servers that expire soon."""
+        horizon = now + timedelta(days=settings.SERVER_RENEWAL_LEAD_DAYS)
+        due = (await db.execute(
+            select(
+                Server.id, Server.user_id, Server.order_id, Server.server_name, Server.hostname,
+                Server.plan_name, Server.monthly_cost, Server.billing_cycle, Server.expiry_date,
+            )
+            .outerjoin(BillingSettings, BillingSettings.user_id == Server.user_id)
+            .where(
+                Server.server_status == "active",
+                Server.expiry_date <= horizon,
+                Server.renewal_invoice_id.is_(None),
+                or_(BillingSettings.auto_renewal.is_(None), BillingSettings.auto_renewal.is_(True)),
+            )
+            .order_by(Server.expiry_date, Server.id)
+            .limit(self.batch_size)
+            .with_for_update(of=Server, skip_locked=True)
+        )).all()
+        if not due:
+            return 0
+
+        numbers = await number_allocator.next_numbers("invoice", len(due))
+        invoice_rows = [self._renewal_invoice(server, number, now) for server, number in zip(due, numbers)]
+        result = await db.execute(
+            insert(Invoice).values(invoice_rows).returning(Invoice.id, Invoice.invoice_number)
+        )
+        invoice_ids = {number: invoice_id for invoice_id, number in result.all()}
+
+        revenue = RevenueDelta()
+        for row in invoice_rows:
+            revenue.invoice(row)
+        await RevenueRollupService().apply(db, revenue)
+
+        links = func.unnest(
+            bindparam("link_server_ids", [server.id for server in due], type_=ARRAY(Integer)),
+            bindparam("link_invoice_ids", [invoice_ids[number] for number in numbers], type_=ARRAY(Integer)),
+        ).table_valued("server_id", "invoice_id").render_derived("links")
+        await db.execute(
+            update(Server)
+            .where(Server.id == links.c.server_id)
+            .values(renewal_invoice_id=links.c.invoice_id)
+            .execution_options(synchronize_session=False)
+        )
+        return len(due)
+
+    async def suspend_expired(self, db: AsyncSession, now: datetime) -> int:
+        """Suspend active servers past expiry and the grace period."""
+        expired_before = now - timedelta(days=settings.SERVER_SUSPEND_GRACE_DAYS)
+        return await self._transition(
+            db, "active", "suspended", Server.expiry_date < expired_before, Server.expiry_date, suspended_at=now,
+        )
+
+    async def terminate_expired(self, db: AsyncSession, now: datetime) -> int:
+        """Terminate servers that stayed suspended past SERVER_TERMINATE_AFTER_DAYS."""
+        suspended_before = now - timedelta(days=settings.SERVER_TERMINATE_AFTER_DAYS)
+        return await self._transition(
+            db, "suspended", "terminated", Server.suspended_at < suspended_before, Server.suspended_at,
+        )
+
+    # ==================== Internals ====================
+
+    async def _transition(self, db: AsyncSession, from_status: str, to_status: str, due, oldest_first, **values) -> int:
+        batch = (
+            select(Server.id)
+            .where(Server.server_status == from_status, due)
+            .order_by(oldest_first)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            update(Server)
+            .where(Server.id.in_(batch.scalar_subquery()))
+            .values(server_status=to_status, **values)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount or 0
+
+    @staticmethod
+    def _renewal_invoice(server, invoice_number: str, now: datetime) -> Dict:
+        months = max(1, cycle_days(server.billing_cycle) // 30)
+        subtotal = (Decimal(server.monthly_cost or 0) * months).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        gst_amount = (subtotal * GST_RATE / Decimal("100.00")).quantize(Decimal("0.01"), ROUND_HALF_UP)
+        total = subtotal + gst_amount
+        cycle = (server.billing_cycle or "monthly").title()
+        return {
+            "user_id": server.user_id,
+            "order_id": server.order_id,
+            "invoice_number": invoice_number,
+            "invoice_date": now,
+            "due_date": server.expiry_date,
+            "subtotal": subtotal,
+            "tax_amount": gst_amount,
+            "total_amount": total,
+            "amount_paid": Decimal("0.00"),
+            "balance_due": total,
+            "status": "unpaid",
+            "payment_status": "pending",
+            "currency": "INR",
+            "tax_rate": GST_RATE,
+            "late_fee": Decimal("0.00"),
+            "days_overdue": 0,
+            "items": [{
+                "description": f"{server.plan_name or server.server_name} - {cycle} Renewal ({server.hostname})",
+                "quantity": 1,
+                "unit_price": float(subtotal),
+                "amount": float(total),
+                "gst_percent": float(GST_RATE),
+                "gst_amount": float(gst_amount),
+                "total_amount": float(total),
+            }],
+            "notes": f"Renewal of server #{server.id} ({server.server_name})",
+            "created_at": now,
+            "updated_at": now,
+        }
+
+
+async def run_server_lifecycle(batch_size: Optional[int] = None) -> LifecycleReport:
+    """One full lifecycle pass; every batch commits in its own session."""
+    service = ServerLifecycleService(batch_size)
+    report = LifecycleReport()
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+
+    passes = (
+        ("renewed", service.apply_paid_renewals),
+        ("invoiced", lambda db: service.create_renewal_invoices(db, now)),
+        ("suspended", lambda db: service.suspend_expired(db, now)),
+        ("terminated", lambda db: service.terminate_expired(db, now)),
+    )
+    for name, run_batch in passes:
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    count = await run_batch(db)
+                    await db.commit()
+            except Exception as e:
+                report.errors.append(f"{name}: {e}")
+                print(f"❌ Server lifecycle {name} batch failed: {e}")
+                break
+            report.batches += 1
+            setattr(report, name, getattr(report, name) + count)
+            # A short batch means nothing else is due (or the rest is locked elsewhere)
+            if count < service.batch_size:
+                break
+
+    report.seconds = time.perf_counter() - started
+    return report
@@ -14,6 +14,7 @@ from app.models.server import Server
 from app.models.plan import HostingPlan
 from app.models.order import Order
 from app.schemas.server import ServerCreate, ServerUpdate, ServerStats
+from app.services.catalog_cache import catalog_cache
 
 
 class ServerService:
@@ -469,36 +470,28 @@ class ServerService:
         ]
 
     async def get_server_stats(self, db: AsyncSession) -> ServerStats:
-        total_servers = (
-            await db.execute(select(func.count(Server.id)))
-        ).scalar() or 0
-
-        active_servers = await self.get_active_servers_count(db)
-
-        stopped_servers = (
-            await db.execute(
-                select(func.count(Server.id)).where(Server.server_status == "stopped")
+        row = (await db.execute(
+            select(
+                func.count(Server.id).label("total_servers"),
+                func.count(Server.id).filter(Server.server_status == "active").label("active_servers"),
+                func.count(Server.id).filter(Server.server_status == "stopped").label("stopped_servers"),
+                func.count(Server.id).filter(Server.server_status == "provisioning").label("provisioning_servers"),
+                func.avg(Server.monthly_cost).label("avg_cost"),
             )
-        ).scalar() or 0
+        )).one()
 
-        provisioning_servers = (
-            await db.execute(
-                select(func.count(Server.id)).where(Server.server_status == "provisioning")
-            )
-        ).scalar() or 0
+        active_servers = row.active_servers or 0
 
         # Calculate total bandwidth (mocked)
         total_bandwidth_used = Decimal(active_servers) * Decimal("2.4")
 
-        avg_cost_result = await db.execute(select(func.avg(Server.monthly_cost)))
-        avg_cost = avg_cost_result.scalar()
-        average_monthly_cost = Decimal(avg_cost) if avg_cost else Decimal("0.0")
+        average_monthly_cost = Decimal(row.avg_cost) if row.avg_cost else Decimal("0.0")
 
         return ServerStats(
-            total_servers=total_servers,
+            total_servers=row.total_servers or 0,
             active_servers=active_servers,
-            stopped_servers=stopped_servers,
-            provisioning_servers=provisioning_servers,
+            stopped_servers=row.stopped_servers or 0,
+            provisioning_servers=row.provisioning_servers or 0,
             total_bandwidth_used=total_bandwidth_used,
             average_monthly_cost=average_monthly_cost,
         )
@@ -517,18 +510,17 @@ class ServerService:
         )
         return result.scalars().all()
 
-    async def renew_server(self, db: AsyncSession, server_id: int, months: int = 1) -> bool:
-        """Renew server subscription."""
-        server = await self.get_server_by_id(db, server_id)
-        if not server:
-            return False
+    async def renew_server(self, db: AsyncSession, server_id: int, cycles: int = 1) -> bool:
+        """Renew server subscription by `cycles` of its own billing cycle."""
+        return bool(await self.renew_servers(db, [server_id], cycles))
 
-        # Extend expiry date
-        current_expiry = server.expiry_date or datetime.now()
-        server.expiry_date = current_expiry + timedelta(days=30 * months)
-        
+    async def renew_servers(self, db: AsyncSession, server_ids: List[int], cycles: int = 1) -> List[int]:
+        """Renew many servers with one UPDATE; returns the ids renewed."""
+        from app.services.server_lifecycle_service import ServerLifecycleService
+
+        renewed = await ServerLifecycleService().extend_expiry(db, server_ids, cycles)
         await db.commit()
-        return True
+        return renewed
 
     async def get_user_server_stats(self, db: AsyncSession, user_id: int) -> Dict[str, Any]:
         """Get comprehensive stats for a user's servers."""
@@ -552,99 +544,29 @@ class ServerService:
         }
 
     async def get_addons_from_ids(self, db: AsyncSession, addon_ids: List[int]) -> List[Dict[str, Any]]:
-        """Fetch addon details from addon IDs"""
-        from app.models.addon import Addon
-        
+        """Fetch addon details from addon IDs (served from the catalog cache)"""
         if not addon_ids:
-            print("⚠️ No addon IDs provided to get_addons_from_ids")
-            return []
-        
-        print(f"🔍 [get_addons_from_ids] Querying for addon IDs: {addon_ids}")
-        print(f"🔍 [get_addons_from_ids] Type of addon_ids: {type(addon_ids)}, Elements: {[type(x) for x in addon_ids]}")
-        
-        try:
-            # First, check if ANY addons exist in the database
-            count_result = await db.execute(select(func.count(Addon.id)))
-            total_addons = count_result.scalar()
-            print(f"📊 Total addons in database: {total_addons}")
-            
-            # Get all addon IDs to see what's available
-            all_ids_result = await db.execute(select(Addon.id))
-            all_ids = [row[0] for row in all_ids_result.fetchall()]
-            print(f"📊 Available addon IDs: {all_ids}")
-            
-            # Now execute the actual query
-            result = await db.execute(
-                select(Addon).where(Addon.id.in_(addon_ids))
-            )
-            addons = result.scalars().all()
-            
-            print(f"📦 [get_addons_from_ids] Database returned {len(addons)} addons for IDs {addon_ids}")
-            
-            if len(addons) != len(addon_ids):
-                missing_ids = set(addon_ids) - {addon.id for addon in addons}
-                print(f"⚠️ Warning: Missing addons with IDs: {missing_ids}")
-            
-            # Convert to dict format
-            addon_list = []
-            for addon in addons:
-                addon_dict = addon.to_dict()
-                print(f"  ✓ Addon found: {addon_dict['name']} (ID: {addon_dict['id']}, Price: {addon_dict['price']})")
-                addon_list.append(addon_dict)
-            
-            print(f"📦 [get_addons_from_ids] Returning {len(addon_list)} addon dictionaries")
-            return addon_list
-        except Exception as e:
-            print(f"❌ Error in get_addons_from_ids: {e}")
-            import traceback
-            traceback.print_exc()
             return []
 
+        catalog = await catalog_cache.get()
+        addons = [catalog.addons[i] for i in dict.fromkeys(addon_ids) if i in catalog.addons]
+
+        if len(addons) != len(set(addon_ids)):
+            missing_ids = set(addon_ids) - {addon.id for addon in addons}
+            print(f"⚠️ Warning: Missing addons with IDs: {missing_ids}")
+
+        return [addon.to_dict() for addon in addons]
+
     async def get_services_from_ids(self, db: AsyncSession, service_ids: List[int]) -> List[Dict[str, Any]]:
-        """Fetch service details from service IDs"""
-        from app.models.service import Service
-        
+        """Fetch service details from service IDs (served from the catalog cache)"""
         if not service_ids:
-            print("⚠️ No service IDs provided to get_services_from_ids")
             return []
-        
-        print(f"🔍 [get_services_from_ids] Querying for service IDs: {service_ids}")
-        print(f"🔍 [get_services_from_ids] Type of service_ids: {type(service_ids)}, Elements: {[type(x) for x in service_ids]}")
-        
-        try:
-            # First, check if ANY services exist in the database
-            count_result = await db.execute(select(func.count(Service.id)))
-            total_services = count_result.scalar()
-            print(f"📊 Total services in database: {total_services}")
-            
-            # Get all service IDs to see what's available
-            all_ids_result = await db.execute(select(Service.id))
-            all_ids = [row[0] for row in all_ids_result.fetchall()]
-            print(f"📊 Available service IDs: {all_ids}")
-            
-            # Now execute the actual query
-            result = await db.execute(
-                select(Service).where(Service.id.in_(service_ids))
-            )
-            services = result.scalars().all()
-            
-            print(f"🔧 [get_services_from_ids] Database returned {len(services)} services for IDs {service_ids}")
-            
-            if len(services) != len(service_ids):
-                missing_ids = set(service_ids) - {service.id for service in services}
-                print(f"⚠️ Warning: Missing services with IDs: {missing_ids}")
-            
-            # Convert to dict format
-            service_list = []
-            for service in services:
-                service_dict = service.to_dict()
-                print(f"  ✓ Service found: {service_dict['name']} (ID: {service_dict['id']}, Price: {service_dict['price']})")
-                service_list.append(service_dict)
-            
-            print(f"🔧 [get_services_from_ids] Returning {len(service_list)} service dictionaries")
-            return service_list
-        except Exception as e:
-            print(f"❌ Error in get_services_from_ids: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
\ No newline at end of file
+
+        catalog = await catalog_cache.get()
+        services = [catalog.services[i] for i in dict.fromkeys(service_ids) if i in catalog.services]
+
+        if len(services) != len(set(service_ids)):
+            missing_ids = set(service_ids) - {service.id for service in services}
+            print(f"⚠️ Warning: Missing services with IDs: {missing_ids}")
+
+        return [service.to_dict() for service in services]
\ No newline at end of file
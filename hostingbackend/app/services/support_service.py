@@ -8,6 +8,7 @@ import string
 from app.models.support import SupportTicket
 from app.models.users import UserProfile
 from app.schemas.support import SupportTicketCreate, SupportTicketUpdate, SupportStats
+from app.services.number_allocator import number_allocator
 
 class SupportService:
     async def get_user_tickets(self, db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, 
@@ -175,57 +176,28 @@ class SupportService:
         return result.scalar()
     
     async def get_support_stats(self, db: AsyncSession) -> SupportStats:
-        total_tickets_result = await db.execute(select(func.count(SupportTicket.id)))
-        total_tickets = total_tickets_result.scalar()
-        
-        open_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'open')
-        )
-        open_tickets = open_tickets_result.scalar()
-        
-        in_progress_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'in_progress')
-        )
-        in_progress_tickets = in_progress_tickets_result.scalar()
-        
-        resolved_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'resolved')
-        )
-        resolved_tickets = resolved_tickets_result.scalar()
-        
-        closed_tickets_result = await db.execute(
-            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'closed')
-        )
-        closed_tickets = closed_tickets_result.scalar()
-        
+        row = (await db.execute(
+            select(
+                func.count(SupportTicket.id).label("total_tickets"),
+                func.count(SupportTicket.id).filter(SupportTicket.status == 'open').label("open_tickets"),
+                func.count(SupportTicket.id).filter(SupportTicket.status == 'in_progress').label("in_progress_tickets"),
+                func.count(SupportTicket.id).filter(SupportTicket.status == 'resolved').label("resolved_tickets"),
+                func.count(SupportTicket.id).filter(SupportTicket.status == 'closed').label("closed_tickets"),
+            )
+        )).one()
+
         # Calculate average response time (mock data)
         average_response_time = 2.5  # hours
-        
+
         return SupportStats(
-            total_tickets=total_tickets,
-            open_tickets=open_tickets,
-            in_progress_tickets=in_progress_tickets,
-            resolved_tickets=resolved_tickets,
-            closed_tickets=closed_tickets,
+            total_tickets=row.total_tickets or 0,
+            open_tickets=row.open_tickets or 0,
+            in_progress_tickets=row.in_progress_tickets or 0,
+            resolved_tickets=row.resolved_tickets or 0,
+            closed_tickets=row.closed_tickets or 0,
             average_response_time=average_response_time
         )
     
     async def _generate_ticket_number(self, db: AsyncSession) -> str:
-        """Generate a unique ticket number"""
-        year = datetime.now().year
-        base_number = f"TICK-{year}-"
-        
-        result = await db.execute(
-            select(SupportTicket.ticket_number).where(
-                SupportTicket.ticket_number.like(f"{base_number}%")
-            ).order_by(SupportTicket.ticket_number.desc()).limit(1)
-        )
-        last_ticket = result.scalar_one_or_none()
-        
-        if last_ticket:
-            last_number = int(last_ticket.split('-')[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-        
-        return f"{base_number}{new_number:03d}"
\ No newline at end of file
+        """Generate a unique ticket number (TICK-YYYY-NNNN, sequence-backed)"""
+        return await number_allocator.next_number("ticket")
\ No newline at end of file
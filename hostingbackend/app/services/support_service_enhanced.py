@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func, select, and_, or_
+from sqlalchemy.orm import aliased
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import secrets
@@ -10,156 +11,144 @@ from app.models.ticket_message import TicketMessage
 from app.models.users import UserProfile
 from app.schemas.support import SupportTicketCreate, SupportTicketUpdate, SupportStats
 from app.schemas.ticket_message import TicketMessageCreate
+from app.services.number_allocator import number_allocator
+from app.utils.pagination import keyset_page
 
 class SupportService:
     """Enhanced support service with ticket assignment and messaging"""
     
+    @staticmethod
+    def _ticket_page_query(
+        filters: List[Any],
+        cursor: Optional[str],
+        skip: int,
+        limit: int,
+        public_messages_only: bool,
+        with_people: bool,
+    ):
+        """
+        One statement for a page of tickets with message counts (and owner
+        and assignee for staff views).
+
+        The page of ticket ids is picked first (keyset or offset), then
+        messages are counted for just those tickets in a single GROUP BY.
+        """
+        page = keyset_page(
+            select(SupportTicket.id, SupportTicket.created_at).where(*filters),
+            SupportTicket.created_at, SupportTicket.id, cursor, limit, skip
+        ).subquery()
+        
+        counts = select(
+            TicketMessage.ticket_id,
+            func.count(TicketMessage.id).label("message_count")
+        ).where(TicketMessage.ticket_id.in_(select(page.c.id)))
+        if public_messages_only:
+            counts = counts.where(TicketMessage.is_internal_note == False)
+        counts = counts.group_by(TicketMessage.ticket_id).subquery()
+        
+        columns = [SupportTicket, func.coalesce(counts.c.message_count, 0).label("message_count")]
+        if with_people:
+            owner = aliased(UserProfile)
+            assignee = aliased(UserProfile)
+            columns += [
+                owner.full_name.label("user_name"),
+                owner.email.label("user_email"),
+                assignee.full_name.label("assigned_to_name"),
+            ]
+        
+        query = (
+            select(*columns)
+            .join(page, page.c.id == SupportTicket.id)
+            .outerjoin(counts, counts.c.ticket_id == SupportTicket.id)
+        )
+        if with_people:
+            query = (
+                query.join(owner, owner.id == SupportTicket.user_id)
+                .outerjoin(assignee, assignee.id == SupportTicket.assigned_to)
+            )
+        return query.order_by(SupportTicket.created_at.desc(), SupportTicket.id.desc())
+    
+    @staticmethod
+    def _ticket_dict(ticket: SupportTicket, message_count: int) -> Dict[str, Any]:
+        return {
+            "id": ticket.id,
+            "user_id": ticket.user_id,
+            "ticket_number": ticket.ticket_number,
+            "subject": ticket.subject,
+            "description": ticket.description,
+            "status": ticket.status,
+            "priority": ticket.priority,
+            "department": ticket.department,
+            "assigned_to": ticket.assigned_to,
+            "created_at": ticket.created_at,
+            "updated_at": ticket.updated_at,
+            "closed_at": ticket.closed_at,
+            "message_count": message_count
+        }
+    
     async def get_user_tickets(self, db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, 
-                              status: Optional[str] = None) -> List[Dict[str, Any]]:
+                              status: Optional[str] = None, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get tickets created by a specific user"""
-        query = select(SupportTicket).where(SupportTicket.user_id == user_id)
-        
+        filters = [SupportTicket.user_id == user_id]
         if status and status != "all":
-            query = query.where(SupportTicket.status == status)
-            
-        query = query.order_by(SupportTicket.created_at.desc()).offset(skip).limit(limit)
-        result = await db.execute(query)
-        tickets = result.scalars().all()
-        
-        # Enrich with message count
-        tickets_list = []
-        for ticket in tickets:
-            msg_count_result = await db.execute(
-                select(func.count(TicketMessage.id)).where(
-                    TicketMessage.ticket_id == ticket.id,
-                    TicketMessage.is_internal_note == False
-                )
-            )
-            message_count = msg_count_result.scalar() or 0
-            
-            ticket_dict = {
-                "id": ticket.id,
-                "user_id": ticket.user_id,
-                "ticket_number": ticket.ticket_number,
-                "subject": ticket.subject,
-                "description": ticket.description,
-                "status": ticket.status,
-                "priority": ticket.priority,
-                "department": ticket.department,
-                "assigned_to": ticket.assigned_to,
-                "created_at": ticket.created_at,
-                "updated_at": ticket.updated_at,
-                "closed_at": ticket.closed_at,
-                "message_count": message_count
-            }
-            tickets_list.append(ticket_dict)
+            filters.append(SupportTicket.status == status)
         
-        return tickets_list
+        # Customers only see the non-internal message count
+        result = await db.execute(self._ticket_page_query(
+            filters, cursor, skip, limit, public_messages_only=True, with_people=False
+        ))
+        return [self._ticket_dict(row.SupportTicket, row.message_count) for row in result.all()]
     
     async def get_all_tickets(self, db: AsyncSession, skip: int = 0, limit: int = 100, 
                              status: Optional[str] = None, priority: Optional[str] = None,
-                             assigned_to: Optional[int] = None, department: Optional[str] = None) -> List[Dict[str, Any]]:
+                             assigned_to: Optional[int] = None, department: Optional[str] = None,
+                             cursor: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get all tickets with filters (Admin/Employee view)"""
-        query = select(SupportTicket, UserProfile).join(
-            UserProfile, SupportTicket.user_id == UserProfile.id
-        )
-        
+        filters = []
         if status and status != "all":
-            query = query.where(SupportTicket.status == status)
-            
+            filters.append(SupportTicket.status == status)
         if priority and priority != "all":
-            query = query.where(SupportTicket.priority == priority)
-        
+            filters.append(SupportTicket.priority == priority)
         if assigned_to:
-            query = query.where(SupportTicket.assigned_to == assigned_to)
-        
+            filters.append(SupportTicket.assigned_to == assigned_to)
         if department and department != "all":
-            query = query.where(SupportTicket.department == department)
-            
-        query = query.order_by(SupportTicket.created_at.desc()).offset(skip).limit(limit)
-        result = await db.execute(query)
-        tickets_with_users = result.all()
+            filters.append(SupportTicket.department == department)
+        
+        result = await db.execute(self._ticket_page_query(
+            filters, cursor, skip, limit, public_messages_only=False, with_people=True
+        ))
         
         tickets_list = []
-        for ticket, user in tickets_with_users:
-            # Get assigned employee info if exists
-            assigned_name = None
-            if ticket.assigned_to:
-                assigned_result = await db.execute(
-                    select(UserProfile).where(UserProfile.id == ticket.assigned_to)
-                )
-                assigned_user = assigned_result.scalar_one_or_none()
-                if assigned_user:
-                    assigned_name = assigned_user.full_name
-            
-            # Get message count
-            msg_count_result = await db.execute(
-                select(func.count(TicketMessage.id)).where(TicketMessage.ticket_id == ticket.id)
-            )
-            message_count = msg_count_result.scalar() or 0
-            
-            ticket_dict = {
-                "id": ticket.id,
-                "user_id": ticket.user_id,
-                "ticket_number": ticket.ticket_number,
-                "subject": ticket.subject,
-                "description": ticket.description,
-                "status": ticket.status,
-                "priority": ticket.priority,
-                "department": ticket.department,
-                "assigned_to": ticket.assigned_to,
-                "assigned_to_name": assigned_name,
-                "created_at": ticket.created_at,
-                "updated_at": ticket.updated_at,
-                "closed_at": ticket.closed_at,
-                "user_name": user.full_name,
-                "user_email": user.email,
-                "message_count": message_count
-            }
+        for row in result.all():
+            ticket_dict = self._ticket_dict(row.SupportTicket, row.message_count)
+            ticket_dict.update({
+                "assigned_to_name": row.assigned_to_name,
+                "user_name": row.user_name,
+                "user_email": row.user_email,
+            })
             tickets_list.append(ticket_dict)
-        
         return tickets_list
     
     async def get_assigned_tickets(self, db: AsyncSession, employee_id: int, skip: int = 0, 
-                                   limit: int = 100, status: Optional[str] = None) -> List[Dict[str, Any]]:
+                                   limit: int = 100, status: Optional[str] = None,
+                                   cursor: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get tickets assigned to a specific employee"""
-        query = select(SupportTicket, UserProfile).join(
-            UserProfile, SupportTicket.user_id == UserProfile.id
-        ).where(SupportTicket.assigned_to == employee_id)
-        
+        filters = [SupportTicket.assigned_to == employee_id]
         if status and status != "all":
-            query = query.where(SupportTicket.status == status)
-            
-        query = query.order_by(SupportTicket.created_at.desc()).offset(skip).limit(limit)
-        result = await db.execute(query)
-        tickets_with_users = result.all()
+            filters.append(SupportTicket.status == status)
+        
+        result = await db.execute(self._ticket_page_query(
+            filters, cursor, skip, limit, public_messages_only=False, with_people=True
+        ))
         
         tickets_list = []
-        for ticket, user in tickets_with_users:
-            msg_count_result = await db.execute(
-                select(func.count(TicketMessage.id)).where(TicketMessage.ticket_id == ticket.id)
-            )
-            message_count = msg_count_result.scalar() or 0
-            
-            ticket_dict = {
-                "id": ticket.id,
-                "user_id": ticket.user_id,
-                "ticket_number": ticket.ticket_number,
-                "subject": ticket.subject,
-                "description": ticket.description,
-                "status": ticket.status,
-                "priority": ticket.priority,
-                "department": ticket.department,
-                "assigned_to": ticket.assigned_to,
-                "created_at": ticket.created_at,
-                "updated_at": ticket.updated_at,
-                "closed_at": ticket.closed_at,
-                "user_name": user.full_name,
-                "user_email": user.email,
-                "message_count": message_count
-            }
+        for row in result.all():
+            ticket_dict = self._ticket_dict(row.SupportTicket, row.message_count)
+            ticket_dict.update({
+                "user_name": row.user_name,
+                "user_email": row.user_email,
+            })
             tickets_list.append(ticket_dict)
-        
         return tickets_list
     
     async def get_ticket_by_id(self, db: AsyncSession, ticket_id: int) -> Optional[SupportTicket]:
@@ -409,8 +398,16 @@ class SupportService:
     
     async def get_support_employees(self, db: AsyncSession) -> List[Dict[str, Any]]:
         """Get list of users who can be assigned to tickets (support staff)"""
+        active_counts = (
+            select(SupportTicket.assigned_to, func.count(SupportTicket.id).label("active_tickets"))
+            .where(SupportTicket.status.in_(['open', 'in_progress']))
+            .group_by(SupportTicket.assigned_to)
+            .subquery()
+        )
         result = await db.execute(
-            select(UserProfile).where(
+            select(UserProfile, func.coalesce(active_counts.c.active_tickets, 0).label("active_tickets"))
+            .outerjoin(active_counts, active_counts.c.assigned_to == UserProfile.id)
+            .where(
                 or_(
                     UserProfile.role == 'admin',
                     UserProfile.role == 'support',
@@ -418,45 +415,20 @@ class SupportService:
                 )
             ).order_by(UserProfile.full_name)
         )
-        employees = result.scalars().all()
-        
-        employees_list = []
-        for emp in employees:
-            # Count assigned tickets
-            assigned_count_result = await db.execute(
-                select(func.count(SupportTicket.id)).where(
-                    SupportTicket.assigned_to == emp.id,
-                    SupportTicket.status.in_(['open', 'in_progress'])
-                )
-            )
-            assigned_count = assigned_count_result.scalar() or 0
-            
-            employees_list.append({
+        
+        employees_list = [
+            {
                 "id": emp.id,
                 "full_name": emp.full_name,
                 "email": emp.email,
                 "role": emp.role,
-                "active_tickets": assigned_count
-            })
+                "active_tickets": active_tickets
+            }
+            for emp, active_tickets in result.all()
+        ]
         
         return employees_list
     
     async def _generate_ticket_number(self, db: AsyncSession) -> str:
-        """Generate a unique ticket number"""
-        year = datetime.now().year
-        base_number = f"TICK-{year}-"
-        
-        result = await db.execute(
-            select(SupportTicket.ticket_number).where(
-                SupportTicket.ticket_number.like(f"{base_number}%")
-            ).order_by(SupportTicket.ticket_number.desc()).limit(1)
-        )
-        last_ticket = result.scalar_one_or_none()
-        
-        if last_ticket:
-            last_number = int(last_ticket.split('-')[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-        
-        return f"{base_number}{new_number:04d}"
+        """Generate a unique ticket number (TICK-YYYY-NNNN, sequence-backed)"""
+        return await number_allocator.next_number("ticket")
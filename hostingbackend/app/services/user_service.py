@@ -267,7 +267,7 @@
 
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, or_, select, extract
+from sqlalchemy import func, select, extract
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import secrets
@@ -277,6 +277,9 @@ from decimal import Decimal
 from app.models.users import UserProfile
 from app.schemas.users import UserCreate, UserUpdate, UserStats
 from app.utils.security_utils import get_password_hash, verify_password
+from app.services.referral_tree_service import ReferralTreeService
+from app.services.search_service import text_match
+from app.utils.pagination import keyset_page
 from fastapi import HTTPException, status
 from sqlalchemy import update
 
@@ -289,17 +292,14 @@ class UserService:
         limit: int = 100,
         search: Optional[str] = None, 
         role: Optional[str] = None, 
-        status: Optional[str] = None
+        status: Optional[str] = None,
+        cursor: Optional[str] = None
     ) -> List[UserProfile]:
         stmt = select(UserProfile)
 
         if search:
-            stmt = stmt.where(
-                or_(
-                    UserProfile.email.ilike(f"%{search}%"),
-                    UserProfile.full_name.ilike(f"%{search}%")
-                )
-            )
+            # Served by the email / full_name trigram indexes
+            stmt = stmt.where(text_match((UserProfile.email, UserProfile.full_name), search))
 
         if role and role != "all":
             stmt = stmt.where(UserProfile.role == role)
@@ -307,7 +307,7 @@ class UserService:
         if status and status != "all":
             stmt = stmt.where(UserProfile.account_status == status)
 
-        stmt = stmt.offset(skip).limit(limit)
+        stmt = keyset_page(stmt, UserProfile.created_at, UserProfile.id, cursor, limit, skip)
         result = await db.execute(stmt)
         return result.scalars().all()
 
@@ -459,40 +459,30 @@ class UserService:
         return result.scalar() or 0
 
     async def get_user_stats(self, db: AsyncSession) -> UserStats:
-        total_users = await self.get_total_users(db)
-        active_users = await self.get_active_users_count(db)
-
-        suspended_result = await db.execute(
-            select(func.count(UserProfile.id)).where(UserProfile.account_status == "suspended")
-        )
-        suspended_users = suspended_result.scalar() or 0
-
         today = datetime.now().date()
         start_of_week = today - timedelta(days=today.weekday())
         start_of_month = today.replace(day=1)
-
-        new_today_result = await db.execute(
-            select(func.count(UserProfile.id)).where(func.date(UserProfile.created_at) == today)
-        )
-        new_users_today = new_today_result.scalar() or 0
-
-        new_week_result = await db.execute(
-            select(func.count(UserProfile.id)).where(func.date(UserProfile.created_at) >= start_of_week)
-        )
-        new_users_this_week = new_week_result.scalar() or 0
-
-        new_month_result = await db.execute(
-            select(func.count(UserProfile.id)).where(func.date(UserProfile.created_at) >= start_of_month)
-        )
-        new_users_this_month = new_month_result.scalar() or 0
+        created_on = func.date(UserProfile.created_at)
+
+        # One scan, one round trip: each counter is a FILTERed aggregate
+        row = (await db.execute(
+            select(
+                func.count(UserProfile.id).label("total_users"),
+                func.count(UserProfile.id).filter(UserProfile.account_status == "active").label("active_users"),
+                func.count(UserProfile.id).filter(UserProfile.account_status == "suspended").label("suspended_users"),
+                func.count(UserProfile.id).filter(created_on == today).label("new_users_today"),
+                func.count(UserProfile.id).filter(created_on >= start_of_week).label("new_users_this_week"),
+                func.count(UserProfile.id).filter(created_on >= start_of_month).label("new_users_this_month"),
+            )
+        )).one()
 
         return UserStats(
-            total_users=total_users,
-            active_users=active_users,
-            suspended_users=suspended_users,
-            new_users_today=new_users_today,
-            new_users_this_week=new_users_this_week,
-            new_users_this_month=new_users_this_month,
+            total_users=row.total_users or 0,
+            active_users=row.active_users or 0,
+            suspended_users=row.suspended_users or 0,
+            new_users_today=row.new_users_today or 0,
+            new_users_this_week=row.new_users_this_week or 0,
+            new_users_this_month=row.new_users_this_month or 0,
         )
 
     # ✅ Recent activity
@@ -527,26 +517,24 @@ class UserService:
 
     async def _update_referral_hierarchy(self, db: AsyncSession, new_user: UserProfile, referrer: UserProfile):
         try:
-            # Set level 1 referral
-            new_user.referral_level_1 = referrer.id
-            referrer.l1_referrals += 1
-            referrer.total_referrals += 1
-
-            # Set level 2 referral (if exists)
-            if referrer.referred_by:
-                lvl2_user = await self.get_user_by_id(db, referrer.referred_by)
-                if lvl2_user:
-                    new_user.referral_level_2 = lvl2_user.id
-                    lvl2_user.l2_referrals += 1
-                    lvl2_user.total_referrals += 1
-
-                    # Set level 3 referral (if exists)
-                    if lvl2_user.referred_by:
-                        lvl3_user = await self.get_user_by_id(db, lvl2_user.referred_by)
-                        if lvl3_user:
-                            new_user.referral_level_3 = lvl3_user.id
-                            lvl3_user.l3_referrals += 1
-                            lvl3_user.total_referrals += 1
+            tree = ReferralTreeService()
+            await tree.add_referral(db, new_user.id, referrer.id)
+            uplines = await tree.get_uplines(db, new_user.id, max_depth=3)
+            upline_users = {
+                u.id: u for u in (await db.execute(
+                    select(UserProfile).where(UserProfile.id.in_(list(uplines.values())))
+                )).scalars().all()
+            } if uplines else {}
+
+            # Set level 1-3 referrals from the closure table
+            for level, upline_id in uplines.items():
+                upline = upline_users.get(upline_id)
+                if not upline:
+                    continue
+                setattr(new_user, f"referral_level_{level}", upline.id)
+                counter = f"l{level}_referrals"
+                setattr(upline, counter, (getattr(upline, counter) or 0) + 1)
+                upline.total_referrals = (upline.total_referrals or 0) + 1
 
             await db.commit()
             await db.refresh(new_user)
@@ -0,0 +1,214 @@
+"""
+Razorpay webhook ingestion.
+
+The webhook endpoint does the minimum needed to acknowledge a delivery:
+verify the HMAC, pull the event id and order id out of the body and insert
+one `webhook_events` row with `ON CONFLICT (event_id) DO NOTHING`. Razorpay
+redeliveries (same `X-Razorpay-Event-Id`) therefore never reach the
+business logic twice.
+
+`drain_batch` runs in the job worker. It claims received events with
+FOR UPDATE SKIP LOCKED, groups them by Razorpay order, and applies the net
+effect once per order:
+
+- `payment.captured` / `order.paid` → mark the transaction PAID and enqueue
+  the post-payment job. The job's dedupe key is the Razorpay order id, the
+  same one `/verify-payment` uses, so the two paths converge on one job.
+- `payment.failed` → mark FAILED, only while the transaction is still
+  INITIATED/PENDING (a late failure never downgrades a paid transaction).
+- anything else is stored for audit and marked IGNORED.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal
+from app.models.payment import PaymentTransaction, PaymentStatus
+from app.models.webhook_event import WebhookEvent, WebhookEventStatus
+from app.services.post_payment_pipeline import PostPaymentPipeline
+
+
+CAPTURE_EVENTS = {"payment.captured", "order.paid"}
+FAILURE_EVENTS = {"payment.failed"}
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def parse_event(raw_body: bytes, event_id_header: Optional[str] = None) -> Dict[str, Any]:
+    """Extract the columns we index on from a raw webhook body."""
+    payload = json.loads(raw_body)
+    entities = payload.get('payload') or {}
+    payment = (entities.get('payment') or {}).get('entity') or {}
+    order = (entities.get('order') or {}).get('entity') or {}
+
+    return {
+        # Razorpay sends a stable id per event; fall back to the body hash
+        "event_id": event_id_header or hashlib.sha256(raw_body).hexdigest(),
+        "event_type": payload.get('event') or 'unknown',
+        "razorpay_order_id": payment.get('order_id') or order.get('id'),
+        "razorpay_payment_id": payment.get('id'),
+        "event_created_at": payload.get('created_at'),
+        "payload": payload,
+    }
+
+
+class WebhookIngestionService:
+    """Store-then-process handling of Razorpay webhooks."""
+
+    MAX_ATTEMPTS = 5
+
+    def __init__(self):
+        self.pipeline = PostPaymentPipeline()
+
+    # ------------------------------------------------------------------
+    # Ingestion (request path)
+    # ------------------------------------------------------------------
+    async def ingest(
+        self,
+        db: AsyncSession,
+        raw_body: bytes,
+        event_id_header: Optional[str] = None,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Persist one verified delivery.
+
+        Returns (parsed event, is_duplicate). One INSERT and one commit; no
+        other reads or writes happen on the request path.
+        """
+        event = parse_event(raw_body, event_id_header)
+
+        stmt = (
+            pg_insert(WebhookEvent)
+            .values(
+                provider='razorpay',
+                status=WebhookEventStatus.RECEIVED,
+                attempts=0,
+                **event,
+            )
+            .on_conflict_do_nothing(index_elements=[WebhookEvent.event_id])
+            .returning(WebhookEvent.id)
+        )
+        result = await db.execute(stmt)
+        inserted_id = result.scalar_one_or_none()
+        await db.commit()
+
+        return event, inserted_id is None
+
+    # ------------------------------------------------------------------
+    # Draining (worker path)
+    # ------------------------------------------------------------------
+    async def drain_batch(self, db: AsyncSession, limit: int = 200) -> Dict[str, int]:
+        """Apply up to `limit` stored events, one transaction for the batch."""
+        result = await db.execute(
+            select(WebhookEvent)
+            .where(
+                WebhookEvent.status.in_([WebhookEventStatus.RECEIVED, WebhookEventStatus.FAILED]),
+                WebhookEvent.attempts < self.MAX_ATTEMPTS,
+            )
+            .order_by(WebhookEvent.received_at, WebhookEvent.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        events = result.scalars().all()
+        stats = {"events": len(events), "orders": 0, "paid": 0, "failed": 0, "ignored": 0, "errors": 0}
+        if not events:
+            await db.commit()
+            return stats
+
+        by_order: Dict[Optional[str], List[WebhookEvent]] = {}
+        for event in events:
+            event.attempts = (event.attempts or 0) + 1
+            by_order.setdefault(event.razorpay_order_id, []).append(event)
+
+        # Events without an order id (refunds, disputes, ...) are kept for audit only
+        for event in by_order.pop(None, []):
+            self._finish(event, WebhookEventStatus.IGNORED)
+            stats["ignored"] += 1
+
+        # One locking read for every transaction touched by the batch
+        transactions: Dict[str, PaymentTransaction] = {}
+        if by_order:
+            txn_result = await db.execute(
+                select(PaymentTransaction)
+                .where(PaymentTransaction.razorpay_order_id.in_(list(by_order.keys())))
+                .with_for_update()
+            )
+            transactions = {txn.razorpay_order_id: txn for txn in txn_result.scalars().all()}
+
+        for razorpay_order_id, order_events in by_order.items():
+            stats["orders"] += 1
+            txn = transactions.get(razorpay_order_id)
+            try:
+                async with db.begin_nested():
+                    outcome = await self._apply_order_events(db, txn, order_events)
+                stats[outcome] += 1
+            except Exception as e:
+                print(f"❌ Webhook events for {razorpay_order_id} failed: {e}")
+                stats["errors"] += 1
+                for event in order_events:
+                    event.status = WebhookEventStatus.FAILED
+                    event.last_error = f"{type(e).__name__}: {e}"[:4000]
+
+        await db.commit()
+        return stats
+
+    async def _apply_order_events(
+        self,
+        db: AsyncSession,
+        txn: Optional[PaymentTransaction],
+        events: List[WebhookEvent],
+    ) -> str:
+        """Fold every pending event of one Razorpay order into a single update."""
+        events = sorted(events, key=lambda e: (e.event_created_at or 0, e.id))
+
+        if txn is None:
+            for event in events:
+                self._finish(event, WebhookEventStatus.IGNORED, "No payment transaction for order")
+            return "ignored"
+
+        capture = next((e for e in reversed(events) if e.event_type in CAPTURE_EVENTS), None)
+        failure = next((e for e in reversed(events) if e.event_type in FAILURE_EVENTS), None)
+
+        if capture is not None:
+            if txn.payment_status != PaymentStatus.PAID:
+                payment = (capture.payload.get('payload', {}).get('payment') or {}).get('entity') or {}
+                txn.payment_status = PaymentStatus.PAID
+                txn.razorpay_payment_id = txn.razorpay_payment_id or capture.razorpay_payment_id
+                txn.payment_method = txn.payment_method or payment.get('method')
+                txn.paid_at = txn.paid_at or _utcnow()
+                txn.failure_reason = None
+                await db.flush()
+            # Idempotent: returns the job /verify-payment may already have created
+            await self.pipeline.enqueue(db, txn)
+            outcome = "paid"
+        elif failure is not None and txn.payment_status in (PaymentStatus.INITIATED, PaymentStatus.PENDING):
+            payment = (failure.payload.get('payload', {}).get('payment') or {}).get('entity') or {}
+            txn.payment_status = PaymentStatus.FAILED
+            txn.failure_reason = payment.get('error_description', 'Payment failed')
+            outcome = "failed"
+        else:
+            outcome = "ignored"
+
+        for event in events:
+            self._finish(event, WebhookEventStatus.IGNORED if outcome == "ignored" else WebhookEventStatus.PROCESSED)
+        return outcome
+
+    @staticmethod
+    def _finish(event: WebhookEvent, status: WebhookEventStatus, note: Optional[str] = None) -> None:
+        event.status = status
+        event.processed_at = _utcnow()
+        event.last_error = note
+
+
+async def drain_webhook_events(limit: int = 200) -> Dict[str, int]:
+    """Drain one batch in a fresh session (worker loop / background task)."""
+    async with AsyncSessionLocal() as db:
+        return await WebhookIngestionService().drain_batch(db, limit=limit)
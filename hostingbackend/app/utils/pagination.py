@@ -0,0 +1,122 @@
+"""
+Keyset (cursor) pagination, newest first.
+
+Pages are ordered by a timestamp column and the primary key, usually
+(created_at, id). A cursor is the opaque, URL-safe encoding of the last
+row of a page. The next page is `WHERE (created_at, id) < (:created_at,
+:id)`, which Postgres answers from a (created_at, id) index no matter how
+deep the page is; OFFSET has to walk and discard every skipped row.
+
+List endpoints return the cursor of the following page in the
+`X-Next-Cursor` response header (and as `next_cursor` in dict bodies),
+absent on the last page. Bodies are otherwise unchanged and skip/limit
+paging keeps working when no cursor is sent.
+
+Totals: an exact COUNT(*) per page is often the slowest query of a
+listing. `approximate_count` returns the planner's row estimate instead
+(pg_class.reltuples for a whole table).
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, func, or_, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int) -> str:
+    payload = json.dumps([sort_value.isoformat() if sort_value else None, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(sort_value) if sort_value is not None else None), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def keyset_page(query: Select, sort_col, id_col, cursor: Optional[str], limit: int, skip: int = 0) -> Select:
+    """
+    Order `query` by (sort_col, id_col) descending and restrict it to one page.
+
+    With a cursor the page starts after the cursor row and `skip` is
+    ignored; without one the legacy offset is applied. A nullable sort
+    column works too: Postgres sorts NULLs first in descending order, so
+    rows with a NULL key form the first pages, ordered by id.
+    """
+    query = query.order_by(sort_col.desc(), id_col.desc())
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if sort_value is None:
+            query = query.where(or_(and_(sort_col.is_(None), id_col < row_id), sort_col.isnot(None)))
+        else:
+            query = query.where(tuple_(sort_col, id_col) < tuple_(sort_value, row_id))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def next_cursor(items: Sequence[Any], limit: int, sort_key: str = "created_at") -> Optional[str]:
+    """Cursor after the last item of a full page (dicts or objects with `sort_key` and id)."""
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    if isinstance(last, dict):
+        return encode_cursor(last[sort_key], last["id"])
+    return encode_cursor(getattr(last, sort_key), last.id)
+
+
+def set_next_cursor(response: Response, items: Sequence[Any], limit: int, sort_key: str = "created_at") -> Optional[str]:
+    cursor = next_cursor(items, limit, sort_key)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    return cursor
+
+
+async def approximate_count(db: AsyncSession, query: Select) -> int:
+    """
+    Planner estimate of the rows `query` returns.
+
+    For an unfiltered table this is pg_class.reltuples (kept current by
+    autovacuum/ANALYZE); for filtered queries it is the estimate from
+    EXPLAIN. Falls back to an exact count off Postgres, for tables that
+    were never analyzed, or when the query cannot be rendered.
+    """
+    if db.bind.dialect.name == "postgresql":
+        froms = query.get_final_froms()
+        if query.whereclause is None and len(froms) == 1 and hasattr(froms[0], "fullname"):
+            estimate = (await db.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+                {"table": froms[0].fullname},
+            )).scalar()
+            if estimate is not None and estimate >= 0:
+                return estimate
+        else:
+            try:
+                sql = str(query.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}))
+            except Exception:
+                sql = None
+            if sql:
+                plan = (await db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]["Plan"]["Plan Rows"])
+
+    return await count_rows(db, query)
+
+
+async def count_rows(db: AsyncSession, query: Select, approximate: bool = False) -> int:
+    """Total for a listing: exact COUNT(*), or the planner estimate when `approximate`."""
+    if approximate:
+        return await approximate_count(db, query)
+    return (await db.execute(select(func.count()).select_from(query.order_by(None).subquery()))).scalar() or 0
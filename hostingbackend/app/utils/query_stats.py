@@ -0,0 +1,37 @@
+"""
+Count the SQL statements a block of code sends on a session's connection.
+
+    async with count_statements(db) as stats:
+        await service.bulk_create_orders(db, items)
+    print(stats.count)
+
+Counts cursor executions, so a statement that SQLAlchemy splits into
+several batches counts once per batch. COMMIT/ROLLBACK are not counted.
+"""
+
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+
+
+@asynccontextmanager
+async def count_statements(db: AsyncSession) -> AsyncIterator[StatementStats]:
+    stats = StatementStats()
+    connection = (await db.connection()).sync_connection
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        stats.count += 1
+
+    event.listen(connection, "before_cursor_execute", on_execute)
+    try:
+        yield stats
+    finally:
+        event.remove(connection, "before_cursor_execute", on_execute)
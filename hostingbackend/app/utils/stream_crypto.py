@@ -0,0 +1,151 @@
+"""
+Segmented AEAD for attachment files (envelope encryption).
+
+Every file gets a random 256-bit data key. The data key is stored wrapped
+(AES-GCM) under the attachment master key, so opening a file costs one
+AES operation instead of a password KDF.
+
+File layout:
+
+    header   = MAGIC | chunk_size (u32) | nonce_prefix (7 bytes)
+    segments = AES-256-GCM(chunk_i) for every plaintext chunk of chunk_size
+               bytes (the last may be shorter), each followed by its 16-byte tag
+
+Segment nonce = nonce_prefix | counter (u32) | last flag (1 byte), and the
+header is authenticated with every segment, so reordered, truncated or
+appended segments fail to decrypt (STREAM construction).
+"""
+
+import base64
+import hashlib
+import os
+import struct
+from functools import lru_cache
+from typing import Tuple
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from app.core.config import settings
+
+
+MAGIC = b"BSA1"
+HEADER_FORMAT = "!4sI7s"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class StreamCryptoError(Exception):
+    """Raised when a stream or wrapped key fails authentication or parsing."""
+
+
+# ==================== Master key / envelope ====================
+
+@lru_cache(maxsize=1)
+def _master_key() -> bytes:
+    if settings.ATTACHMENT_MASTER_KEY:
+        key = base64.urlsafe_b64decode(settings.ATTACHMENT_MASTER_KEY)
+        if len(key) != 32:
+            raise ValueError("ATTACHMENT_MASTER_KEY must be 32 bytes, urlsafe base64 encoded")
+        return key
+    # Derived once per process; unlike PBKDF2 per file this is a single HMAC
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"ticket-attachments/master-key",
+    ).derive(settings.SECRET_KEY.encode())
+
+
+def master_key_id() -> str:
+    """Identifier of the master key that wraps new data keys (stored per attachment)."""
+    return "mk-" + hashlib.sha256(_master_key()).hexdigest()[:16]
+
+
+def new_data_key() -> bytes:
+    return AESGCM.generate_key(bit_length=256)
+
+
+def wrap_key(data_key: bytes, context: str) -> str:
+    """Encrypt a data key under the master key; `context` is bound as AAD."""
+    nonce = os.urandom(12)
+    wrapped = AESGCM(_master_key()).encrypt(nonce, data_key, context.encode())
+    return base64.urlsafe_b64encode(nonce + wrapped).decode()
+
+
+def unwrap_key(wrapped_key: str, context: str) -> bytes:
+    raw = base64.urlsafe_b64decode(wrapped_key)
+    try:
+        return AESGCM(_master_key()).decrypt(raw[:12], raw[12:], context.encode())
+    except Exception as e:
+        raise StreamCryptoError("Data key could not be unwrapped") from e
+
+
+# ==================== Segments ====================
+
+def _nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    return prefix + struct.pack("!IB", counter, 1 if last else 0)
+
+
+class SegmentEncryptor:
+    """Encrypts a stream chunk by chunk; call `encrypt(chunk, last=True)` exactly once at the end."""
+
+    def __init__(self, data_key: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._aead = AESGCM(data_key)
+        self._prefix = os.urandom(NONCE_PREFIX_SIZE)
+        self.header = struct.pack(HEADER_FORMAT, MAGIC, chunk_size, self._prefix)
+        self._counter = 0
+        self._finished = False
+
+    def encrypt(self, chunk: bytes, last: bool = False) -> bytes:
+        if self._finished:
+            raise StreamCryptoError("Stream already finalized")
+        if len(chunk) > self.chunk_size or (not last and len(chunk) != self.chunk_size):
+            raise StreamCryptoError("Only the last segment may be shorter than chunk_size")
+        segment = self._aead.encrypt(_nonce(self._prefix, self._counter, last), chunk, self.header)
+        self._counter += 1
+        self._finished = last
+        return segment
+
+
+class SegmentDecryptor:
+    """Decrypts segments produced by SegmentEncryptor, in order."""
+
+    def __init__(self, data_key: bytes, header: bytes):
+        try:
+            magic, chunk_size, prefix = struct.unpack(HEADER_FORMAT, header)
+        except struct.error as e:
+            raise StreamCryptoError("Truncated header") from e
+        if magic != MAGIC:
+            raise StreamCryptoError("Not an encrypted attachment stream")
+        self.header = header
+        self.chunk_size = chunk_size
+        self._aead = AESGCM(data_key)
+        self._prefix = prefix
+        self._counter = 0
+
+    @property
+    def segment_size(self) -> int:
+        return self.chunk_size + TAG_SIZE
+
+    def seek_segment(self, index: int) -> None:
+        """Position at segment `index` (for ranged reads)."""
+        self._counter = index
+
+    def decrypt(self, segment: bytes, last: bool) -> bytes:
+        try:
+            chunk = self._aead.decrypt(_nonce(self._prefix, self._counter, last), segment, self.header)
+        except Exception as e:
+            raise StreamCryptoError(f"Segment {self._counter} failed authentication") from e
+        self._counter += 1
+        return chunk
+
+
+def encrypted_size(plain_size: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[int, int]:
+    """(segment count, total encrypted bytes incl. header) for a plaintext size."""
+    segments = max(1, -(-plain_size // chunk_size))
+    return segments, HEADER_SIZE + plain_size + segments * TAG_SIZE
@@ -0,0 +1,132 @@
+"""
+Background job worker.
+
+Run one or more of these next to the API:
+
+    python -m app.workers.job_worker
+
+Each worker drains stored webhook events, refreshes the admin stats
+snapshot and rebuilds recent revenue rollups when they are due; the
+affiliate stats reconcile runs only on the worker holding the
+AFFILIATE_RECONCILE_LOCK_NAME advisory lock (app.core.leader). It then polls `background_jobs` and runs up to a batch of
+jobs, claiming each one (FOR UPDATE SKIP LOCKED) just before running it in
+its own session: a job's lease starts when it starts, so jobs waiting
+behind a slow one are never reclaimed and run twice by another worker. It also takes
+part in the server lifecycle leader election (app.workers.lifecycle_scheduler).
+"""
+
+import asyncio
+import signal
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.leader import AdvisoryLeader
+from app.services.job_queue_service import JobQueueService, default_worker_id
+from app.services.webhook_ingestion_service import drain_webhook_events
+from app.services.admin_stats_service import refresh_admin_stats
+from app.services.affiliate_stats_service import reconcile_affiliate_stats
+from app.services.revenue_rollup_service import rebuild_recent_revenue_rollups
+from app.services.catalog_cache import catalog_cache
+from app.workers.lifecycle_scheduler import lifecycle_scheduler
+
+# Importing the job modules registers their handlers
+import app.services.post_payment_pipeline  # noqa: F401
+
+
+AFFILIATE_RECONCILE_LOCK_NAME = "affiliate_stats_reconcile"
+
+
+async def run_worker(poll_seconds: float = None, batch_size: int = None) -> None:
+    poll_seconds = poll_seconds or settings.JOB_WORKER_POLL_SECONDS
+    batch_size = batch_size or settings.JOB_WORKER_BATCH_SIZE
+    worker_id = default_worker_id()
+    job_queue = JobQueueService()
+    reconcile_leader = AdvisoryLeader(AFFILIATE_RECONCILE_LOCK_NAME)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    last_stats_refresh = 0.0
+    last_affiliate_reconcile = 0.0
+    last_revenue_rebuild = 0.0
+
+    catalog_cache.start_listener()
+    lifecycle_scheduler.start()
+    print(f"👷 Job worker {worker_id} started (batch={batch_size}, poll={poll_seconds}s)")
+
+    while not stop.is_set():
+        webhook_backlog = False
+        try:
+            # Webhooks first: a captured payment enqueues its post_payment job
+            drained = await drain_webhook_events(limit=settings.WEBHOOK_DRAIN_BATCH_SIZE)
+            webhook_backlog = drained["events"] >= settings.WEBHOOK_DRAIN_BATCH_SIZE
+            if drained["events"]:
+                print(f"📨 Webhooks drained: {drained}")
+        except Exception as e:
+            print(f"❌ Failed to drain webhooks: {e}")
+
+        if loop.time() - last_stats_refresh >= settings.ADMIN_STATS_REFRESH_SECONDS:
+            last_stats_refresh = loop.time()
+            try:
+                await refresh_admin_stats()
+            except Exception as e:
+                print(f"❌ Failed to refresh admin stats: {e}")
+
+        if loop.time() - last_affiliate_reconcile >= settings.AFFILIATE_STATS_RECONCILE_SECONDS:
+            last_affiliate_reconcile = loop.time()
+            try:
+                # One worker at a time: the repair locks the drifted stats rows
+                if await reconcile_leader.ensure():
+                    report = await reconcile_affiliate_stats()
+                    if report["drifted"] or report["created"]:
+                        print(f"🔧 Affiliate stats repaired: {report['drifted']} drifted, {report['created']} created")
+            except Exception as e:
+                print(f"❌ Failed to reconcile affiliate stats: {e}")
+
+        if loop.time() - last_revenue_rebuild >= settings.REVENUE_ROLLUP_RECONCILE_SECONDS:
+            last_revenue_rebuild = loop.time()
+            try:
+                await rebuild_recent_revenue_rollups()
+            except Exception as e:
+                print(f"❌ Failed to rebuild revenue rollups: {e}")
+
+        ran = 0
+        while ran < batch_size and not stop.is_set():
+            async with AsyncSessionLocal() as db:
+                try:
+                    jobs = await job_queue.claim_batch(db, worker_id, limit=1)
+                except Exception as e:
+                    print(f"❌ Failed to claim jobs: {e}")
+                    break
+                if not jobs:
+                    break
+                job = jobs[0]
+                job_id, job_type = job.id, job.job_type
+                ok = await job_queue.run_job(db, job)
+                print(f"{'✅' if ok else '⚠️'} Job {job_id} ({job_type}) {'succeeded' if ok else 'failed'}")
+            ran += 1
+
+        # Drain without sleeping while there is a backlog
+        if ran < batch_size and not webhook_backlog:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    await catalog_cache.stop_listener()
+    await lifecycle_scheduler.stop()
+    await reconcile_leader.release()
+    print(f"👋 Job worker {worker_id} stopped")
+
+
+def main() -> None:
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
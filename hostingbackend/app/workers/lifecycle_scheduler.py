@@ -0,0 +1,98 @@
+"""
+Server lifecycle scheduler.
+
+Started in every API worker (and the job worker) when SERVER_LIFECYCLE_ENABLED
+is set (off by default); all of them try to become leader every SERVER_LIFECYCLE_INTERVAL_SECONDS and only the leader runs
+`run_server_lifecycle()` (see app.services.server_lifecycle_service).
+It can also run on its own:
+
+    python -m app.workers.lifecycle_scheduler          # loop
+    python -m app.workers.lifecycle_scheduler --once   # one pass (cron), if leader
+"""
+
+import argparse
+import asyncio
+from typing import Optional
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.leader import AdvisoryLeader
+from app.services.server_lifecycle_service import LifecycleReport, run_server_lifecycle
+
+
+LEADER_LOCK_NAME = "server_lifecycle"
+
+
+class LifecycleScheduler:
+    def __init__(self, interval_seconds: Optional[float] = None):
+        self.interval = interval_seconds or settings.SERVER_LIFECYCLE_INTERVAL_SECONDS
+        self.leader = AdvisoryLeader(LEADER_LOCK_NAME)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the background loop (call once per process, inside the event loop)."""
+        # The lifecycle statements are Postgres-only (make_interval, unnest)
+        if not settings.SERVER_LIFECYCLE_ENABLED or engine.dialect.name != "postgresql":
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.leader.release()
+
+    async def run_once(self) -> Optional[LifecycleReport]:
+        """One pass if this process is the leader; None otherwise."""
+        if not await self.leader.ensure():
+            return None
+        report = await run_server_lifecycle()
+        if report.changed or report.errors:
+            print(
+                f"🔁 Server lifecycle: {report.renewed} renewed, {report.invoiced} invoiced, "
+                f"{report.suspended} suspended, {report.terminated} terminated "
+                f"in {report.seconds:.1f}s ({report.batches} batches, {len(report.errors)} errors)"
+            )
+        return report
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Server lifecycle pass failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+lifecycle_scheduler = LifecycleScheduler()
+
+
+async def _main(once: bool) -> None:
+    scheduler = LifecycleScheduler()
+    try:
+        if once:
+            report = await scheduler.run_once()
+            if report is None:
+                print("⏭️ Another process holds the server lifecycle lock; nothing to do")
+            return
+        await scheduler._run_forever()
+    finally:
+        await scheduler.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Server lifecycle scheduler")
+    parser.add_argument("--once", action="store_true", help="Run one pass and exit")
+    args = parser.parse_args()
+    asyncio.run(_main(args.once))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Backfill Referral Commissions
+
+Creates the missing L1-L3 referral earnings for paid orders that have
+none, in batches of COMMISSION_BACKFILL_BATCH_SIZE orders (one INSERT per
+batch). Earnings are created as 'pending' for admin approval. Orders that
+already have earnings are never touched, so the script is safe to re-run.
+
+Before that, the (order, beneficiary, level) unique keys that
+CommissionEngine's ON CONFLICT inserts rely on are added to tables that
+lack them (create_all does not alter existing tables), after deleting the
+duplicate earnings / commissions written before the keys existed. Run
+sync_affiliate_stats.py afterwards if duplicates were found.
+
+The keys must exist before any code that writes commissions runs against
+a database, so `--keys-only` is part of deploy (docker-compose runs it
+before uvicorn starts, and the job worker waits for the API):
+
+    python backfill_commissions.py --keys-only  # deploy step; no-op once the keys exist
+    python backfill_commissions.py              # every paid order
+    python backfill_commissions.py 101 102 103  # specific orders
+"""
+import asyncio
+import sys
+
+from sqlalchemy import UniqueConstraint, inspect
+from sqlalchemy.schema import AddConstraint
+
+from app.core.database import AsyncSessionLocal, engine
+from app.models.affiliate import Commission
+from app.models.referrals import ReferralEarning
+from app.services.commission_engine import CommissionEngine
+
+
+async def remove_duplicate_commissions():
+    """Delete duplicate rows so the unique keys can be created"""
+    async with AsyncSessionLocal() as db:
+        try:
+            report = await CommissionEngine().remove_duplicates(db)
+        except Exception as e:
+            print(f"❌ Error removing duplicate commissions: {e}")
+            await db.rollback()
+            raise
+    print(
+        f"🧹 Removed {report['earnings_deleted']} duplicate earnings and "
+        f"{report['commissions_deleted']} duplicate commissions"
+    )
+    return report
+
+
+async def missing_unique_constraints():
+    """Commission unique keys not yet present in the database"""
+    missing = []
+    async with engine.connect() as conn:
+        for table in (ReferralEarning.__table__, Commission.__table__):
+            existing = await conn.run_sync(
+                lambda sync, name=table.name: {c["name"] for c in inspect(sync).get_unique_constraints(name)}
+            )
+            missing += [
+                constraint for constraint in table.constraints
+                if isinstance(constraint, UniqueConstraint) and constraint.name not in existing
+            ]
+    return missing
+
+
+async def ensure_unique_constraints():
+    """Dedupe and add the commission unique keys to tables created before them"""
+    missing = await missing_unique_constraints()
+    if not missing:
+        print("✅ Commission unique keys present")
+        return
+
+    await remove_duplicate_commissions()
+    async with engine.begin() as conn:
+        for constraint in missing:
+            await conn.execute(AddConstraint(constraint))
+            print(f"🔒 Added {constraint.name} on {constraint.table.name}")
+
+
+async def backfill_commissions(order_ids=None):
+    """Create missing commissions for paid orders"""
+    await ensure_unique_constraints()
+
+    async with AsyncSessionLocal() as db:
+        try:
+            report = await CommissionEngine().backfill(db, order_ids=order_ids)
+            print(
+                f"✅ Scanned {report['orders_scanned']} orders in {report['batches']} batches: "
+                f"{report['earnings_created']} earnings created for {report['orders_credited']} orders"
+            )
+        except Exception as e:
+            print(f"❌ Error backfilling commissions: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--keys-only"]:
+        asyncio.run(ensure_unique_constraints())
+    else:
+        ids = [int(arg) for arg in sys.argv[1:]] or None
+        asyncio.run(backfill_commissions(ids))
@@ -0,0 +1,30 @@
+"""
+Backfill the referral_closure table
+
+Rebuilds every (ancestor, descendant, depth) row from
+users_profiles.referred_by with one recursive query. Run once after the
+table is created; afterwards AffiliateService.track_referral keeps it
+current on signup. Safe to re-run.
+
+    python backfill_referral_closure.py
+"""
+import asyncio
+
+from app.core.database import AsyncSessionLocal
+from app.services.referral_tree_service import ReferralTreeService
+
+
+async def backfill_referral_closure():
+    """Rebuild the closure table from the referred_by chain"""
+    async with AsyncSessionLocal() as db:
+        try:
+            total = await ReferralTreeService().rebuild(db)
+            print(f"✅ Rebuilt referral_closure: {total} rows")
+        except Exception as e:
+            print(f"❌ Error rebuilding referral closure: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_referral_closure())
@@ -0,0 +1,62 @@
+"""
+Backfill Revenue Rollups
+
+Rebuilds `revenue_rollups` from orders and invoices, one month per
+transaction, so the admin revenue endpoints have history to read. Each
+month is deleted and recomputed, so the script is safe to re-run (e.g.
+after fixing amounts with raw SQL).
+
+    python backfill_revenue_rollups.py                  # earliest order/invoice to this month
+    python backfill_revenue_rollups.py 2025-01          # 2025-01 to this month
+    python backfill_revenue_rollups.py 2025-01 2025-06  # 2025-01 to 2025-06 inclusive
+"""
+import asyncio
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.invoice import Invoice
+from app.models.order import Order
+from app.services.revenue_rollup_service import RevenueRollupService, add_months, month_start, utc_day
+
+
+def parse_month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+async def earliest_month() -> date:
+    async with AsyncSessionLocal() as db:
+        first_order = (await db.execute(select(func.min(Order.created_at)))).scalar()
+        first_invoice = (await db.execute(select(func.min(Invoice.created_at)))).scalar()
+    firsts = [utc_day(value) for value in (first_order, first_invoice) if value is not None]
+    return month_start(min(firsts)) if firsts else month_start(utc_day(None))
+
+
+async def backfill_revenue_rollups(first: date = None, last: date = None):
+    """Rebuild every month in [first, last]"""
+    first = first or await earliest_month()
+    last = last or month_start(utc_day(None))
+    service = RevenueRollupService()
+
+    month, total = first, 0
+    while month <= last:
+        async with AsyncSessionLocal() as db:
+            try:
+                written = await service.rebuild(db, month, add_months(month, 1))
+                await db.commit()
+            except Exception as e:
+                print(f"❌ Error rebuilding {month:%Y-%m}: {e}")
+                await db.rollback()
+                raise
+        print(f"📊 {month:%Y-%m}: {written} rollup rows")
+        total += written
+        month = add_months(month, 1)
+
+    print(f"✅ Revenue rollups rebuilt from {first:%Y-%m} to {last:%Y-%m}: {total} rows")
+
+
+if __name__ == "__main__":
+    months = [parse_month(arg) for arg in sys.argv[1:3]]
+    asyncio.run(backfill_revenue_rollups(*months))
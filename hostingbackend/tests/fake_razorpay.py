@@ -0,0 +1,100 @@
+"""
+In-process stand-in for the Razorpay REST API.
+
+Used by the gateway tests through `httpx.ASGITransport`, and can also be run
+locally so the app talks to it instead of the real gateway:
+
+    uvicorn tests.fake_razorpay:app --port 9090
+    RAZORPAY_API_BASE_URL=http://localhost:9090/v1 uvicorn app.main:app
+
+Failure injection: set `state.fail_next` to make the next N calls return
+503, or `state.delay_seconds` to slow every call down.
+"""
+
+import asyncio
+import secrets
+import time
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class FakeRazorpayState:
+    def __init__(self):
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.payments: Dict[str, Dict[str, Any]] = {}
+        self.fail_next = 0
+        self.delay_seconds = 0.0
+        self.calls = 0
+
+    def reset(self):
+        self.__init__()
+
+
+state = FakeRazorpayState()
+app = FastAPI(title="Fake Razorpay")
+
+
+@app.middleware("http")
+async def inject_faults(request: Request, call_next):
+    state.calls += 1
+    if state.delay_seconds:
+        await asyncio.sleep(state.delay_seconds)
+    if state.fail_next > 0:
+        state.fail_next -= 1
+        return JSONResponse(
+            status_code=503,
+            content={"error": {"code": "SERVER_ERROR", "description": "Injected failure"}},
+        )
+    return await call_next(request)
+
+
+@app.post("/v1/orders")
+async def create_order(request: Request):
+    data = await request.json()
+    if not isinstance(data.get("amount"), int) or data["amount"] < 100:
+        return JSONResponse(
+            status_code=400,
+            content={"error": {"code": "BAD_REQUEST_ERROR", "description": "The amount must be atleast INR 1.00"}},
+        )
+
+    order_id = f"order_{secrets.token_hex(7)}"
+    order = {
+        "id": order_id,
+        "entity": "order",
+        "amount": data["amount"],
+        "amount_paid": 0,
+        "amount_due": data["amount"],
+        "currency": data.get("currency", "INR"),
+        "status": "created",
+        "notes": data.get("notes", {}),
+        "created_at": int(time.time()),
+    }
+    state.orders[order_id] = order
+    return order
+
+
+@app.get("/v1/orders/{order_id}")
+async def fetch_order(order_id: str):
+    if order_id not in state.orders:
+        return JSONResponse(
+            status_code=400,
+            content={"error": {"code": "BAD_REQUEST_ERROR", "description": "The id provided does not exist"}},
+        )
+    return state.orders[order_id]
+
+
+@app.get("/v1/payments/{payment_id}")
+async def fetch_payment(payment_id: str):
+    payment = state.payments.get(payment_id)
+    if payment is None:
+        payment = {
+            "id": payment_id,
+            "entity": "payment",
+            "status": "captured",
+            "method": "upi",
+            "currency": "INR",
+            "created_at": int(time.time()),
+        }
+    return payment
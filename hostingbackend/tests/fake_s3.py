@@ -0,0 +1,85 @@
+"""
+In-process stand-in for an S3-compatible object store (MinIO-style,
+path-style URLs).
+
+Used by the attachment storage tests through `httpx.ASGITransport`, and can
+also be run locally so the app stores attachments in it:
+
+    uvicorn tests.fake_s3:app --port 9000
+    ATTACHMENT_STORAGE_BACKEND=s3 ATTACHMENT_S3_ENDPOINT_URL=http://localhost:9000 \
+    ATTACHMENT_S3_BUCKET=attachments ATTACHMENT_S3_ACCESS_KEY=test ATTACHMENT_S3_SECRET_KEY=test \
+    uvicorn app.main:app
+
+Objects live in memory. Requests must carry a SigV4 Authorization header for
+`state.access_key`; the signature itself is not verified.
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+from fastapi import FastAPI, Request, Response
+
+
+class FakeS3State:
+    def __init__(self):
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.access_key = "test"
+        self.requests: List[Tuple[str, str, str]] = []  # (method, key, range)
+
+    def reset(self):
+        self.__init__()
+
+
+state = FakeS3State()
+app = FastAPI(title="Fake S3")
+
+
+@app.middleware("http")
+async def require_signature(request: Request, call_next):
+    authorization = request.headers.get("authorization", "")
+    if not authorization.startswith(f"AWS4-HMAC-SHA256 Credential={state.access_key}/"):
+        return Response(status_code=403)
+    return await call_next(request)
+
+
+@app.put("/{bucket}/{key:path}")
+async def put_object(bucket: str, key: str, request: Request):
+    state.requests.append(("PUT", key, ""))
+    state.objects[(bucket, key)] = await request.body()
+    return Response(status_code=200)
+
+
+@app.get("/{bucket}/{key:path}")
+async def get_object(bucket: str, key: str, request: Request):
+    byte_range = request.headers.get("range", "")
+    state.requests.append(("GET", key, byte_range))
+    data = state.objects.get((bucket, key))
+    if data is None:
+        return Response(status_code=404)
+
+    match = re.fullmatch(r"bytes=(\d+)-(\d*)", byte_range)
+    if not match:
+        return Response(content=data, status_code=200)
+    start = int(match.group(1))
+    end = min(int(match.group(2)) + 1, len(data)) if match.group(2) else len(data)
+    if start >= len(data):
+        return Response(status_code=416)
+    return Response(
+        content=data[start:end],
+        status_code=206,
+        headers={"Content-Range": f"bytes {start}-{end - 1}/{len(data)}"},
+    )
+
+
+@app.head("/{bucket}/{key:path}")
+async def head_object(bucket: str, key: str):
+    data = state.objects.get((bucket, key))
+    if data is None:
+        return Response(status_code=404)
+    return Response(status_code=200, headers={"Content-Length": str(len(data))})
+
+
+@app.delete("/{bucket}/{key:path}")
+async def delete_object(bucket: str, key: str):
+    state.objects.pop((bucket, key), None)
+    return Response(status_code=204)
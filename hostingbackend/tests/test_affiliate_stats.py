@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from sqlalchemy import MetaData, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.schema import CreateTable
+
+from app.models.affiliate import AffiliateStats, Payout, Referral
+from app.models.referrals import ReferralEarning
+from app.services.affiliate_stats_service import DELTA_COLUMNS, AffiliateStatsService
+
+
+STAMP = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class RecordingStatsService(AffiliateStatsService):
+    def __init__(self):
+        self.reads = []
+
+    async def _stored(self, db, user_ids, lock=False):
+        self.reads.append((user_ids, lock))
+        return await super()._stored(db, user_ids, lock)
+
+
+def run(scenario):
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            copies = MetaData()
+            async with engine.begin() as conn:
+                for model in (AffiliateStats, Referral, ReferralEarning, Payout):
+                    await conn.execute(CreateTable(model.__table__.to_metadata(copies), include_foreign_key_constraints=[]))
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                return await scenario(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def stats(user_id, **values):
+    row = {column: Decimal("0") if "commission" in column or "amount" in column else 0 for column in DELTA_COLUMNS}
+    row.update(values)
+    return AffiliateStats(affiliate_user_id=user_id, available_balance=Decimal("0"), last_calculated_at=STAMP, **row)
+
+
+def test_reconcile_locks_and_rewrites_only_drifted_rows():
+    async def scenario(db):
+        db.add_all([
+            ReferralEarning(
+                order_id=10, user_id=user_id, referred_user_id=99, level=1, status="pending",
+                commission_rate=Decimal("10.00"), order_amount=Decimal("100.00"), commission_amount=Decimal("10.00"),
+            )
+            for user_id in (1, 2)
+        ])
+        db.add_all([
+            stats(1, total_commission_earned=Decimal("10.00"), pending_commission=Decimal("10.00")),
+            stats(2),  # Drifted: missed its earning
+        ])
+        await db.commit()
+
+        service = RecordingStatsService()
+        report = await service.reconcile(db)
+        rows = (await db.execute(
+            select(AffiliateStats.affiliate_user_id, AffiliateStats.pending_commission, AffiliateStats.last_calculated_at)
+            .order_by(AffiliateStats.affiliate_user_id)
+        )).all()
+        return report, service.reads, rows
+
+    report, reads, rows = run(scenario)
+    assert (report["checked"], report["drifted"], report["created"]) == (2, 1, 0)
+    assert reads == [(None, False), ([2], True)]
+    assert [(user_id, Decimal(pending)) for user_id, pending, _ in rows] == [(1, Decimal("10.00")), (2, Decimal("10.00"))]
+    assert rows[0][2].replace(tzinfo=timezone.utc) == STAMP
+    assert rows[1][2].replace(tzinfo=timezone.utc) != STAMP
+
+
+def test_reconcile_without_repair_takes_no_locks():
+    async def scenario(db):
+        db.add(stats(1, total_referrals=3))
+        await db.commit()
+        service = RecordingStatsService()
+        report = await service.reconcile(db, repair=False)
+        stored = (await db.execute(select(AffiliateStats.total_referrals))).scalar_one()
+        return report, service.reads, stored
+
+    report, reads, stored = run(scenario)
+    assert report["drifted"] == 1
+    assert reads == [(None, False)]
+    assert stored == 3
@@ -0,0 +1,162 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from app.services.attachment_storage import (
+    LocalAttachmentStorage,
+    S3AttachmentStorage,
+    StorageError,
+)
+from app.services.file_service import SecureFileService, parse_range_header
+from app.utils.stream_crypto import SegmentEncryptor, StreamCryptoError, new_data_key
+from tests.fake_s3 import app as fake_app, state
+
+
+CHUNK_SIZE = 1024
+PLAINTEXT = os.urandom(5 * CHUNK_SIZE + 123)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_s3():
+    state.reset()
+    return S3AttachmentStorage(
+        endpoint_url="http://fake-s3",
+        bucket="attachments",
+        access_key="test",
+        secret_key="test",
+        transport=httpx.ASGITransport(app=fake_app),
+    )
+
+
+def write_encrypted(path, data_key):
+    encryptor = SegmentEncryptor(data_key, CHUNK_SIZE)
+    chunks = [PLAINTEXT[i:i + CHUNK_SIZE] for i in range(0, len(PLAINTEXT), CHUNK_SIZE)]
+    with open(path, "wb") as out:
+        out.write(encryptor.header)
+        for index, chunk in enumerate(chunks):
+            out.write(encryptor.encrypt(chunk, last=index == len(chunks) - 1))
+
+
+async def decrypt(storage, key, data_key, start, end):
+    stream = SecureFileService._decrypt_range(storage, key, data_key, len(PLAINTEXT), start, end)
+    return b"".join([chunk async for chunk in stream])
+
+
+@pytest.fixture(params=["local", "s3"])
+def storage(request, tmp_path):
+    if request.param == "local":
+        yield LocalAttachmentStorage(str(tmp_path / "store"))
+    else:
+        s3 = make_s3()
+        yield s3
+        run(s3.aclose())
+
+
+def test_put_and_ranged_read(storage, tmp_path):
+    source = tmp_path / "blob"
+    source.write_bytes(PLAINTEXT)
+
+    async def scenario():
+        await storage.put_file("tickets/blob.enc", source)
+        return (
+            await storage.exists("tickets/blob.enc"),
+            await storage.read_range("tickets/blob.enc", 100, 2100),
+            await storage.exists("tickets/missing.enc"),
+        )
+
+    found, middle, missing = run(scenario())
+    assert found and not missing
+    assert middle == PLAINTEXT[100:2100]
+
+
+@pytest.mark.parametrize("start,end", [
+    (0, len(PLAINTEXT)),
+    (0, 1),
+    (CHUNK_SIZE - 10, CHUNK_SIZE + 10),
+    (3 * CHUNK_SIZE, 4 * CHUNK_SIZE),
+    (len(PLAINTEXT) - 50, len(PLAINTEXT)),
+])
+def test_ranged_decrypt(storage, tmp_path, start, end):
+    data_key = new_data_key()
+    source = tmp_path / "file.enc"
+    write_encrypted(source, data_key)
+
+    async def scenario():
+        await storage.put_file("tickets/file.enc", source)
+        return await decrypt(storage, "tickets/file.enc", data_key, start, end)
+
+    assert run(scenario()) == PLAINTEXT[start:end]
+
+
+def test_s3_ranged_decrypt_fetches_only_covering_segments(tmp_path):
+    storage = make_s3()
+    data_key = new_data_key()
+    source = tmp_path / "file.enc"
+    write_encrypted(source, data_key)
+
+    async def scenario():
+        await storage.put_file("tickets/file.enc", source)
+        state.requests.clear()
+        data = await decrypt(storage, "tickets/file.enc", data_key, 2 * CHUNK_SIZE + 5, 2 * CHUNK_SIZE + 9)
+        await storage.aclose()
+        return data
+
+    assert run(scenario()) == PLAINTEXT[2 * CHUNK_SIZE + 5:2 * CHUNK_SIZE + 9]
+    segment = CHUNK_SIZE + 16
+    assert [r[2] for r in state.requests] == [
+        "bytes=0-14",
+        f"bytes={15 + 2 * segment}-{15 + 3 * segment - 1}",
+    ]
+
+
+def test_truncated_object_fails_authentication(tmp_path):
+    storage = LocalAttachmentStorage(str(tmp_path / "store"))
+    data_key = new_data_key()
+    source = tmp_path / "file.enc"
+    write_encrypted(source, data_key)
+    source.write_bytes(source.read_bytes()[:-200])
+
+    async def scenario():
+        await storage.put_file("tickets/file.enc", source)
+        return await decrypt(storage, "tickets/file.enc", data_key, 0, len(PLAINTEXT))
+
+    with pytest.raises(StreamCryptoError):
+        run(scenario())
+
+
+def test_local_storage_rejects_keys_outside_root(tmp_path):
+    storage = LocalAttachmentStorage(str(tmp_path / "store"))
+    with pytest.raises(StorageError):
+        run(storage.exists("../outside.enc"))
+
+
+def test_parse_range_header():
+    assert parse_range_header("bytes=0-99") == (0, 99)
+    assert parse_range_header("bytes=100-") == (100, None)
+    assert parse_range_header("bytes=-500") == (None, 500)
+    assert parse_range_header("bytes=0-1,5-9") is None
+    assert parse_range_header("items=0-1") is None
+    assert parse_range_header(None) is None
+
+
+def test_s3_wraps_transport_errors(tmp_path):
+    def unreachable(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    storage = make_s3()
+    storage._client = httpx.AsyncClient(transport=httpx.MockTransport(unreachable))
+    staged = tmp_path / "staged.enc"
+    staged.write_bytes(b"data")
+    for operation in (
+        storage.exists("tickets/a.enc"),
+        storage.put_file("tickets/a.enc", staged),
+        storage.read_range("tickets/a.enc", 0, 4),
+        storage.delete("tickets/a.enc"),
+    ):
+        with pytest.raises(StorageError):
+            run(operation)
@@ -0,0 +1,85 @@
+import asyncio
+from decimal import Decimal
+
+from sqlalchemy import MetaData, UniqueConstraint, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.schema import AddConstraint, CreateTable
+
+from app.models.affiliate import Commission, CommissionStatus, Payout
+from app.models.referrals import ReferralEarning
+from app.services.commission_engine import CommissionEngine
+
+
+def run(scenario):
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            # The tables as they were before the unique keys, so duplicates can be inserted
+            legacy = MetaData()
+            async with engine.begin() as conn:
+                for table in (ReferralEarning.__table__, Commission.__table__, Payout.__table__):
+                    copy = table.to_metadata(legacy)
+                    copy.constraints = {c for c in copy.constraints if not isinstance(c, UniqueConstraint)}
+                    await conn.execute(CreateTable(copy, include_foreign_key_constraints=[]))
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                return await scenario(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def earning(earning_id, order_id, user_id, level, status="pending"):
+    return ReferralEarning(
+        id=earning_id, order_id=order_id, user_id=user_id, referred_user_id=99, level=level, status=status,
+        commission_rate=Decimal("10.00"), order_amount=Decimal("100.00"), commission_amount=Decimal("10.00"),
+    )
+
+
+def commission(commission_id, order_id, user_id, level, status=CommissionStatus.PENDING, payout_id=None):
+    return Commission(
+        id=commission_id, order_id=order_id, affiliate_user_id=user_id, level=level, status=status, payout_id=payout_id,
+        order_amount=Decimal("100.00"), commission_rate=Decimal("10.00"), commission_amount=Decimal("10.00"),
+    )
+
+
+def test_remove_duplicates_keeps_the_row_furthest_along():
+    async def scenario(db):
+        db.add_all([
+            earning(1, 10, 5, 1),
+            earning(2, 10, 5, 1, status="approved"),   # kept: further along
+            earning(3, 10, 5, 1),
+            earning(4, 10, 5, 2),                      # different level: untouched
+            earning(5, 11, 5, 1),
+            earning(6, 11, 5, 1),                      # kept: in a payout
+            commission(1, 10, 5, 1),                   # kept: oldest
+            commission(2, 10, 5, 1),
+            commission(3, 12, 5, 1),
+            commission(4, 12, 5, 1, status=CommissionStatus.PAID, payout_id=7),
+            commission(5, None, 5, 1),                 # NULL order ids never collide
+            commission(6, None, 5, 1),
+            Payout(id=1, affiliate_user_id=5, earning_id=6, amount=Decimal("10.00"),
+                   net_amount=Decimal("10.00"), payment_method="upi"),
+        ])
+        await db.commit()
+
+        report = await CommissionEngine().remove_duplicates(db)
+        earnings = (await db.execute(select(ReferralEarning.id).order_by(ReferralEarning.id))).scalars().all()
+        commissions = (await db.execute(select(Commission.id).order_by(Commission.id))).scalars().all()
+        return report, earnings, commissions
+
+    report, earnings, commissions = run(scenario)
+    assert report == {"earnings_deleted": 3, "commissions_deleted": 2}
+    assert earnings == [2, 4, 6]
+    assert commissions == [1, 4, 5, 6]
+
+
+def test_unique_keys_can_be_added_to_existing_tables():
+    for model, name in (
+        (ReferralEarning, "uq_referral_earning_order_user_level"),
+        (Commission, "uq_commission_order_affiliate_level"),
+    ):
+        constraint = next(c for c in model.__table__.constraints if c.name == name)
+        sql = str(AddConstraint(constraint).compile(dialect=postgresql.dialect()))
+        assert sql.startswith(f"ALTER TABLE {model.__tablename__} ADD CONSTRAINT {name} UNIQUE")
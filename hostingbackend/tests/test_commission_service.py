@@ -0,0 +1,59 @@
+import asyncio
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.models.referrals import ReferralEarning
+from app.models.users import UserProfile
+from app.services.commission_service import CommissionService
+
+
+def run(scenario):
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(lambda sync: UserProfile.__table__.create(sync))
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                return await scenario(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def earning(user_id, level, amount):
+    return ReferralEarning(
+        order_id=10, user_id=user_id, referred_user_id=99, level=level, status="approved",
+        commission_rate=Decimal("10.00"), order_amount=Decimal("100.00"), commission_amount=Decimal(amount),
+    )
+
+
+def test_credit_referrer_balances_counts_every_level():
+    async def scenario(db):
+        for user_id in (1, 2, 3, 4):
+            db.add(UserProfile(
+                id=user_id, email=f"user{user_id}@example.com", full_name="User", hashed_password="x",
+                l1_referrals=1, l2_referrals=0, l3_referrals=2,
+            ))
+        await db.commit()
+
+        await CommissionService()._credit_referrer_balances(
+            db, [earning(1, 1, "10.00"), earning(2, 2, "5.00"), earning(3, 3, "2.50")]
+        )
+        await db.commit()
+        rows = await db.execute(
+            select(
+                UserProfile.id, UserProfile.l1_referrals, UserProfile.l2_referrals,
+                UserProfile.l3_referrals, UserProfile.available_balance,
+            ).order_by(UserProfile.id)
+        )
+        return {row[0]: (row[1], row[2], row[3], Decimal(str(row[4] or 0))) for row in rows}
+
+    result = run(scenario)
+    assert result[1][:3] == (2, 0, 2)
+    assert result[2][:3] == (1, 1, 2)
+    assert result[3][:3] == (1, 0, 3)
+    assert result[4] == (1, 0, 2, Decimal("0"))
+    assert [result[user_id][3] for user_id in (1, 2, 3)] == [Decimal("10.00"), Decimal("5.00"), Decimal("2.50")]
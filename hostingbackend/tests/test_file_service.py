@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import MetaData
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.schema import CreateTable
+
+from app.core.config import settings
+from app.core.permissions import BUILTIN_PERMISSIONS, UserAccess
+from app.models.support import SupportTicket
+from app.models.ticket_attachment import ENCRYPTION_VERSION_LEGACY, TicketAttachment
+from app.models.users import UserProfile
+from app.services import attachment_storage
+from app.services.file_service import SecureFileService
+
+
+def access(user_id, role, code):
+    return UserAccess(user_id=user_id, role=role, role_codes=frozenset({code}),
+                      permissions=BUILTIN_PERMISSIONS.get(code, frozenset()))
+
+
+OWNER = UserProfile(id=1, role="customer")
+OTHER = UserProfile(id=2, role="customer")
+AGENT = UserProfile(id=3, role="support")
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ATTACHMENT_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(attachment_storage, "_storage", attachment_storage.LocalAttachmentStorage(tmp_path))
+    return SecureFileService()
+
+
+def run(scenario):
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            copies = MetaData()
+            async with engine.begin() as conn:
+                for model in (SupportTicket, TicketAttachment):
+                    await conn.execute(CreateTable(model.__table__.to_metadata(copies), include_foreign_key_constraints=[]))
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                db.add(SupportTicket(id=1, user_id=OWNER.id, ticket_number="T-1", subject="Help", description="..."))
+                db.add(TicketAttachment(
+                    id=1, ticket_id=1, user_id=OWNER.id, original_filename="a.txt", file_extension="txt",
+                    mime_type="text/plain", file_size=3, storage_path="tickets/missing.enc", storage_backend="local",
+                    encryption_key_id="k", encryption_version=ENCRYPTION_VERSION_LEGACY, file_hash="0" * 64,
+                ))
+                await db.commit()
+                return await scenario(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def download_status(service, user, user_access):
+    async def scenario(db):
+        try:
+            await service.download_file(db, 1, user, user_access)
+        except HTTPException as e:
+            return e.status_code
+
+    return run(scenario)
+
+
+def test_download_checks_support_permission(service):
+    assert download_status(service, OTHER, access(OTHER.id, "customer", "CUSTOMER")) == 403
+    # Owner and support staff get past the access check to the legacy-format refusal
+    assert download_status(service, OWNER, access(OWNER.id, "customer", "CUSTOMER")) == 410
+    assert download_status(service, AGENT, access(AGENT.id, "support", "SUPPORT_AGENT")) == 410
+
+
+def test_delete_checks_support_permission(service):
+    async def scenario(db):
+        with pytest.raises(HTTPException) as denied:
+            await service.delete_file(db, 1, OTHER, access(OTHER.id, "customer", "CUSTOMER"))
+        deleted = await service.delete_file(db, 1, AGENT, access(AGENT.id, "support", "SUPPORT_AGENT"))
+        return denied.value.status_code, deleted
+
+    assert run(scenario) == (403, True)
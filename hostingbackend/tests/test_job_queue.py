@@ -0,0 +1,43 @@
+import asyncio
+
+from sqlalchemy.dialects import postgresql
+
+from app.models.job import BackgroundJob
+from app.services.job_queue_service import JobQueueService
+
+
+class Recorder:
+    """Session stand-in whose dedupe insert loses the race to another delivery."""
+
+    def __init__(self, existing):
+        self.existing = existing
+        self.statements = []
+
+    async def scalars(self, stmt):
+        self.statements.append(stmt)
+
+        class Result:
+            def one_or_none(self):
+                return None
+        return Result()
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        existing = self.existing
+
+        class Result:
+            def scalar_one_or_none(self):
+                return existing
+        return Result()
+
+
+def test_enqueue_with_dedupe_key_returns_the_row_that_won_the_race():
+    existing = BackgroundJob(id=7, job_type="post_payment", dedupe_key="post_payment:1")
+    db = Recorder(existing)
+
+    job = asyncio.run(JobQueueService().enqueue(db, "post_payment", {"id": 1}, dedupe_key="post_payment:1"))
+
+    insert, lookup = (str(stmt.compile(dialect=postgresql.dialect())) for stmt in db.statements)
+    assert job is existing
+    assert "ON CONFLICT (dedupe_key) DO NOTHING RETURNING" in insert
+    assert "WHERE background_jobs.dedupe_key = " in lookup
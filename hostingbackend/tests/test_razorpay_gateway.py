@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import hmac
+
+import httpx
+import pytest
+
+from app.services.razorpay_gateway import (
+    CircuitBreaker,
+    GatewayError,
+    GatewayUnavailableError,
+    RazorpayGateway,
+)
+from tests.fake_razorpay import app as fake_app, state
+
+
+def make_gateway(**kwargs):
+    state.reset()
+    return RazorpayGateway(
+        key_id="rzp_test_key",
+        key_secret="secret",
+        base_url="http://fake-razorpay/v1",
+        transport=httpx.ASGITransport(app=fake_app),
+        backoff_base=0,
+        **kwargs,
+    )
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_create_and_fetch_order():
+    async def scenario():
+        gateway = make_gateway()
+        order = await gateway.create_order({"amount": 49900, "currency": "INR"})
+        fetched = await gateway.fetch_order(order["id"])
+        await gateway.aclose()
+        return order, fetched
+
+    order, fetched = run(scenario())
+    assert order["id"].startswith("order_")
+    assert fetched["amount"] == 49900
+
+
+def test_idempotent_calls_retry_on_5xx():
+    async def scenario():
+        gateway = make_gateway(max_retries=2)
+        state.fail_next = 2
+        payment = await gateway.fetch_payment("pay_123")
+        await gateway.aclose()
+        return payment
+
+    assert run(scenario())["method"] == "upi"
+    assert state.calls == 3
+
+
+def test_order_create_is_not_retried_after_reaching_gateway():
+    async def scenario():
+        gateway = make_gateway(max_retries=2)
+        state.fail_next = 1
+        try:
+            await gateway.create_order({"amount": 49900})
+        finally:
+            await gateway.aclose()
+
+    with pytest.raises(GatewayUnavailableError):
+        run(scenario())
+    assert state.calls == 1
+
+
+def test_client_errors_surface_without_tripping_breaker():
+    async def scenario():
+        gateway = make_gateway(breaker=CircuitBreaker(failure_threshold=1))
+        try:
+            await gateway.create_order({"amount": 1})
+        finally:
+            await gateway.aclose()
+        return gateway
+
+    with pytest.raises(GatewayError) as exc_info:
+        run(scenario())
+    assert exc_info.value.status_code == 400
+
+
+def test_circuit_opens_after_repeated_failures():
+    async def scenario():
+        gateway = make_gateway(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        state.fail_next = 10
+        for _ in range(2):
+            with pytest.raises(GatewayUnavailableError):
+                await gateway.fetch_payment("pay_1")
+        calls_before = state.calls
+        with pytest.raises(GatewayUnavailableError):
+            await gateway.fetch_payment("pay_1")
+        await gateway.aclose()
+        return calls_before
+
+    calls_before = run(scenario())
+    assert state.calls == calls_before
+
+
+def test_signature_verification():
+    gateway = make_gateway()
+    signature = hmac.new(b"secret", b"order_1|pay_1", hashlib.sha256).hexdigest()
+    assert gateway.verify_payment_signature("order_1", "pay_1", signature)
+    assert not gateway.verify_payment_signature("order_1", "pay_2", signature)
+
+    body = b'{"event":"payment.captured"}'
+    webhook_signature = hmac.new(b"whsec", body, hashlib.sha256).hexdigest()
+    assert gateway.verify_webhook_signature(body, webhook_signature, "whsec")
+    assert not gateway.verify_webhook_signature(body, None, "whsec")
+    run(gateway.aclose())
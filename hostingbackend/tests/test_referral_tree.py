@@ -0,0 +1,103 @@
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.models.affiliate import ReferralClosure
+from app.models.users import UserProfile
+from app.services.referral_tree_service import ReferralTreeService
+
+
+def run(scenario):
+    """Run `scenario(db)` against a fresh in-memory users_profiles + referral_closure."""
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(lambda sync: UserProfile.__table__.create(sync))
+                await conn.run_sync(lambda sync: ReferralClosure.__table__.create(sync))
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                return await scenario(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def make_user(db, user_id, referred_by=None, **levels):
+    user = UserProfile(
+        id=user_id,
+        email=f"user{user_id}@example.com",
+        full_name=f"User {user_id}",
+        hashed_password="x",
+        referred_by=referred_by,
+        **levels,
+    )
+    db.add(user)
+    return user
+
+
+def test_add_referral_extends_ancestry():
+    async def scenario(db):
+        tree = ReferralTreeService()
+        for user_id, referrer_id in ((1, None), (2, 1), (3, 2), (4, 3), (5, 4)):
+            make_user(db, user_id, referred_by=referrer_id)
+        await db.flush()
+        for user_id, referrer_id in ((2, 1), (3, 2), (4, 3), (5, 4)):
+            await tree.add_referral(db, user_id, referrer_id)
+        await tree.add_referral(db, 5, 4)  # Re-running is a no-op
+
+        return (
+            await tree.get_uplines(db, 5),
+            await tree.get_uplines(db, 5, max_depth=4),
+            await tree.get_downline_counts(db, 1),
+            sorted(await tree.get_downline_ids(db, 2, depth=2)),
+        )
+
+    uplines, deep, downline, ids = run(scenario)
+    assert uplines == {1: 4, 2: 3, 3: 2}
+    assert deep == {1: 4, 2: 3, 3: 2, 4: 1}
+    assert downline == {1: 1, 2: 1, 3: 1}
+    assert ids == [4]
+
+
+def test_add_referral_seeds_referrer_without_closure_rows():
+    async def scenario(db):
+        # 3 predates the closure table: only its referral_level_* columns know 2 and 1
+        make_user(db, 1)
+        make_user(db, 2, referred_by=1, referral_level_1=1)
+        make_user(db, 3, referred_by=2, referral_level_1=2, referral_level_2=1)
+        make_user(db, 4, referred_by=3)
+        await db.flush()
+
+        tree = ReferralTreeService()
+        await tree.add_referral(db, 4, 3)
+        closure = (await db.execute(
+            select(ReferralClosure.descendant_id, ReferralClosure.depth, ReferralClosure.ancestor_id)
+        )).all()
+        return await tree.get_uplines(db, 4), sorted(closure)
+
+    uplines, closure = run(scenario)
+    assert uplines == {1: 3, 2: 2, 3: 1}
+    assert closure == [(3, 1, 2), (3, 2, 1), (4, 1, 3), (4, 2, 2), (4, 3, 1)]
+
+
+def test_resolve_uplines_falls_back_per_missing_depth():
+    async def scenario(db):
+        for user_id in (1, 2, 3, 9):
+            make_user(db, user_id)
+        user = make_user(db, 4, referred_by=3, referral_level_1=3, referral_level_2=2, referral_level_3=1)
+        # Only the direct referral made it into the closure table
+        db.add(ReferralClosure(ancestor_id=3, descendant_id=4, depth=1))
+        await db.flush()
+
+        tree = ReferralTreeService()
+        partial = await tree.resolve_uplines(db, user)
+        db.add(ReferralClosure(ancestor_id=9, descendant_id=4, depth=2))
+        await db.flush()
+        return partial, await tree.resolve_uplines(db, user), await tree.resolve_uplines(db, user, max_depth=1)
+
+    partial, closure_wins, shallow = run(scenario)
+    assert partial == {1: 3, 2: 2, 3: 1}
+    assert closure_wins == {1: 3, 2: 9, 3: 1}
+    assert shallow == {1: 3}
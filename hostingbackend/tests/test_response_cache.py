@@ -0,0 +1,121 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+from app.core.response_cache import NO_STORE_HEADERS, CachePolicy, ResponseCacheMiddleware
+
+
+POLICY = CachePolicy(max_age=60, stale_while_revalidate=300)
+
+
+class Catalog:
+    def __init__(self):
+        self.version = 0
+        self.calls = 0
+
+
+def make_app(catalog):
+    app = FastAPI()
+
+    @app.get("/api/plans")
+    async def plans(region: str = "in", sort: str = "price"):
+        catalog.calls += 1
+        return {"version": catalog.version, "region": region, "sort": sort}
+
+    @app.get("/api/missing")
+    async def missing():
+        catalog.calls += 1
+        raise HTTPException(status_code=404, detail="Not found")
+
+    @app.get("/api/me")
+    async def me():
+        catalog.calls += 1
+        return {"id": 1}
+
+    app.add_middleware(
+        ResponseCacheMiddleware,
+        version=lambda: catalog.version,
+        policies={"/plans": POLICY, "/missing": POLICY},
+        prefix="/api",
+    )
+    return app
+
+
+def run(scenario):
+    catalog = Catalog()
+
+    async def main():
+        transport = httpx.ASGITransport(app=make_app(catalog))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await scenario(client, catalog)
+
+    return asyncio.run(main())
+
+
+def test_matching_if_none_match_gets_304_from_the_cache():
+    async def scenario(client, catalog):
+        first = await client.get("/api/plans")
+        again = await client.get("/api/plans", headers={"If-None-Match": first.headers["etag"]})
+        return first, again, catalog.calls
+
+    first, again, calls = run(scenario)
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == POLICY.cache_control
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == first.headers["etag"]
+    assert calls == 1
+
+
+def test_catalog_version_bump_invalidates_entries():
+    async def scenario(client, catalog):
+        first = await client.get("/api/plans")
+        catalog.version += 1
+        second = await client.get("/api/plans", headers={"If-None-Match": first.headers["etag"]})
+        return first, second, catalog.calls
+
+    first, second, calls = run(scenario)
+    assert calls == 2
+    assert second.status_code == 200
+    assert second.json()["version"] == 1
+    assert second.headers["etag"] != first.headers["etag"]
+
+
+def test_query_order_does_not_matter():
+    async def scenario(client, catalog):
+        first = await client.get("/api/plans?region=eu&sort=name")
+        second = await client.get("/api/plans?sort=name&region=eu")
+        other = await client.get("/api/plans?region=us&sort=name")
+        return first, second, other, catalog.calls
+
+    first, second, other, calls = run(scenario)
+    assert second.json() == first.json()
+    assert second.headers["etag"] == first.headers["etag"]
+    assert other.json()["region"] == "us"
+    assert calls == 2
+
+
+def test_authorization_and_other_routes_are_not_stored():
+    async def scenario(client, catalog):
+        authed = [await client.get("/api/plans", headers={"Authorization": "Bearer x"}) for _ in range(2)]
+        private = await client.get("/api/me")
+        return authed, private, catalog.calls
+
+    authed, private, calls = run(scenario)
+    assert calls == 3
+    for response in (*authed, private):
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == NO_STORE_HEADERS["Cache-Control"]
+        assert "etag" not in response.headers
+
+
+def test_non_200_responses_are_not_cached():
+    async def scenario(client, catalog):
+        responses = [await client.get("/api/missing") for _ in range(2)]
+        return responses, catalog.calls
+
+    responses, calls = run(scenario)
+    assert calls == 2
+    assert [response.status_code for response in responses] == [404, 404]
+    assert all(response.headers["cache-control"] == NO_STORE_HEADERS["Cache-Control"] for response in responses)
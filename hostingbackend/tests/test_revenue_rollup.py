@@ -0,0 +1,69 @@
+import asyncio
+from collections import Counter
+from decimal import Decimal
+
+from sqlalchemy import MetaData, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.schema import CreateTable
+
+from app.models.invoice import Invoice
+from app.models.order import Order
+from app.services import revenue_rollup_service
+
+
+def run(scenario, monkeypatch):
+    deltas = []
+
+    def capture(delta):
+        deltas.append(delta)
+        return select(1)
+
+    monkeypatch.setattr(revenue_rollup_service, "_upsert", capture)
+
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            copies = MetaData()
+            async with engine.begin() as conn:
+                for model in (Order, Invoice):
+                    await conn.execute(CreateTable(model.__table__.to_metadata(copies), include_foreign_key_constraints=[]))
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                await scenario(db)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(main())
+
+    # Net count per (source, payment_status) over the day buckets
+    net = Counter()
+    for delta in deltas:
+        for row in delta.rows():
+            if row["period"] == "day":
+                net[(row["source"], row["payment_status"])] += row["count"]
+    return +net
+
+
+def test_insert_relying_on_default_status_is_bucketed_as_pending(monkeypatch):
+    async def scenario(db):
+        order = Order(
+            id=1, user_id=1, plan_id=1, order_number="ORD-1", billing_cycle="monthly",
+            total_amount=Decimal("100.00"), grand_total=Decimal("100.00"),
+        )
+        db.add(order)
+        await db.flush()
+        order.payment_status = "paid"
+        await db.commit()
+
+    # Moved out of 'pending', not out of an empty status bucket
+    assert run(scenario, monkeypatch) == {("order", "paid"): 1}
+
+
+def test_pending_insert_alone(monkeypatch):
+    async def scenario(db):
+        db.add(Order(
+            id=1, user_id=1, plan_id=1, order_number="ORD-1", billing_cycle="monthly",
+            total_amount=Decimal("100.00"), grand_total=Decimal("100.00"),
+        ))
+        await db.commit()
+
+    assert run(scenario, monkeypatch) == {("order", "pending"): 1}
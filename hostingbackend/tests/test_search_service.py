@@ -0,0 +1,63 @@
+import asyncio
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.models.users import UserProfile
+from app.services.search_service import SEARCH_CANDIDATES, SearchService, candidates, escape_like
+
+
+def run(scenario):
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(lambda sync: UserProfile.__table__.create(sync))
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                return await scenario(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def test_escape_like():
+    assert escape_like("plain") == "plain"
+    assert escape_like("100%_off") == "100\\%\\_off"
+    assert escape_like("a\\b") == "a\\\\b"
+
+
+def test_users_ranked_exact_then_prefix_then_id():
+    async def scenario(db):
+        for user_id, email, name in (
+            (1, "zed@example.com", "Mary Anna"),        # substring (name)
+            (2, "anna@example.com", "Zed"),              # prefix (email)
+            (3, "anna", "Someone"),                      # exact
+            (4, "bob@example.com", "Bob"),               # no match
+            (5, "joanna@example.com", "Jo"),             # substring (email)
+            (6, "x_anna@example.com", "X"),              # substring (email)
+        ):
+            db.add(UserProfile(id=user_id, email=email, full_name=name, hashed_password="x"))
+        await db.commit()
+        service = SearchService()
+        return (
+            [user.id for user in await service.search_users(db, "anna")],
+            [user.id for user in await service.search_users(db, "anna", limit=2)],
+            [user.id for user in await service.search_users(db, "a_n")],  # "_" is not a wildcard
+        )
+
+    ranked, top, literal = run(scenario)
+    assert ranked == [3, 2, 1, 5, 6]
+    assert top == [3, 2]
+    assert literal == []
+
+
+def test_candidates_use_bounded_knn_scans_on_postgres():
+    columns = (UserProfile.email, UserProfile.full_name)
+    stmt = candidates(UserProfile, "gmail", columns, fuzzy=columns, exact=(UserProfile.email,))
+    sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+    assert sql.count(f"LIMIT {SEARCH_CANDIDATES}") == 4
+    assert "ORDER BY users_profiles.email <-> 'gmail'" in sql
+    assert "ORDER BY users_profiles.full_name <-> 'gmail'" in sql
+    assert "similarity" not in sql
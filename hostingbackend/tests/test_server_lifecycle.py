@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.config import settings
+from app.models.server import Server
+from app.services.server_lifecycle_service import ServerLifecycleService
+
+
+NOW = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+def run(scenario):
+    """Run `scenario(db)` against a fresh in-memory servers table."""
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(lambda sync: Server.__table__.create(sync))
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                return await scenario(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def make_server(db, server_id, status, expired_days_ago, suspended_days_ago=None):
+    db.add(Server(
+        id=server_id, user_id=1, plan_id=1, server_name=f"srv-{server_id}", hostname=f"srv-{server_id}.example.com",
+        server_status=status, server_type="vps", vcpu=1, ram_gb=1, storage_gb=10, bandwidth_gb=100,
+        operating_system="linux", monthly_cost=Decimal("100.00"),
+        expiry_date=NOW - timedelta(days=expired_days_ago),
+        suspended_at=None if suspended_days_ago is None else NOW - timedelta(days=suspended_days_ago),
+    ))
+
+
+async def statuses(db):
+    rows = (await db.execute(select(Server.id, Server.server_status, Server.suspended_at).order_by(Server.id))).all()
+    return {server_id: (status, suspended_at is not None) for server_id, status, suspended_at in rows}
+
+
+def test_suspend_stamps_suspended_at_and_respects_grace():
+    async def scenario(db):
+        make_server(db, 1, "active", expired_days_ago=settings.SERVER_SUSPEND_GRACE_DAYS + 1)
+        make_server(db, 2, "active", expired_days_ago=settings.SERVER_SUSPEND_GRACE_DAYS - 1)
+        make_server(db, 3, "active", expired_days_ago=-10)
+        await db.flush()
+        count = await ServerLifecycleService().suspend_expired(db, NOW)
+        return count, await statuses(db)
+
+    count, result = run(scenario)
+    assert count == 1
+    assert result == {1: ("suspended", True), 2: ("active", False), 3: ("active", False)}
+
+
+def test_long_expired_server_is_not_terminated_in_the_pass_that_suspends_it():
+    async def scenario(db):
+        service = ServerLifecycleService()
+        make_server(db, 1, "active", expired_days_ago=settings.SERVER_TERMINATE_AFTER_DAYS + 30)
+        await db.flush()
+
+        # Same order as run_server_lifecycle
+        suspended = await service.suspend_expired(db, NOW)
+        terminated = await service.terminate_expired(db, NOW)
+        first_pass = await statuses(db)
+
+        later = NOW + timedelta(days=settings.SERVER_TERMINATE_AFTER_DAYS - 1)
+        early = await service.terminate_expired(db, later)
+        late = await service.terminate_expired(db, later + timedelta(days=2))
+        return suspended, terminated, first_pass, early, late, await statuses(db)
+
+    suspended, terminated, first_pass, early, late, final = run(scenario)
+    assert (suspended, terminated) == (1, 0)
+    assert first_pass == {1: ("suspended", True)}
+    assert (early, late) == (0, 1)
+    assert final == {1: ("terminated", True)}
+
+
+def test_terminate_counts_from_suspension_not_expiry():
+    async def scenario(db):
+        days = settings.SERVER_TERMINATE_AFTER_DAYS
+        make_server(db, 1, "suspended", expired_days_ago=days + 100, suspended_days_ago=days + 1)
+        make_server(db, 2, "suspended", expired_days_ago=days + 100, suspended_days_ago=days - 1)
+        make_server(db, 3, "suspended", expired_days_ago=days + 100)  # Suspended by hand: no suspended_at
+        make_server(db, 4, "active", expired_days_ago=1, suspended_days_ago=days + 1)
+        await db.flush()
+        count = await ServerLifecycleService().terminate_expired(db, NOW)
+        return count, await statuses(db)
+
+    count, result = run(scenario)
+    assert count == 1
+    assert result == {
+        1: ("terminated", True),
+        2: ("suspended", True),
+        3: ("suspended", False),
+        4: ("active", True),
+    }
+
+
+def test_paid_renewal_clears_suspension():
+    captured = []
+
+    class Recorder:
+        async def execute(self, stmt):
+            captured.append(stmt)
+
+            class Result:
+                rowcount = 0
+            return Result()
+
+    asyncio.run(ServerLifecycleService().apply_paid_renewals(Recorder()))
+    sql = str(captured[0].compile(dialect=postgresql.dialect()))
+    assert "suspended_at=" in sql.replace(" ", "")
+    assert "FOR UPDATE OF servers SKIP LOCKED" in sql
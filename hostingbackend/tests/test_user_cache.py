@@ -0,0 +1,82 @@
+import asyncio
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.core.user_cache import user_cache
+from app.models.users import UserProfile
+
+
+def run(scenario):
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(lambda sync: UserProfile.__table__.create(sync))
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                users = [
+                    UserProfile(id=user_id, email=f"user{user_id}@example.com", full_name="User", hashed_password="x")
+                    for user_id in (1, 2, 3)
+                ]
+                db.add_all(users)
+                await db.commit()
+                user_cache.clear()
+                for user in users:
+                    user_cache.put(user.id, "iat", user)
+                return await scenario(db, users)
+        finally:
+            user_cache.clear()
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def cached():
+    return {user_id for user_id in (1, 2, 3) if user_cache.get(user_id, "iat") is not None}
+
+
+def test_flushed_change_invalidates_on_commit_only():
+    async def scenario(db, users):
+        users[0].account_status = "suspended"
+        await db.flush()
+        before_commit = cached()
+        await db.commit()
+        after_commit = cached()
+
+        users[1].role = "admin"
+        await db.flush()
+        await db.rollback()
+        return before_commit, after_commit, cached()
+
+    before_commit, after_commit, after_rollback = run(scenario)
+    assert before_commit == {1, 2, 3}
+    assert after_commit == {2, 3}
+    assert after_rollback == {2, 3}
+
+
+def test_bulk_writes_invalidate_principal_changes():
+    async def scenario(db, users):
+        await db.execute(update(UserProfile).where(UserProfile.id == 1).values(full_name="Renamed"))
+        await db.commit()
+        unrelated = cached()
+
+        await db.execute(update(UserProfile), [{"id": 2, "role": "admin"}])
+        await db.commit()
+        by_primary_key = cached()
+
+        await db.execute(update(UserProfile).where(UserProfile.role == "customer").values(account_status="suspended"))
+        await db.commit()
+        by_filter = cached()
+
+        for user in users:
+            await db.refresh(user)
+            user_cache.put(user.id, "iat", user)
+        await db.execute(delete(UserProfile).where(UserProfile.id == 3))
+        await db.commit()
+        return unrelated, by_primary_key, by_filter, cached()
+
+    unrelated, by_primary_key, by_filter, after_delete = run(scenario)
+    assert unrelated == {1, 2, 3}
+    assert by_primary_key == {1, 3}
+    assert by_filter == set()
+    assert after_delete == set()